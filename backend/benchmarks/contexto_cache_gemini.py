@@ -0,0 +1,132 @@
+"""
+Benchmark del context cache del prompt CliniDoc
+Compara tokens enviados y latencia de la estructuración con el prompt completo y con las instrucciones cacheadas
+
+Uso (desde backend/):
+    python benchmarks/contexto_cache_gemini.py --documentos 50
+
+No llama a Gemini: usa un reemplazo local de google.generativeai cuya
+latencia es una base fija más un costo por cada mil tokens de entrada, más
+bajo para los tokens que vienen del cache (la generación de la respuesta
+cuesta lo mismo en los dos casos y no se simula). Los tokens se cuentan con
+el mismo estimador que usa el backend (4 caracteres por token).
+
+Modos:
+    completo    cache deshabilitado: cada llamada envía instrucciones + documento
+    cache       instrucciones en el context cache: cada llamada envía solo el documento
+    sin_soporte el proveedor rechaza el cache: se vuelve al prompt completo
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from servicios.contexto_cache_gemini import ContextoCacheGemini
+from servicios.fragmentacion_informes import estimar_tokens
+from servicios.prompt_clinidoc import INSTRUCCIONES_CLINIDOC, construir_prompt, construir_sufijo
+
+MODOS = ["completo", "cache", "sin_soporte"]
+
+
+class ApiLocal:
+    """Reemplazo de google.generativeai con latencia proporcional a los tokens de entrada"""
+
+    def __init__(self, ms_base: float, ms_por_mil_tokens: float, ms_por_mil_cacheados: float, admite_cache: bool):
+        self.tokens_enviados = 0
+        self.tokens_cacheados = 0
+        api = self
+
+        class GenerativeModel:
+            def __init__(self, model_name: str, instrucciones_cacheadas: str = ""):
+                self.model_name = model_name
+                self.instrucciones_cacheadas = instrucciones_cacheadas
+
+            @classmethod
+            def from_cached_content(cls, cached_content):
+                return cls(cached_content.model, cached_content.system_instruction)
+
+            def generate_content(self, contenido: str):
+                enviados = estimar_tokens(contenido)
+                cacheados = estimar_tokens(self.instrucciones_cacheadas)
+                api.tokens_enviados += enviados
+                api.tokens_cacheados += cacheados
+                time.sleep((ms_base + ms_por_mil_tokens * enviados / 1000 + ms_por_mil_cacheados * cacheados / 1000) / 1000)
+                return types.SimpleNamespace(text="# Resumen del Informe Veterinario")
+
+        def crear_cache(model, display_name, system_instruction, ttl):
+            if not admite_cache:
+                raise RuntimeError("400 Cached content is too small")
+            return types.SimpleNamespace(
+                name=f"cachedContents/{display_name}", model=model, system_instruction=system_instruction
+            )
+
+        self.GenerativeModel = GenerativeModel
+        self.caching = types.SimpleNamespace(CachedContent=types.SimpleNamespace(create=crear_cache))
+
+
+def documento_sintetico(numero: int) -> tuple:
+    """Texto de informe (entre ~300 y ~2500 tokens) y la descripción de sus imágenes"""
+    parrafo = "Se observa silueta cardíaca aumentada de tamaño, con campos pulmonares sin alteraciones. "
+    texto = f"INFORME {numero}\nHALLAZGOS:\n" + parrafo * random.randint(15, 110) + "\nCONCLUSIÓN:\nCardiomegalia leve."
+    info_imagenes = "\n\n### INFORMACIÓN DE IMÁGENES DETECTADAS:\n" + "".join(
+        f"- **IMAGEN {i}:** Radiografía de tórax (Tipo: radiografia, Página: {i})\n"
+        for i in range(1, random.randint(1, 4) + 1)
+    )
+    return texto, info_imagenes
+
+
+async def medir(modo: str, documentos: list, args) -> dict:
+    """Estructura los documentos en un modo y devuelve tokens y latencias"""
+    api = ApiLocal(args.ms_base, args.ms_por_mil_tokens, args.ms_por_mil_cacheados, admite_cache=modo != "sin_soporte")
+    contexto = ContextoCacheGemini("clinidoc", INSTRUCCIONES_CLINIDOC, "gemini-benchmark", habilitado=modo != "completo")
+    modelo = api.GenerativeModel("gemini-benchmark")
+
+    latencias = []
+    for texto, info_imagenes in documentos:
+        inicio = time.perf_counter()
+        # Misma elección que ProcesadorPDFServicio._estructurar_fragmento
+        modelo_cacheado = await contexto.obtener_modelo(api)
+        if modelo_cacheado is not None:
+            await asyncio.to_thread(modelo_cacheado.generate_content, construir_sufijo(texto, info_imagenes))
+        else:
+            await asyncio.to_thread(modelo.generate_content, construir_prompt(texto, info_imagenes))
+        latencias.append((time.perf_counter() - inicio) * 1000)
+
+    return {
+        "enviados": api.tokens_enviados,
+        "cacheados": api.tokens_cacheados,
+        "promedio_ms": statistics.mean(latencias),
+        "p50_ms": statistics.median(latencias),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documentos", type=int, default=50, help="Documentos a estructurar por modo")
+    parser.add_argument("--ms-base", type=float, default=50, help="Latencia fija por llamada (ms)")
+    parser.add_argument("--ms-por-mil-tokens", type=float, default=40, help="Latencia por cada mil tokens enviados (ms)")
+    parser.add_argument("--ms-por-mil-cacheados", type=float, default=4, help="Latencia por cada mil tokens del cache (ms)")
+    parser.add_argument("--semilla", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.semilla)
+    documentos = [documento_sintetico(i) for i in range(args.documentos)]
+    print(f"Instrucciones fijas: ~{estimar_tokens(INSTRUCCIONES_CLINIDOC)} tokens por llamada")
+    print(f"{'modo':>12} | {'tokens enviados':>15} | {'tokens cacheados':>16} | {'promedio ms':>11} | {'p50 ms':>8}")
+    for modo in MODOS:
+        resultado = await medir(modo, documentos, args)
+        print(
+            f"{modo:>12} | {resultado['enviados']:>15} | {resultado['cacheados']:>16} | "
+            f"{resultado['promedio_ms']:>11.1f} | {resultado['p50_ms']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+"""
+Benchmark de ingesta por lotes
+Mide reportes/segundo de ReportesServicio.guardar_reportes_lote con lotes de 1, 50 y 500
+
+Uso (desde backend/, con el esquema de supabase/base_datos_supabase.sql cargado):
+    DIAGNOVET_BACKEND_DATOS=postgres DATABASE_URL=postgresql://... \\
+        python benchmarks/ingesta_lote.py --reportes 2000
+
+Corre en un directorio temporal para no tocar reportes.json ni el índice local,
+y borra de la base los reportes que inserta.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from configuracion.database import inicializar_base_datos, cerrar_base_datos, obtener_pool_postgres, usa_postgres_directo
+from modelos.reporte_modelo import ReporteModelo
+from servicios.reportes_servicio import ReportesServicio
+
+TAMANOS_LOTE = [1, 50, 500]
+
+
+def crear_reporte_sintetico(numero: int) -> ReporteModelo:
+    """Reporte con el tamaño típico de un estudio procesado (sin imágenes en base64)"""
+    return ReporteModelo.crear_desde_datos({
+        "tipo_estudio": ["radiografia", "ecografia", "ecocardiografia"][numero % 3],
+        "paciente": {"nombre": f"Paciente {numero}", "especie": ["canino", "felino"][numero % 2], "raza": "Mestizo"},
+        "tutor": {"nombre": f"Tutor {numero}", "telefono": None, "email": None},
+        "veterinario": {"nombre": "Dr. Benchmark", "clinica": "Clínica de Prueba"},
+        "diagnostico": {
+            "principal": "Cardiomegalia leve",
+            "secundarios": ["Soplo sistólico"],
+            "recomendaciones": ["Control en 6 meses"],
+            "observaciones": "Sin otros hallazgos"
+        },
+        "imagenes": [{
+            "tipo": "radiografia",
+            "descripcion": "Radiografía lateral de tórax",
+            "hallazgos": "Silueta cardíaca aumentada",
+            "ubicacion": "tórax",
+            "url": "placeholder_radiografia.jpg"
+        }],
+        "contenido_extraido": "Se realiza estudio radiológico de tórax. " * 40,
+        "confianza_extraccion": 0.9
+    }, f"benchmark_{numero}.pdf")
+
+
+async def medir(servicio: ReportesServicio, cantidad: int, tamano_lote: int) -> float:
+    """Ingiere 'cantidad' reportes en lotes de 'tamano_lote' y devuelve reportes/segundo"""
+    reportes = [crear_reporte_sintetico(i) for i in range(cantidad)]
+    inicio = time.perf_counter()
+    for desde in range(0, cantidad, tamano_lote):
+        resultado = await servicio.guardar_reportes_lote(reportes[desde:desde + tamano_lote])
+        if resultado["datos"]["fallidos"]:
+            raise RuntimeError(f"Fallaron {resultado['datos']['fallidos']} reportes")
+    return cantidad / (time.perf_counter() - inicio)
+
+
+async def limpiar():
+    """Elimina los reportes del benchmark (las filas hijas caen en cascada)"""
+    pool = obtener_pool_postgres()
+    async with pool.acquire() as conexion:
+        await conexion.execute("DELETE FROM reporte WHERE origen_archivo LIKE 'benchmark_%'")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reportes", type=int, default=2000, help="Reportes a ingerir por cada tamaño de lote")
+    args = parser.parse_args()
+
+    if not usa_postgres_directo():
+        print("Este benchmark requiere DIAGNOVET_BACKEND_DATOS=postgres y DATABASE_URL")
+        return
+
+    await inicializar_base_datos()
+    try:
+        print(f"{'lote':>6} | {'reportes/s':>12}")
+        for tamano_lote in TAMANOS_LOTE:
+            # Cada medición arranca con almacenamiento local vacío
+            with tempfile.TemporaryDirectory() as directorio:
+                os.chdir(directorio)
+                servicio = ReportesServicio()
+                velocidad = await medir(servicio, args.reportes, tamano_lote)
+                print(f"{tamano_lote:>6} | {velocidad:>12.1f}")
+            await limpiar()
+    finally:
+        await cerrar_base_datos()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
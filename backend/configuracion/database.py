@@ -1,14 +1,17 @@
 """
 Configuración de base de datos
-Maneja la conexión y configuración de Supabase
+Maneja la conexión y configuración de Supabase y del Postgres directo opcional
 """
 
 import os
 from supabase import create_client, Client
 from typing import Optional
+import json
 import logging
 from dotenv import load_dotenv
 
+from utilidades.circuitos import obtener_circuito
+
 # Cargar variables de entorno
 load_dotenv()
 
@@ -18,9 +21,56 @@ logger = logging.getLogger(__name__)
 SUPABASE_URL = os.getenv("SUPABASE_URL", "")
 SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY", "")
 
+# Backend de datos: 'supabase' (PostgREST) o 'postgres' (conexión directa con asyncpg)
+BACKEND_DATOS = os.getenv("DIAGNOVET_BACKEND_DATOS", "supabase").strip().lower()
+
+# Configuración de Postgres directo
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+POSTGRES_POOL_MIN = int(os.getenv("POSTGRES_POOL_MIN", "2"))
+POSTGRES_POOL_MAX = int(os.getenv("POSTGRES_POOL_MAX", "10"))
+
 # Cliente de Supabase
 supabase_client: Optional[Client] = None
 
+# Pool de conexiones de Postgres directo
+pool_postgres = None
+
+# Clases de SQLSTATE de errores del request, no de la base: datos inválidos (22),
+# restricciones (23) y sintaxis o acceso, ej: columna inexistente (42)
+CLASES_SQLSTATE_CLIENTE = ('22', '23', '42')
+
+def _es_fallo_bd(excepcion: Exception) -> bool:
+    """
+    Indica si un error cuenta como caída de la base para el circuit breaker
+    
+    Solo cuentan los errores de conexión, timeouts y 5xx. Los errores con los que la
+    base respondió a un request inválido (SQLSTATE 22/23/42, códigos PGRST de
+    PostgREST salvo los de conexión PGRST0xx) no indican que esté caída.
+    """
+    try:
+        from postgrest.exceptions import APIError
+    except ImportError:
+        APIError = None
+    if APIError is not None and isinstance(excepcion, APIError):
+        codigo = str(excepcion.code or '')
+        if codigo.startswith('PGRST'):
+            return codigo.startswith('PGRST0')
+        return codigo[:2] not in CLASES_SQLSTATE_CLIENTE
+    
+    try:
+        import asyncpg
+    except ImportError:
+        return True
+    return not isinstance(excepcion, (
+        asyncpg.exceptions.DataError,
+        asyncpg.exceptions.IntegrityConstraintViolationError,
+        asyncpg.exceptions.SyntaxOrAccessError
+    ))
+
+# Circuit breaker del backend de datos: con la base caída los requests usan
+# su fallback local al instante en vez de esperar el timeout de la conexión
+circuito_bd = obtener_circuito(BACKEND_DATOS, es_fallo=_es_fallo_bd)
+
 def obtener_cliente_supabase() -> Client:
     """
     Obtiene el cliente de Supabase
@@ -39,22 +89,88 @@ def obtener_cliente_supabase() -> Client:
     
     return supabase_client
 
+def usa_postgres_directo() -> bool:
+    """
+    Indica si el backend de datos configurado es Postgres directo
+    
+    Returns:
+        True si DIAGNOVET_BACKEND_DATOS es 'postgres'
+    """
+    return BACKEND_DATOS == "postgres"
+
+async def _inicializar_conexion_postgres(conexion):
+    """
+    Configura los codecs JSON en una conexión nueva
+    
+    Los statements no se preparan de antemano: la caché de statements de asyncpg
+    de cada conexión se llena en la primera ejecución de cada SQL y las siguientes
+    lo reutilizan.
+    """
+    for tipo in ('json', 'jsonb'):
+        await conexion.set_type_codec(
+            tipo,
+            encoder=json.dumps,
+            decoder=json.loads,
+            schema='pg_catalog'
+        )
+
 async def inicializar_base_datos():
     """
     Inicializa la base de datos y crea las tablas necesarias
     """
+    global pool_postgres
+    
     try:
         logger.info("Inicializando base de datos...")
         
         # En un entorno real, aquí se ejecutarían los scripts SQL
         # para crear las tablas y configurar las políticas RLS
         
+        if usa_postgres_directo() and pool_postgres is None:
+            if not DATABASE_URL:
+                raise ValueError("DATABASE_URL no configurada para el backend Postgres")
+            
+            import asyncpg
+            
+            pool_postgres = await asyncpg.create_pool(
+                dsn=DATABASE_URL,
+                min_size=POSTGRES_POOL_MIN,
+                max_size=POSTGRES_POOL_MAX,
+                init=_inicializar_conexion_postgres
+            )
+            logger.info(
+                f"Pool de Postgres inicializado ({POSTGRES_POOL_MIN}-{POSTGRES_POOL_MAX} conexiones)"
+            )
+        
         logger.info("Base de datos inicializada correctamente")
         
     except Exception as e:
         logger.error(f"Error al inicializar base de datos: {str(e)}")
         raise
 
+async def cerrar_base_datos():
+    """
+    Cierra las conexiones abiertas con la base de datos
+    """
+    global pool_postgres
+    
+    if pool_postgres is not None:
+        await pool_postgres.close()
+        pool_postgres = None
+        logger.info("Pool de Postgres cerrado")
+
+def obtener_pool_postgres():
+    """
+    Obtiene el pool de conexiones de Postgres directo
+    
+    Returns:
+        Pool de asyncpg inicializado en el arranque
+    """
+    if pool_postgres is None:
+        raise RuntimeError("Pool de Postgres no inicializado")
+    
+    return pool_postgres
+
 def obtener_conexion_bd():
     """
     Obtiene una conexión a la base de datos
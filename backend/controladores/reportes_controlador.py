@@ -5,18 +5,47 @@ Implementa la lógica de negocio para el manejo de reportes
 
 from typing import Dict, List, Optional, Any
 from fastapi import UploadFile
+import asyncio
+import hashlib
 import logging
-from datetime import datetime
+import uuid
+from datetime import date, datetime, timedelta
 
-from servicios.procesador_pdf_servicio import ProcesadorPDFServicio
+from servicios.procesador_pdf_servicio import ProcesadorPDFServicio, CLINICA_POR_DEFECTO
 from servicios.reportes_servicio import ReportesServicio
+from servicios.estadisticas_servicio import GRANULARIDADES, DIMENSIONES
+from servicios.cambios_servicio import token_valido
 from servicios.google_drive_servicio import GoogleDriveServicio
 from servicios.archivos_servicio import ArchivosServicio
 from modelos.reporte_modelo import ReporteModelo
 from utilidades.validadores import ValidadorReporte
+from utilidades.eventos import bus_eventos, flujo_sse, TIPOS_EVENTO, POLITICAS_DESCARTE
+from utilidades.circuitos import obtener_circuito, es_fallo_http
+from utilidades.metricas import metricas
 
 logger = logging.getLogger(__name__)
 
+# Tope de reportes por request de importación
+MAXIMO_REPORTES_IMPORTACION = 5000
+
+# IDs máximos por llamada a POST /api/reportes/lote
+MAXIMO_IDS_MULTIGET = 200
+
+# Cambios máximos por llamada a GET /api/reportes/cambios
+MAXIMO_CAMBIOS = 1000
+
+# Eventos que se pueden acumular por cliente de /api/eventos/stream
+MAXIMA_CAPACIDAD_EVENTOS = 1000
+
+# Rango máximo de /api/estadisticas/serie (unos 5 años de buckets diarios)
+MAXIMO_DIAS_SERIE = 1830
+
+# Bytes leídos por vez al calcular la huella de un archivo subido
+TAMANO_BLOQUE_HUELLA = 1024 * 1024
+
+# Webhook de n8n: con el circuito abierto el envío se saltea sin esperar el timeout
+circuito_n8n = obtener_circuito('n8n', es_fallo=es_fallo_http)
+
 class ReportesControlador:
     """Controlador para manejo de reportes veterinarios"""
     
@@ -26,19 +55,124 @@ class ReportesControlador:
         self.google_drive = GoogleDriveServicio()
         self.archivos = ArchivosServicio()
         self.validador = ValidadorReporte()
+        # Huella del archivo -> resultado del procesamiento en curso (para unirse en lugar de repetirlo)
+        self.procesamientos_en_curso: Dict[str, asyncio.Future] = {}
     
-    async def procesar_reporte(self, archivo: UploadFile) -> Dict[str, Any]:
+    async def procesar_reporte(
+        self,
+        archivo: UploadFile,
+        forzar: bool = False,
+        clinica: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
         Procesa un archivo PDF y extrae información estructurada
         
+        Un archivo ya procesado (misma huella SHA-256) devuelve el reporte
+        existente, y uno que se está procesando en este momento espera ese
+        mismo procesamiento; en ambos casos sin volver a llamar a Gemini,
+        Google Drive ni n8n.
+        
         Args:
             archivo: Archivo PDF a procesar
+            forzar: Procesar de nuevo aunque el archivo ya se haya procesado
+            clinica: Clínica que sube el archivo (reparto de la cuota de Gemini)
             
         Returns:
             Dict con el resultado del procesamiento
         """
+        huella = await self._calcular_huella(archivo)
+        if forzar:
+            return await self._procesar_archivo(archivo, huella, clinica)
+        
+        en_curso = self.procesamientos_en_curso.get(huella)
+        if en_curso:
+            logger.info(f"{archivo.filename} ya se está procesando, se espera ese resultado")
+            metricas.incrementar("procesamiento.unidos")
+            try:
+                resultado = await asyncio.shield(en_curso)
+            except asyncio.CancelledError:
+                if not en_curso.cancelled():
+                    raise
+                return {
+                    "exito": False,
+                    "error": "Procesamiento interrumpido",
+                    "mensaje": "El procesamiento del mismo archivo se interrumpió, intente nuevamente"
+                }
+            return self._marcar_duplicado(resultado)
+        
+        # Se registra antes del primer await: otra subida del mismo archivo ya lo ve en curso
+        futuro = asyncio.get_running_loop().create_future()
+        self.procesamientos_en_curso[huella] = futuro
+        try:
+            existente = await self._buscar_reporte_procesado(huella)
+            if existente:
+                logger.info(f"{archivo.filename} ya fue procesado: reporte {existente['id']}")
+                metricas.incrementar("procesamiento.duplicados")
+                resultado = self._marcar_duplicado({
+                    "exito": True,
+                    "datos": self._datos_respuesta_procesamiento(existente),
+                    "mensaje": "El archivo ya fue procesado: se devuelve el reporte existente"
+                })
+            else:
+                resultado = await self._procesar_archivo(archivo, huella, clinica)
+            futuro.set_result(resultado)
+            return resultado
+        finally:
+            del self.procesamientos_en_curso[huella]
+            if not futuro.done():
+                futuro.cancel()
+    
+    async def _calcular_huella(self, archivo: UploadFile) -> str:
+        """SHA-256 del archivo subido, leído por bloques; lo deja posicionado al inicio"""
+        huella = hashlib.sha256()
+        await archivo.seek(0)
+        while True:
+            bloque = await archivo.read(TAMANO_BLOQUE_HUELLA)
+            if not bloque:
+                break
+            huella.update(bloque)
+        await archivo.seek(0)
+        return huella.hexdigest()
+    
+    async def _buscar_reporte_procesado(self, huella: str) -> Optional[Dict[str, Any]]:
+        """Reporte ya generado a partir del archivo (None si no hay o no se pudo consultar)"""
+        try:
+            return await self.servicio_reportes.buscar_reporte_por_huella(huella)
+        except Exception as e:
+            # Sin la consulta no se sabe si es repetido: se procesa igual
+            logger.warning(f"No se pudo buscar el archivo entre los procesados: {str(e)}")
+            return None
+    
+    def _datos_respuesta_procesamiento(self, reporte: Dict[str, Any]) -> Dict[str, Any]:
+        """Datos que devuelve /api/reportes/procesar para un reporte ya guardado"""
+        return {
+            "id": reporte.get("id"),
+            "tipo_estudio": reporte.get("tipo_estudio"),
+            "paciente": reporte.get("paciente"),
+            "veterinario": reporte.get("veterinario"),
+            "diagnostico": reporte.get("diagnostico"),
+            "archivo_original": reporte.get("archivo_original"),
+            "url_google_drive": reporte.get("url_google_drive"),
+            "id_google_drive": reporte.get("id_google_drive")
+        }
+    
+    def _marcar_duplicado(self, resultado: Dict[str, Any]) -> Dict[str, Any]:
+        """Copia de un resultado exitoso marcada como proveniente de un procesamiento anterior"""
+        if not resultado.get("exito"):
+            return resultado
+        return {**resultado, "datos": {**resultado["datos"], "duplicado": True}}
+    
+    async def _procesar_archivo(
+        self,
+        archivo: UploadFile,
+        huella: str,
+        clinica: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Procesa un archivo de punta a punta: Gemini, Google Drive, n8n y base de datos"""
+        procesamiento_id = str(uuid.uuid4())
         try:
             logger.info(f"Iniciando procesamiento de archivo: {archivo.filename}")
+            self._publicar_etapa(procesamiento_id, archivo.filename, "recibido")
             
             # Validar archivo
             if not self.validador.validar_archivo(archivo):
@@ -53,13 +187,16 @@ class ReportesControlador:
             
             # Procesar PDF con Gemini (con fallback)
             logger.info("Iniciando procesamiento de PDF con Gemini...")
+            self._publicar_etapa(procesamiento_id, archivo.filename, "extrayendo")
+            datos_de_ejemplo = False
             try:
-                resultado_procesamiento = await self.procesador_pdf.procesar_pdf(archivo)
+                resultado_procesamiento = await self.procesador_pdf.procesar_pdf(archivo, clinica or CLINICA_POR_DEFECTO)
                 logger.info(f"Resultado del procesamiento: {resultado_procesamiento}")
                 
                 if not resultado_procesamiento["exito"]:
                     logger.warning(f"Error en procesamiento con Gemini: {resultado_procesamiento['error']}")
                     logger.info("Usando datos de ejemplo para continuar...")
+                    datos_de_ejemplo = True
                     
                     # Crear datos de ejemplo para continuar
                     resultado_procesamiento = {
@@ -109,16 +246,19 @@ class ReportesControlador:
                     }
             except Exception as e:
                 logger.error(f"Error crítico en procesamiento: {str(e)}")
+                self._publicar_etapa(procesamiento_id, archivo.filename, "error")
                 return {
                     "exito": False,
                     "error": "Error crítico en procesamiento",
                     "mensaje": f"Error crítico: {str(e)}"
                 }
             
-            # Crear modelo de reporte
+            # Crear modelo de reporte. Los datos de ejemplo no guardan la huella:
+            # el mismo PDF se vuelve a procesar en lugar de devolver el ejemplo como duplicado
             reporte = ReporteModelo.crear_desde_datos(
                 resultado_procesamiento["datos"],
-                archivo.filename
+                archivo.filename,
+                huella_contenido=None if datos_de_ejemplo else huella
             )
             
             # Debug: Mostrar datos del reporte
@@ -129,6 +269,7 @@ class ReportesControlador:
             
             # Subir PDF original usando método garantizado
             logger.info("🚀 SUBIENDO PDF ORIGINAL CON MÉTODO GARANTIZADO...")
+            self._publicar_etapa(procesamiento_id, archivo.filename, "subiendo", reporte.id)
             resultado_google_drive = await self._subir_pdf_original_garantizado(archivo)
             
             # Actualizar reporte con URL de Google Drive si fue exitoso
@@ -147,6 +288,7 @@ class ReportesControlador:
                 logger.error(f"❌ Error al subir a Google Drive: {resultado_google_drive['error']}")
             
             # Guardar en base de datos
+            self._publicar_etapa(procesamiento_id, archivo.filename, "guardando", reporte.id)
             resultado_guardado = await self.servicio_reportes.guardar_reporte(reporte)
             
             if not resultado_guardado["exito"]:
@@ -154,6 +296,7 @@ class ReportesControlador:
                 # Continuar aunque falle el guardado
             
             logger.info(f"Reporte procesado exitosamente: {reporte.id}")
+            self._publicar_etapa(procesamiento_id, archivo.filename, "completado", reporte.id)
             
             # Preparar respuesta
             datos_respuesta = {
@@ -178,6 +321,7 @@ class ReportesControlador:
             }
         except Exception as e:
             logger.error(f"Error al procesar reporte: {str(e)}")
+            self._publicar_etapa(procesamiento_id, archivo.filename, "error")
             import traceback
             logger.error(f"Traceback completo: {traceback.format_exc()}")
             return {
@@ -186,33 +330,170 @@ class ReportesControlador:
                 "mensaje": f"Error detallado: {str(e)}"
             }
     
+    def _publicar_etapa(
+        self,
+        procesamiento_id: str,
+        archivo: str,
+        etapa: str,
+        reporte_id: Optional[str] = None
+    ):
+        """Avisa a los clientes conectados del avance de un procesamiento"""
+        bus_eventos.publicar("procesamiento.etapa", {
+            "procesamiento_id": procesamiento_id,
+            "archivo": archivo,
+            "etapa": etapa,
+            "reporte_id": reporte_id
+        })
+    
+    async def importar_reportes(self, lote: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Importa muchos reportes ya procesados (backfill de estudios históricos)
+        
+        Args:
+            lote: Dict con la lista 'reportes'; cada elemento tiene el mismo formato
+                que devuelve el procesamiento del PDF más 'archivo_original' y,
+                opcionalmente, 'id', 'fecha_creacion' y 'estado'
+            
+        Returns:
+            Dict con el estado de cada reporte en el orden recibido
+        """
+        try:
+            items = lote.get("reportes") if isinstance(lote, dict) else None
+            if not isinstance(items, list) or not items:
+                return {
+                    "exito": False,
+                    "error": "Datos inválidos",
+                    "mensaje": "Se debe enviar una lista no vacía en 'reportes'"
+                }
+            
+            if len(items) > MAXIMO_REPORTES_IMPORTACION:
+                return {
+                    "exito": False,
+                    "error": "Lote demasiado grande",
+                    "mensaje": f"Se permiten hasta {MAXIMO_REPORTES_IMPORTACION} reportes por importación"
+                }
+            
+            logger.info(f"Importando lote de {len(items)} reportes")
+            
+            reportes_validos = []
+            posiciones_validas = []
+            resultados: List[Optional[Dict[str, Any]]] = [None] * len(items)
+            for posicion, item in enumerate(items):
+                try:
+                    reportes_validos.append(self._crear_reporte_importado(item))
+                    posiciones_validas.append(posicion)
+                except ValueError as e:
+                    resultados[posicion] = {"id": None, "exito": False, "error": str(e)}
+            
+            resultado_lote = await self.servicio_reportes.guardar_reportes_lote(reportes_validos)
+            for posicion, resultado in zip(posiciones_validas, resultado_lote["datos"]["resultados"]):
+                resultados[posicion] = resultado
+            
+            guardados = resultado_lote["datos"]["guardados"]
+            return {
+                "exito": guardados == len(items),
+                "datos": {
+                    "total": len(items),
+                    "guardados": guardados,
+                    "fallidos": len(items) - guardados,
+                    "resultados": resultados
+                },
+                "mensaje": f"Se importaron {guardados} de {len(items)} reportes"
+            }
+            
+        except Exception as e:
+            logger.error(f"Error al importar reportes: {str(e)}")
+            return {
+                "exito": False,
+                "error": "Error interno",
+                "mensaje": f"Ha ocurrido un error inesperado: {str(e)}"
+            }
+    
+    async def obtener_reportes_por_ids(self, solicitud: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Obtiene varios reportes por ID en una sola llamada
+        
+        Args:
+            solicitud: Dict con la lista 'ids'
+            
+        Returns:
+            Dict con un resultado por ID en el orden recibido; los que no
+            existen vienen con 'encontrado': False
+        """
+        try:
+            ids = solicitud.get("ids") if isinstance(solicitud, dict) else None
+            if not isinstance(ids, list) or not ids or not all(isinstance(i, str) and i for i in ids):
+                return {
+                    "exito": False,
+                    "error": "Datos inválidos",
+                    "mensaje": "Se debe enviar una lista no vacía de IDs en 'ids'"
+                }
+            
+            if len(ids) > MAXIMO_IDS_MULTIGET:
+                return {
+                    "exito": False,
+                    "error": "Demasiados IDs",
+                    "mensaje": f"Se permiten hasta {MAXIMO_IDS_MULTIGET} IDs por llamada"
+                }
+            
+            return await self.servicio_reportes.obtener_reportes_por_ids(ids)
+            
+        except Exception as e:
+            logger.error(f"Error al obtener reportes por ID: {str(e)}")
+            return {
+                "exito": False,
+                "error": "Error interno",
+                "mensaje": "Ha ocurrido un error inesperado"
+            }
+    
+    def _crear_reporte_importado(self, item: Any) -> ReporteModelo:
+        """Crea el modelo de un reporte importado; lanza ValueError si el item no es válido"""
+        if not isinstance(item, dict):
+            raise ValueError("Cada reporte debe ser un objeto JSON")
+        if not item.get("archivo_original"):
+            raise ValueError("Falta 'archivo_original'")
+        
+        reporte = ReporteModelo.crear_desde_datos(item, item["archivo_original"])
+        
+        # Los estudios históricos conservan su identidad y fecha originales
+        if item.get("id"):
+            if not self.validador.validar_id(item["id"]):
+                raise ValueError(f"ID inválido: {item['id']}")
+            reporte.id = item["id"]
+        if item.get("fecha_creacion"):
+            try:
+                reporte.fecha_creacion = datetime.fromisoformat(item["fecha_creacion"])
+            except (TypeError, ValueError):
+                raise ValueError(f"Fecha inválida: {item['fecha_creacion']}")
+        reporte.estado = item.get("estado", "completado")
+        reporte.url_google_drive = item.get("url_google_drive")
+        reporte.id_google_drive = item.get("id_google_drive")
+        return reporte
+    
     async def obtener_veterinarios(self) -> Dict[str, Any]:
-        """Obtiene la lista de veterinarios desde Supabase"""
+        """Obtiene la lista de veterinarios desde la base de datos"""
         try:
-            # Intentar conectar a Supabase
             try:
-                supabase = self.servicio_reportes.obtener_conexion_bd()
+                # Con el circuito abierto se pasa directo a los datos de ejemplo
+                veterinarios = await self.servicio_reportes.consultar_veterinarios_bd()
                 
-                # Obtener veterinarios desde la base de datos
-                resultado = supabase.table('veterinarios').select('*').eq('activo', True).execute()
-                
-                if resultado.data:
+                if veterinarios:
                     return {
                         "exito": True,
-                        "datos": resultado.data,
-                        "mensaje": "Veterinarios obtenidos exitosamente desde Supabase"
+                        "datos": veterinarios,
+                        "mensaje": "Veterinarios obtenidos exitosamente desde la base de datos"
                     }
                 else:
                     return {
                         "exito": True,
                         "datos": [],
-                        "mensaje": "No se encontraron veterinarios en Supabase"
+                        "mensaje": "No se encontraron veterinarios en la base de datos"
                     }
-            except Exception as supabase_error:
-                logger.warning(f"Error al conectar con Supabase: {str(supabase_error)}")
+            except Exception as bd_error:
+                logger.warning(f"Error al consultar veterinarios en la base de datos: {str(bd_error)}")
                 logger.info("Usando datos de ejemplo para veterinarios")
                 
-                # Datos de ejemplo si Supabase no está configurado
+                # Datos de ejemplo si la base de datos no está disponible
                 veterinarios = [
                     {
                         "id": "1",
@@ -320,9 +601,11 @@ class ReportesControlador:
         """Crea un nuevo turno"""
         try:
             # Implementar inserción en Supabase
+            datos_turno = {"id": "turno_123", "estado": "programado"}
+            bus_eventos.publicar("turno.creado", {**turno, **datos_turno})
             return {
                 "exito": True,
-                "datos": {"id": "turno_123", "estado": "programado"},
+                "datos": datos_turno,
                 "mensaje": "Turno creado exitosamente"
             }
         except Exception as e:
@@ -353,12 +636,14 @@ class ReportesControlador:
     async def obtener_imagenes_por_reporte(self, reporte_id: str) -> Dict[str, Any]:
         """Obtiene las imágenes de un reporte específico"""
         try:
-            # Implementar consulta a Supabase
-            return {
-                "exito": True,
-                "datos": [],
-                "mensaje": "Imágenes obtenidas exitosamente"
-            }
+            if not self.validador.validar_id(reporte_id):
+                return {
+                    "exito": False,
+                    "error": "ID inválido",
+                    "mensaje": "El ID del reporte no es válido"
+                }
+            
+            return await self.servicio_reportes.obtener_imagenes_por_reporte(reporte_id)
         except Exception as e:
             logger.error(f"Error al obtener imágenes: {str(e)}")
             return {
@@ -370,12 +655,14 @@ class ReportesControlador:
     async def obtener_diagnostico_por_reporte(self, reporte_id: str) -> Dict[str, Any]:
         """Obtiene el diagnóstico de un reporte específico"""
         try:
-            # Implementar consulta a Supabase
-            return {
-                "exito": True,
-                "datos": {"principal": "Diagnóstico de ejemplo"},
-                "mensaje": "Diagnóstico obtenido exitosamente"
-            }
+            if not self.validador.validar_id(reporte_id):
+                return {
+                    "exito": False,
+                    "error": "ID inválido",
+                    "mensaje": "El ID del reporte no es válido"
+                }
+            
+            return await self.servicio_reportes.obtener_diagnostico_por_reporte(reporte_id)
         except Exception as e:
             logger.error(f"Error al obtener diagnóstico: {str(e)}")
             return {
@@ -387,18 +674,7 @@ class ReportesControlador:
     async def obtener_estadisticas(self) -> Dict[str, Any]:
         """Obtiene estadísticas del sistema"""
         try:
-            # Implementar consulta a Supabase usando la vista vista_estadisticas_sistema
-            return {
-                "exito": True,
-                "datos": {
-                    "total_reportes": 0,
-                    "reportes_completados": 0,
-                    "total_pacientes": 0,
-                    "veterinarios_activos": 0,
-                    "turnos_pendientes": 0
-                },
-                "mensaje": "Estadísticas obtenidas exitosamente"
-            }
+            return await self.servicio_reportes.obtener_estadisticas()
         except Exception as e:
             logger.error(f"Error al obtener estadísticas: {str(e)}")
             return {
@@ -407,6 +683,192 @@ class ReportesControlador:
                 "mensaje": "Error al obtener estadísticas"
             }
     
+    async def obtener_facetas(self, filtros: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Obtiene los conteos por faceta para el panel de filtros
+        
+        Args:
+            filtros: tipo_estudio, especie, veterinario y estado elegidos
+            
+        Returns:
+            Dict con el total filtrado y los conteos de cada faceta
+        """
+        try:
+            return await self.servicio_reportes.obtener_facetas(filtros)
+        except Exception as e:
+            logger.error(f"Error al obtener facetas: {str(e)}")
+            return {
+                "exito": False,
+                "error": str(e),
+                "mensaje": "Error al obtener facetas"
+            }
+    
+    def suscribir_eventos(
+        self,
+        tipos: Optional[str] = None,
+        politica: str = "descartar_antiguos",
+        capacidad: int = 100,
+        ultimo_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Abre un canal de Server-Sent Events con los eventos de la aplicación
+        
+        Args:
+            tipos: Tipos de evento separados por coma (todos si se omite)
+            politica: Qué hacer si el cliente no lee a tiempo (ver POLITICAS_DESCARTE)
+            capacidad: Eventos que se acumulan para el cliente antes de aplicar la política
+            ultimo_id: Último evento recibido (Last-Event-ID) al reconectarse
+            
+        Returns:
+            Dict con el generador del flujo SSE
+        """
+        lista_tipos = [t.strip() for t in tipos.split(',') if t.strip()] if tipos else None
+        invalidos = [t for t in lista_tipos or [] if t not in TIPOS_EVENTO]
+        if invalidos:
+            return {
+                "exito": False,
+                "error": "Tipos de evento inválidos",
+                "mensaje": f"Tipos no soportados: {', '.join(invalidos)}. Válidos: {', '.join(TIPOS_EVENTO)}"
+            }
+        if politica not in POLITICAS_DESCARTE:
+            return {
+                "exito": False,
+                "error": "Política inválida",
+                "mensaje": f"Políticas soportadas: {', '.join(POLITICAS_DESCARTE)}"
+            }
+        if capacidad < 1 or capacidad > MAXIMA_CAPACIDAD_EVENTOS:
+            return {
+                "exito": False,
+                "error": "Capacidad inválida",
+                "mensaje": f"La capacidad debe estar entre 1 y {MAXIMA_CAPACIDAD_EVENTOS}"
+            }
+        
+        suscripcion = bus_eventos.suscribir(
+            lista_tipos, capacidad, politica,
+            int(ultimo_id) if ultimo_id and ultimo_id.isdigit() else None
+        )
+        return {
+            "exito": True,
+            "datos": {"contenido": flujo_sse(suscripcion)},
+            "mensaje": "Suscripción abierta"
+        }
+    
+    async def obtener_cambios(self, desde: Optional[str] = None, limite: int = 500) -> Dict[str, Any]:
+        """
+        Obtiene los reportes que cambiaron desde un token (sincronización incremental)
+        
+        Args:
+            desde: Token de la consulta anterior; sin token se devuelve el actual
+            limite: Cantidad máxima de cambios
+            
+        Returns:
+            Dict con el token siguiente y los cambios
+        """
+        try:
+            if desde is not None and not token_valido(desde):
+                return {
+                    "exito": False,
+                    "error": "Token inválido",
+                    "mensaje": "El parámetro 'desde' debe ser un token devuelto por este endpoint"
+                }
+            if limite < 1 or limite > MAXIMO_CAMBIOS:
+                return {
+                    "exito": False,
+                    "error": "Límite inválido",
+                    "mensaje": f"El límite debe estar entre 1 y {MAXIMO_CAMBIOS}"
+                }
+            return await self.servicio_reportes.obtener_cambios(desde, limite)
+        except Exception as e:
+            logger.error(f"Error al obtener cambios de reportes: {str(e)}")
+            return {
+                "exito": False,
+                "error": str(e),
+                "mensaje": "Error al obtener cambios de reportes"
+            }
+    
+    async def exportar_reportes(self, formato: str, filtros: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Prepara la descarga completa de reportes en NDJSON, CSV o Parquet
+        
+        Args:
+            formato: 'ndjson', 'csv' o 'parquet'
+            filtros: tipo_estudio, especie, veterinario, paciente y tutor
+            
+        Returns:
+            Dict con el generador del contenido, su tipo y el nombre de archivo
+        """
+        try:
+            return self.servicio_reportes.exportar_reportes((formato or '').strip().lower(), filtros)
+        except Exception as e:
+            logger.error(f"Error al exportar reportes: {str(e)}")
+            return {
+                "exito": False,
+                "error": str(e),
+                "mensaje": "Error al exportar reportes"
+            }
+    
+    async def obtener_serie_estadisticas(
+        self,
+        desde: Optional[str] = None,
+        hasta: Optional[str] = None,
+        agrupar_por: str = "dia",
+        dimension: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Obtiene la serie temporal de reportes para los gráficos del dashboard
+        
+        Args:
+            desde: Primer día (YYYY-MM-DD); por defecto, 30 días antes de 'hasta'
+            hasta: Último día (YYYY-MM-DD); por defecto, hoy
+            agrupar_por: 'dia', 'semana' o 'mes'
+            dimension: 'tipo_estudio', 'especie', 'veterinario' o vacío para una sola serie
+            
+        Returns:
+            Dict con los períodos y las series
+        """
+        try:
+            try:
+                fecha_hasta = date.fromisoformat(hasta) if hasta else date.today()
+                fecha_desde = date.fromisoformat(desde) if desde else fecha_hasta - timedelta(days=30)
+            except ValueError:
+                return {
+                    "exito": False,
+                    "error": "Fecha inválida",
+                    "mensaje": "Las fechas deben tener formato YYYY-MM-DD"
+                }
+            
+            if fecha_desde > fecha_hasta or (fecha_hasta - fecha_desde).days > MAXIMO_DIAS_SERIE:
+                return {
+                    "exito": False,
+                    "error": "Rango inválido",
+                    "mensaje": f"'desde' debe ser anterior a 'hasta' y el rango no puede superar {MAXIMO_DIAS_SERIE} días"
+                }
+            
+            if agrupar_por not in GRANULARIDADES:
+                return {
+                    "exito": False,
+                    "error": "Agrupación inválida",
+                    "mensaje": f"agrupar_por debe ser uno de: {', '.join(GRANULARIDADES)}"
+                }
+            
+            if dimension and dimension not in DIMENSIONES:
+                return {
+                    "exito": False,
+                    "error": "Dimensión inválida",
+                    "mensaje": f"dimension debe ser uno de: {', '.join(DIMENSIONES)}"
+                }
+            
+            return await self.servicio_reportes.obtener_serie_estadisticas(
+                fecha_desde, fecha_hasta, agrupar_por, dimension or None
+            )
+        except Exception as e:
+            logger.error(f"Error al obtener serie de estadísticas: {str(e)}")
+            return {
+                "exito": False,
+                "error": str(e),
+                "mensaje": "Error al obtener serie de estadísticas"
+            }
+    
     async def obtener_reportes(
         self, 
         filtros: Dict[str, Any], 
@@ -521,11 +983,8 @@ class ReportesControlador:
             )
             
             if not resultado["exito"]:
-                return {
-                    "exito": False,
-                    "error": "Error al actualizar reporte",
-                    "mensaje": resultado["error"]
-                }
+                # Incluye la versión actual cuando hay conflicto de concurrencia
+                return resultado
             
             return {
                 "exito": True,
@@ -583,13 +1042,19 @@ class ReportesControlador:
                 "mensaje": "Ha ocurrido un error inesperado"
             }
     
-    async def buscar_reportes(self, termino: str, limite: int = 10) -> Dict[str, Any]:
+    async def buscar_reportes(
+        self, 
+        termino: str, 
+        limite: int = 10, 
+        desplazamiento: int = 0
+    ) -> Dict[str, Any]:
         """
         Busca reportes por término
         
         Args:
             termino: Término de búsqueda
             limite: Cantidad máxima de resultados
+            desplazamiento: Cantidad de resultados a saltear
             
         Returns:
             Dict con los reportes encontrados
@@ -604,7 +1069,11 @@ class ReportesControlador:
                     "mensaje": "El término de búsqueda no es válido"
                 }
             
-            resultado = await self.servicio_reportes.buscar_reportes(termino, limite)
+            resultado = await self.servicio_reportes.buscar_reportes(
+                termino, 
+                limite, 
+                desplazamiento
+            )
             
             if not resultado["exito"]:
                 return {
@@ -613,13 +1082,11 @@ class ReportesControlador:
                     "mensaje": resultado["error"]
                 }
             
-            # Convertir reportes a diccionarios
-            reportes_dict = [reporte.to_dict() for reporte in resultado["datos"]]
-            
             return {
                 "exito": True,
-                "datos": reportes_dict,
-                "mensaje": f"Se encontraron {len(reportes_dict)} reportes"
+                "datos": resultado["datos"],
+                "total": resultado["total"],
+                "mensaje": f"Se encontraron {resultado['total']} reportes"
             }
             
         except Exception as e:
@@ -714,12 +1181,19 @@ class ReportesControlador:
             }
             
             # Enviar a n8n
-            response = requests.post(
-                webhook_url,
-                data=datos_n8n,
-                files=files,
-                timeout=30
-            )
+            try:
+                with circuito_n8n.proteger():
+                    response = requests.post(
+                        webhook_url,
+                        data=datos_n8n,
+                        files=files,
+                        timeout=30
+                    )
+                    # Un 5xx cuenta como fallo del circuito
+                    if response.status_code >= 500:
+                        response.raise_for_status()
+            except requests.HTTPError:
+                pass
             
             if response.status_code == 200:
                 logger.info("PDF enviado exitosamente a n8n")
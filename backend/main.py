@@ -3,9 +3,9 @@ Aplicación principal del backend de DiagnoVET
 Implementa Clean Architecture con separación de responsabilidades
 """
 
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import uvicorn
 from typing import List, Optional
 import os
@@ -14,8 +14,10 @@ from dotenv import load_dotenv
 from controladores.reportes_controlador import ReportesControlador
 from controladores.chatbot_controlador import ChatbotControlador
 from controladores.archivos_controlador import ArchivosControlador
-from configuracion.database import inicializar_base_datos
+from configuracion.database import inicializar_base_datos, cerrar_base_datos
 from utilidades.logger import configurar_logger
+from utilidades.metricas import metricas
+from utilidades.circuitos import estado_circuitos
 
 # Cargar variables de entorno
 load_dotenv()
@@ -69,12 +71,15 @@ async def startup_event():
     """Evento de inicio de la aplicación"""
     logger.info("Iniciando aplicación DiagnoVET...")
     await inicializar_base_datos()
+    await reportes_controlador.servicio_reportes.iniciar()
     logger.info("Aplicación iniciada correctamente")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Evento de cierre de la aplicación"""
     logger.info("Cerrando aplicación DiagnoVET...")
+    await reportes_controlador.servicio_reportes.detener()
+    await cerrar_base_datos()
 
 @app.get("/")
 async def raiz():
@@ -90,34 +95,68 @@ async def verificar_salud():
     """Endpoint para verificar el estado de la API"""
     return {
         "estado": "saludable",
-        "timestamp": "2024-01-01T00:00:00Z"
+        "timestamp": "2024-01-01T00:00:00Z",
+        # Circuitos de las dependencias externas (abierto = dependencia caída)
+        "dependencias": estado_circuitos()
     }
 
 # Rutas de reportes
 @app.post("/api/reportes/procesar")
-async def procesar_reporte(archivo: UploadFile = File(...)):
-    """Procesa un archivo PDF y extrae información estructurada"""
+async def procesar_reporte(
+    archivo: UploadFile = File(...),
+    forzar: bool = False,
+    clinica: Optional[str] = Header(None, alias="X-Clinica")
+):
+    """
+    Procesa un archivo PDF y extrae información estructurada (forzar=true reprocesa un archivo ya subido)
+    
+    El header X-Clinica identifica a la clínica: las llamadas a Gemini se reparten por turnos entre clínicas.
+    """
     try:
-        resultado = await reportes_controlador.procesar_reporte(archivo)
+        resultado = await reportes_controlador.procesar_reporte(archivo, forzar=forzar, clinica=clinica)
         return resultado
     except Exception as e:
         logger.error(f"Error al procesar reporte: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/reportes/importar")
+async def importar_reportes(lote: dict):
+    """Importa muchos reportes ya procesados con inserciones por lotes"""
+    try:
+        resultado = await reportes_controlador.importar_reportes(lote)
+        return resultado
+    except Exception as e:
+        logger.error(f"Error al importar reportes: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/reportes/lote")
+async def obtener_reportes_por_ids(solicitud: dict):
+    """Obtiene varios reportes por ID ({"ids": [...]}) en el orden pedido"""
+    try:
+        resultado = await reportes_controlador.obtener_reportes_por_ids(solicitud)
+        return resultado
+    except Exception as e:
+        logger.error(f"Error al obtener reportes por ID: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/reportes")
 async def obtener_reportes(
     pagina: int = 1,
     limite: int = 10,
     tipo_estudio: Optional[str] = None,
     especie: Optional[str] = None,
-    veterinario: Optional[str] = None
+    veterinario: Optional[str] = None,
+    paciente: Optional[str] = None,
+    tutor: Optional[str] = None
 ):
-    """Obtiene reportes con filtros y paginación"""
+    """Obtiene reportes con filtros y paginación (paciente y tutor filtran por prefijo del nombre)"""
     try:
         filtros = {
             "tipo_estudio": tipo_estudio,
             "especie": especie,
-            "veterinario": veterinario
+            "veterinario": veterinario,
+            "paciente": paciente,
+            "tutor": tutor
         }
         resultado = await reportes_controlador.obtener_reportes(filtros, pagina, limite)
         return resultado
@@ -125,6 +164,79 @@ async def obtener_reportes(
         logger.error(f"Error al obtener reportes: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Declaradas antes de /api/reportes/{reporte_id} para que no queden capturadas por esa ruta
+@app.get("/api/reportes/facetas")
+async def obtener_facetas_reportes(
+    tipo_estudio: Optional[str] = None,
+    especie: Optional[str] = None,
+    veterinario: Optional[str] = None,
+    estado: Optional[str] = None
+):
+    """Obtiene la cantidad de reportes por valor de cada filtro"""
+    try:
+        filtros = {
+            "tipo_estudio": tipo_estudio,
+            "especie": especie,
+            "veterinario": veterinario,
+            "estado": estado
+        }
+        resultado = await reportes_controlador.obtener_facetas(filtros)
+        return resultado
+    except Exception as e:
+        logger.error(f"Error al obtener facetas: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/reportes/cambios")
+async def obtener_cambios_reportes(desde: Optional[str] = None, limite: int = 500):
+    """Obtiene los reportes creados, actualizados o eliminados desde un token de cambios"""
+    try:
+        resultado = await reportes_controlador.obtener_cambios(desde, limite)
+        return resultado
+    except Exception as e:
+        logger.error(f"Error al obtener cambios de reportes: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/reportes/exportar")
+async def exportar_reportes(
+    formato: str = "ndjson",
+    tipo_estudio: Optional[str] = None,
+    especie: Optional[str] = None,
+    veterinario: Optional[str] = None,
+    paciente: Optional[str] = None,
+    tutor: Optional[str] = None
+):
+    """Descarga todos los reportes (con los filtros del listado) como NDJSON, CSV o Parquet"""
+    try:
+        filtros = {
+            "tipo_estudio": tipo_estudio,
+            "especie": especie,
+            "veterinario": veterinario,
+            "paciente": paciente,
+            "tutor": tutor
+        }
+        resultado = await reportes_controlador.exportar_reportes(formato, filtros)
+        if not resultado["exito"]:
+            return resultado
+        datos = resultado["datos"]
+        return StreamingResponse(
+            datos["contenido"],
+            media_type=datos["tipo_contenido"],
+            headers={"Content-Disposition": f'attachment; filename="{datos["nombre_archivo"]}"'}
+        )
+    except Exception as e:
+        logger.error(f"Error al exportar reportes: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/reportes/buscar")
+async def buscar_reportes(termino: str, limite: int = 10, desplazamiento: int = 0):
+    """Busca reportes por término con búsqueda de texto completo"""
+    try:
+        resultado = await reportes_controlador.buscar_reportes(termino, limite, desplazamiento)
+        return resultado
+    except Exception as e:
+        logger.error(f"Error al buscar reportes: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/reportes/{reporte_id}")
 async def obtener_reporte_por_id(reporte_id: str):
     """Obtiene un reporte específico por ID"""
@@ -155,16 +267,6 @@ async def eliminar_reporte(reporte_id: str):
         logger.error(f"Error al eliminar reporte {reporte_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/reportes/buscar")
-async def buscar_reportes(termino: str, limite: int = 10):
-    """Busca reportes por término"""
-    try:
-        resultado = await reportes_controlador.buscar_reportes(termino, limite)
-        return resultado
-    except Exception as e:
-        logger.error(f"Error al buscar reportes: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
-
 # Rutas de veterinarios
 @app.get("/api/veterinarios")
 async def obtener_veterinarios():
@@ -271,6 +373,55 @@ async def obtener_estadisticas():
         logger.error(f"Error al obtener estadísticas: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/estadisticas/serie")
+async def obtener_serie_estadisticas(
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    agrupar_por: str = "dia",
+    dimension: Optional[str] = None
+):
+    """Obtiene la serie temporal de reportes por día, semana o mes"""
+    try:
+        resultado = await reportes_controlador.obtener_serie_estadisticas(desde, hasta, agrupar_por, dimension)
+        return resultado
+    except Exception as e:
+        logger.error(f"Error al obtener serie de estadísticas: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Canal de eventos (Server-Sent Events)
+@app.get("/api/eventos/stream")
+async def stream_eventos(
+    request: Request,
+    tipos: Optional[str] = None,
+    politica: str = "descartar_antiguos",
+    capacidad: int = 100
+):
+    """Canal Server-Sent Events con reportes nuevos, etapas de procesamiento, turnos y variaciones de estadísticas"""
+    try:
+        resultado = reportes_controlador.suscribir_eventos(
+            tipos, politica, capacidad, request.headers.get("last-event-id")
+        )
+        if not resultado["exito"]:
+            return resultado
+        return StreamingResponse(
+            resultado["datos"]["contenido"],
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    except Exception as e:
+        logger.error(f"Error al abrir el canal de eventos: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Métricas internas (caché, latencias, etc.)
+@app.get("/api/metricas")
+async def obtener_metricas():
+    """Obtiene las métricas del proceso"""
+    return {
+        "exito": True,
+        "datos": metricas.instantanea(),
+        "mensaje": "Métricas obtenidas exitosamente"
+    }
+
 # Rutas de chatbot
 @app.post("/api/chatbot/mensaje")
 async def enviar_mensaje_chatbot(mensaje: dict):
@@ -3,7 +3,7 @@ Modelo de reporte veterinario
 Implementa la lógica de negocio para reportes
 """
 
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 import uuid
 import json
@@ -28,7 +28,9 @@ class ReporteModelo:
         estado: str,
         url_google_drive: Optional[str] = None,
         id_google_drive: Optional[str] = None,
-        markdown_completo: str = ""
+        markdown_completo: str = "",
+        huella_contenido: Optional[str] = None,
+        extraccion: Optional[Dict[str, Any]] = None
     ):
         self.id = id
         self.fecha_creacion = fecha_creacion
@@ -46,15 +48,25 @@ class ReporteModelo:
         self.url_google_drive = url_google_drive
         self.id_google_drive = id_google_drive
         self.markdown_completo = markdown_completo
+        # SHA-256 del PDF de origen (detecta subidas repetidas)
+        self.huella_contenido = huella_contenido
+        # Texto extraído, análisis de imágenes y versión del prompt (para reprocesar sin el PDF)
+        self.extraccion = extraccion
     
     @classmethod
-    def crear_desde_datos(cls, datos: Dict[str, Any], nombre_archivo: str) -> 'ReporteModelo':
+    def crear_desde_datos(
+        cls,
+        datos: Dict[str, Any],
+        nombre_archivo: str,
+        huella_contenido: Optional[str] = None
+    ) -> 'ReporteModelo':
         """
         Crea un reporte desde datos extraídos
         
         Args:
             datos: Datos extraídos del PDF
             nombre_archivo: Nombre del archivo original
+            huella_contenido: SHA-256 del PDF de origen
             
         Returns:
             Instancia de ReporteModelo
@@ -76,7 +88,9 @@ class ReporteModelo:
             contenido_extraido=datos.get('contenido_extraido', ''),
             confianza_extraccion=datos.get('confianza_extraccion', 0.0),
             estado='procesando',
-            markdown_completo=datos.get('markdown_completo', '')
+            markdown_completo=datos.get('markdown_completo', ''),
+            huella_contenido=huella_contenido,
+            extraccion=datos.get('extraccion')
         )
     
     @classmethod
@@ -191,6 +205,63 @@ class ReporteModelo:
         
         self.fecha_actualizacion = datetime.now()
     
+    @staticmethod
+    def cambios_parciales(datos_actualizacion: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Traduce una actualización a cambios puntuales sobre la fila de la base
+        
+        Sigue la misma semántica que actualizar_datos: paciente, tutor,
+        veterinario y diagnóstico se actualizan clave por clave y las imágenes
+        se reemplazan completas. Solo viajan las rutas que cambian.
+        
+        Args:
+            datos_actualizacion: Datos a actualizar
+        
+        Returns:
+            Tupla (cambios sobre json_resultado como [{"ruta": [...], "valor": ...}],
+            columnas de la tabla a actualizar)
+        
+        Raises:
+            ValueError: Si un campo no tiene el tipo esperado
+        """
+        cambios: List[Dict[str, Any]] = []
+        columnas: Dict[str, Any] = {}
+        
+        for campo in ('paciente', 'tutor', 'veterinario', 'diagnostico'):
+            if campo not in datos_actualizacion:
+                continue
+            valores = datos_actualizacion[campo]
+            if not isinstance(valores, dict):
+                raise ValueError(f"'{campo}' debe ser un objeto")
+            for clave, valor in valores.items():
+                cambios.append({"ruta": [campo, str(clave)], "valor": valor})
+        
+        if 'imagenes' in datos_actualizacion:
+            if not isinstance(datos_actualizacion['imagenes'], list):
+                raise ValueError("'imagenes' debe ser una lista")
+            cambios.append({"ruta": ['imagenes'], "valor": datos_actualizacion['imagenes']})
+        
+        if 'contenido_extraido' in datos_actualizacion:
+            cambios.append({"ruta": ['contenido_extraido'], "valor": datos_actualizacion['contenido_extraido']})
+        
+        if 'confianza_extraccion' in datos_actualizacion:
+            confianza = datos_actualizacion['confianza_extraccion']
+            if isinstance(confianza, bool) or not isinstance(confianza, (int, float)):
+                raise ValueError("'confianza_extraccion' debe ser numérica")
+            cambios.append({"ruta": ['confianza_extraccion'], "valor": confianza})
+        
+        # El frontend envía 'tipoEstudio'
+        tipo_estudio = datos_actualizacion.get('tipo_estudio', datos_actualizacion.get('tipoEstudio'))
+        if tipo_estudio:
+            columnas['tipo_estudio'] = str(tipo_estudio)
+        
+        if datos_actualizacion.get('estado'):
+            if datos_actualizacion['estado'] not in ('pendiente', 'procesando', 'completado', 'error'):
+                raise ValueError(f"Estado no válido: {datos_actualizacion['estado']}")
+            columnas['estado_procesamiento'] = datos_actualizacion['estado']
+        
+        return cambios, columnas
+    
     def es_valido(self) -> bool:
         """
         Valida si el reporte es válido
@@ -0,0 +1,65 @@
+"""
+Reprocesamiento de reportes tras un cambio del prompt CliniDoc o del parser de Markdown
+Vuelve a estructurar, a partir del texto ya extraído, los reportes con una versión de prompt anterior
+
+Uso (desde backend/, después de subir VERSION_PROMPT en servicios/procesador_pdf_servicio.py):
+    python reprocesar_reportes.py --concurrencia 4
+
+No vuelve a subir los PDFs ni repite el OCR. El avance se guarda en un
+checkpoint: si se interrumpe, la próxima ejecución sigue donde quedó.
+Con --reiniciar se recorre todo de nuevo (incluidos los que fallaron).
+"""
+
+import argparse
+import asyncio
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv()
+load_dotenv('.env.local')
+
+from configuracion.database import inicializar_base_datos, cerrar_base_datos
+from servicios.procesador_pdf_servicio import ProcesadorPDFServicio, VERSION_PROMPT, MODELO_GEMINI
+from servicios.reportes_servicio import ReportesServicio
+from servicios.reprocesamiento_servicio import ReprocesadorReportes
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrencia", type=int, default=4, help="Reportes reestructurándose a la vez")
+    parser.add_argument("--lote", type=int, default=50, help="Reportes por lote (el checkpoint se guarda tras cada lote)")
+    parser.add_argument("--limite", type=int, default=None, help="Reportes máximos a recorrer en esta ejecución")
+    parser.add_argument("--checkpoint", default="reprocesamiento_checkpoint.json", help="Archivo de avance")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignorar el checkpoint y reintentar los fallidos")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    await inicializar_base_datos()
+    servicio = ReportesServicio()
+    try:
+        reprocesador = ReprocesadorReportes(
+            servicio,
+            ProcesadorPDFServicio(),
+            version_prompt=VERSION_PROMPT,
+            modelo=MODELO_GEMINI,
+            concurrencia=args.concurrencia,
+            tamano_lote=args.lote,
+            archivo_checkpoint=args.checkpoint
+        )
+        print(f"Reprocesando reportes a la versión de prompt '{VERSION_PROMPT}' ({MODELO_GEMINI})")
+        resultado = await reprocesador.ejecutar(limite=args.limite, reiniciar=args.reiniciar)
+    finally:
+        await servicio.detener()
+        await cerrar_base_datos()
+
+    print(f"Actualizados: {resultado['procesados']} | Fallidos: {len(resultado['fallidos'])}")
+    if resultado["detenido"]:
+        print(f"Detenido ({resultado['detenido']}): vuelva a ejecutar para continuar")
+    elif not resultado["completado"]:
+        print("Quedan reportes por reprocesar: vuelva a ejecutar para continuar")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
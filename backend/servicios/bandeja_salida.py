@@ -0,0 +1,282 @@
+"""
+Bandeja de salida de reportes
+Guarda en disco los reportes que no se pudieron escribir en la base y los reenvía en segundo plano
+"""
+
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+from utilidades.circuitos import Circuito, ABIERTO
+from utilidades.metricas import metricas
+
+logger = logging.getLogger(__name__)
+
+SQL_CREAR_TABLA = """
+    CREATE TABLE IF NOT EXISTS bandeja_salida (
+        reporte_id TEXT PRIMARY KEY,
+        registro TEXT NOT NULL,
+        estado TEXT NOT NULL DEFAULT 'pendiente',
+        intentos INTEGER NOT NULL DEFAULT 0,
+        creado_en REAL NOT NULL,
+        proximo_intento REAL NOT NULL,
+        ultimo_error TEXT
+    )
+"""
+
+SQL_CREAR_INDICE = """
+    CREATE INDEX IF NOT EXISTS idx_bandeja_salida_vencidos
+    ON bandeja_salida (estado, proximo_intento)
+"""
+
+
+class BandejaSalida:
+    """
+    Outbox durable en SQLite con reenvío por lotes
+
+    'agregar' vuelve cuando el registro quedó confirmado en disco, así un
+    reinicio no pierde el reporte. Un worker reenvía los registros vencidos
+    en lotes con la misma función de persistencia de la ingesta; la RPC es
+    idempotente por UUID, de modo que reenviar un reporte que sí había
+    llegado a la base no lo duplica. Cada fallo aleja el próximo intento con
+    espera exponencial (con jitter) y, tras 'maximo_intentos', el registro
+    queda como 'fallido' en la bandeja para revisarlo a mano.
+
+    Mientras el circuito de la base está abierto no se reintenta ni se
+    consumen intentos.
+    """
+
+    def __init__(
+        self,
+        persistir: Callable[[List[Dict[str, Any]]], Awaitable[List[Optional[str]]]],
+        archivo: str = 'bandeja_salida.db',
+        tamano_lote: int = 50,
+        maximo_intentos: int = 20,
+        espera_base_s: float = 2,
+        espera_maxima_s: float = 600,
+        intervalo_s: float = 1,
+        circuito: Optional[Circuito] = None
+    ):
+        """
+        Args:
+            persistir: Función que guarda una lista de registros y devuelve, por
+                cada uno, None si se guardó o el mensaje de error
+            archivo: Base SQLite de la bandeja
+            tamano_lote: Registros máximos por reenvío
+            maximo_intentos: Reenvíos fallidos antes de marcar un registro como 'fallido'
+            espera_base_s: Espera tras el primer fallo (se duplica en cada intento)
+            espera_maxima_s: Tope de la espera entre intentos
+            intervalo_s: Cada cuánto revisa el worker si hay registros vencidos
+            circuito: Circuito de la base; abierto = no reintentar todavía
+        """
+        self.persistir = persistir
+        self.archivo = archivo
+        self.tamano_lote = tamano_lote
+        self.maximo_intentos = maximo_intentos
+        self.espera_base_s = espera_base_s
+        self.espera_maxima_s = espera_maxima_s
+        self.intervalo_s = intervalo_s
+        self.circuito = circuito
+
+        self._conexion: Optional[sqlite3.Connection] = None
+        # La conexión se usa desde hilos de asyncio.to_thread: un acceso por vez
+        self._bloqueo = threading.Lock()
+        # Espejo en memoria de los pendientes (ID -> momento en que entró) para las métricas
+        self._pendientes: Dict[str, float] = {}
+        self._fallidos = 0
+        self._tarea: Optional[asyncio.Task] = None
+
+        metricas.registrar_medidor("bandeja_salida.profundidad", lambda: len(self._pendientes))
+        metricas.registrar_medidor("bandeja_salida.antiguedad_s", self.antiguedad_s)
+        metricas.registrar_medidor("bandeja_salida.fallidos", lambda: self._fallidos)
+
+    async def iniciar(self) -> None:
+        """Abre la bandeja, carga lo pendiente de ejecuciones anteriores y arranca el worker"""
+        await asyncio.to_thread(self._abrir)
+        if self._pendientes:
+            logger.info(f"Bandeja de salida: {len(self._pendientes)} reportes pendientes de reenvío")
+        self._tarea = asyncio.create_task(self._reenviar_periodicamente())
+
+    async def detener(self) -> None:
+        """Detiene el worker; lo pendiente queda en disco para el próximo inicio"""
+        if self._tarea:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        if self._conexion:
+            with self._bloqueo:
+                self._conexion.close()
+                self._conexion = None
+
+    def _abrir(self) -> None:
+        conexion = sqlite3.connect(self.archivo, check_same_thread=False)
+        # WAL + synchronous=FULL: cada commit queda en disco antes de confirmarse
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute("PRAGMA synchronous=FULL")
+        conexion.execute(SQL_CREAR_TABLA)
+        conexion.execute(SQL_CREAR_INDICE)
+        with self._bloqueo:
+            self._conexion = conexion
+            self._pendientes = dict(conexion.execute(
+                "SELECT reporte_id, creado_en FROM bandeja_salida WHERE estado = 'pendiente'"
+            ).fetchall())
+            self._fallidos = conexion.execute(
+                "SELECT COUNT(*) FROM bandeja_salida WHERE estado = 'fallido'"
+            ).fetchone()[0]
+
+    def antiguedad_s(self) -> float:
+        """Segundos que lleva en la bandeja el pendiente más viejo (0 si está vacía)"""
+        if not self._pendientes:
+            return 0.0
+        return round(time.time() - min(self._pendientes.values()), 3)
+
+    async def agregar(self, registros: List[Dict[str, Any]], error: str) -> None:
+        """
+        Guarda registros para reenviarlos; vuelve cuando quedaron en disco
+
+        Args:
+            registros: Dicts con 'id', 'bd' (fila de la tabla) y 'memoria' (registro local)
+            error: Motivo por el que no se pudieron guardar
+        """
+        if not registros:
+            return
+        ahora = time.time()
+        filas = [
+            (r["id"], json.dumps(r, ensure_ascii=False, default=str), ahora, ahora + self.espera_base_s, error)
+            for r in registros
+        ]
+        await asyncio.to_thread(self._ejecutar_varios, """
+            INSERT INTO bandeja_salida (reporte_id, registro, creado_en, proximo_intento, ultimo_error)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (reporte_id) DO UPDATE SET
+                registro = excluded.registro,
+                estado = 'pendiente',
+                intentos = 0,
+                proximo_intento = excluded.proximo_intento,
+                ultimo_error = excluded.ultimo_error
+        """, filas)
+        for registro in registros:
+            self._pendientes.setdefault(registro["id"], ahora)
+        metricas.incrementar("bandeja_salida.encolados", len(registros))
+        logger.warning(f"Bandeja de salida: {len(registros)} reportes guardados para reenvío ({error})")
+
+    def obtener_pendiente(self, reporte_id: str) -> Optional[Dict[str, Any]]:
+        """Devuelve el registro local de un reporte que todavía no llegó a la base"""
+        if reporte_id not in self._pendientes:
+            return None
+        with self._bloqueo:
+            fila = self._conexion.execute(
+                "SELECT registro FROM bandeja_salida WHERE reporte_id = ? AND estado = 'pendiente'",
+                (reporte_id,)
+            ).fetchone()
+        return json.loads(fila[0])["memoria"] if fila else None
+
+    async def quitar(self, reporte_id: str) -> bool:
+        """
+        Descarta un reporte pendiente (ej: se eliminó antes de llegar a la base)
+
+        Returns:
+            True si estaba en la bandeja
+        """
+        if reporte_id not in self._pendientes:
+            return False
+        await asyncio.to_thread(
+            self._ejecutar_varios, "DELETE FROM bandeja_salida WHERE reporte_id = ?", [(reporte_id,)]
+        )
+        self._pendientes.pop(reporte_id, None)
+        return True
+
+    async def reenviar_pendientes(self) -> int:
+        """
+        Reenvía un lote de registros vencidos
+
+        Returns:
+            Cantidad de registros intentados (0 si no había nada para reenviar)
+        """
+        if not self._pendientes:
+            return 0
+        if self.circuito and self.circuito.estado == ABIERTO:
+            return 0
+
+        filas = await asyncio.to_thread(self._consultar, """
+            SELECT reporte_id, registro, intentos FROM bandeja_salida
+            WHERE estado = 'pendiente' AND proximo_intento <= ?
+            ORDER BY creado_en
+            LIMIT ?
+        """, (time.time(), self.tamano_lote))
+        if not filas:
+            return 0
+
+        registros = [json.loads(registro) for _, registro, _ in filas]
+        try:
+            with metricas.medir_latencia("bandeja_salida.reenvio_ms"):
+                errores = await self.persistir(registros)
+        except Exception as e:
+            errores = [str(e)] * len(registros)
+
+        guardados, reprogramados, fallidos = [], [], []
+        ahora = time.time()
+        for (reporte_id, _, intentos), error in zip(filas, errores):
+            if error is None:
+                guardados.append((reporte_id,))
+            elif intentos + 1 >= self.maximo_intentos:
+                fallidos.append((intentos + 1, error, reporte_id))
+            else:
+                espera = min(self.espera_maxima_s, self.espera_base_s * 2 ** (intentos + 1))
+                # Jitter: los reportes que fallaron juntos no vuelven todos en el mismo instante
+                reprogramados.append((intentos + 1, ahora + espera * random.uniform(0.5, 1), error, reporte_id))
+
+        await asyncio.to_thread(self._aplicar_resultados, guardados, reprogramados, fallidos)
+        for (reporte_id,) in guardados:
+            self._pendientes.pop(reporte_id, None)
+        for _, _, reporte_id in fallidos:
+            self._pendientes.pop(reporte_id, None)
+            logger.error(f"Bandeja de salida: el reporte {reporte_id} queda como fallido tras {self.maximo_intentos} intentos")
+        self._fallidos += len(fallidos)
+
+        metricas.incrementar("bandeja_salida.reenviados", len(guardados))
+        metricas.incrementar("bandeja_salida.reintentos_fallidos", len(reprogramados) + len(fallidos))
+        if guardados:
+            logger.info(f"Bandeja de salida: {len(guardados)} reportes reenviados a la base")
+        return len(filas)
+
+    async def _reenviar_periodicamente(self) -> None:
+        while True:
+            try:
+                # Lote completo: puede haber más vencidos, se sigue sin esperar
+                if await self.reenviar_pendientes() >= self.tamano_lote:
+                    continue
+            except Exception as e:
+                logger.error(f"Error en el reenvío de la bandeja de salida: {str(e)}")
+            await asyncio.sleep(self.intervalo_s)
+
+    def _ejecutar_varios(self, sql: str, parametros: List[tuple]) -> None:
+        with self._bloqueo:
+            with self._conexion:
+                self._conexion.executemany(sql, parametros)
+
+    def _consultar(self, sql: str, parametros: tuple) -> List[tuple]:
+        with self._bloqueo:
+            return self._conexion.execute(sql, parametros).fetchall()
+
+    def _aplicar_resultados(self, guardados: List[tuple], reprogramados: List[tuple], fallidos: List[tuple]) -> None:
+        """Aplica el resultado de un reenvío en una sola transacción"""
+        with self._bloqueo:
+            with self._conexion:
+                self._conexion.executemany("DELETE FROM bandeja_salida WHERE reporte_id = ?", guardados)
+                self._conexion.executemany("""
+                    UPDATE bandeja_salida SET intentos = ?, proximo_intento = ?, ultimo_error = ?
+                    WHERE reporte_id = ?
+                """, reprogramados)
+                self._conexion.executemany("""
+                    UPDATE bandeja_salida SET estado = 'fallido', intentos = ?, ultimo_error = ?
+                    WHERE reporte_id = ?
+                """, fallidos)
@@ -0,0 +1,129 @@
+"""
+Servicio de cambios de reportes
+Expone el registro de cambios (reporte_cambios) para la sincronización incremental de los clientes
+"""
+
+from typing import Dict, Any, Optional, Callable
+import asyncio
+import logging
+import os
+import re
+
+from configuracion.database import obtener_conexion_bd
+from utilidades.metricas import metricas
+
+logger = logging.getLogger(__name__)
+
+# Formato del token de cambios: '<transacción>.<id>'
+PATRON_TOKEN = re.compile(r'^\d+\.\d+$')
+
+# Cada cuánto se purgan los cambios viejos
+INTERVALO_PURGA_S = 3600
+
+
+def token_valido(token: str) -> bool:
+    """Indica si un texto tiene el formato de un token de cambios"""
+    return bool(PATRON_TOKEN.match(token or ''))
+
+
+class CambiosReportesServicio:
+    """
+    Feed de cambios de reportes
+
+    Los triggers de 'reporte' anotan cada alta, modificación y baja en
+    reporte_cambios dentro de la misma transacción. Un cliente guarda el
+    token de la última consulta y pide solo lo que cambió desde entonces:
+    cada reporte llega una vez, con su versión actual o como eliminado.
+
+    Los cambios de más de CAMBIOS_RETENCION_DIAS se purgan periódicamente;
+    un token anterior a la purga recibe 'reiniciar' y el cliente debe
+    recargar la lista completa.
+    """
+
+    def __init__(self, formatear: Callable[[Dict[str, Any]], Dict[str, Any]], repositorio_postgres=None):
+        """
+        Args:
+            formatear: Convierte una fila de 'reporte' al formato del frontend
+            repositorio_postgres: ReportesRepositorioPostgres si se usa Postgres directo
+        """
+        self.formatear = formatear
+        self.repositorio_postgres = repositorio_postgres
+        self.dias_retencion = int(os.getenv("CAMBIOS_RETENCION_DIAS", "30"))
+        self._tarea_purga: Optional[asyncio.Task] = None
+
+    async def iniciar(self) -> None:
+        """Arranca la purga periódica (CAMBIOS_RETENCION_DIAS=0 la desactiva)"""
+        if self.dias_retencion > 0 and not self._tarea_purga:
+            self._tarea_purga = asyncio.create_task(self._purgar_periodicamente())
+
+    async def detener(self) -> None:
+        """Detiene la purga periódica"""
+        if self._tarea_purga:
+            self._tarea_purga.cancel()
+            try:
+                await self._tarea_purga
+            except asyncio.CancelledError:
+                pass
+            self._tarea_purga = None
+
+    async def obtener_cambios(self, desde: Optional[str], limite: int) -> Dict[str, Any]:
+        """
+        Obtiene los reportes creados, actualizados o eliminados desde un token
+
+        Args:
+            desde: Token de la consulta anterior; None devuelve el token actual
+            limite: Cantidad máxima de cambios a leer
+
+        Returns:
+            Dict con el token siguiente, los cambios, si quedan más por leer
+            y si el cliente debe recargar todo
+        """
+        if self.repositorio_postgres:
+            resultado = await self.repositorio_postgres.obtener_cambios(desde, limite)
+        else:
+            supabase = obtener_conexion_bd()
+            resultado = supabase.rpc('obtener_cambios_reportes', {'p_desde': desde, 'p_limite': limite}).execute().data
+
+        cambios = []
+        for cambio in resultado.get('cambios') or []:
+            if cambio.get('reporte'):
+                cambios.append({"id": cambio['id'], "operacion": cambio['operacion'],
+                                "reporte": self.formatear(cambio['reporte'])})
+            else:
+                cambios.append({"id": cambio['id'], "operacion": cambio['operacion']})
+
+        metricas.incrementar("cambios.entregados", len(cambios))
+        if resultado.get('reiniciar'):
+            metricas.incrementar("cambios.reinicios")
+        return {
+            "token": resultado.get('token'),
+            "cambios": cambios,
+            "hay_mas": bool(resultado.get('hay_mas')),
+            "reiniciar": bool(resultado.get('reiniciar'))
+        }
+
+    async def purgar(self) -> int:
+        """
+        Borra los cambios más viejos que la retención configurada
+
+        Returns:
+            Cantidad de cambios borrados
+        """
+        if self.repositorio_postgres:
+            borrados = await self.repositorio_postgres.purgar_cambios(self.dias_retencion)
+        else:
+            supabase = obtener_conexion_bd()
+            borrados = supabase.rpc('purgar_cambios_reportes', {'p_dias': self.dias_retencion}).execute().data
+        borrados = int(borrados or 0)
+        metricas.incrementar("cambios.purgados", borrados)
+        if borrados:
+            logger.info(f"Registro de cambios: {borrados} cambios purgados")
+        return borrados
+
+    async def _purgar_periodicamente(self) -> None:
+        while True:
+            await asyncio.sleep(INTERVALO_PURGA_S)
+            try:
+                await self.purgar()
+            except Exception as e:
+                logger.error(f"Error al purgar el registro de cambios: {str(e)}")
@@ -10,6 +10,7 @@ import json
 from datetime import datetime
 
 from modelos.mensaje_chatbot_modelo import MensajeChatbotModelo
+from utilidades.circuitos import CircuitoAbierto, obtener_circuito, es_fallo_http
 from typing import List
 
 logger = logging.getLogger(__name__)
@@ -21,6 +22,8 @@ class ChatbotServicio:
         self.webhook_url = "https://tu-webhook-n8n.com/webhook/chatbot"
         self.timeout = 30
         self.max_reintentos = 3
+        # Compartido con el envío de PDFs: ambos usan el mismo n8n
+        self.circuito = obtener_circuito('n8n', es_fallo=es_fallo_http)
     
     async def enviar_mensaje(
         self, 
@@ -57,11 +60,18 @@ class ChatbotServicio:
             
             # Enviar request
             async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    self.webhook_url,
-                    json=payload,
-                    headers={"Content-Type": "application/json"}
-                )
+                try:
+                    with self.circuito.proteger():
+                        response = await client.post(
+                            self.webhook_url,
+                            json=payload,
+                            headers={"Content-Type": "application/json"}
+                        )
+                        # Un 5xx cuenta como fallo del circuito
+                        if response.status_code >= 500:
+                            response.raise_for_status()
+                except httpx.HTTPStatusError:
+                    pass
                 
                 if response.status_code != 200:
                     return {
@@ -84,6 +94,11 @@ class ChatbotServicio:
                     "datos": data.get("response", "Sin respuesta del chatbot")
                 }
                 
+        except CircuitoAbierto:
+            return {
+                "exito": False,
+                "error": "El chatbot no está disponible en este momento, intente nuevamente en unos segundos"
+            }
         except httpx.TimeoutException:
             logger.error("Timeout al enviar mensaje al chatbot")
             return {
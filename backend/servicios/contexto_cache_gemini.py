@@ -0,0 +1,115 @@
+"""
+Context cache de Gemini
+Guarda una vez las instrucciones fijas de un prompt y las reutiliza en cada llamada, con vuelta al prompt completo
+"""
+
+from typing import Any, Optional
+from datetime import timedelta
+import asyncio
+import logging
+import time
+
+from utilidades.metricas import metricas
+
+logger = logging.getLogger(__name__)
+
+
+class ContextoCacheGemini:
+    """
+    Instrucciones de sistema guardadas en el context cache de Gemini
+
+    Con el cache, cada llamada envía solo la parte propia del documento y
+    Gemini antepone las instrucciones ya procesadas (se cobran con
+    descuento). El cache se crea al primer uso, se renueva poco antes de
+    vencer y todas las llamadas concurrentes comparten uno.
+
+    Si el cache no está disponible (SDK sin el módulo 'caching', modelo sin
+    versión fija, instrucciones por debajo del mínimo de tokens del modelo,
+    etc.), obtener_modelo devuelve None y se usa el prompt completo; la
+    creación no se reintenta hasta pasados 'espera_reintento_s'.
+    """
+
+    def __init__(
+        self,
+        nombre: str,
+        instrucciones: str,
+        modelo: str,
+        habilitado: bool = True,
+        ttl_s: float = 3600.0,
+        margen_renovacion_s: float = 300.0,
+        espera_reintento_s: float = 3600.0
+    ):
+        """
+        Args:
+            nombre: Nombre visible del cache en Gemini
+            instrucciones: Texto fijo que se guarda como instrucción de sistema
+            modelo: Modelo de Gemini (el cache solo sirve para ese modelo)
+            habilitado: Si es False siempre se usa el prompt completo
+            ttl_s: Vigencia de cada cache creado
+            margen_renovacion_s: Antelación con la que se crea uno nuevo antes de que venza
+            espera_reintento_s: Tiempo sin reintentar la creación tras un fallo
+        """
+        self.nombre = nombre
+        self.instrucciones = instrucciones
+        self.modelo = modelo
+        self.habilitado = habilitado
+        self.ttl_s = ttl_s
+        self.margen_renovacion_s = margen_renovacion_s
+        self.espera_reintento_s = espera_reintento_s
+
+        self._modelo_cacheado: Optional[Any] = None
+        self._vence_en = 0.0
+        self._no_disponible_hasta = 0.0
+        self._bloqueo: Optional[asyncio.Lock] = None
+
+    def _nombre_modelo(self) -> str:
+        return self.modelo if self.modelo.startswith("models/") else f"models/{self.modelo}"
+
+    async def obtener_modelo(self, genai) -> Optional[Any]:
+        """
+        Devuelve un modelo que ya trae las instrucciones desde el cache, o None para usar el prompt completo
+
+        Args:
+            genai: Módulo google.generativeai (o un reemplazo con la misma interfaz)
+        """
+        if not self.habilitado or time.monotonic() < self._no_disponible_hasta:
+            return None
+        if self._modelo_cacheado is not None and time.monotonic() < self._vence_en - self.margen_renovacion_s:
+            return self._modelo_cacheado
+
+        if self._bloqueo is None:
+            self._bloqueo = asyncio.Lock()
+        async with self._bloqueo:
+            # Otra llamada pudo crearlo (o fallar) mientras se esperaba el bloqueo
+            if time.monotonic() < self._no_disponible_hasta:
+                return None
+            if self._modelo_cacheado is not None and time.monotonic() < self._vence_en - self.margen_renovacion_s:
+                return self._modelo_cacheado
+            # El vencimiento se cuenta desde el pedido: el real es un poco posterior
+            pedido_en = time.monotonic()
+            try:
+                cache = await asyncio.to_thread(
+                    genai.caching.CachedContent.create,
+                    model=self._nombre_modelo(),
+                    display_name=self.nombre,
+                    system_instruction=self.instrucciones,
+                    ttl=timedelta(seconds=self.ttl_s)
+                )
+                self._modelo_cacheado = genai.GenerativeModel.from_cached_content(cached_content=cache)
+            except Exception as e:
+                logger.warning(
+                    f"Context cache '{self.nombre}' no disponible, se envía el prompt completo: {str(e)}"
+                )
+                metricas.incrementar("gemini.contexto_cache.no_disponible")
+                self.invalidar()
+                self._no_disponible_hasta = time.monotonic() + self.espera_reintento_s
+                return None
+            self._vence_en = pedido_en + self.ttl_s
+            metricas.incrementar("gemini.contexto_cache.creados")
+            logger.info(f"Context cache '{self.nombre}' creado: {getattr(cache, 'name', '')}")
+            return self._modelo_cacheado
+
+    def invalidar(self) -> None:
+        """Descarta el cache actual (ej: Gemini respondió que ya no existe); el próximo uso crea otro"""
+        self._modelo_cacheado = None
+        self._vence_en = 0.0
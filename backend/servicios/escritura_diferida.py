@@ -0,0 +1,366 @@
+"""
+Escritura diferida de reportes
+Cola write-behind que agrupa reportes terminados y los guarda en un solo lote (group commit)
+"""
+
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+import uuid
+
+from utilidades.metricas import metricas
+
+# fcntl no existe en Windows: ahí no hay bloqueo entre procesos y se asume un solo worker
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Intentos de guardado antes de mover un reporte al archivo de fallidos
+MAXIMO_INTENTOS = 3
+
+
+class ColaEscrituraLlena(Exception):
+    """La cola no liberó lugar dentro del tiempo de espera (la base está lenta)"""
+
+
+class BufferEscrituraDiferida:
+    """
+    Buffer write-behind con journal local y backpressure
+
+    Cada reporte se escribe (con fsync) en un journal antes de confirmarse al
+    llamador, así un reinicio no pierde nada: al iniciar se reencolan los
+    reportes del journal que no llegaron a confirmarse. Cada instancia usa su
+    propio journal ('escrituras_pendientes.<pid>-<sufijo>.jsonl') y lo
+    mantiene bloqueado mientras vive; al iniciar adopta los journals que
+    nadie tiene bloqueados (sus dueños terminaron). Un worker junta los
+    reportes durante 'espera_ms' o hasta 'tamano_maximo_lote' y los guarda con
+    una sola llamada a la función de persistencia.
+
+    La cantidad de reportes sin confirmar está acotada por 'maximo_pendientes':
+    cuando la base está lenta, 'encolar' espera a que se libere lugar.
+    """
+
+    def __init__(
+        self,
+        persistir: Callable[[List[Dict[str, Any]]], Awaitable[List[Optional[str]]]],
+        archivo_journal: str = 'escrituras_pendientes.jsonl',
+        archivo_fallidos: str = 'escrituras_fallidas.jsonl',
+        espera_ms: float = 20,
+        tamano_maximo_lote: int = 50,
+        maximo_pendientes: int = 1000,
+        espera_maxima_encolar_s: float = 10,
+        al_descartar: Optional[Callable[[List[Dict[str, Any]], str], Awaitable[None]]] = None
+    ):
+        """
+        Args:
+            persistir: Función que guarda una lista de registros y devuelve, por
+                cada uno, None si se guardó o el mensaje de error
+            archivo_journal: Nombre base del journal de registros sin confirmar (cada instancia le agrega PID y sufijo)
+            archivo_fallidos: Registros descartados tras agotar los intentos
+            espera_ms: Tiempo máximo que se espera para juntar un lote
+            tamano_maximo_lote: Registros máximos por lote
+            maximo_pendientes: Registros sin confirmar admitidos antes de frenar a los productores
+            espera_maxima_encolar_s: Tiempo máximo que un productor espera lugar en la cola
+            al_descartar: Destino de los registros que agotan los intentos (ej: la
+                bandeja de salida); sin él se escriben en 'archivo_fallidos'
+        """
+        self.persistir = persistir
+        self.archivo_journal = archivo_journal
+        self.archivo_fallidos = archivo_fallidos
+        self.espera_ms = espera_ms
+        self.tamano_maximo_lote = tamano_maximo_lote
+        self.espera_maxima_encolar_s = espera_maxima_encolar_s
+        self.al_descartar = al_descartar
+
+        self._cola: asyncio.Queue = asyncio.Queue()
+        self._capacidad = asyncio.Semaphore(maximo_pendientes)
+        self._bloqueo_journal = asyncio.Lock()
+        self._pendientes: Dict[str, Dict[str, Any]] = {}
+        self._tarea_worker: Optional[asyncio.Task] = None
+        # Lote que se está guardando (quitar espera a que termine)
+        self._lote_en_vuelo: Optional[asyncio.Future] = None
+        self._ids_en_vuelo: set = set()
+        # Journal propio de la instancia y su descriptor abierto (mantiene el bloqueo)
+        self._journal_propio = ''
+        self._descriptor_journal = None
+
+        metricas.registrar_medidor("escritura_diferida.pendientes", lambda: len(self._pendientes))
+
+    def obtener_pendiente(self, reporte_id: str) -> Optional[Dict[str, Any]]:
+        """Devuelve el registro de un reporte encolado que todavía no llegó a la base"""
+        registro = self._pendientes.get(reporte_id)
+        return registro["memoria"] if registro else None
+
+    async def quitar(self, reporte_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Saca un reporte de la cola para que no llegue a la base (ej: se eliminó antes de guardarse)
+
+        Si el reporte está en el lote que se está guardando, primero espera a
+        que ese lote termine: si se guardó, ya no está pendiente y queda en la
+        base para que el llamador lo elimine ahí.
+
+        Returns:
+            El registro quitado, o None si no estaba pendiente
+        """
+        while reporte_id in self._ids_en_vuelo:
+            await asyncio.shield(self._lote_en_vuelo)
+        registro = self._pendientes.get(reporte_id)
+        if registro is None:
+            return None
+        await self._confirmar([registro])
+        metricas.incrementar("escritura_diferida.quitados")
+        return registro
+
+    async def iniciar(self) -> None:
+        """Arranca el worker y reencola lo que haya quedado en los journals abandonados"""
+        await asyncio.to_thread(self._abrir_journal_propio)
+        recuperados = await asyncio.to_thread(self._adoptar_journales)
+        if recuperados:
+            # Pasan al journal propio antes de borrar nada: una nueva caída tampoco los pierde
+            await asyncio.to_thread(
+                self._escribir_lineas, self._journal_propio, [{"tipo": "pendiente", **r} for r in recuperados]
+            )
+
+        self._tarea_worker = asyncio.create_task(self._procesar_cola())
+        for registro in recuperados:
+            await self._capacidad.acquire()
+            self._pendientes[registro["id"]] = registro
+            self._cola.put_nowait(registro)
+        if recuperados:
+            logger.info(f"Escritura diferida: {len(recuperados)} reportes recuperados del journal")
+
+    async def detener(self, espera_maxima_s: float = 30) -> None:
+        """
+        Espera a que se guarden los pendientes y detiene el worker
+
+        Lo que no llegue a guardarse dentro de 'espera_maxima_s' queda en el
+        journal y se reintenta en el próximo inicio.
+        """
+        if not self._tarea_worker:
+            return
+        limite = time.monotonic() + espera_maxima_s
+        while self._pendientes and time.monotonic() < limite:
+            await asyncio.sleep(0.05)
+        if self._pendientes:
+            logger.warning(f"Escritura diferida: {len(self._pendientes)} reportes quedan en el journal")
+        self._tarea_worker.cancel()
+        try:
+            await self._tarea_worker
+        except asyncio.CancelledError:
+            pass
+        self._tarea_worker = None
+        self._cerrar_journal_propio()
+
+    async def encolar(self, registro: Dict[str, Any]) -> None:
+        """
+        Encola un registro; vuelve cuando quedó escrito en el journal
+
+        Args:
+            registro: Dict con 'id', 'bd' (fila de la tabla) y 'memoria' (registro local)
+
+        Raises:
+            ColaEscrituraLlena: Si no se liberó lugar a tiempo
+        """
+        if not self._capacidad.locked():
+            # Hay lugar: acquire no suspende
+            await self._capacidad.acquire()
+        else:
+            metricas.incrementar("escritura_diferida.esperas_backpressure")
+            try:
+                with metricas.medir_latencia("escritura_diferida.espera_backpressure_ms"):
+                    await asyncio.wait_for(self._capacidad.acquire(), timeout=self.espera_maxima_encolar_s)
+            except asyncio.TimeoutError:
+                metricas.incrementar("escritura_diferida.rechazados")
+                raise ColaEscrituraLlena(f"Hay {len(self._pendientes)} reportes pendientes de guardar")
+
+        try:
+            await self._anotar_en_journal({"tipo": "pendiente", **registro})
+        except Exception:
+            self._capacidad.release()
+            raise
+        self._pendientes[registro["id"]] = registro
+        self._cola.put_nowait(registro)
+
+    async def _procesar_cola(self) -> None:
+        """Worker: junta lotes y los persiste de a uno"""
+        while True:
+            lote = [await self._cola.get()]
+            vencimiento = time.monotonic() + self.espera_ms / 1000
+            while len(lote) < self.tamano_maximo_lote:
+                restante = vencimiento - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(await asyncio.wait_for(self._cola.get(), timeout=restante))
+                except asyncio.TimeoutError:
+                    break
+            # Los registros quitados de la cola (o reencolados) se saltean
+            lote = [registro for registro in lote if self._pendientes.get(registro["id"]) is registro]
+            if not lote:
+                continue
+            self._lote_en_vuelo = asyncio.get_running_loop().create_future()
+            self._ids_en_vuelo = {registro["id"] for registro in lote}
+            try:
+                await self._guardar_lote(lote)
+            except Exception as e:
+                logger.error(f"Error inesperado en la escritura diferida: {str(e)}")
+            finally:
+                self._ids_en_vuelo = set()
+                self._lote_en_vuelo.set_result(None)
+
+    async def _guardar_lote(self, lote: List[Dict[str, Any]]) -> None:
+        metricas.observar("escritura_diferida.tamano_lote", len(lote))
+        try:
+            with metricas.medir_latencia("escritura_diferida.latencia_commit_ms"):
+                errores = await self.persistir(lote)
+        except Exception as e:
+            errores = [str(e)] * len(lote)
+
+        confirmados = []
+        for registro, error in zip(lote, errores):
+            if error is None:
+                confirmados.append(registro)
+                continue
+            registro["intentos"] = registro.get("intentos", 0) + 1
+            if registro["intentos"] < MAXIMO_INTENTOS:
+                # Reintento con espera creciente sin bloquear al resto de la cola
+                metricas.incrementar("escritura_diferida.reintentos")
+                asyncio.get_running_loop().call_later(
+                    0.5 * 2 ** registro["intentos"], self._cola.put_nowait, registro
+                )
+                continue
+            logger.error(f"Reporte {registro['id']} descartado de la escritura diferida: {error}")
+            metricas.incrementar("escritura_diferida.fallidos")
+            await self._descartar(registro, error)
+            confirmados.append(registro)
+
+        if confirmados:
+            await self._confirmar(confirmados)
+        metricas.incrementar("escritura_diferida.guardados", errores.count(None))
+
+    async def _descartar(self, registro: Dict[str, Any], error: str) -> None:
+        """Entrega un registro que agotó los intentos a 'al_descartar' o al archivo de fallidos"""
+        if self.al_descartar:
+            try:
+                await self.al_descartar([registro], error)
+                return
+            except Exception as e:
+                logger.error(f"No se pudo entregar el reporte {registro['id']} descartado: {str(e)}")
+        await asyncio.to_thread(self._escribir_lineas, self.archivo_fallidos, [{**registro, "error": error}])
+
+    async def _confirmar(self, registros: List[Dict[str, Any]]) -> None:
+        """Marca registros como resueltos en el journal y libera su lugar en la cola"""
+        for registro in registros:
+            self._pendientes.pop(registro["id"], None)
+        async with self._bloqueo_journal:
+            if not self._pendientes:
+                # Nada sin confirmar: el journal se puede vaciar
+                await asyncio.to_thread(self._truncar_journal)
+            else:
+                await asyncio.to_thread(
+                    self._escribir_lineas, self._journal_propio,
+                    [{"tipo": "confirmado", "ids": [r["id"] for r in registros]}]
+                )
+        for _ in registros:
+            self._capacidad.release()
+
+    async def _anotar_en_journal(self, entrada: Dict[str, Any]) -> None:
+        async with self._bloqueo_journal:
+            await asyncio.to_thread(self._escribir_lineas, self._journal_propio, [entrada])
+
+    def _abrir_journal_propio(self) -> None:
+        """Crea el journal de la instancia y lo bloquea mientras viva el proceso"""
+        base, extension = os.path.splitext(self.archivo_journal)
+        while True:
+            self._journal_propio = f"{base}.{os.getpid()}-{uuid.uuid4().hex[:8]}{extension}"
+            descriptor = open(self._journal_propio, 'a', encoding='utf-8')
+            if fcntl is not None:
+                fcntl.flock(descriptor.fileno(), fcntl.LOCK_EX)
+            # Otra instancia pudo adoptarlo y borrarlo entre el open y el bloqueo
+            if os.path.exists(self._journal_propio) and os.path.samestat(
+                os.stat(self._journal_propio), os.fstat(descriptor.fileno())
+            ):
+                self._descriptor_journal = descriptor
+                return
+            descriptor.close()
+
+    def _cerrar_journal_propio(self) -> None:
+        """Libera el bloqueo; sin registros pendientes el journal se borra"""
+        if self._descriptor_journal is None:
+            return
+        self._descriptor_journal.close()
+        self._descriptor_journal = None
+        if not self._pendientes:
+            os.remove(self._journal_propio)
+
+    def _adoptar_journales(self) -> List[Dict[str, Any]]:
+        """
+        Toma los registros de los journals de instancias que ya terminaron
+
+        Un journal que otra instancia tiene bloqueado está en uso y no se toca.
+        También se adopta el journal único de versiones anteriores
+        ('escrituras_pendientes.jsonl').
+        """
+        base, extension = os.path.splitext(self.archivo_journal)
+        candidatos = glob.glob(f"{glob.escape(base)}.*{extension}") + [self.archivo_journal]
+        adoptados = []
+        for archivo in candidatos:
+            if archivo == self._journal_propio or not os.path.exists(archivo):
+                continue
+            try:
+                descriptor = open(archivo, 'r+', encoding='utf-8')
+            except FileNotFoundError:
+                continue
+            with descriptor:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(descriptor.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue
+                registros = self._leer_journal(archivo)
+                # Vaciado antes de borrarlo: quien lo haya abierto a la vez lo encuentra sin registros
+                descriptor.truncate(0)
+                os.remove(archivo)
+            if registros:
+                logger.info(f"Escritura diferida: se adoptan {len(registros)} reportes de {archivo}")
+                adoptados.extend(registros)
+        return adoptados
+
+    def _escribir_lineas(self, archivo: str, entradas: List[Dict[str, Any]]) -> None:
+        with open(archivo, 'a', encoding='utf-8') as f:
+            for entrada in entradas:
+                f.write(json.dumps(entrada, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _truncar_journal(self) -> None:
+        with open(self._journal_propio, 'w', encoding='utf-8') as f:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _leer_journal(self, archivo: str) -> List[Dict[str, Any]]:
+        """Registros anotados como pendientes y nunca confirmados"""
+        if not os.path.exists(archivo):
+            return []
+        pendientes: Dict[str, Dict[str, Any]] = {}
+        with open(archivo, 'r', encoding='utf-8') as f:
+            for linea in f:
+                try:
+                    entrada = json.loads(linea)
+                except json.JSONDecodeError:
+                    # Última línea a medio escribir por una caída: se ignora
+                    continue
+                if entrada.get("tipo") == "pendiente":
+                    entrada.pop("tipo")
+                    pendientes[entrada["id"]] = entrada
+                elif entrada.get("tipo") == "confirmado":
+                    for reporte_id in entrada.get("ids", []):
+                        pendientes.pop(reporte_id, None)
+        return list(pendientes.values())
@@ -0,0 +1,353 @@
+"""
+Servicio de estadísticas
+Lee los contadores precalculados (estadisticas_resumen) y las series diarias
+(estadisticas_diarias), y los reconcilia periódicamente
+"""
+
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+from datetime import date
+import asyncio
+import logging
+import os
+
+import numpy as np
+
+from configuracion.database import obtener_conexion_bd, circuito_bd
+from utilidades.cache import CacheLectura
+from utilidades.metricas import metricas
+
+logger = logging.getLogger(__name__)
+
+# Contadores de estadisticas_resumen que se devuelven tal cual
+CLAVES_CONTADORES = [
+    "total_reportes",
+    "reportes_completados",
+    "reportes_procesando",
+    "reportes_error",
+    "total_pacientes",
+    "veterinarios_activos",
+    "turnos_pendientes",
+    "total_imagenes",
+]
+
+# Granularidades de /api/estadisticas/serie (los buckets guardados son diarios)
+GRANULARIDADES = ("dia", "semana", "mes")
+
+# Dimensiones por las que se puede abrir una serie
+DIMENSIONES = ("tipo_estudio", "especie", "veterinario")
+
+# Estado de procesamiento -> contador de estadisticas_resumen
+CONTADOR_POR_ESTADO = {
+    "completado": "reportes_completados",
+    "procesando": "reportes_procesando",
+    "error": "reportes_error",
+}
+
+# Contadores que se suman al re-agrupar buckets
+CAMPOS_BUCKET = ("total", "completados", "errores", "con_confianza", "suma_confianza")
+
+# Filas por página al leer buckets con el cliente de Supabase
+TAMANO_PAGINA_SUPABASE = 1000
+
+
+def resumen_a_estadisticas(filas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Convierte las filas de estadisticas_resumen al formato de vista_estadisticas_sistema
+
+    Args:
+        filas: Filas (clave, valor, actualizado_en) de estadisticas_resumen
+
+    Returns:
+        Dict con los contadores, confianza_promedio y la fecha de la última actualización
+    """
+    valores = {fila["clave"]: float(fila["valor"]) for fila in filas}
+    estadisticas: Dict[str, Any] = {clave: int(valores.get(clave, 0)) for clave in CLAVES_CONTADORES}
+
+    con_confianza = valores.get("reportes_con_confianza", 0)
+    estadisticas["confianza_promedio"] = (
+        round(valores.get("suma_confianza", 0) / con_confianza, 4) if con_confianza else None
+    )
+    fechas = [str(fila["actualizado_en"]) for fila in filas if fila.get("actualizado_en")]
+    estadisticas["actualizado_en"] = max(fechas) if fechas else None
+    return estadisticas
+
+
+def delta_estadisticas(transiciones: Iterable[Tuple[Optional[str], Optional[str]]]) -> Dict[str, int]:
+    """
+    Variación de los contadores del dashboard por cambios de estado de reportes
+
+    Args:
+        transiciones: Pares (estado anterior, estado nuevo); None como
+            anterior es un alta y None como nuevo, una baja
+
+    Returns:
+        Dict contador -> variación (sin los que no cambian)
+    """
+    delta: Dict[str, int] = {}
+    for anterior, nuevo in transiciones:
+        if anterior == nuevo:
+            continue
+        if anterior is None:
+            delta["total_reportes"] = delta.get("total_reportes", 0) + 1
+        if nuevo is None:
+            delta["total_reportes"] = delta.get("total_reportes", 0) - 1
+        if anterior in CONTADOR_POR_ESTADO:
+            clave = CONTADOR_POR_ESTADO[anterior]
+            delta[clave] = delta.get(clave, 0) - 1
+        if nuevo in CONTADOR_POR_ESTADO:
+            clave = CONTADOR_POR_ESTADO[nuevo]
+            delta[clave] = delta.get(clave, 0) + 1
+    return {clave: valor for clave, valor in delta.items() if valor}
+
+
+def inicio_de_periodo(dias: np.ndarray, granularidad: str) -> np.ndarray:
+    """
+    Lleva cada día al primer día de su período
+
+    Args:
+        dias: Arreglo datetime64[D]
+        granularidad: 'dia', 'semana' (ISO, empieza el lunes) o 'mes'
+
+    Returns:
+        Arreglo datetime64[D] con el inicio del período de cada día
+    """
+    if granularidad == "semana":
+        # El 1970-01-01 fue jueves: (días desde la época + 3) % 7 es 0 los lunes
+        return dias - (dias.astype("int64") + 3) % 7
+    if granularidad == "mes":
+        return dias.astype("datetime64[M]").astype("datetime64[D]")
+    return dias
+
+
+def agregar_serie(
+    filas: List[Dict[str, Any]],
+    desde: date,
+    hasta: date,
+    granularidad: str = "dia",
+    dimension: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Re-agrupa buckets diarios por período y, opcionalmente, por una dimensión
+
+    Args:
+        filas: Buckets de estadisticas_diarias
+        desde: Primer día del rango (inclusive)
+        hasta: Último día del rango (inclusive)
+        granularidad: 'dia', 'semana' o 'mes'
+        dimension: 'tipo_estudio', 'especie', 'veterinario' o None para una sola serie
+
+    Returns:
+        Dict con los períodos, los totales por período y una serie por valor de la dimensión
+    """
+    # Todos los períodos del rango, aunque no tengan reportes
+    periodos = np.unique(inicio_de_periodo(
+        np.arange(np.datetime64(desde, "D"), np.datetime64(hasta, "D") + 1), granularidad
+    ))
+
+    if filas:
+        dias = np.array([fila["dia"][:10] for fila in filas], dtype="datetime64[D]")
+        indice_periodo = np.searchsorted(periodos, inicio_de_periodo(dias, granularidad))
+        if dimension:
+            claves, indice_clave = np.unique([fila[dimension] for fila in filas], return_inverse=True)
+        else:
+            claves, indice_clave = np.array(["total"]), np.zeros(len(filas), dtype=np.int64)
+    else:
+        indice_periodo = indice_clave = np.zeros(0, dtype=np.int64)
+        claves = np.array([]) if dimension else np.array(["total"])
+
+    # Una matriz (clave x período) por contador
+    matrices = {}
+    for campo in CAMPOS_BUCKET:
+        matriz = np.zeros((len(claves), len(periodos)), dtype=np.float64)
+        np.add.at(matriz, (indice_clave, indice_periodo), [float(fila[campo]) for fila in filas])
+        matrices[campo] = matriz
+
+    def promedio(suma: np.ndarray, cantidad: np.ndarray) -> List[Optional[float]]:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            valores = np.round(suma / cantidad, 4)
+        return [float(v) if c else None for v, c in zip(np.atleast_1d(valores), np.atleast_1d(cantidad))]
+
+    totales = {campo: matriz.sum(axis=0) for campo, matriz in matrices.items()}
+    series = []
+    for i, clave in enumerate(claves):
+        con_confianza = matrices["con_confianza"][i].sum()
+        series.append({
+            "clave": str(clave),
+            "valores": matrices["total"][i].astype(int).tolist(),
+            "total": int(matrices["total"][i].sum()),
+            "completados": int(matrices["completados"][i].sum()),
+            "errores": int(matrices["errores"][i].sum()),
+            "confianza_promedio": promedio(matrices["suma_confianza"][i].sum(), con_confianza)[0]
+        })
+    series.sort(key=lambda serie: (-serie["total"], serie["clave"]))
+
+    return {
+        "desde": desde.isoformat(),
+        "hasta": hasta.isoformat(),
+        "agrupar_por": granularidad,
+        "dimension": dimension,
+        "periodos": [str(periodo) for periodo in periodos],
+        "totales": {
+            "reportes": totales["total"].astype(int).tolist(),
+            "completados": totales["completados"].astype(int).tolist(),
+            "errores": totales["errores"].astype(int).tolist(),
+            "confianza_promedio": promedio(totales["suma_confianza"], totales["con_confianza"])
+        },
+        "series": series
+    }
+
+
+class EstadisticasServicio:
+    """
+    Estadísticas del sistema sobre contadores y buckets mantenidos por triggers
+
+    Las lecturas nunca recorren la tabla de reportes y además se guardan en
+    una caché en proceso de TTL corto. Una tarea en segundo plano reconcilia
+    contadores y buckets cada cierto tiempo para corregir cualquier desvío
+    (TRUNCATE, cargas con triggers desactivados).
+    """
+
+    def __init__(self, repositorio_postgres=None):
+        """
+        Args:
+            repositorio_postgres: ReportesRepositorioPostgres si se usa Postgres directo
+        """
+        self.repositorio_postgres = repositorio_postgres
+        self.intervalo_reconciliacion_s = float(os.getenv("ESTADISTICAS_RECONCILIACION_S", "900"))
+        # Solo local: las lecturas ya son baratas, la caché evita ir a la base en cada polling del dashboard
+        self.cache = CacheLectura(
+            'estadisticas',
+            capacidad=64,
+            ttl_segundos=float(os.getenv("ESTADISTICAS_CACHE_TTL", "5")),
+            url_compartida=''
+        )
+        self._tarea_reconciliacion: Optional[asyncio.Task] = None
+
+    async def iniciar(self) -> None:
+        """Arranca la reconciliación periódica (0 la desactiva)"""
+        if self.intervalo_reconciliacion_s > 0 and not self._tarea_reconciliacion:
+            self._tarea_reconciliacion = asyncio.create_task(self._reconciliar_periodicamente())
+
+    async def detener(self) -> None:
+        """Detiene la reconciliación periódica"""
+        if self._tarea_reconciliacion:
+            self._tarea_reconciliacion.cancel()
+            try:
+                await self._tarea_reconciliacion
+            except asyncio.CancelledError:
+                pass
+            self._tarea_reconciliacion = None
+
+    async def obtener_estadisticas(self) -> Dict[str, Any]:
+        """
+        Obtiene las estadísticas del sistema
+
+        Returns:
+            Dict con los contadores del sistema
+        """
+        return await self.cache.obtener_o_cargar('resumen', self._cargar_estadisticas)
+
+    async def _cargar_estadisticas(self) -> Dict[str, Any]:
+        with circuito_bd.proteger():
+            if self.repositorio_postgres:
+                filas = await self.repositorio_postgres.obtener_resumen_estadisticas()
+            else:
+                supabase = obtener_conexion_bd()
+                filas = supabase.table('estadisticas_resumen').select('clave, valor, actualizado_en').execute().data
+
+        if not filas:
+            # Esquema sin la tabla de resumen poblada: se cuenta sobre la vista
+            logger.warning("estadisticas_resumen vacía; usando vista_estadisticas_sistema")
+            return await self._cargar_desde_vista()
+        return resumen_a_estadisticas(filas)
+
+    async def _cargar_desde_vista(self) -> Dict[str, Any]:
+        with circuito_bd.proteger():
+            if self.repositorio_postgres:
+                return await self.repositorio_postgres.obtener_estadisticas_vista()
+            supabase = obtener_conexion_bd()
+            resultado = supabase.table('vista_estadisticas_sistema').select('*').execute()
+        return resultado.data[0] if resultado.data else {}
+
+    async def obtener_serie(
+        self,
+        desde: date,
+        hasta: date,
+        granularidad: str = "dia",
+        dimension: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Obtiene una serie temporal de reportes desde los buckets diarios
+
+        Args:
+            desde: Primer día (inclusive)
+            hasta: Último día (inclusive)
+            granularidad: 'dia', 'semana' o 'mes'
+            dimension: 'tipo_estudio', 'especie', 'veterinario' o None
+
+        Returns:
+            Serie con períodos, totales y una serie por valor de la dimensión
+        """
+        async def cargar():
+            filas = await self._cargar_buckets(desde, hasta)
+            with metricas.medir_latencia("estadisticas.agregacion_serie_ms"):
+                return agregar_serie(filas, desde, hasta, granularidad, dimension)
+
+        clave = f"serie:{desde}:{hasta}:{granularidad}:{dimension or ''}"
+        return await self.cache.obtener_o_cargar(clave, cargar)
+
+    async def _cargar_buckets(self, desde: date, hasta: date) -> List[Dict[str, Any]]:
+        with circuito_bd.proteger():
+            if self.repositorio_postgres:
+                return await self.repositorio_postgres.obtener_estadisticas_diarias(desde, hasta)
+
+            supabase = obtener_conexion_bd()
+            filas: List[Dict[str, Any]] = []
+            while True:
+                pagina = supabase.table('estadisticas_diarias').select('*') \
+                    .gte('dia', desde.isoformat()) \
+                    .lte('dia', hasta.isoformat()) \
+                    .order('dia') \
+                    .range(len(filas), len(filas) + TAMANO_PAGINA_SUPABASE - 1) \
+                    .execute().data
+                filas.extend(pagina)
+                if len(pagina) < TAMANO_PAGINA_SUPABASE:
+                    return filas
+
+    async def reconciliar(self) -> List[Dict[str, Any]]:
+        """
+        Recalcula contadores y buckets diarios desde las tablas y corrige los desviados
+
+        Returns:
+            Claves del resumen corregidas con su valor anterior y el real
+        """
+        with metricas.medir_latencia("estadisticas.reconciliacion_ms"), circuito_bd.proteger():
+            if self.repositorio_postgres:
+                desvios = await self.repositorio_postgres.reconciliar_estadisticas()
+                buckets_desviados = await self.repositorio_postgres.reconstruir_estadisticas_diarias()
+            else:
+                supabase = obtener_conexion_bd()
+                desvios = supabase.rpc('reconciliar_estadisticas', {}).execute().data or []
+                buckets_desviados = supabase.rpc('reconstruir_estadisticas_diarias', {}).execute().data or 0
+
+        metricas.incrementar("estadisticas.reconciliaciones")
+        if desvios:
+            metricas.incrementar("estadisticas.desvios_corregidos", len(desvios))
+            for desvio in desvios:
+                logger.warning(
+                    f"Estadística '{desvio['clave']}' desviada: "
+                    f"{desvio['valor_anterior']} -> {desvio['valor_real']}"
+                )
+            await self.cache.invalidar('resumen')
+        if buckets_desviados:
+            metricas.incrementar("estadisticas.buckets_corregidos", buckets_desviados)
+            logger.warning(f"{buckets_desviados} buckets de estadisticas_diarias reconstruidos")
+        return desvios
+
+    async def _reconciliar_periodicamente(self) -> None:
+        while True:
+            await asyncio.sleep(self.intervalo_reconciliacion_s)
+            try:
+                await self.reconciliar()
+            except Exception as e:
+                logger.error(f"Error al reconciliar estadísticas: {str(e)}")
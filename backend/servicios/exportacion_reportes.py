@@ -0,0 +1,195 @@
+"""
+Exportación de reportes
+Serializa reportes a NDJSON, CSV o Parquet de forma incremental, lote por lote
+"""
+
+from typing import Dict, Any, List, AsyncIterator, Tuple
+import csv
+import io
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# pyarrow es opcional: sin el paquete solo se ofrecen NDJSON y CSV
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Formato -> (tipo de contenido, extensión del archivo)
+FORMATOS_EXPORTACION: Dict[str, Tuple[str, str]] = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+# Columnas de las exportaciones tabulares (CSV y Parquet) con su tipo en Parquet
+COLUMNAS_PLANAS: List[Tuple[str, str]] = [
+    ('id', 'texto'),
+    ('fecha_creacion', 'texto'),
+    ('fecha_actualizacion', 'texto'),
+    ('tipo_estudio', 'texto'),
+    ('estado', 'texto'),
+    ('archivo_original', 'texto'),
+    ('paciente_nombre', 'texto'),
+    ('paciente_especie', 'texto'),
+    ('paciente_raza', 'texto'),
+    ('paciente_edad', 'texto'),
+    ('paciente_sexo', 'texto'),
+    ('tutor_nombre', 'texto'),
+    ('veterinario_id', 'texto'),
+    ('veterinario_nombre', 'texto'),
+    ('diagnostico_principal', 'texto'),
+    ('diagnostico_secundarios', 'texto'),
+    ('recomendaciones', 'texto'),
+    ('cantidad_imagenes', 'entero'),
+    ('confianza_extraccion', 'decimal'),
+]
+
+
+def parquet_disponible() -> bool:
+    """Indica si está instalado pyarrow para exportar en Parquet"""
+    return pa is not None
+
+
+def _texto(valor: Any) -> Any:
+    if valor is None or valor == '':
+        return None
+    if isinstance(valor, list):
+        return '; '.join(str(elemento) for elemento in valor)
+    if isinstance(valor, dict):
+        return json.dumps(valor, ensure_ascii=False)
+    return str(valor)
+
+
+def fila_plana(reporte: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Aplana un reporte (formato del frontend) a las columnas de COLUMNAS_PLANAS
+
+    Args:
+        reporte: Reporte formateado
+
+    Returns:
+        Dict columna -> valor
+    """
+    paciente = reporte.get('paciente') or {}
+    tutor = reporte.get('tutor') or {}
+    veterinario = reporte.get('veterinario') or {}
+    diagnostico = reporte.get('diagnostico') or {}
+    try:
+        confianza = float(reporte.get('confianza_extraccion'))
+    except (TypeError, ValueError):
+        confianza = None
+    return {
+        'id': _texto(reporte.get('id')),
+        'fecha_creacion': _texto(reporte.get('fecha_creacion')),
+        'fecha_actualizacion': _texto(reporte.get('fecha_actualizacion')),
+        'tipo_estudio': _texto(reporte.get('tipo_estudio')),
+        'estado': _texto(reporte.get('estado')),
+        'archivo_original': _texto(reporte.get('archivo_original')),
+        'paciente_nombre': _texto(paciente.get('nombre')),
+        'paciente_especie': _texto(paciente.get('especie')),
+        'paciente_raza': _texto(paciente.get('raza')),
+        'paciente_edad': _texto(paciente.get('edad')),
+        'paciente_sexo': _texto(paciente.get('sexo')),
+        'tutor_nombre': _texto(tutor.get('nombre')),
+        'veterinario_id': _texto(veterinario.get('id')),
+        'veterinario_nombre': _texto(veterinario.get('nombre')),
+        'diagnostico_principal': _texto(diagnostico.get('principal')),
+        'diagnostico_secundarios': _texto(diagnostico.get('secundarios')),
+        'recomendaciones': _texto(diagnostico.get('recomendaciones')),
+        'cantidad_imagenes': len(reporte.get('imagenes') or []),
+        'confianza_extraccion': confianza,
+    }
+
+
+async def generar_ndjson(lotes: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    """Un reporte completo por línea; emite un bloque por lote"""
+    async for lote in lotes:
+        yield ''.join(
+            json.dumps(reporte, ensure_ascii=False, default=str) + '\n' for reporte in lote
+        ).encode('utf-8')
+
+
+async def generar_csv(lotes: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    """Encabezado y luego las filas aplanadas; emite un bloque por lote"""
+    columnas = [nombre for nombre, _ in COLUMNAS_PLANAS]
+    buffer = io.StringIO()
+    escritor = csv.DictWriter(buffer, fieldnames=columnas)
+    # BOM para que Excel reconozca UTF-8
+    buffer.write('\ufeff')
+    escritor.writeheader()
+    async for lote in lotes:
+        escritor.writerows(fila_plana(reporte) for reporte in lote)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _SalidaIncremental:
+    """Archivo de solo escritura que entrega lo escrito hasta el momento y lo descarta"""
+
+    def __init__(self):
+        self._partes: List[bytes] = []
+        self._posicion = 0
+        self.closed = False
+
+    def write(self, datos) -> int:
+        datos = bytes(datos)
+        self._partes.append(datos)
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self) -> int:
+        return self._posicion
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def vaciar(self) -> bytes:
+        datos = b''.join(self._partes)
+        self._partes = []
+        return datos
+
+
+def _esquema_parquet():
+    tipos = {'texto': pa.string(), 'entero': pa.int32(), 'decimal': pa.float64()}
+    return pa.schema([(nombre, tipos[tipo]) for nombre, tipo in COLUMNAS_PLANAS])
+
+
+async def generar_parquet(lotes: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    """
+    Cada lote se convierte a columnas y se escribe como un row group
+
+    Parquet guarda el índice de row groups al final del archivo, así que el
+    archivo se puede emitir por partes sin tenerlo completo en memoria.
+    """
+    esquema = _esquema_parquet()
+    salida = _SalidaIncremental()
+    escritor = pq.ParquetWriter(salida, esquema, compression='zstd')
+    try:
+        async for lote in lotes:
+            filas = [fila_plana(reporte) for reporte in lote]
+            columnas = {nombre: [fila[nombre] for fila in filas] for nombre, _ in COLUMNAS_PLANAS}
+            escritor.write_table(pa.Table.from_pydict(columnas, schema=esquema))
+            datos = salida.vaciar()
+            if datos:
+                yield datos
+    finally:
+        escritor.close()
+    yield salida.vaciar()
+
+
+GENERADORES_EXPORTACION = {
+    'ndjson': generar_ndjson,
+    'csv': generar_csv,
+    'parquet': generar_parquet,
+}
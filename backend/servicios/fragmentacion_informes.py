@@ -0,0 +1,249 @@
+"""
+Fragmentación de informes largos
+Divide el texto extraído en fragmentos que entran en el presupuesto de tokens y combina sus resúmenes en uno
+"""
+
+from typing import Dict, List, Optional, Tuple
+import math
+import re
+
+# Caracteres por token aproximados para texto en español (Gemini no expone el tokenizador localmente)
+CARACTERES_POR_TOKEN = 4
+
+# Líneas que abren una sección o una página nueva: cortes preferidos entre fragmentos
+PATRON_CORTE = re.compile(
+    r"^\s*("
+    r"#{1,6}\s"                                         # encabezado Markdown
+    r"|(?i:-{3,}\s*p[áa]gina\b)"                        # --- Página 2 ---
+    r"|(?i:(p[áa]gina|page)\s+\d+)"                     # Página 2 / Página 2 de 5
+    r"|[A-ZÁÉÍÓÚÑ][A-ZÁÉÍÓÚÑ0-9 /().,-]{3,}:?\s*$"      # TÍTULO EN MAYÚSCULAS
+    r")"
+)
+
+# Diagnósticos que el modelo completa cuando el fragmento no trae ninguno
+DIAGNOSTICOS_VACIOS = ('', 'no especificado', 'no especificada', 'no se menciona', 'no consta', 'n/a', '-')
+
+
+def estimar_tokens(texto: str) -> int:
+    """Tokens aproximados de un texto"""
+    return math.ceil(len(texto) / CARACTERES_POR_TOKEN)
+
+
+def _dividir_en_bloques(texto: str) -> List[str]:
+    """Corta el texto antes de cada salto de página o encabezado de sección"""
+    bloques, actual = [], []
+    for linea in texto.replace('\f', '\n\f').split('\n'):
+        if actual and (linea.startswith('\f') or PATRON_CORTE.match(linea)):
+            bloques.append('\n'.join(actual))
+            actual = []
+        actual.append(linea.lstrip('\f'))
+    if actual:
+        bloques.append('\n'.join(actual))
+    return [bloque for bloque in bloques if bloque.strip()]
+
+
+def _partir_bloque(bloque: str, maximo_caracteres: int) -> List[str]:
+    """Parte un bloque que no entra en un fragmento: por párrafos, luego por líneas y, en último caso, por caracteres"""
+    if len(bloque) <= maximo_caracteres:
+        return [bloque]
+    for separador in ('\n\n', '\n'):
+        partes = [parte for parte in bloque.split(separador) if parte.strip()]
+        if len(partes) > 1:
+            resultado = []
+            for parte in partes:
+                resultado.extend(_partir_bloque(parte, maximo_caracteres))
+            return resultado
+    return [bloque[i:i + maximo_caracteres] for i in range(0, len(bloque), maximo_caracteres)]
+
+
+def dividir_en_fragmentos(texto: str, maximo_tokens: int) -> List[str]:
+    """
+    Divide un informe en fragmentos de hasta 'maximo_tokens' tokens (aprox.)
+
+    Corta preferentemente en los límites de página o de sección; una sección
+    que sola excede el presupuesto se parte por párrafos o líneas. Las
+    secciones consecutivas se agrupan mientras entren en el mismo fragmento.
+
+    Args:
+        texto: Texto extraído del PDF
+        maximo_tokens: Presupuesto de tokens del informe por fragmento
+
+    Returns:
+        Lista de fragmentos en orden (uno solo si el texto ya entra)
+    """
+    maximo_caracteres = max(1, maximo_tokens * CARACTERES_POR_TOKEN)
+    if len(texto) <= maximo_caracteres:
+        return [texto]
+
+    piezas = []
+    for bloque in _dividir_en_bloques(texto):
+        piezas.extend(_partir_bloque(bloque, maximo_caracteres))
+
+    fragmentos, actual = [], ''
+    for pieza in piezas:
+        if actual and len(actual) + 1 + len(pieza) > maximo_caracteres:
+            fragmentos.append(actual)
+            actual = pieza
+        else:
+            actual = f"{actual}\n{pieza}" if actual else pieza
+    if actual:
+        fragmentos.append(actual)
+    return fragmentos
+
+
+def _normalizar(texto: str) -> str:
+    return re.sub(r'\s+', ' ', texto).strip().lower()
+
+
+def _secciones(markdown: str) -> Tuple[str, Dict[str, List[str]]]:
+    """Separa un resumen en encabezado y secciones '## ...' (clave: título sin el emoji)"""
+    encabezado, secciones, actual = [], {}, None
+    for linea in markdown.split('\n'):
+        if linea.startswith('## '):
+            titulo = linea[3:].strip()
+            for clave in ('Hallazgos', 'Diagnóstico', 'Plan de Acción', 'Imágenes'):
+                if clave in titulo:
+                    actual = secciones.setdefault(clave, [])
+                    break
+            else:
+                actual = None
+            continue
+        if actual is None:
+            if not secciones:
+                encabezado.append(linea)
+        else:
+            actual.append(linea)
+    return '\n'.join(encabezado), secciones
+
+
+def _items(lineas: List[str]) -> List[Tuple[str, List[str]]]:
+    """Viñetas de primer nivel con sus sub-viñetas (se ignoran las notas en cursiva y los separadores)"""
+    items: List[Tuple[str, List[str]]] = []
+    for linea in lineas:
+        if not linea.strip() or linea.strip() == '---' or linea.lstrip().startswith('*'):
+            continue
+        if linea.startswith('- '):
+            items.append((linea.rstrip(), []))
+        elif linea[:1].isspace() and items:
+            items[-1][1].append(linea.rstrip())
+    return items
+
+
+def _campo_encabezado(encabezado: str, campo: str) -> Optional[str]:
+    coincidencia = re.search(rf'\*\*{re.escape(campo)}:\*\*\s*([^\n]+)', encabezado)
+    if not coincidencia:
+        return None
+    valor = coincidencia.group(1).strip()
+    # Vacío o plantilla sin completar ('[Nombre]', 'AAAA-MM-DD')
+    if _normalizar(valor) in DIAGNOSTICOS_VACIOS or valor.startswith('[') or 'AAAA' in valor:
+        return None
+    return valor
+
+
+def _agregar_sin_repetir(destino: List[str], valores: List[str]) -> None:
+    vistos = {_normalizar(valor) for valor in destino}
+    for valor in valores:
+        if _normalizar(valor) not in vistos:
+            vistos.add(_normalizar(valor))
+            destino.append(valor)
+
+
+def combinar_resumenes(resumenes: List[str]) -> str:
+    """
+    Combina los resúmenes Markdown de los fragmentos de un informe en uno
+
+    - Encabezado: cada campo se toma del primer fragmento que lo informa.
+    - Hallazgos: se concatenan; los del mismo órgano se agrupan bajo una viñeta.
+    - Diagnóstico principal: el del último fragmento que lo informa (las
+      conclusiones suelen estar al final del informe); los principales de
+      los demás fragmentos pasan a secundarios.
+    - Secundarios, recomendaciones e imágenes: unión sin repetidos, en orden.
+
+    Args:
+        resumenes: Markdown de cada fragmento, en el orden del informe
+
+    Returns:
+        Markdown con la misma estructura que el de un informe procesado de una vez
+    """
+    if len(resumenes) == 1:
+        return resumenes[0]
+
+    partes = [_secciones(resumen) for resumen in resumenes]
+
+    campos = {}
+    for campo in ('Fecha del Estudio', 'Tipo de Estudio', 'Paciente', 'Propietario', 'Veterinario/s Principal/es'):
+        campos[campo] = next(
+            (valor for valor in (_campo_encabezado(encabezado, campo) for encabezado, _ in partes) if valor),
+            'No especificado'
+        )
+    titulo = next(
+        (linea for encabezado, _ in partes for linea in encabezado.split('\n')
+         if linea.startswith('# ') and '[' not in linea),
+        '# Resumen del Informe Veterinario'
+    )
+
+    # Hallazgos agrupados por viñeta de primer nivel (órgano)
+    hallazgos: Dict[str, Tuple[str, List[str]]] = {}
+    for _, secciones in partes:
+        for item, subitems in _items(secciones.get('Hallazgos', [])):
+            clave = _normalizar(item)
+            if clave not in hallazgos:
+                hallazgos[clave] = (item, [])
+            _agregar_sin_repetir(hallazgos[clave][1], subitems)
+
+    principales, secundarios = [], []
+    for _, secciones in partes:
+        principal, secundarios_fragmento = None, []
+        for item, subitems in _items(secciones.get('Diagnóstico', [])):
+            if 'Diagnóstico Principal:' in item:
+                valor = item.split('Diagnóstico Principal:**', 1)[-1].strip()
+                if _normalizar(valor) not in DIAGNOSTICOS_VACIOS:
+                    principal = valor
+            elif 'Secundarios' in item:
+                secundarios_fragmento = [subitem.strip()[2:].strip() for subitem in subitems if subitem.strip().startswith('- ')]
+        if principal:
+            principales.append(principal)
+        _agregar_sin_repetir(secundarios, [s for s in secundarios_fragmento if _normalizar(s) not in DIAGNOSTICOS_VACIOS])
+    principal = principales[-1] if principales else 'No especificado'
+    secundarios_finales: List[str] = []
+    _agregar_sin_repetir(secundarios_finales, principales[:-1] + secundarios)
+    secundarios_finales = [s for s in secundarios_finales if _normalizar(s) != _normalizar(principal)]
+
+    recomendaciones: List[str] = []
+    imagenes: List[str] = []
+    for _, secciones in partes:
+        _agregar_sin_repetir(recomendaciones, [item for item, _ in _items(secciones.get('Plan de Acción', []))])
+        descripciones = [
+            coincidencia.group(1).strip()
+            for item, _ in _items(secciones.get('Imágenes', []))
+            for coincidencia in [re.search(r'\[IMAGEN \d+:\s*([^\]]+)\]', item)] if coincidencia
+        ]
+        _agregar_sin_repetir(imagenes, descripciones)
+
+    lineas = [
+        titulo,
+        '',
+        f"**Fecha del Estudio:** {campos['Fecha del Estudio']}",
+        f"**Tipo de Estudio:** {campos['Tipo de Estudio']}",
+        f"**Paciente:** {campos['Paciente']}",
+        f"**Propietario:** {campos['Propietario']}",
+        f"**Veterinario/s Principal/es:** {campos['Veterinario/s Principal/es']}",
+        '',
+        '---',
+        '',
+        '## 🔬 Hallazgos Clínicos Detallados',
+        ''
+    ]
+    for item, subitems in hallazgos.values():
+        lineas.append(item)
+        lineas.extend(subitems)
+    lineas += ['', '## 🩺 Diagnóstico y Conclusiones', '', f"- **Diagnóstico Principal:** {principal}"]
+    if secundarios_finales:
+        lineas.append('- **Diagnósticos Secundarios / Presuntivos:**')
+        lineas.extend(f"  - {secundario}" for secundario in secundarios_finales)
+    lineas += ['', '## 💡 Plan de Acción y Recomendaciones', '']
+    lineas.extend(recomendaciones)
+    lineas += ['', '## 🖼️ Imágenes Médicas Adjuntas', '']
+    lineas.extend(f"- **[IMAGEN {i}: {descripcion}]**" for i, descripcion in enumerate(imagenes, 1))
+    lineas += ['', '---']
+    return '\n'.join(lineas)
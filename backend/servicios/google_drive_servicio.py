@@ -15,8 +15,13 @@ from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload
 import pickle
 
+from utilidades.circuitos import obtener_circuito, es_fallo_http
+
 logger = logging.getLogger(__name__)
 
+# Con Drive caído la subida se saltea al instante y el reporte se guarda igual
+circuito_drive = obtener_circuito('drive', es_fallo=es_fallo_http)
+
 class GoogleDriveServicio:
     """Servicio para integración con Google Drive"""
     
@@ -101,11 +106,12 @@ class GoogleDriveServicio:
             )
             
             # Subir archivo
-            archivo_drive = self.servicio.files().create(
-                body=metadata,
-                media_body=media,
-                fields='id,name,webViewLink,webContentLink'
-            ).execute()
+            with circuito_drive.proteger():
+                archivo_drive = self.servicio.files().create(
+                    body=metadata,
+                    media_body=media,
+                    fields='id,name,webViewLink,webContentLink'
+                ).execute()
             
             logger.info(f"Archivo subido exitosamente a Google Drive: {archivo_drive['id']}")
             
@@ -168,11 +174,12 @@ class GoogleDriveServicio:
             )
             
             # Subir archivo
-            archivo_drive = self.servicio.files().create(
-                body=metadata,
-                media_body=media,
-                fields='id,name,webViewLink,webContentLink'
-            ).execute()
+            with circuito_drive.proteger():
+                archivo_drive = self.servicio.files().create(
+                    body=metadata,
+                    media_body=media,
+                    fields='id,name,webViewLink,webContentLink'
+                ).execute()
             
             logger.info(f"Archivo subido exitosamente a Google Drive: {archivo_drive['id']}")
             
@@ -226,10 +233,11 @@ class GoogleDriveServicio:
             }
             
             # Crear carpeta
-            carpeta = self.servicio.files().create(
-                body=metadata,
-                fields='id,name,webViewLink'
-            ).execute()
+            with circuito_drive.proteger():
+                carpeta = self.servicio.files().create(
+                    body=metadata,
+                    fields='id,name,webViewLink'
+                ).execute()
             
             logger.info(f"Carpeta creada exitosamente: {carpeta['id']}")
             
@@ -274,11 +282,12 @@ class GoogleDriveServicio:
             query = f"'{self.folder_id}' in parents" if self.folder_id else None
             
             # Obtener archivos
-            resultados = self.servicio.files().list(
-                q=query,
-                pageSize=limite,
-                fields="nextPageToken, files(id, name, size, createdTime, webViewLink)"
-            ).execute()
+            with circuito_drive.proteger():
+                resultados = self.servicio.files().list(
+                    q=query,
+                    pageSize=limite,
+                    fields="nextPageToken, files(id, name, size, createdTime, webViewLink)"
+                ).execute()
             
             archivos = resultados.get('files', [])
             
@@ -327,7 +336,8 @@ class GoogleDriveServicio:
             logger.info(f"Eliminando archivo de Google Drive: {archivo_id}")
             
             # Eliminar archivo
-            self.servicio.files().delete(fileId=archivo_id).execute()
+            with circuito_drive.proteger():
+                self.servicio.files().delete(fileId=archivo_id).execute()
             
             logger.info(f"Archivo eliminado exitosamente: {archivo_id}")
             
@@ -360,7 +370,8 @@ class GoogleDriveServicio:
                 }
             
             # Intentar obtener información del usuario
-            about = self.servicio.about().get(fields='user').execute()
+            with circuito_drive.proteger():
+                about = self.servicio.about().get(fields='user').execute()
             usuario = about.get('user', {})
             
             return {
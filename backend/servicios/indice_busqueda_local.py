@@ -0,0 +1,437 @@
+"""
+Índice de búsqueda local
+Implementa un índice invertido con ranking BM25 sobre el almacén local de reportes
+"""
+
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+from array import array
+from collections import Counter
+import heapq
+import logging
+import math
+import os
+import re
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# Palabras vacías en español (ya sin acentos, igual que los tokens normalizados)
+PALABRAS_VACIAS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aqui asi aun bajo bien
+cada casi como con contra cual cuales cuando de del desde donde dos durante e el
+ella ellas ello ellos en entre era eran es esa esas ese eso esos esta estaba
+estado estan estar estas este esto estos fue fueron ha habia han hasta hay la las
+le les lo los mas me mi mis mismo muy nada ni no nos o otra otras otro otros para
+pero poco por porque que quien se sea segun ser si sin sobre son su sus tambien
+tan te tiene tienen todo todos tras tu un una uno unos usted y ya
+""".split())
+
+# Sufijos a recortar después del plural, de más largo a más corto
+# (stemming liviano para español)
+SUFIJOS = (
+    'amiento', 'imiento', 'mente', 'acion', 'ucion', 'idad',
+    'adora', 'ador', 'ancia', 'encia', 'able', 'ible', 'ista', 'ismo',
+    'oso', 'osa', 'ivo', 'iva', 'a', 'o', 'e'
+)
+
+LONGITUD_MINIMA_RAIZ = 3
+
+# Peso de cada campo, aplicado como frecuencia del término
+CAMPOS_INDEXADOS = (
+    (('diagnostico', 'principal'), 3),
+    (('paciente', 'nombre'), 3),
+    (('paciente', 'especie'), 2),
+    (('paciente', 'raza'), 2),
+    (('tutor', 'nombre'), 2),
+    (('diagnostico', 'secundarios'), 2),
+    (('diagnostico', 'observaciones'), 1),
+    (('contenido_extraido',), 1),
+)
+
+PATRON_PALABRA = re.compile(r'\w+', re.UNICODE)
+
+CABECERA_ARCHIVO = b'DVIX'
+VERSION_ARCHIVO = 1
+
+
+def plegar_acentos(texto: str) -> str:
+    """Pasa a minúsculas y elimina tildes y diéresis (la ñ queda como n)"""
+    descompuesto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def obtener_raiz(palabra: str) -> str:
+    """Recorta el plural y luego el primer sufijo que deje una raíz suficientemente larga"""
+    for plural in ('es', 's'):
+        if palabra.endswith(plural) and len(palabra) - len(plural) >= LONGITUD_MINIMA_RAIZ:
+            palabra = palabra[:-len(plural)]
+            break
+    for sufijo in SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= LONGITUD_MINIMA_RAIZ:
+            return palabra[:-len(sufijo)]
+    return palabra
+
+
+def normalizar_palabra(palabra: str) -> Optional[str]:
+    """Normaliza una palabra suelta; devuelve None si no debe indexarse"""
+    plegada = plegar_acentos(palabra)
+    if len(plegada) < 2 or plegada in PALABRAS_VACIAS:
+        return None
+    return obtener_raiz(plegada)
+
+
+def normalizar_texto(texto: str) -> List[str]:
+    """
+    Convierte un texto en la lista de términos indexables
+
+    Args:
+        texto: Texto libre en español
+
+    Returns:
+        Lista de raíces sin acentos ni palabras vacías
+    """
+    terminos = []
+    for palabra in PATRON_PALABRA.findall(texto or ''):
+        termino = normalizar_palabra(palabra)
+        if termino:
+            terminos.append(termino)
+    return terminos
+
+
+def resaltar_fragmento(texto: str, terminos: Iterable[str], max_palabras: int = 25) -> str:
+    """
+    Arma un fragmento alrededor de la primera coincidencia con <mark>
+
+    Args:
+        texto: Texto original
+        terminos: Términos normalizados de la consulta
+        max_palabras: Cantidad de palabras del fragmento
+
+    Returns:
+        Fragmento con las coincidencias resaltadas
+    """
+    terminos = set(terminos)
+    palabras = (texto or '').split()
+    if not palabras:
+        return ''
+
+    coincide = [
+        any(normalizar_palabra(p) in terminos for p in PATRON_PALABRA.findall(palabra))
+        for palabra in palabras
+    ]
+    primera = coincide.index(True) if True in coincide else 0
+    inicio = max(0, primera - max_palabras // 3)
+    fin = min(len(palabras), inicio + max_palabras)
+
+    fragmento = [
+        f"<mark>{palabra}</mark>" if coincide[i] else palabra
+        for i, palabra in enumerate(palabras[inicio:fin], start=inicio)
+    ]
+    return ' '.join(fragmento)
+
+
+def _codificar_varint(valor: int, destino: bytearray) -> None:
+    """Agrega un entero sin signo en formato varint (7 bits por byte)"""
+    while valor >= 0x80:
+        destino.append((valor & 0x7F) | 0x80)
+        valor >>= 7
+    destino.append(valor)
+
+
+def _decodificar_varint(datos: bytes, posicion: int) -> Tuple[int, int]:
+    """Lee un varint y devuelve (valor, nueva posición)"""
+    valor = 0
+    desplazamiento = 0
+    while True:
+        byte = datos[posicion]
+        posicion += 1
+        valor |= (byte & 0x7F) << desplazamiento
+        if byte < 0x80:
+            return valor, posicion
+        desplazamiento += 7
+
+
+class IndiceBusquedaLocal:
+    """Índice invertido en memoria con ranking BM25 y persistencia compacta"""
+
+    def __init__(self, archivo_indice: str, k1: float = 1.2, b: float = 0.75):
+        self.archivo_indice = archivo_indice
+        self.k1 = k1
+        self.b = b
+        self._reiniciar()
+
+    def _reiniciar(self):
+        """Deja el índice vacío"""
+        # Número interno de documento -> ID del reporte (None si fue eliminado)
+        self.ids: List[Optional[str]] = []
+        self.posiciones: Dict[str, int] = {}
+        self.longitudes = array('I')
+        # Término -> (documentos ordenados, frecuencias)
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.eliminados: set = set()
+        self.longitud_total = 0
+
+    @property
+    def total_documentos(self) -> int:
+        """Cantidad de documentos vigentes"""
+        return len(self.posiciones)
+
+    def _terminos_reporte(self, reporte: Dict[str, Any]) -> Counter:
+        """Extrae los términos ponderados de los campos indexados"""
+        frecuencias = Counter()
+        for ruta, peso in CAMPOS_INDEXADOS:
+            valor: Any = reporte
+            for clave in ruta:
+                valor = valor.get(clave) if isinstance(valor, dict) else None
+            if not valor:
+                continue
+            if isinstance(valor, list):
+                valor = ' '.join(str(v) for v in valor)
+            for termino in normalizar_texto(str(valor)):
+                frecuencias[termino] += peso
+        return frecuencias
+
+    def agregar(self, reporte: Dict[str, Any]) -> None:
+        """
+        Indexa un reporte (si ya existía, reemplaza la versión anterior)
+
+        Args:
+            reporte: Reporte en el formato del almacén local
+        """
+        reporte_id = reporte.get('id')
+        if not reporte_id:
+            return
+        if reporte_id in self.posiciones:
+            self.eliminar(reporte_id)
+
+        documento = len(self.ids)
+        frecuencias = self._terminos_reporte(reporte)
+        longitud = sum(frecuencias.values())
+
+        self.ids.append(reporte_id)
+        self.posiciones[reporte_id] = documento
+        self.longitudes.append(longitud)
+        self.longitud_total += longitud
+
+        # Los documentos nuevos siempre tienen el número más alto,
+        # así que agregar al final mantiene las listas ordenadas
+        for termino, frecuencia in frecuencias.items():
+            if termino not in self.postings:
+                self.postings[termino] = (array('I'), array('I'))
+            documentos, tfs = self.postings[termino]
+            documentos.append(documento)
+            tfs.append(frecuencia)
+
+    def eliminar(self, reporte_id: str) -> None:
+        """
+        Quita un reporte del índice (queda marcado hasta la próxima compactación)
+
+        Args:
+            reporte_id: ID del reporte
+        """
+        documento = self.posiciones.pop(reporte_id, None)
+        if documento is None:
+            return
+        self.eliminados.add(documento)
+        self.ids[documento] = None
+        self.longitud_total -= self.longitudes[documento]
+
+    def buscar(
+        self,
+        consulta: str,
+        limite: int = 10,
+        desplazamiento: int = 0
+    ) -> Tuple[List[Tuple[str, float]], int]:
+        """
+        Busca reportes rankeados con BM25
+
+        Args:
+            consulta: Texto de búsqueda
+            limite: Cantidad máxima de resultados
+            desplazamiento: Cantidad de resultados a saltear
+
+        Returns:
+            Tupla (lista de (ID, puntaje), total de coincidencias)
+        """
+        terminos = set(normalizar_texto(consulta))
+        total_documentos = self.total_documentos
+        if not terminos or not total_documentos:
+            return [], 0
+
+        promedio_longitud = self.longitud_total / total_documentos or 1.0
+        puntajes: Dict[int, float] = {}
+
+        for termino in terminos:
+            posting = self.postings.get(termino)
+            if not posting:
+                continue
+            documentos, tfs = posting
+            vigentes = [
+                (documento, tf) for documento, tf in zip(documentos, tfs)
+                if documento not in self.eliminados
+            ]
+            if not vigentes:
+                continue
+
+            df = len(vigentes)
+            idf = math.log(1 + (total_documentos - df + 0.5) / (df + 0.5))
+            for documento, tf in vigentes:
+                normalizacion = self.k1 * (1 - self.b + self.b * self.longitudes[documento] / promedio_longitud)
+                puntajes[documento] = puntajes.get(documento, 0.0) + idf * tf * (self.k1 + 1) / (tf + normalizacion)
+
+        mejores = heapq.nlargest(desplazamiento + limite, puntajes.items(), key=lambda item: item[1])
+        resultados = [
+            (self.ids[documento], puntaje)
+            for documento, puntaje in mejores[desplazamiento:]
+        ]
+        return resultados, len(puntajes)
+
+    def compactar(self) -> None:
+        """Renumera los documentos descartando los eliminados"""
+        if not self.eliminados:
+            return
+
+        nuevo_numero = {}
+        ids = []
+        longitudes = array('I')
+        for documento, reporte_id in enumerate(self.ids):
+            if reporte_id is None:
+                continue
+            nuevo_numero[documento] = len(ids)
+            ids.append(reporte_id)
+            longitudes.append(self.longitudes[documento])
+
+        postings = {}
+        for termino, (documentos, tfs) in self.postings.items():
+            nuevos_documentos, nuevos_tfs = array('I'), array('I')
+            for documento, tf in zip(documentos, tfs):
+                if documento in nuevo_numero:
+                    nuevos_documentos.append(nuevo_numero[documento])
+                    nuevos_tfs.append(tf)
+            if nuevos_documentos:
+                postings[termino] = (nuevos_documentos, nuevos_tfs)
+
+        self.ids = ids
+        self.posiciones = {reporte_id: i for i, reporte_id in enumerate(ids)}
+        self.longitudes = longitudes
+        self.postings = postings
+        self.eliminados = set()
+
+    def guardar(self) -> None:
+        """
+        Persiste el índice en disco
+
+        Formato: cabecera, tabla de documentos (ID y longitud) y por cada
+        término sus postings con números de documento delta-codificados
+        y frecuencias, todo como varints.
+        """
+        try:
+            self.compactar()
+
+            datos = bytearray(CABECERA_ARCHIVO)
+            datos.append(VERSION_ARCHIVO)
+
+            _codificar_varint(len(self.ids), datos)
+            for reporte_id, longitud in zip(self.ids, self.longitudes):
+                id_bytes = reporte_id.encode('utf-8')
+                _codificar_varint(len(id_bytes), datos)
+                datos.extend(id_bytes)
+                _codificar_varint(longitud, datos)
+
+            _codificar_varint(len(self.postings), datos)
+            for termino in sorted(self.postings):
+                documentos, tfs = self.postings[termino]
+                termino_bytes = termino.encode('utf-8')
+                _codificar_varint(len(termino_bytes), datos)
+                datos.extend(termino_bytes)
+                _codificar_varint(len(documentos), datos)
+                anterior = 0
+                for documento in documentos:
+                    _codificar_varint(documento - anterior, datos)
+                    anterior = documento
+                for tf in tfs:
+                    _codificar_varint(tf, datos)
+
+            # Escritura atómica para no dejar un índice corrupto si se corta el proceso
+            archivo_temporal = f"{self.archivo_indice}.tmp"
+            with open(archivo_temporal, 'wb') as f:
+                f.write(datos)
+            os.replace(archivo_temporal, self.archivo_indice)
+
+        except Exception as e:
+            logger.error(f"Error al guardar índice de búsqueda: {str(e)}")
+
+    def cargar(self) -> bool:
+        """
+        Carga el índice desde disco
+
+        Returns:
+            True si se pudo cargar, False en caso contrario
+        """
+        try:
+            if not os.path.exists(self.archivo_indice):
+                return False
+
+            with open(self.archivo_indice, 'rb') as f:
+                datos = f.read()
+
+            if datos[:4] != CABECERA_ARCHIVO or datos[4] != VERSION_ARCHIVO:
+                logger.warning("Formato de índice de búsqueda desconocido, se descarta")
+                return False
+
+            self._reiniciar()
+            posicion = 5
+
+            cantidad_documentos, posicion = _decodificar_varint(datos, posicion)
+            for _ in range(cantidad_documentos):
+                largo, posicion = _decodificar_varint(datos, posicion)
+                reporte_id = datos[posicion:posicion + largo].decode('utf-8')
+                posicion += largo
+                longitud, posicion = _decodificar_varint(datos, posicion)
+                self.posiciones[reporte_id] = len(self.ids)
+                self.ids.append(reporte_id)
+                self.longitudes.append(longitud)
+                self.longitud_total += longitud
+
+            cantidad_terminos, posicion = _decodificar_varint(datos, posicion)
+            for _ in range(cantidad_terminos):
+                largo, posicion = _decodificar_varint(datos, posicion)
+                termino = datos[posicion:posicion + largo].decode('utf-8')
+                posicion += largo
+                df, posicion = _decodificar_varint(datos, posicion)
+                documentos, tfs = array('I'), array('I')
+                documento = 0
+                for _ in range(df):
+                    delta, posicion = _decodificar_varint(datos, posicion)
+                    documento += delta
+                    documentos.append(documento)
+                for _ in range(df):
+                    tf, posicion = _decodificar_varint(datos, posicion)
+                    tfs.append(tf)
+                self.postings[termino] = (documentos, tfs)
+
+            return True
+
+        except Exception as e:
+            logger.error(f"Error al cargar índice de búsqueda: {str(e)}")
+            self._reiniciar()
+            return False
+
+    def cargar_o_reconstruir(self, reportes: List[Dict[str, Any]]) -> None:
+        """
+        Carga el índice persistido o lo reconstruye si no coincide con el almacén
+
+        Args:
+            reportes: Reportes del almacén local
+        """
+        ids_almacen = {r.get('id') for r in reportes if r.get('id')}
+        if self.cargar() and set(self.posiciones) == ids_almacen:
+            logger.info(f"Índice de búsqueda local cargado ({self.total_documentos} reportes)")
+            return
+
+        logger.info("Reconstruyendo índice de búsqueda local...")
+        self._reiniciar()
+        for reporte in reportes:
+            self.agregar(reporte)
+        self.guardar()
+        logger.info(f"Índice de búsqueda local reconstruido ({self.total_documentos} reportes)")
@@ -0,0 +1,215 @@
+"""
+Índice de facetas local
+Implementa conteos por faceta con bitmaps sobre el almacén local de reportes
+"""
+
+from typing import Dict, Any, List, Optional, Tuple, Callable
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _valor_texto(valor: Any) -> Optional[str]:
+    """Normaliza el valor de una faceta; None si está vacío"""
+    if valor is None:
+        return None
+    texto = str(valor).strip()
+    return texto or None
+
+
+def _veterinario(reporte: Dict[str, Any]) -> Optional[str]:
+    # Mismo criterio que el filtro de /api/reportes: el ID del veterinario
+    veterinario = reporte.get('veterinario') or {}
+    return _valor_texto(veterinario.get('id') or veterinario.get('nombre'))
+
+
+# Faceta -> función que obtiene su valor de un reporte del almacén local
+FACETAS: Dict[str, Callable[[Dict[str, Any]], Optional[str]]] = {
+    'tipo_estudio': lambda reporte: _valor_texto(reporte.get('tipo_estudio')),
+    'especie': lambda reporte: _valor_texto((reporte.get('paciente') or {}).get('especie')),
+    'veterinario': _veterinario,
+    'estado': lambda reporte: _valor_texto(reporte.get('estado')),
+}
+
+
+class IndiceFacetas:
+    """
+    Bitmaps por valor de faceta para contar sin recorrer los reportes
+
+    Cada reporte recibe un número de documento y cada valor de faceta guarda un
+    entero de Python usado como bitmap de los documentos que lo tienen. Contar
+    una faceta bajo una combinación de filtros es un AND de bitmaps y un
+    popcount por valor, independiente de la cantidad de reportes.
+
+    Los conteos de cada faceta aplican los filtros de las demás pero no el
+    propio, así el panel puede mostrar cuántos reportes quedarían al cambiar
+    de valor.
+    """
+
+    def __init__(self):
+        self._reiniciar()
+
+    def _reiniciar(self):
+        """Deja el índice vacío"""
+        self.posiciones: Dict[str, int] = {}
+        # Número de documento -> valores de sus facetas (None si fue eliminado)
+        self.valores: List[Optional[Tuple[Optional[str], ...]]] = []
+        self.bitmaps: Dict[str, Dict[str, int]] = {faceta: {} for faceta in FACETAS}
+        self.vigentes = 0
+        # Nombre visible de cada veterinario (la faceta se cuenta por ID)
+        self.etiquetas_veterinario: Dict[str, str] = {}
+
+    @property
+    def total_documentos(self) -> int:
+        """Cantidad de documentos vigentes"""
+        return len(self.posiciones)
+
+    def reconstruir(self, reportes: List[Dict[str, Any]]) -> None:
+        """
+        Reconstruye el índice completo desde el almacén local
+
+        Args:
+            reportes: Reportes del almacén local
+        """
+        self._reiniciar()
+        entradas = {}
+        for reporte in reportes:
+            if reporte.get('id'):
+                entradas[reporte['id']] = self._valores_reporte(reporte)
+        self._construir(list(entradas.items()))
+        logger.info(f"Índice de facetas construido ({self.total_documentos} reportes)")
+
+    def _construir(self, entradas: List[Tuple[str, Tuple[Optional[str], ...]]]) -> None:
+        """Numera los documentos desde cero y arma todos los bitmaps de una vez"""
+        # Los bits se acumulan como bytes: armar cada entero de una sola vez es
+        # lineal, mientras que hacer '|=' documento por documento es cuadrático
+        tamano = (len(entradas) + 7) // 8
+        bits: Dict[str, Dict[str, bytearray]] = {faceta: {} for faceta in FACETAS}
+        vigentes = bytearray(tamano)
+
+        self.posiciones = {}
+        self.valores = []
+        for documento, (reporte_id, valores) in enumerate(entradas):
+            self.posiciones[reporte_id] = documento
+            self.valores.append(valores)
+            vigentes[documento >> 3] |= 1 << (documento & 7)
+            for faceta, valor in zip(FACETAS, valores):
+                if valor is not None:
+                    bitmap = bits[faceta].setdefault(valor, bytearray(tamano))
+                    bitmap[documento >> 3] |= 1 << (documento & 7)
+
+        self.vigentes = int.from_bytes(vigentes, 'little')
+        self.bitmaps = {
+            faceta: {valor: int.from_bytes(bitmap, 'little') for valor, bitmap in por_valor.items()}
+            for faceta, por_valor in bits.items()
+        }
+
+    def _valores_reporte(self, reporte: Dict[str, Any]) -> Tuple[Optional[str], ...]:
+        veterinario_id = _veterinario(reporte)
+        nombre = (reporte.get('veterinario') or {}).get('nombre')
+        if veterinario_id is not None and nombre:
+            self.etiquetas_veterinario[veterinario_id] = str(nombre)
+        return tuple(obtener(reporte) for obtener in FACETAS.values())
+
+    def agregar(self, reporte: Dict[str, Any]) -> None:
+        """
+        Indexa un reporte (si ya existía, reemplaza la versión anterior)
+
+        Args:
+            reporte: Reporte en el formato del almacén local
+        """
+        reporte_id = reporte.get('id')
+        if not reporte_id:
+            return
+        if reporte_id in self.posiciones:
+            self.eliminar(reporte_id)
+
+        documento = len(self.valores)
+        bit = 1 << documento
+        valores = self._valores_reporte(reporte)
+        self.posiciones[reporte_id] = documento
+        self.valores.append(valores)
+        self.vigentes |= bit
+        for faceta, valor in zip(FACETAS, valores):
+            if valor is not None:
+                self.bitmaps[faceta][valor] = self.bitmaps[faceta].get(valor, 0) | bit
+
+    def eliminar(self, reporte_id: str) -> None:
+        """
+        Quita un reporte del índice
+
+        Args:
+            reporte_id: ID del reporte
+        """
+        documento = self.posiciones.pop(reporte_id, None)
+        if documento is None:
+            return
+        mascara = ~(1 << documento)
+        self.vigentes &= mascara
+        for faceta, valor in zip(FACETAS, self.valores[documento]):
+            if valor is None:
+                continue
+            bitmap = self.bitmaps[faceta][valor] & mascara
+            if bitmap:
+                self.bitmaps[faceta][valor] = bitmap
+            else:
+                del self.bitmaps[faceta][valor]
+        self.valores[documento] = None
+
+        # Con más de la mitad de los números de documento libres, renumerar
+        # para que los bitmaps no crezcan con huecos
+        if len(self.valores) > 64 and self.total_documentos < len(self.valores) // 2:
+            self._compactar()
+
+    def _compactar(self) -> None:
+        """Renumera los documentos descartando los eliminados"""
+        ids_por_documento = {documento: reporte_id for reporte_id, documento in self.posiciones.items()}
+        self._construir([
+            (ids_por_documento[documento], valores)
+            for documento, valores in enumerate(self.valores)
+            if valores is not None
+        ])
+
+    def contar(self, filtros: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Cuenta reportes por valor de cada faceta bajo una combinación de filtros
+
+        Args:
+            filtros: Valor elegido por faceta (las vacías no filtran)
+
+        Returns:
+            Dict con el total que cumple todos los filtros y, por faceta, la
+            lista de valores con su cantidad ordenada de mayor a menor
+        """
+        seleccion = {
+            faceta: _valor_texto(filtros.get(faceta))
+            for faceta in FACETAS
+            if _valor_texto(filtros.get(faceta)) is not None
+        }
+
+        def mascara(excluir: Optional[str] = None) -> int:
+            resultado = self.vigentes
+            for faceta, valor in seleccion.items():
+                if faceta != excluir:
+                    resultado &= self.bitmaps[faceta].get(valor, 0)
+            return resultado
+
+        facetas = {}
+        for faceta, por_valor in self.bitmaps.items():
+            base = mascara(excluir=faceta)
+            conteos = []
+            for valor, bitmap in por_valor.items():
+                cantidad = (bitmap & base).bit_count()
+                if cantidad or seleccion.get(faceta) == valor:
+                    entrada = {"valor": valor, "cantidad": cantidad}
+                    if faceta == 'veterinario':
+                        entrada["etiqueta"] = self.etiquetas_veterinario.get(valor, valor)
+                    conteos.append(entrada)
+            conteos.sort(key=lambda entrada: (-entrada["cantidad"], entrada["valor"]))
+            facetas[faceta] = conteos
+
+        return {
+            "total": mascara().bit_count(),
+            "filtros": seleccion,
+            "facetas": facetas
+        }
@@ -3,18 +3,87 @@ Servicio de procesamiento de PDFs
 Implementa la lógica de extracción de información de PDFs veterinarios usando Gemini
 """
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple, Callable
+import asyncio
 import logging
 from fastapi import UploadFile
 import uuid
 from datetime import datetime
 import os
+import tempfile
 
 from modelos.reporte_modelo import ReporteModelo
 from .procesador_imagenes import ProcesadorImagenesMedicas
+from utilidades.circuitos import obtener_circuito, es_fallo_http
+from utilidades.metricas import metricas
+from utilidades.limitador import LimitadorAdaptativo, es_limite_excedido
+from utilidades.respaldo import PoliticaRespaldo
+from .registro_archivos_gemini import RegistroArchivosGemini, es_archivo_no_disponible
+from .fragmentacion_informes import dividir_en_fragmentos, combinar_resumenes, estimar_tokens
+from .prompt_clinidoc import INSTRUCCIONES_CLINIDOC, construir_prompt, construir_sufijo
+from .contexto_cache_gemini import ContextoCacheGemini
 
 logger = logging.getLogger(__name__)
 
+# Con Gemini caído el procesamiento falla al instante en lugar de esperar el timeout
+# (un 429 no es una caída: lo maneja el limitador)
+circuito_gemini = obtener_circuito(
+    'gemini', es_fallo=lambda excepcion: es_fallo_http(excepcion) and not es_limite_excedido(excepcion)
+)
+
+# Cuota compartida por todas las llamadas a Gemini del proceso, repartida por turnos entre clínicas
+limitador_gemini = LimitadorAdaptativo(
+    'gemini',
+    solicitudes_por_minuto=float(os.getenv("GEMINI_SOLICITUDES_POR_MINUTO", "60")),
+    tokens_por_minuto=float(os.getenv("GEMINI_TOKENS_POR_MINUTO", "1000000")),
+    concurrencia_inicial=int(os.getenv("GEMINI_CONCURRENCIA_INICIAL", "4")),
+    concurrencia_maxima=int(os.getenv("GEMINI_CONCURRENCIA_MAXIMA", "16")),
+    latencia_objetivo_s=float(os.getenv("GEMINI_LATENCIA_OBJETIVO_S", "30"))
+)
+# Reintentos de una llamada rechazada por cuota (429), que vuelve a la cola del limitador
+REINTENTOS_LIMITE_GEMINI = int(os.getenv("GEMINI_REINTENTOS_429", "2"))
+# Tokens estimados para la cuota: la extracción del PDF (no se conocen sus páginas) y cada respuesta
+TOKENS_EXTRACCION_ESTIMADOS = int(os.getenv("GEMINI_TOKENS_EXTRACCION", "8000"))
+TOKENS_RESPUESTA_ESTIMADOS = 2000
+
+# Solicitudes de respaldo: generate_content es idempotente, así que si una llamada supera el p90
+# observado se envía otra y gana la primera (opcional: cada respaldo es una solicitud más)
+respaldo_gemini = PoliticaRespaldo(
+    'gemini',
+    habilitada=os.getenv("GEMINI_RESPALDO", "false").lower() == "true",
+    presupuesto=float(os.getenv("GEMINI_RESPALDO_PRESUPUESTO", "0.1"))
+)
+
+# PDFs ya subidos a la Files API, por huella del contenido (se reutilizan hasta que vencen)
+registro_archivos_gemini = RegistroArchivosGemini(
+    archivo=os.getenv("GEMINI_REGISTRO_ARCHIVOS", "archivos_gemini.json")
+)
+
+# Clave de reparto cuando el request no identifica la clínica
+CLINICA_POR_DEFECTO = "general"
+
+# Modelo de Gemini para la extracción y la estructuración
+MODELO_GEMINI = os.getenv("GEMINI_MODELO", "gemini-1.5-flash")
+
+# Versión del prompt CliniDoc y del parser de Markdown. Subirla al cambiar
+# prompt_clinidoc.py o _extraer_datos_desde_markdown: reprocesar_reportes.py
+# regenera los reportes estructurados con una versión anterior
+VERSION_PROMPT = "clinidoc-1"
+
+# Informes más largos que este presupuesto (tokens aprox.) se resumen por fragmentos en paralelo
+TOKENS_POR_FRAGMENTO = int(os.getenv("GEMINI_TOKENS_POR_FRAGMENTO", "12000"))
+FRAGMENTOS_PARALELOS = int(os.getenv("GEMINI_FRAGMENTOS_PARALELOS", "4"))
+
+# Instrucciones CliniDoc en el context cache de Gemini: cada llamada envía solo el documento
+# (si el modelo o el SDK no lo admiten, se envía el prompt completo)
+contexto_clinidoc = ContextoCacheGemini(
+    'clinidoc',
+    INSTRUCCIONES_CLINIDOC,
+    MODELO_GEMINI,
+    habilitado=os.getenv("GEMINI_CONTEXTO_CACHE", "true").lower() == "true",
+    ttl_s=float(os.getenv("GEMINI_CONTEXTO_CACHE_TTL_S", "3600"))
+)
+
 class ProcesadorPDFServicio:
     """Servicio para procesamiento de PDFs veterinarios"""
     
@@ -22,12 +91,13 @@ class ProcesadorPDFServicio:
         self.confianza_minima = 0.7
         self.procesador_imagenes = ProcesadorImagenesMedicas()
     
-    async def procesar_pdf(self, archivo: UploadFile) -> Dict[str, Any]:
+    async def procesar_pdf(self, archivo: UploadFile, clinica: str = CLINICA_POR_DEFECTO) -> Dict[str, Any]:
         """
         Procesa un archivo PDF y extrae información estructurada usando Gemini
         
         Args:
             archivo: Archivo PDF a procesar
+            clinica: Clínica que subió el archivo (turno en la cola de Gemini)
             
         Returns:
             Dict con el resultado del procesamiento
@@ -52,14 +122,25 @@ class ProcesadorPDFServicio:
                 
                 try:
                     # Extraer texto del PDF usando Gemini
-                    texto_extraido = await self._extraer_texto_con_gemini(contenido, archivo.filename)
+                    texto_extraido = await self._extraer_texto_con_gemini(contenido, archivo.filename, clinica)
                     
                     # Procesar imágenes del PDF
                     imagenes_procesadas = self.procesador_imagenes.procesar_imagenes_desde_pdf(temp_file_path)
                     logger.info(f"Imágenes procesadas: {len(imagenes_procesadas)}")
                     
                     # Procesar el texto con Gemini para extraer información estructurada
-                    datos_estructurados = await self._procesar_texto_con_gemini(texto_extraido, imagenes_procesadas)
+                    datos_estructurados = await self._procesar_texto_con_gemini(texto_extraido, imagenes_procesadas, clinica)
+                    
+                    # Insumos de la estructuración, para poder repetirla sin el PDF
+                    datos_estructurados["extraccion"] = {
+                        "texto": texto_extraido,
+                        "imagenes": [
+                            {clave: valor for clave, valor in imagen.items() if clave != 'url'}
+                            for imagen in imagenes_procesadas
+                        ],
+                        "version_prompt": VERSION_PROMPT,
+                        "modelo": MODELO_GEMINI
+                    }
                     
                     return {
                         "exito": True,
@@ -86,7 +167,59 @@ class ProcesadorPDFServicio:
                 "mensaje": "Error al procesar PDF"
             }
     
-    async def _extraer_texto_con_gemini(self, contenido: bytes, nombre_archivo: str) -> str:
+    async def reestructurar(
+        self,
+        texto: str,
+        imagenes: List[Dict[str, Any]],
+        clinica: str = "reprocesamiento"
+    ) -> Dict[str, Any]:
+        """
+        Repite solo la estructuración con el prompt actual, sobre un texto ya extraído
+        
+        Args:
+            texto: Texto extraído del PDF
+            imagenes: Análisis de las imágenes del PDF (sin las data URLs)
+            clinica: Clave en la cola de Gemini (por defecto una propia, para no demorar las subidas)
+            
+        Returns:
+            Dict con los datos estructurados (mismo formato que procesar_pdf)
+        """
+        return await self._procesar_texto_con_gemini(texto, imagenes, clinica)
+    
+    async def _llamar_gemini(self, tipo: str, clinica: str, tokens: int, llamada: Callable[[], Any]) -> Any:
+        """
+        Ejecuta una llamada bloqueante a Gemini en un hilo, a través del limitador y del circuito
+        
+        Un rechazo por cuota (429) vuelve a la cola hasta REINTENTOS_LIMITE_GEMINI veces. Con
+        GEMINI_RESPALDO activo, una llamada más lenta que el p90 de su tipo se duplica.
+        
+        Args:
+            tipo: Tipo de llamada ('extraccion' o 'estructuracion'), con su propia distribución de latencias
+            clinica: Clave de reparto en la cola del limitador
+            tokens: Tokens estimados de la llamada (prompt + respuesta)
+            llamada: Función bloqueante que hace la llamada al SDK
+        """
+        async def solicitar():
+            async with limitador_gemini.adquirir(clinica, tokens):
+                with circuito_gemini.proteger():
+                    return await asyncio.to_thread(llamada)
+        
+        for intento in range(REINTENTOS_LIMITE_GEMINI + 1):
+            try:
+                return await respaldo_gemini.ejecutar(
+                    tipo, solicitar, tokens=tokens, puede_duplicar=limitador_gemini.tiene_capacidad
+                )
+            except Exception as e:
+                if not es_limite_excedido(e) or intento == REINTENTOS_LIMITE_GEMINI:
+                    raise
+                logger.warning(f"Gemini rechazó la llamada por cuota, reintento {intento + 1}")
+    
+    async def _extraer_texto_con_gemini(
+        self,
+        contenido: bytes,
+        nombre_archivo: str,
+        clinica: str = CLINICA_POR_DEFECTO
+    ) -> str:
         """Extrae texto del PDF usando Gemini"""
         try:
             import google.generativeai as genai
@@ -101,46 +234,77 @@ class ProcesadorPDFServicio:
                 raise ValueError("NEXT_PUBLIC_GEMINI_API_KEY no configurada")
             
             genai.configure(api_key=api_key)
-            model = genai.GenerativeModel('gemini-1.5-flash')
+            model = genai.GenerativeModel(MODELO_GEMINI)
             
-            # Crear archivo temporal para Gemini
-            import tempfile
-            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
-                temp_file.write(contenido)
-                temp_file_path = temp_file.name
+            async def subir():
+                # Crear archivo temporal para Gemini
+                with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
+                    temp_file.write(contenido)
+                    temp_file_path = temp_file.name
+                try:
+                    with circuito_gemini.proteger():
+                        # Subir archivo a Gemini (la Files API no consume la cuota de generación)
+                        return await asyncio.to_thread(
+                            genai.upload_file,
+                            path=temp_file_path,
+                            mime_type='application/pdf',
+                            display_name=nombre_archivo
+                        )
+                finally:
+                    # Limpiar archivo temporal
+                    try:
+                        os.unlink(temp_file_path)
+                    except:
+                        pass
+            
+            async def recuperar(nombre: str):
+                with circuito_gemini.proteger():
+                    return await asyncio.to_thread(genai.get_file, nombre)
             
+            # Procesar con Gemini
+            prompt = """
+            Extrae todo el texto de este documento PDF veterinario.
+            Devuelve solo el texto extraído sin comentarios adicionales.
+            """
+            
+            huella = registro_archivos_gemini.calcular_huella(contenido)
+            archivo_gemini = await registro_archivos_gemini.obtener(contenido, subir, recuperar, huella)
             try:
-                # Subir archivo a Gemini
-                archivo_gemini = genai.upload_file(
-                    path=temp_file_path,
-                    mime_type='application/pdf',
-                    display_name=nombre_archivo
+                response = await self._llamar_gemini(
+                    'extraccion',
+                    clinica,
+                    TOKENS_EXTRACCION_ESTIMADOS,
+                    lambda: model.generate_content([prompt, archivo_gemini])
                 )
-                
-                # Procesar con Gemini
-                prompt = """
-                Extrae todo el texto de este documento PDF veterinario.
-                Devuelve solo el texto extraído sin comentarios adicionales.
-                """
-                
-                response = model.generate_content([prompt, archivo_gemini])
-                texto_extraido = response.text
-                
-                logger.info(f"Texto extraído: {len(texto_extraido)} caracteres")
-                return texto_extraido
-                
-            finally:
-                # Limpiar archivo temporal
-                try:
-                    os.unlink(temp_file_path)
-                except:
-                    pass
+            except Exception as e:
+                if not es_archivo_no_disponible(e):
+                    raise
+                # El archivo venció o se borró entre la consulta al registro y la llamada: se sube de nuevo
+                logger.info(f"El archivo de {nombre_archivo} ya no está disponible en Gemini, se sube de nuevo")
+                metricas.incrementar("gemini.archivos.renovados")
+                registro_archivos_gemini.invalidar(huella)
+                archivo_renovado = await registro_archivos_gemini.obtener(contenido, subir, recuperar, huella)
+                response = await self._llamar_gemini(
+                    'extraccion',
+                    clinica,
+                    TOKENS_EXTRACCION_ESTIMADOS,
+                    lambda: model.generate_content([prompt, archivo_renovado])
+                )
+            texto_extraido = response.text
+            
+            logger.info(f"Texto extraído: {len(texto_extraido)} caracteres")
+            return texto_extraido
             
         except Exception as e:
             logger.error(f"Error al extraer texto con Gemini: {str(e)}")
             raise e
     
-    async def _procesar_texto_con_gemini(self, texto: str, imagenes: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+    async def _procesar_texto_con_gemini(
+        self,
+        texto: str,
+        imagenes: List[Dict[str, Any]] = None,
+        clinica: str = CLINICA_POR_DEFECTO
+    ) -> Dict[str, Any]:
         """Procesa el texto extraído con Gemini para obtener información estructurada"""
         try:
             import google.generativeai as genai
@@ -156,7 +320,7 @@ class ProcesadorPDFServicio:
                 raise ValueError("NEXT_PUBLIC_GEMINI_API_KEY no configurada")
             
             genai.configure(api_key=api_key)
-            model = genai.GenerativeModel('gemini-1.5-flash')
+            model = genai.GenerativeModel(MODELO_GEMINI)
             
             # Preparar información de imágenes para el prompt
             info_imagenes = ""
@@ -167,78 +331,33 @@ class ProcesadorPDFServicio:
                     if img.get('texto_extraido'):
                         info_imagenes += f"  - Texto detectado: {img['texto_extraido'][:100]}...\n"
 
-            prompt = f"""
-        Actúa como un **Asistente Experto en Documentación Médica Veterinaria (CliniDoc AI)**. Tu única función es transformar informes veterinarios complejos, provistos como texto plano, en un resumen estructurado, claro y profesional en formato **Markdown**.
-
-        El resumen debe ser fácilmente legible tanto para otros veterinarios como para los propietarios de las mascotas, destacando la información más relevante sin omitir detalles cruciales.
-
-        ### Principios Fundamentales de Procesamiento:
-        1.  **Principio de Relevancia:** Extrae y presenta solo la información clínica y de identificación. Ignora metadatos repetitivos del pie de página (números de teléfono, M.P., etc.) a menos que sea la única fuente para identificar a un veterinario.
-        2.  **Principio de Estructura:** Organiza la información obligatoriamente en las secciones predefinidas más abajo. No mezcles hallazgos objetivos con diagnósticos o recomendaciones.
-        3.  **Principio de Consistencia:** Normaliza todas las fechas al formato **AAAA-MM-DD**. Estandariza los nombres de los campos como se muestra en la plantilla.
-        4.  **Principio de Claridad:** Usa listas con viñetas (`-`) para desglosar los hallazgos, diagnósticos y recomendaciones, facilitando una lectura rápida. Si el texto original describe hallazgos por órgano, mantén esa estructura.
-
-        ---
-
-        ### ## Estructura de Salida OBLIGATORIA (Formato Markdown):
-
-        # Resumen del Informe Veterinario de [Nombre del Paciente]
-
-        **Fecha del Estudio:** AAAA-MM-DD
-        **Tipo de Estudio:** [Ej: Ecografía Ocular, Radiografía de Tórax, Ecocardiografía]
-        **Paciente:** [Nombre], [Especie], [Raza], [Edad], [Sexo]
-        **Propietario:** [Nombre del Propietario]
-        **Veterinario/s Principal/es:** [Nombre del Veterinario Principal o Solicitante]
-
-        ---
-
-        ## 🔬 Hallazgos Clínicos Detallados
-        *Esta sección contiene las observaciones objetivas y mediciones descritas en el informe (las secciones "Hallazgos" o "Descripción").*
-
-        - **[Órgano 1, ej: Ojo izquierdo]:**
-          - [Hallazgo 1.1, extraído textualmente, ej: Presenta un diámetro total de 19.7 mm, cámara vítrea de 9.5 mm.]
-          - [Hallazgo 1.2, ej: Humor vítreo presenta puntillado hiperecoico abundante, no móvil.]
-        - **[Órgano 2, ej: Ojo derecho]:**
-          - [Hallazgo 2.1, ej: Cristalino de 6.2 mm, con una estructura hiperecoica central con forma de reloj de arena.]
-        - **[Hallazgo general si no está desglosado por órgano]:**
-          - [Descripción del hallazgo general.]
-
-        ## 🩺 Diagnóstico y Conclusiones
-        *Esta es la interpretación profesional de los hallazgos (la sección "Diagnóstico" o "Conclusión").*
-
-        - **Diagnóstico Principal:** [Extraer el diagnóstico más importante, ej: Catarata intumescente bilateral.]
-        - **Diagnósticos Secundarios / Presuntivos:**
-          - [Diagnóstico secundario o presuntivo 1, ej: Esclerosis nuclear en cristalino derecho.]
-          - [Diagnóstico secundario o presuntivo 2, ej: Presuntivo de coagulo en cámara vítrea derecha.]
-          - [Y así sucesivamente con todos los diagnósticos listados.]
-
-        ## 💡 Plan de Acción y Recomendaciones
-        *Pasos a seguir sugeridos por el profesional (la sección "Notas" o "Recomendaciones").*
-
-        - [Recomendación 1, ej: Se recomienda estudio radiológico de control en 30 días, según criterio clínico.]
-        - [Recomendación 2, si aplica, ej: Se recomienda pimobendan 0.25 mg/kg cada 12 horas, de por vida.]
-
-        ## 🖼️ Imágenes Médicas Adjuntas
-        *(Nota: A continuación se listan las imágenes médicas relevantes identificadas en el documento. La aplicación debe reemplazar estos placeholders con las imágenes reales.)*
-
-        - **[IMAGEN 1: Breve descripción basada en el contexto o etiquetas del informe, ej: Ecografía del cristalino del ojo derecho con mediciones.]**
-        - **[IMAGEN 2: Breve descripción, ej: Radiografía de tórax, incidencia latero-lateral derecha.]**
-
-        ---
-
-        ### ## Reglas Finales de Procesamiento:
-        - Tu única salida debe ser el texto en formato Markdown. No añadas introducciones, despedidas ni explicaciones.
-        - Para la sección de imágenes, **NO intentes crear o mostrar imágenes**. En su lugar, crea una lista de placeholders `[IMAGEN X: ...]`. Basa la descripción en el texto cercano a donde se mencionan las imágenes (como "IMÁGENES ADJUNTAS") o en las etiquetas que aparecen sobre las propias imágenes si fueron extraídas por el OCR (ej: "HIGADO", "CRISTALINO").
-        - Sé exhaustivo. Revisa todo el texto proporcionado para no omitir ninguna sección, especialmente en informes largos de múltiples páginas.
-
-        {info_imagenes}
-
-        ## TEXTO DEL INFORME A CONTINUACIÓN:
-        {texto}
-        """
+            modelo_cacheado = await contexto_clinidoc.obtener_modelo(genai)
             
-            response = model.generate_content(prompt)
-            texto_respuesta = response.text.strip()
+            fragmentos = dividir_en_fragmentos(texto, TOKENS_POR_FRAGMENTO)
+            if len(fragmentos) == 1:
+                texto_respuesta = await self._estructurar_fragmento(
+                    model, texto, info_imagenes, clinica, modelo_cacheado=modelo_cacheado
+                )
+            else:
+                # Map-reduce: cada fragmento se resume por separado y los resúmenes se combinan
+                logger.info(
+                    f"Informe de ~{estimar_tokens(texto)} tokens dividido en {len(fragmentos)} fragmentos"
+                )
+                metricas.observar("gemini.fragmentos_por_informe", len(fragmentos))
+                semaforo = asyncio.Semaphore(FRAGMENTOS_PARALELOS)
+                
+                async def estructurar(numero: int, fragmento: str) -> str:
+                    async with semaforo:
+                        # Las imágenes se describen una sola vez (en el primer fragmento)
+                        return await self._estructurar_fragmento(
+                            model, fragmento, info_imagenes if numero == 1 else "", clinica,
+                            (numero, len(fragmentos)), modelo_cacheado
+                        )
+                
+                resumenes = await asyncio.gather(*[
+                    estructurar(numero, fragmento) for numero, fragmento in enumerate(fragmentos, 1)
+                ])
+                texto_respuesta = combinar_resumenes(resumenes)
             
             # El prompt ahora devuelve Markdown directamente, no JSON
             # Extraer información básica del Markdown para compatibilidad
@@ -261,6 +380,61 @@ class ProcesadorPDFServicio:
             logger.error(f"Error al procesar texto con Gemini: {str(e)}")
             raise e
     
+    async def _estructurar_fragmento(
+        self,
+        model,
+        texto: str,
+        info_imagenes: str,
+        clinica: str,
+        fragmento: Optional[Tuple[int, int]] = None,
+        modelo_cacheado=None
+    ) -> str:
+        """
+        Resume con el prompt CliniDoc un informe completo o uno de sus fragmentos (numero, total)
+        
+        Con modelo_cacheado (instrucciones en el context cache) se envía solo la parte del
+        documento; si no, o si el cache ya no existe en Gemini, el prompt completo.
+        """
+        nota_fragmento = ""
+        if fragmento:
+            nota_fragmento = (
+                f"\n\n        ### NOTA: este texto es la parte {fragmento[0]} de {fragmento[1]} de un informe más largo. "
+                "Resume solo lo que aparece en esta parte, con la misma estructura, y completa con "
+                "'No especificado' los datos que no figuren en ella."
+            )
+        sufijo = construir_sufijo(texto, info_imagenes, nota_fragmento)
+        tokens_instrucciones = estimar_tokens(INSTRUCCIONES_CLINIDOC)
+        # Para la cuota cuentan también los tokens cacheados
+        tokens = tokens_instrucciones + estimar_tokens(sufijo) + TOKENS_RESPUESTA_ESTIMADOS
+        
+        if modelo_cacheado is not None:
+            try:
+                response = await self._llamar_gemini(
+                    'estructuracion',
+                    clinica,
+                    tokens,
+                    lambda: modelo_cacheado.generate_content(sufijo)
+                )
+                metricas.incrementar("gemini.prompt.tokens_enviados", estimar_tokens(sufijo))
+                metricas.incrementar("gemini.prompt.tokens_cacheados", tokens_instrucciones)
+                return response.text.strip()
+            except Exception as e:
+                if not es_archivo_no_disponible(e):
+                    raise
+                # El cache venció o se borró antes de lo previsto: esta llamada va con el prompt completo
+                logger.info("El context cache de CliniDoc ya no está en Gemini, se envía el prompt completo")
+                contexto_clinidoc.invalidar()
+        
+        prompt = construir_prompt(texto, info_imagenes, nota_fragmento)
+        response = await self._llamar_gemini(
+            'estructuracion',
+            clinica,
+            tokens,
+            lambda: model.generate_content(prompt)
+        )
+        metricas.incrementar("gemini.prompt.tokens_enviados", estimar_tokens(prompt))
+        return response.text.strip()
+    
     def _extraer_datos_desde_markdown(self, markdown_text: str) -> Dict[str, Any]:
         """
         Extrae datos estructurados del Markdown generado por Gemini
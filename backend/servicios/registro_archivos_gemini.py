@@ -0,0 +1,168 @@
+"""
+Registro de archivos subidos a Gemini
+Reutiliza la subida de un PDF (Files API) mientras no venza, identificándolo por la huella de su contenido
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+
+from utilidades.circuitos import codigo_estado_http
+from utilidades.metricas import metricas
+
+logger = logging.getLogger(__name__)
+
+# Vigencia de un archivo de la Files API cuando la respuesta no trae 'expiration_time'
+DURACION_POR_DEFECTO_S = 48 * 3600
+
+
+def es_archivo_no_disponible(excepcion: Exception) -> bool:
+    """Indica si Gemini rechazó la llamada porque el archivo ya no existe o venció (403/404)"""
+    return codigo_estado_http(excepcion) in (403, 404) or type(excepcion).__name__ in ('NotFound', 'PermissionDenied')
+
+
+class RegistroArchivosGemini:
+    """
+    Registro huella SHA-256 -> archivo subido a la Files API de Gemini
+
+    Un PDF que ya se subió (unos minutos antes, o al procesarlo de nuevo con
+    forzar) se usa sin volver a subirlo. Gemini borra los archivos a las 48
+    horas: una entrada que vence dentro de 'margen_expiracion_s' se descarta
+    y el PDF se sube otra vez. Dos subidas simultáneas del mismo contenido
+    comparten una sola subida.
+
+    El registro se guarda en un archivo JSON (nombre del archivo en Gemini y
+    vencimiento), así sobrevive a un reinicio; el handle se recupera con una
+    consulta de metadatos, sin subir el PDF.
+    """
+
+    def __init__(self, archivo: str = 'archivos_gemini.json', margen_expiracion_s: float = 3600.0):
+        """
+        Args:
+            archivo: Archivo JSON donde se guarda el registro
+            margen_expiracion_s: Antelación con la que se deja de usar un archivo antes de que venza
+        """
+        self.archivo = archivo
+        self.margen_expiracion_s = margen_expiracion_s
+        self._entradas: Dict[str, Dict[str, Any]] = self._cargar()
+        # Handles ya recuperados en este proceso (no se guardan en el JSON)
+        self._handles: Dict[str, Any] = {}
+        self._subidas_en_curso: Dict[str, asyncio.Future] = {}
+
+        metricas.registrar_medidor("gemini.archivos_registrados", lambda: len(self._entradas))
+
+    @staticmethod
+    def calcular_huella(contenido: bytes) -> str:
+        """Huella SHA-256 del contenido del PDF"""
+        return hashlib.sha256(contenido).hexdigest()
+
+    def _cargar(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.archivo):
+            return {}
+        try:
+            with open(self.archivo, 'r', encoding='utf-8') as f:
+                entradas = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Registro de archivos de Gemini ilegible, se empieza vacío: {str(e)}")
+            return {}
+        ahora = time.time()
+        return {huella: entrada for huella, entrada in entradas.items() if entrada.get("expira_en", 0) > ahora}
+
+    def _guardar(self) -> None:
+        archivo_temporal = f"{self.archivo}.tmp"
+        try:
+            with open(archivo_temporal, 'w', encoding='utf-8') as f:
+                json.dump(self._entradas, f)
+            os.replace(archivo_temporal, self.archivo)
+        except OSError as e:
+            # Sin el archivo solo se pierde la reutilización tras un reinicio
+            logger.warning(f"No se pudo guardar el registro de archivos de Gemini: {str(e)}")
+
+    def _vigente(self, huella: str) -> bool:
+        entrada = self._entradas.get(huella)
+        return entrada is not None and entrada["expira_en"] - self.margen_expiracion_s > time.time()
+
+    async def obtener(
+        self,
+        contenido: bytes,
+        subir: Callable[[], Awaitable[Any]],
+        recuperar: Callable[[str], Awaitable[Any]],
+        huella: Optional[str] = None
+    ) -> Any:
+        """
+        Devuelve el archivo de Gemini para un PDF, subiéndolo solo si no hay uno vigente
+
+        Args:
+            contenido: Contenido del PDF
+            subir: Sube el PDF y devuelve el archivo de Gemini (con 'name' y 'expiration_time')
+            recuperar: Obtiene el archivo de Gemini a partir de su nombre ('files/...')
+            huella: Huella SHA-256 ya calculada del contenido (opcional)
+
+        Returns:
+            El archivo de Gemini, listo para pasar a generate_content
+        """
+        huella = huella or self.calcular_huella(contenido)
+
+        if self._vigente(huella):
+            try:
+                handle = self._handles.get(huella)
+                if handle is None:
+                    handle = await recuperar(self._entradas[huella]["nombre"])
+                    self._handles[huella] = handle
+                metricas.incrementar("gemini.archivos.reutilizados")
+                return handle
+            except Exception as e:
+                if not es_archivo_no_disponible(e):
+                    raise
+                logger.info(f"El archivo {self._entradas[huella]['nombre']} ya no está en Gemini, se sube de nuevo")
+                self.invalidar(huella)
+        elif huella in self._entradas:
+            metricas.incrementar("gemini.archivos.vencidos")
+            self.invalidar(huella)
+
+        en_curso = self._subidas_en_curso.get(huella)
+        if en_curso:
+            return await asyncio.shield(en_curso)
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._subidas_en_curso[huella] = futuro
+        try:
+            handle = await subir()
+            self._registrar(huella, handle)
+            futuro.set_result(handle)
+            return handle
+        except BaseException as e:
+            if isinstance(e, Exception):
+                futuro.set_exception(e)
+                # Si nadie más esperaba la subida, la excepción no queda "sin recuperar"
+                futuro.exception()
+            raise
+        finally:
+            del self._subidas_en_curso[huella]
+            if not futuro.done():
+                futuro.cancel()
+
+    def _registrar(self, huella: str, handle: Any) -> None:
+        vencimiento = getattr(handle, 'expiration_time', None)
+        try:
+            expira_en = vencimiento.timestamp()
+        except AttributeError:
+            expira_en = time.time() + DURACION_POR_DEFECTO_S
+        self._entradas[huella] = {"nombre": handle.name, "expira_en": expira_en}
+        self._handles[huella] = handle
+        # De paso se descartan las entradas vencidas
+        ahora = time.time()
+        self._entradas = {h: entrada for h, entrada in self._entradas.items() if entrada["expira_en"] > ahora}
+        self._handles = {h: archivo for h, archivo in self._handles.items() if h in self._entradas}
+        self._guardar()
+        metricas.incrementar("gemini.archivos.subidos")
+
+    def invalidar(self, huella: str) -> None:
+        """Olvida el archivo de una huella (ej: Gemini respondió que ya no existe)"""
+        self._handles.pop(huella, None)
+        if self._entradas.pop(huella, None) is not None:
+            self._guardar()
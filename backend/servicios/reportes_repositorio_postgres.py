@@ -0,0 +1,583 @@
+"""
+Repositorio de reportes sobre Postgres directo
+Implementa el acceso a datos asíncrono con asyncpg como alternativa al cliente de Supabase
+"""
+
+from typing import Dict, Any, List, Optional
+from datetime import date, datetime
+from decimal import Decimal
+import logging
+
+from configuracion.database import obtener_pool_postgres
+
+logger = logging.getLogger(__name__)
+
+# Columnas que se devuelven al leer reportes (mismo formato que la fila de Supabase)
+COLUMNAS_REPORTE = """
+    id, paciente_id, veterinario_id, fecha_estudio, tipo_estudio, origen_archivo,
+    json_resultado, tipo_procesamiento, estado_procesamiento, creado_en, actualizado_en
+"""
+
+SQL_OBTENER_POR_ID = f"""
+    SELECT {COLUMNAS_REPORTE}
+    FROM reporte
+    WHERE reporte_uuid = $1::uuid
+"""
+
+SQL_OBTENER_POR_IDS = f"""
+    SELECT {COLUMNAS_REPORTE}
+    FROM reporte
+    WHERE reporte_uuid = ANY($1::uuid[])
+"""
+
+# Último reporte generado a partir de un mismo archivo (huella SHA-256 del PDF)
+SQL_OBTENER_POR_HUELLA = f"""
+    SELECT {COLUMNAS_REPORTE}
+    FROM reporte
+    WHERE huella_contenido = $1
+    ORDER BY id DESC
+    LIMIT 1
+"""
+
+# Inserta el reporte y sus filas hijas (diagnóstico, imágenes, hallazgos) en una sola sentencia
+SQL_INSERTAR = """
+    SELECT * FROM guardar_reportes_normalizados($1::jsonb)
+"""
+
+SQL_IMAGENES = """
+    SELECT url, metadatos
+    FROM imagenes_medicas
+    WHERE reporte_uuid = $1::uuid
+    ORDER BY posicion
+"""
+
+SQL_DIAGNOSTICO = """
+    SELECT principal, secundarios, recomendaciones, observaciones, metadatos
+    FROM diagnosticos
+    WHERE reporte_uuid = $1::uuid
+    LIMIT 1
+"""
+
+SQL_HALLAZGOS = """
+    SELECT organo, descripcion, severidad, tipo, mediciones
+    FROM hallazgos_clinicos
+    WHERE reporte_uuid = $1::uuid
+    ORDER BY posicion
+"""
+
+SQL_ELIMINAR = """
+    DELETE FROM reporte
+    WHERE reporte_uuid = $1::uuid
+    RETURNING id, estado_procesamiento
+"""
+
+# Extracciones estructuradas con otra versión del prompt, en orden de UUID (paginado por cursor)
+SQL_EXTRACCIONES_DESACTUALIZADAS = """
+    SELECT e.reporte_uuid::text AS reporte_id, e.texto, e.imagenes, e.version_prompt, r.actualizado_en
+    FROM reporte_extraccion e
+    JOIN reporte r ON r.reporte_uuid = e.reporte_uuid
+    WHERE e.version_prompt <> $1 AND e.reporte_uuid > $2::uuid
+    ORDER BY e.reporte_uuid
+    LIMIT $3
+"""
+
+SQL_ACTUALIZAR_VERSION_EXTRACCION = """
+    UPDATE reporte_extraccion
+    SET version_prompt = $2, modelo = $3, actualizado_en = NOW()
+    WHERE reporte_uuid = $1::uuid
+"""
+
+# Aplica cambios puntuales a json_resultado con concurrencia optimista (ver actualizar_reporte_parcial)
+SQL_ACTUALIZAR_PARCIAL = """
+    SELECT actualizar_reporte_parcial($1::uuid, $2::jsonb, $3::jsonb, $4::timestamptz)
+"""
+
+SQL_OBTENER_CAMBIOS = """
+    SELECT obtener_cambios_reportes($1, $2)
+"""
+
+SQL_PURGAR_CAMBIOS = """
+    SELECT purgar_cambios_reportes($1)
+"""
+
+# Búsqueda de texto completo (misma función que la RPC de Supabase)
+SQL_BUSCAR = """
+    SELECT * FROM buscar_reportes_fts($1, $2, $3)
+"""
+
+SQL_VETERINARIOS_ACTIVOS = """
+    SELECT * FROM veterinarios WHERE activo
+"""
+
+SQL_RESUMEN_ESTADISTICAS = """
+    SELECT clave, valor, actualizado_en FROM estadisticas_resumen
+"""
+
+SQL_ESTADISTICAS_VISTA = """
+    SELECT * FROM vista_estadisticas_sistema
+"""
+
+SQL_RECONCILIAR_ESTADISTICAS = """
+    SELECT * FROM reconciliar_estadisticas()
+"""
+
+SQL_ESTADISTICAS_DIARIAS = """
+    SELECT dia, tipo_estudio, especie, veterinario, total, completados, errores, con_confianza, suma_confianza
+    FROM estadisticas_diarias
+    WHERE dia BETWEEN $1 AND $2
+"""
+
+SQL_RECONSTRUIR_ESTADISTICAS_DIARIAS = """
+    SELECT reconstruir_estadisticas_diarias()
+"""
+
+# Filtros soportados en el listado: nombre del filtro -> condición SQL.
+# Todos son igualdades o prefijos sobre columnas indexadas (ver
+# "COLUMNAS DE FILTRO MATERIALIZADAS" en supabase/base_datos_supabase.sql).
+FILTROS_LISTADO = {
+    'tipo_estudio': "tipo_estudio_normalizado = ${}",
+    'especie': "especie = ${}",
+    'veterinario': "veterinario_id = ${}",
+    'paciente': "paciente_nombre LIKE ${}",
+    'tutor': "tutor_nombre LIKE ${}",
+}
+
+# Filtros que comparan por prefijo en lugar de por igualdad
+FILTROS_PREFIJO = ('paciente', 'tutor')
+
+
+def normalizar_valor_filtro(valor: Any) -> str:
+    """Normaliza un valor de filtro igual que las columnas generadas (minúsculas, sin bordes)"""
+    return str(valor).strip().lower()
+
+
+def patron_prefijo(valor: Any) -> str:
+    """Patrón LIKE 'valor%' con los comodines del valor escapados"""
+    escapado = normalizar_valor_filtro(valor).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"{escapado}%"
+
+
+def parametro_filtro(nombre: str, valor: Any) -> Optional[Any]:
+    """
+    Convierte el valor recibido de un filtro en el parámetro de su condición
+
+    Returns:
+        El parámetro, o None si el valor no puede coincidir con ningún reporte
+    """
+    if nombre in FILTROS_PREFIJO:
+        return patron_prefijo(valor)
+    if nombre == 'veterinario':
+        valor = str(valor).strip()
+        return int(valor) if valor.isdigit() else None
+    return normalizar_valor_filtro(valor)
+
+
+def _sql_listar(filtros_activos: List[str]) -> str:
+    """
+    Arma el SQL del listado para una combinación de filtros
+
+    Cada combinación produce siempre el mismo texto, así asyncpg reutiliza
+    el statement preparado en lugar de planificar en cada request.
+    """
+    condiciones = [
+        FILTROS_LISTADO[nombre].format(i)
+        for i, nombre in enumerate(filtros_activos, start=1)
+    ]
+    donde = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    n = len(filtros_activos)
+    return f"""
+    SELECT {COLUMNAS_REPORTE}
+    FROM reporte
+    {donde}
+    ORDER BY creado_en DESC
+    LIMIT ${n + 1} OFFSET ${n + 2}
+"""
+
+
+def _sql_exportar(filtros_activos: List[str]) -> str:
+    """
+    Arma el SQL de una página de exportación (keyset sobre la clave primaria)
+
+    Cada página continúa después del último ID de la anterior: el costo no
+    crece con la posición como con OFFSET.
+    """
+    condiciones = ["id > $1"] + [
+        FILTROS_LISTADO[nombre].format(i)
+        for i, nombre in enumerate(filtros_activos, start=2)
+    ]
+    n = len(filtros_activos)
+    return f"""
+    SELECT {COLUMNAS_REPORTE}
+    FROM reporte
+    WHERE {' AND '.join(condiciones)}
+    ORDER BY id
+    LIMIT ${n + 2}
+"""
+
+
+def _fila_a_dict(fila) -> Dict[str, Any]:
+    """Convierte un Record de asyncpg al mismo formato que devuelve Supabase"""
+    datos = dict(fila)
+    for clave, valor in datos.items():
+        if isinstance(valor, (datetime, date)):
+            datos[clave] = valor.isoformat()
+        elif isinstance(valor, Decimal):
+            datos[clave] = float(valor)
+    return datos
+
+
+class ReportesRepositorioPostgres:
+    """Acceso a la tabla 'reporte' mediante un pool de conexiones asyncpg"""
+
+    async def listar(self, filtros: Dict[str, Any], pagina: int = 1, limite: int = 10) -> List[Dict[str, Any]]:
+        """
+        Lista reportes con filtros y paginación
+
+        Args:
+            filtros: Filtros a aplicar (tipo_estudio, especie, veterinario, paciente, tutor)
+            pagina: Número de página
+            limite: Cantidad de elementos por página
+
+        Returns:
+            Lista de filas de la tabla 'reporte'
+        """
+        filtros_activos = [nombre for nombre in FILTROS_LISTADO if filtros.get(nombre)]
+        parametros = [parametro_filtro(nombre, filtros[nombre]) for nombre in filtros_activos]
+        if None in parametros:
+            return []
+        offset = (pagina - 1) * limite
+
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            filas = await conexion.fetch(_sql_listar(filtros_activos), *parametros, limite, offset)
+        return [_fila_a_dict(fila) for fila in filas]
+
+    async def listar_desde(
+        self,
+        filtros: Dict[str, Any],
+        despues_de_id: int,
+        limite: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Lista reportes en orden de ID a partir de un ID (paginación keyset)
+
+        Args:
+            filtros: Filtros a aplicar (los mismos que el listado)
+            despues_de_id: Último ID de la página anterior (0 para empezar)
+            limite: Cantidad máxima de filas
+
+        Returns:
+            Lista de filas de la tabla 'reporte' ordenadas por ID
+        """
+        filtros_activos = [nombre for nombre in FILTROS_LISTADO if filtros.get(nombre)]
+        parametros = [parametro_filtro(nombre, filtros[nombre]) for nombre in filtros_activos]
+        if None in parametros:
+            return []
+
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            filas = await conexion.fetch(_sql_exportar(filtros_activos), despues_de_id, *parametros, limite)
+        return [_fila_a_dict(fila) for fila in filas]
+
+    async def obtener_por_id(self, reporte_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtiene un reporte por su UUID público
+
+        Args:
+            reporte_id: UUID del reporte
+
+        Returns:
+            Fila de la tabla 'reporte' o None si no existe
+        """
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            fila = await conexion.fetchrow(SQL_OBTENER_POR_ID, reporte_id)
+        return _fila_a_dict(fila) if fila else None
+
+    async def obtener_por_huella(self, huella: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtiene el último reporte generado a partir de un archivo
+
+        Args:
+            huella: SHA-256 (hex) del contenido del PDF
+
+        Returns:
+            Fila de la tabla 'reporte' o None si el archivo no se procesó
+        """
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            fila = await conexion.fetchrow(SQL_OBTENER_POR_HUELLA, huella)
+        return _fila_a_dict(fila) if fila else None
+
+    async def obtener_por_ids(self, reporte_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Obtiene varios reportes por UUID público con una sola consulta
+
+        Args:
+            reporte_ids: UUIDs de los reportes (deben ser UUIDs válidos)
+
+        Returns:
+            Filas encontradas, sin orden garantizado
+        """
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            filas = await conexion.fetch(SQL_OBTENER_POR_IDS, reporte_ids)
+        return [_fila_a_dict(fila) for fila in filas]
+
+    async def insertar(self, datos: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Inserta un reporte junto con su diagnóstico, imágenes y hallazgos normalizados
+
+        Args:
+            datos: Datos en el mismo formato que se envía a Supabase
+
+        Returns:
+            Fila insertada
+        """
+        filas = await self.insertar_lote([datos])
+        return filas[0]
+
+    async def insertar_lote(self, lista_datos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Inserta varios reportes (y sus filas hijas) en una sola sentencia
+
+        Args:
+            lista_datos: Reportes en el mismo formato que se envía a Supabase
+
+        Returns:
+            Filas insertadas
+        """
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            filas = await conexion.fetch(SQL_INSERTAR, lista_datos)
+        return [_fila_a_dict(fila) for fila in filas]
+
+    async def obtener_imagenes(self, reporte_id: str) -> List[Dict[str, Any]]:
+        """
+        Obtiene las filas de imagenes_medicas de un reporte
+
+        Args:
+            reporte_id: UUID del reporte
+
+        Returns:
+            Lista de filas (url y metadatos) en el orden original
+        """
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            filas = await conexion.fetch(SQL_IMAGENES, reporte_id)
+        return [_fila_a_dict(fila) for fila in filas]
+
+    async def obtener_diagnostico(self, reporte_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtiene la fila de diagnosticos de un reporte junto con sus hallazgos clínicos
+
+        Args:
+            reporte_id: UUID del reporte
+
+        Returns:
+            Fila de diagnosticos con la clave 'hallazgos', o None si no existe
+        """
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            fila = await conexion.fetchrow(SQL_DIAGNOSTICO, reporte_id)
+            if not fila:
+                return None
+            hallazgos = await conexion.fetch(SQL_HALLAZGOS, reporte_id)
+        diagnostico = _fila_a_dict(fila)
+        diagnostico['hallazgos'] = [_fila_a_dict(h) for h in hallazgos]
+        return diagnostico
+
+    async def eliminar(self, reporte_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Elimina un reporte por su UUID público
+
+        Args:
+            reporte_id: UUID del reporte
+
+        Returns:
+            ID y estado de la fila eliminada, o None si no existía
+        """
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            fila = await conexion.fetchrow(SQL_ELIMINAR, reporte_id)
+        return _fila_a_dict(fila) if fila else None
+
+    async def listar_extracciones_desactualizadas(
+        self,
+        version_prompt: str,
+        despues_de: str,
+        limite: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Lista las extracciones estructuradas con una versión de prompt distinta
+
+        Args:
+            version_prompt: Versión actual del prompt
+            despues_de: UUID a partir del cual seguir (excluido)
+            limite: Cantidad máxima de extracciones
+
+        Returns:
+            Extracciones con el texto, las imágenes y la versión del reporte (actualizado_en)
+        """
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            filas = await conexion.fetch(SQL_EXTRACCIONES_DESACTUALIZADAS, version_prompt, despues_de, limite)
+        return [_fila_a_dict(fila) for fila in filas]
+
+    async def actualizar_version_extraccion(self, reporte_id: str, version_prompt: str, modelo: str) -> None:
+        """
+        Registra con qué versión del prompt y qué modelo se estructuró un reporte
+
+        Args:
+            reporte_id: UUID del reporte
+            version_prompt: Versión del prompt usada
+            modelo: Modelo de Gemini usado
+        """
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            await conexion.execute(SQL_ACTUALIZAR_VERSION_EXTRACCION, reporte_id, version_prompt, modelo)
+
+    async def actualizar_parcial(
+        self,
+        reporte_id: str,
+        cambios: List[Dict[str, Any]],
+        columnas: Dict[str, Any],
+        actualizado_en: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """
+        Aplica cambios puntuales a un reporte sin reenviar el documento completo
+
+        Args:
+            reporte_id: UUID del reporte
+            cambios: Rutas de json_resultado y sus valores nuevos
+            columnas: Columnas de la tabla a actualizar (tipo_estudio, estado_procesamiento)
+            actualizado_en: Versión que vio el cliente (None no verifica)
+
+        Returns:
+            Dict con 'estado' ('actualizado', 'conflicto' o 'no_encontrado') y,
+            según el caso, la fila actualizada o la versión actual
+        """
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            return await conexion.fetchval(SQL_ACTUALIZAR_PARCIAL, reporte_id, cambios, columnas, actualizado_en)
+
+    async def obtener_cambios(self, desde: Optional[str], limite: int) -> Dict[str, Any]:
+        """
+        Obtiene los reportes que cambiaron desde un token del registro de cambios
+
+        Args:
+            desde: Token devuelto por la consulta anterior (None para obtener el actual)
+            limite: Cantidad máxima de cambios a leer
+
+        Returns:
+            Dict con 'token', 'cambios', 'hay_mas' y 'reiniciar'
+        """
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            return await conexion.fetchval(SQL_OBTENER_CAMBIOS, desde, limite)
+
+    async def purgar_cambios(self, dias: int) -> int:
+        """
+        Borra del registro de cambios lo anterior a una cantidad de días
+
+        Args:
+            dias: Días de historia que se conservan
+
+        Returns:
+            Cantidad de cambios borrados
+        """
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            return await conexion.fetchval(SQL_PURGAR_CAMBIOS, dias)
+
+    async def buscar(self, termino: str, limite: int, desplazamiento: int) -> List[Dict[str, Any]]:
+        """
+        Busca reportes con la búsqueda de texto completo (buscar_reportes_fts)
+
+        Args:
+            termino: Término de búsqueda (sintaxis de websearch_to_tsquery)
+            limite: Cantidad máxima de resultados
+            desplazamiento: Cantidad de resultados a saltear
+
+        Returns:
+            Filas ordenadas por relevancia, con su fragmento resaltado y el total de coincidencias
+        """
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            filas = await conexion.fetch(SQL_BUSCAR, termino, limite, desplazamiento)
+        return [_fila_a_dict(fila) for fila in filas]
+
+    async def listar_veterinarios_activos(self) -> List[Dict[str, Any]]:
+        """
+        Lista los veterinarios activos
+
+        Returns:
+            Filas de la tabla 'veterinarios'
+        """
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            filas = await conexion.fetch(SQL_VETERINARIOS_ACTIVOS)
+        return [_fila_a_dict(fila) for fila in filas]
+
+    async def obtener_resumen_estadisticas(self) -> List[Dict[str, Any]]:
+        """
+        Obtiene los contadores precalculados de estadisticas_resumen
+
+        Returns:
+            Lista de filas (clave, valor, actualizado_en)
+        """
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            filas = await conexion.fetch(SQL_RESUMEN_ESTADISTICAS)
+        return [_fila_a_dict(fila) for fila in filas]
+
+    async def obtener_estadisticas_vista(self) -> Dict[str, Any]:
+        """
+        Cuenta las estadísticas sobre vista_estadisticas_sistema (sin los contadores precalculados)
+
+        Returns:
+            Dict con los contadores del sistema (vacío si la vista no devuelve filas)
+        """
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            fila = await conexion.fetchrow(SQL_ESTADISTICAS_VISTA)
+        return _fila_a_dict(fila) if fila else {}
+
+    async def reconciliar_estadisticas(self) -> List[Dict[str, Any]]:
+        """
+        Recalcula los contadores desde las tablas y corrige el desvío
+
+        Returns:
+            Claves que estaban desviadas con su valor anterior y el real
+        """
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            filas = await conexion.fetch(SQL_RECONCILIAR_ESTADISTICAS)
+        return [_fila_a_dict(fila) for fila in filas]
+
+    async def obtener_estadisticas_diarias(self, desde: date, hasta: date) -> List[Dict[str, Any]]:
+        """
+        Obtiene los buckets diarios de estadisticas_diarias en un rango de fechas
+
+        Args:
+            desde: Primer día (inclusive)
+            hasta: Último día (inclusive)
+
+        Returns:
+            Lista de buckets (día, tipo de estudio, especie, veterinario y contadores)
+        """
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            filas = await conexion.fetch(SQL_ESTADISTICAS_DIARIAS, desde, hasta)
+        return [_fila_a_dict(fila) for fila in filas]
+
+    async def reconstruir_estadisticas_diarias(self) -> int:
+        """
+        Reconstruye los buckets diarios desde la tabla reporte
+
+        Returns:
+            Cantidad de buckets que estaban desviados
+        """
+        pool = obtener_pool_postgres()
+        async with pool.acquire() as conexion:
+            return await conexion.fetchval(SQL_RECONSTRUIR_ESTADISTICAS_DIARIAS)
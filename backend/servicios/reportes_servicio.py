@@ -3,17 +3,44 @@ Servicio de reportes
 Implementa la lógica de acceso a datos para reportes
 """
 
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator
 import logging
 import json
 import os
-from datetime import datetime
+import uuid
+from datetime import date, datetime, timezone
 
 from modelos.reporte_modelo import ReporteModelo
-from configuracion.database import obtener_conexion_bd
+from configuracion.database import obtener_conexion_bd, usa_postgres_directo, circuito_bd
+from servicios.reportes_repositorio_postgres import (
+    ReportesRepositorioPostgres, FILTROS_PREFIJO, normalizar_valor_filtro, parametro_filtro
+)
+from servicios.indice_busqueda_local import IndiceBusquedaLocal, normalizar_texto, resaltar_fragmento
+from servicios.indice_facetas import IndiceFacetas
+from servicios.escritura_diferida import BufferEscrituraDiferida, ColaEscrituraLlena
+from servicios.bandeja_salida import BandejaSalida
+from servicios.estadisticas_servicio import EstadisticasServicio, delta_estadisticas
+from servicios.cambios_servicio import CambiosReportesServicio
+from servicios.exportacion_reportes import FORMATOS_EXPORTACION, GENERADORES_EXPORTACION, parquet_disponible
+from utilidades.cache import CacheLectura
+from utilidades.metricas import metricas
+from utilidades.eventos import bus_eventos
 
 logger = logging.getLogger(__name__)
 
+# Reportes por sentencia INSERT en la ingesta por lotes
+TAMANO_BLOQUE_LOTE = int(os.getenv("LOTE_TAMANO_BLOQUE", "100"))
+# Reportes por consulta al recorrer la base para una exportación
+TAMANO_LOTE_EXPORTACION = int(os.getenv("EXPORTACION_TAMANO_LOTE", "1000"))
+
+def _es_uuid(valor: str) -> bool:
+    """Indica si un texto es un UUID válido"""
+    try:
+        uuid.UUID(str(valor))
+        return True
+    except ValueError:
+        return False
+
 class ReportesServicio:
     """Servicio para manejo de reportes"""
     
@@ -23,6 +50,64 @@ class ReportesServicio:
         self.archivo_reportes = 'reportes.json'
         # Cargar reportes existentes
         self.reportes_memoria = self._cargar_reportes()
+        # Índice invertido local para búsquedas sin Supabase
+        self.archivo_indice = 'indice_reportes.idx'
+        self.indice_local = IndiceBusquedaLocal(self.archivo_indice)
+        self.indice_local.cargar_o_reconstruir(self.reportes_memoria)
+        # Bitmaps por faceta para los conteos del panel de filtros (solo en memoria)
+        self.indice_facetas = IndiceFacetas()
+        self.indice_facetas.reconstruir(self.reportes_memoria)
+        # Huella del PDF -> ID del reporte, para no reprocesar un archivo ya subido
+        self.huellas_locales: Dict[str, str] = {
+            r['huella_contenido']: r['id'] for r in self.reportes_memoria if r.get('huella_contenido')
+        }
+        # Acceso directo a Postgres (asyncpg) si está configurado en lugar de Supabase
+        self.repositorio_postgres = ReportesRepositorioPostgres() if usa_postgres_directo() else None
+        # Bandeja de salida durable: los reportes que no se pudieron guardar se reenvían en segundo plano
+        self.bandeja_salida = BandejaSalida(
+            self._persistir_registros,
+            archivo=os.getenv("BANDEJA_SALIDA_ARCHIVO", "bandeja_salida.db"),
+            tamano_lote=int(os.getenv("BANDEJA_SALIDA_LOTE", "50")),
+            maximo_intentos=int(os.getenv("BANDEJA_SALIDA_MAX_INTENTOS", "20")),
+            espera_maxima_s=float(os.getenv("BANDEJA_SALIDA_ESPERA_MAXIMA_S", "600")),
+            circuito=circuito_bd
+        )
+        # Cola write-behind opcional: agrupa los reportes terminados en un solo INSERT
+        self.escritura_diferida = BufferEscrituraDiferida(
+            self._persistir_registros,
+            espera_ms=float(os.getenv("ESCRITURA_DIFERIDA_ESPERA_MS", "20")),
+            tamano_maximo_lote=int(os.getenv("ESCRITURA_DIFERIDA_MAX_LOTE", "50")),
+            maximo_pendientes=int(os.getenv("ESCRITURA_DIFERIDA_MAX_PENDIENTES", "1000")),
+            al_descartar=self.bandeja_salida.agregar
+        ) if os.getenv("ESCRITURA_DIFERIDA", "false").lower() == "true" else None
+        # Caché de lectura por ID: detalle, imágenes y diagnóstico leen la misma fila
+        self.cache_reportes = CacheLectura(
+            'reportes',
+            capacidad=int(os.getenv("CACHE_REPORTES_CAPACIDAD", "512")),
+            ttl_segundos=float(os.getenv("CACHE_REPORTES_TTL", "60"))
+        )
+        # Contadores precalculados por triggers con reconciliación periódica
+        self.estadisticas = EstadisticasServicio(self.repositorio_postgres)
+        # Registro de cambios para la sincronización incremental de los clientes
+        self.cambios = CambiosReportesServicio(self._formatear_reporte_supabase, self.repositorio_postgres)
+    
+    async def iniciar(self):
+        """Arranca las tareas en segundo plano del servicio (al iniciar la aplicación)"""
+        await self.cache_reportes.iniciar()
+        await self.estadisticas.iniciar()
+        await self.cambios.iniciar()
+        await self.bandeja_salida.iniciar()
+        if self.escritura_diferida:
+            await self.escritura_diferida.iniciar()
+    
+    async def detener(self):
+        """Vacía la escritura diferida y detiene las tareas en segundo plano"""
+        if self.escritura_diferida:
+            await self.escritura_diferida.detener()
+        await self.bandeja_salida.detener()
+        await self.cambios.detener()
+        await self.estadisticas.detener()
+        await self.cache_reportes.detener()
     
     def obtener_conexion_bd(self):
         """Obtiene la conexión a la base de datos"""
@@ -47,6 +132,477 @@ class ReportesServicio:
         except Exception as e:
             logger.error(f"Error al guardar reportes: {str(e)}")
     
+    def _formatear_reporte_supabase(self, reporte: Dict[str, Any]) -> Dict[str, Any]:
+        """Convierte una fila de la tabla 'reporte' al formato esperado por el frontend"""
+        json_data = reporte.get('json_resultado') or {}
+        return {
+            "id": json_data.get('id', str(reporte.get('id'))),  # Usar ID del JSON o del registro
+            "fecha_creacion": reporte.get('creado_en'),
+            "fecha_actualizacion": reporte.get('actualizado_en'),
+            "tipo_estudio": reporte.get('tipo_estudio'),
+            "paciente": json_data.get('paciente', {}),
+            "tutor": json_data.get('tutor', {}),
+            "veterinario": json_data.get('veterinario', {}),
+            "diagnostico": json_data.get('diagnostico', {}),
+            "imagenes": json_data.get('imagenes', []),
+            "archivo_original": reporte.get('origen_archivo'),
+            "contenido_extraido": json_data.get('contenido_extraido', ''),
+            "confianza_extraccion": json_data.get('confianza_extraccion', 0),
+            "estado": reporte.get('estado_procesamiento'),
+            "url_google_drive": json_data.get('url_google_drive'),
+            "id_google_drive": json_data.get('id_google_drive')
+        }
+    
+    async def _insertar_reporte_bd(self, datos: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Inserta una fila en la tabla 'reporte' usando el backend de datos configurado"""
+        return await self._insertar_reportes_bd([datos])
+    
+    async def _insertar_reportes_bd(self, lista_datos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Inserta varias filas en la tabla 'reporte' con una sola llamada a la base"""
+        with circuito_bd.proteger():
+            if self.repositorio_postgres:
+                return await self.repositorio_postgres.insertar_lote(lista_datos)
+        
+            # La RPC escribe también diagnosticos, imagenes_medicas y hallazgos_clinicos
+            supabase = obtener_conexion_bd()
+            resultado = supabase.rpc('guardar_reportes_normalizados', {'reportes': lista_datos}).execute()
+            return resultado.data or []
+    
+    async def _consultar_reportes_bd(
+        self, 
+        filtros: Dict[str, Any], 
+        pagina: int, 
+        limite: int
+    ) -> List[Dict[str, Any]]:
+        """Lista filas de la tabla 'reporte' usando el backend de datos configurado"""
+        with circuito_bd.proteger():
+            if self.repositorio_postgres:
+                return await self.repositorio_postgres.listar(filtros, pagina, limite)
+        
+            supabase = self.obtener_conexion_bd()
+        
+            # Construir consulta con filtros
+            query = self._aplicar_filtros_supabase(supabase.table('reporte').select('*'), filtros)
+            if query is None:
+                return []
+        
+            # Aplicar paginación
+            offset = (pagina - 1) * limite
+            query = query.range(offset, offset + limite - 1)
+        
+            resultado = query.execute()
+            return resultado.data or []
+    
+    def _aplicar_filtros_supabase(self, query, filtros: Dict[str, Any]):
+        """Aplica los filtros del listado sobre las columnas generadas e indexadas (None si ninguno puede coincidir)"""
+        columnas = {
+            'tipo_estudio': 'tipo_estudio_normalizado',
+            'especie': 'especie',
+            'veterinario': 'veterinario_id',
+            'paciente': 'paciente_nombre',
+            'tutor': 'tutor_nombre',
+        }
+        for nombre, columna in columnas.items():
+            if not filtros.get(nombre):
+                continue
+            parametro = parametro_filtro(nombre, filtros[nombre])
+            if parametro is None:
+                return None
+            if nombre in FILTROS_PREFIJO:
+                query = query.like(columna, parametro)
+            else:
+                query = query.eq(columna, parametro)
+        return query
+    
+    async def _consultar_reportes_desde_bd(
+        self,
+        filtros: Dict[str, Any],
+        despues_de_id: int,
+        limite: int
+    ) -> List[Dict[str, Any]]:
+        """Lista filas de la tabla 'reporte' en orden de ID a partir de un ID (keyset)"""
+        with circuito_bd.proteger():
+            if self.repositorio_postgres:
+                return await self.repositorio_postgres.listar_desde(filtros, despues_de_id, limite)
+        
+            supabase = self.obtener_conexion_bd()
+            query = self._aplicar_filtros_supabase(supabase.table('reporte').select('*'), filtros)
+            if query is None:
+                return []
+            resultado = query.gt('id', despues_de_id).order('id').limit(limite).execute()
+            return resultado.data or []
+    
+    async def _consultar_reporte_por_id_bd(self, reporte_id: str) -> Optional[Dict[str, Any]]:
+        """Obtiene la fila de la tabla 'reporte' por UUID usando el backend de datos configurado"""
+        with circuito_bd.proteger():
+            if self.repositorio_postgres:
+                return await self.repositorio_postgres.obtener_por_id(reporte_id)
+        
+            supabase = obtener_conexion_bd()
+            resultado = supabase.table('reporte').select('*').eq('reporte_uuid', reporte_id).limit(1).execute()
+            return resultado.data[0] if resultado.data else None
+    
+    async def _consultar_reporte_por_huella_bd(self, huella: str) -> Optional[Dict[str, Any]]:
+        """Obtiene el último reporte generado a partir de un archivo (huella SHA-256 del PDF)"""
+        with circuito_bd.proteger():
+            if self.repositorio_postgres:
+                return await self.repositorio_postgres.obtener_por_huella(huella)
+        
+            supabase = obtener_conexion_bd()
+            resultado = (
+                supabase.table('reporte').select('*')
+                .eq('huella_contenido', huella).order('id', desc=True).limit(1).execute()
+            )
+            return resultado.data[0] if resultado.data else None
+    
+    async def _consultar_reportes_por_ids_bd(self, reporte_ids: List[str]) -> List[Dict[str, Any]]:
+        """Obtiene varias filas de la tabla 'reporte' por UUID con una sola consulta"""
+        with circuito_bd.proteger():
+            if self.repositorio_postgres:
+                return await self.repositorio_postgres.obtener_por_ids(reporte_ids)
+        
+            supabase = obtener_conexion_bd()
+            resultado = supabase.table('reporte').select('*').in_('reporte_uuid', reporte_ids).execute()
+            return resultado.data or []
+    
+    async def _actualizar_reporte_bd(
+        self,
+        reporte_id: str,
+        cambios: List[Dict[str, Any]],
+        columnas: Dict[str, Any],
+        actualizado_en: Optional[datetime]
+    ) -> Dict[str, Any]:
+        """Aplica cambios puntuales a un reporte usando el backend de datos configurado"""
+        with circuito_bd.proteger():
+            if self.repositorio_postgres:
+                return await self.repositorio_postgres.actualizar_parcial(reporte_id, cambios, columnas, actualizado_en)
+        
+            supabase = obtener_conexion_bd()
+            resultado = supabase.rpc('actualizar_reporte_parcial', {
+                'p_reporte_uuid': reporte_id,
+                'p_cambios': cambios,
+                'p_columnas': columnas,
+                'p_actualizado_en': actualizado_en.isoformat() if actualizado_en else None
+            }).execute()
+            return resultado.data or {}
+    
+    async def _consultar_extracciones_desactualizadas_bd(
+        self,
+        version_prompt: str,
+        despues_de: str,
+        limite: int
+    ) -> List[Dict[str, Any]]:
+        """Lee de reporte_extraccion las extracciones con otra versión del prompt, en orden de UUID"""
+        with circuito_bd.proteger():
+            if self.repositorio_postgres:
+                return await self.repositorio_postgres.listar_extracciones_desactualizadas(
+                    version_prompt, despues_de, limite
+                )
+        
+            supabase = obtener_conexion_bd()
+            resultado = (
+                supabase.table('reporte_extraccion')
+                .select('reporte_uuid, texto, imagenes, version_prompt, reporte(actualizado_en)')
+                .neq('version_prompt', version_prompt).gt('reporte_uuid', despues_de)
+                .order('reporte_uuid').limit(limite).execute()
+            )
+            return [
+                {
+                    "reporte_id": fila['reporte_uuid'],
+                    "texto": fila['texto'],
+                    "imagenes": fila['imagenes'],
+                    "version_prompt": fila['version_prompt'],
+                    "actualizado_en": (fila.get('reporte') or {}).get('actualizado_en')
+                }
+                for fila in resultado.data or []
+            ]
+    
+    async def _actualizar_version_extraccion_bd(self, reporte_id: str, version_prompt: str, modelo: str):
+        """Registra en reporte_extraccion la versión del prompt y el modelo que estructuraron el reporte"""
+        with circuito_bd.proteger():
+            if self.repositorio_postgres:
+                await self.repositorio_postgres.actualizar_version_extraccion(reporte_id, version_prompt, modelo)
+                return
+        
+            supabase = obtener_conexion_bd()
+            supabase.table('reporte_extraccion').update({
+                'version_prompt': version_prompt,
+                'modelo': modelo,
+                'actualizado_en': datetime.now(timezone.utc).isoformat()
+            }).eq('reporte_uuid', reporte_id).execute()
+    
+    async def _eliminar_reporte_bd(self, reporte_id: str) -> Optional[Dict[str, Any]]:
+        """Elimina la fila de la tabla 'reporte' por UUID; devuelve la fila eliminada o None"""
+        with circuito_bd.proteger():
+            if self.repositorio_postgres:
+                return await self.repositorio_postgres.eliminar(reporte_id)
+        
+            supabase = obtener_conexion_bd()
+            resultado = supabase.table('reporte').delete().eq('reporte_uuid', reporte_id).execute()
+            return resultado.data[0] if resultado.data else None
+    
+    async def _buscar_reportes_bd(self, termino: str, limite: int, desplazamiento: int) -> List[Dict[str, Any]]:
+        """Búsqueda de texto completo (buscar_reportes_fts) usando el backend de datos configurado"""
+        with circuito_bd.proteger():
+            if self.repositorio_postgres:
+                return await self.repositorio_postgres.buscar(termino, limite, desplazamiento)
+        
+            supabase = obtener_conexion_bd()
+            resultado = supabase.rpc('buscar_reportes_fts', {
+                'termino_busqueda': termino,
+                'limite_busqueda': limite,
+                'desplazamiento_busqueda': desplazamiento
+            }).execute()
+            return resultado.data or []
+    
+    async def consultar_veterinarios_bd(self) -> List[Dict[str, Any]]:
+        """Lee los veterinarios activos usando el backend de datos configurado"""
+        with circuito_bd.proteger():
+            if self.repositorio_postgres:
+                return await self.repositorio_postgres.listar_veterinarios_activos()
+        
+            supabase = obtener_conexion_bd()
+            resultado = supabase.table('veterinarios').select('*').eq('activo', True).execute()
+            return resultado.data or []
+    
+    async def _consultar_imagenes_bd(self, reporte_id: str) -> List[Dict[str, Any]]:
+        """Lee las imágenes de un reporte desde imagenes_medicas (índice por reporte_uuid)"""
+        with circuito_bd.proteger():
+            if self.repositorio_postgres:
+                filas = await self.repositorio_postgres.obtener_imagenes(reporte_id)
+            else:
+                supabase = obtener_conexion_bd()
+                resultado = supabase.table('imagenes_medicas').select('url, metadatos') \
+                    .eq('reporte_uuid', reporte_id).order('posicion').execute()
+                filas = resultado.data or []
+        return [{**(fila.get('metadatos') or {}), "url": fila.get('url')} for fila in filas]
+    
+    async def _consultar_diagnostico_bd(self, reporte_id: str) -> Optional[Dict[str, Any]]:
+        """Lee el diagnóstico y los hallazgos de un reporte desde sus tablas normalizadas"""
+        with circuito_bd.proteger():
+            if self.repositorio_postgres:
+                fila = await self.repositorio_postgres.obtener_diagnostico(reporte_id)
+            else:
+                supabase = obtener_conexion_bd()
+                resultado = supabase.table('diagnosticos') \
+                    .select('principal, secundarios, recomendaciones, observaciones, metadatos') \
+                    .eq('reporte_uuid', reporte_id).limit(1).execute()
+                fila = resultado.data[0] if resultado.data else None
+                if fila:
+                    hallazgos = supabase.table('hallazgos_clinicos') \
+                        .select('organo, descripcion, severidad, tipo, mediciones') \
+                        .eq('reporte_uuid', reporte_id).order('posicion').execute()
+                    fila['hallazgos'] = hallazgos.data or []
+
+        if not fila:
+            return None
+        metadatos = fila.pop('metadatos', None) or {}
+        return {**fila, **metadatos}
+    
+    async def _cargar_imagenes(self, reporte_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Imágenes normalizadas; los reportes guardados antes de normalizar usan su JSON"""
+        imagenes = await self._consultar_imagenes_bd(reporte_id)
+        if imagenes:
+            return imagenes
+        reporte = await self.obtener_reporte_formateado(reporte_id)
+        return reporte.get('imagenes', []) if reporte else None
+    
+    async def _cargar_diagnostico(self, reporte_id: str) -> Optional[Dict[str, Any]]:
+        """Diagnóstico normalizado; los reportes guardados antes de normalizar usan su JSON"""
+        diagnostico = await self._consultar_diagnostico_bd(reporte_id)
+        if diagnostico:
+            return diagnostico
+        reporte = await self.obtener_reporte_formateado(reporte_id)
+        return reporte.get('diagnostico', {}) if reporte else None
+    
+    async def _invalidar_cache_reporte(self, reporte_id: str):
+        """Invalida todas las entradas de caché derivadas de un reporte"""
+        await self.cache_reportes.invalidar(reporte_id)
+        await self.cache_reportes.invalidar(f"imagenes:{reporte_id}")
+        await self.cache_reportes.invalidar(f"diagnostico:{reporte_id}")
+    
+    def _obtener_pendiente(self, reporte_id: str) -> Optional[Dict[str, Any]]:
+        """Reporte aceptado que todavía no está en la base (escritura diferida o bandeja de salida)"""
+        if self.escritura_diferida:
+            pendiente = self.escritura_diferida.obtener_pendiente(reporte_id)
+            if pendiente:
+                return pendiente
+        return self.bandeja_salida.obtener_pendiente(reporte_id)
+    
+    async def _cargar_reporte_formateado(self, reporte_id: str) -> Optional[Dict[str, Any]]:
+        """Lee un reporte de la base de datos ya convertido al formato del frontend"""
+        pendiente = self._obtener_pendiente(reporte_id)
+        if pendiente:
+            return pendiente
+        datos_bd = await self._consultar_reporte_por_id_bd(reporte_id)
+        return self._formatear_reporte_supabase(datos_bd) if datos_bd else None
+    
+    async def obtener_reporte_formateado(self, reporte_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtiene un reporte en formato del frontend pasando por la caché de lectura
+        
+        Args:
+            reporte_id: UUID del reporte
+            
+        Returns:
+            Dict con el reporte o None si no existe
+        """
+        return await self.cache_reportes.obtener_o_cargar(
+            reporte_id,
+            lambda: self._cargar_reporte_formateado(reporte_id)
+        )
+    
+    async def _cargar_reportes_formateados(self, reporte_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Lee varios reportes de la base (una consulta) ya convertidos al formato del frontend"""
+        encontrados = {}
+        for reporte_id in reporte_ids:
+            pendiente = self._obtener_pendiente(reporte_id)
+            if pendiente:
+                encontrados[reporte_id] = pendiente
+        
+        # Un ID que no es UUID no puede existir (y haría fallar la consulta entera)
+        a_consultar = [
+            reporte_id for reporte_id in reporte_ids
+            if reporte_id not in encontrados and _es_uuid(reporte_id)
+        ]
+        if a_consultar:
+            for fila in await self._consultar_reportes_por_ids_bd(a_consultar):
+                reporte = self._formatear_reporte_supabase(fila)
+                encontrados[reporte["id"]] = reporte
+        return encontrados
+    
+    async def obtener_reportes_formateados(self, reporte_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Obtiene varios reportes en formato del frontend, primero desde la caché
+        
+        Args:
+            reporte_ids: UUIDs de los reportes
+            
+        Returns:
+            Dict ID -> reporte, solo con los encontrados
+        """
+        return await self.cache_reportes.obtener_o_cargar_varios(reporte_ids, self._cargar_reportes_formateados)
+    
+    def _datos_para_bd(self, reporte: ReporteModelo) -> Dict[str, Any]:
+        """Arma la fila de la tabla 'reporte' (el ID numérico lo genera la base)"""
+        return {
+            "paciente_id": reporte.paciente.get("id", 1),
+            "veterinario_id": reporte.veterinario.get("id", 1),
+            "fecha_estudio": reporte.fecha_creacion.date().isoformat(),
+            "tipo_estudio": reporte.tipo_estudio,
+            "origen_archivo": reporte.archivo_original,
+            "json_resultado": {
+                "id": reporte.id,  # Guardamos el UUID en el JSON
+                "paciente": reporte.paciente,
+                "tutor": reporte.tutor,
+                "veterinario": reporte.veterinario,
+                "diagnostico": reporte.diagnostico,
+                "imagenes": reporte.imagenes,
+                "contenido_extraido": reporte.contenido_extraido,
+                "confianza_extraccion": reporte.confianza_extraccion,
+                "url_google_drive": reporte.url_google_drive,
+                "id_google_drive": reporte.id_google_drive,
+                "huella_contenido": reporte.huella_contenido
+            },
+            # Fuera de json_resultado: la RPC lo guarda en reporte_extraccion
+            "extraccion": reporte.extraccion,
+            "tipo_procesamiento": "ia_analisis",
+            "estado_procesamiento": reporte.estado,
+            "creado_en": reporte.fecha_creacion.isoformat(),
+            "actualizado_en": reporte.fecha_actualizacion.isoformat()
+        }
+    
+    def _datos_para_memoria(self, reporte: ReporteModelo) -> Dict[str, Any]:
+        """Arma el registro del almacenamiento local (mismo formato que ve el frontend)"""
+        return {
+            "id": reporte.id,
+            "fecha_creacion": reporte.fecha_creacion.isoformat(),
+            "fecha_actualizacion": reporte.fecha_actualizacion.isoformat(),
+            "tipo_estudio": reporte.tipo_estudio,
+            "paciente": reporte.paciente,
+            "tutor": reporte.tutor,
+            "veterinario": reporte.veterinario,
+            "diagnostico": reporte.diagnostico,
+            "imagenes": reporte.imagenes,
+            "archivo_original": reporte.archivo_original,
+            "contenido_extraido": reporte.contenido_extraido,
+            "confianza_extraccion": reporte.confianza_extraccion,
+            "estado": reporte.estado,
+            "url_google_drive": reporte.url_google_drive,
+            "id_google_drive": reporte.id_google_drive,
+            "huella_contenido": reporte.huella_contenido
+        }
+    
+    def _registrar_en_almacenamiento_local(self, registros: List[Dict[str, Any]]):
+        """Agrega reportes al almacenamiento local y al índice, persistiendo una sola vez"""
+        if not registros:
+            return
+        self.reportes_memoria.extend(registros)
+        self._guardar_reportes()
+        for registro in registros:
+            self.indice_local.agregar(registro)
+            self.indice_facetas.agregar(registro)
+        self.indice_local.guardar()
+    
+    def _actualizar_en_almacenamiento_local(self, registro: Dict[str, Any]):
+        """Reemplaza un reporte del almacenamiento local y lo reindexa (si está guardado localmente)"""
+        for posicion, existente in enumerate(self.reportes_memoria):
+            if existente.get('id') == registro['id']:
+                self.reportes_memoria[posicion] = {**existente, **registro}
+                self._guardar_reportes()
+                self.indice_local.agregar(self.reportes_memoria[posicion])
+                self.indice_local.guardar()
+                self.indice_facetas.agregar(self.reportes_memoria[posicion])
+                return
+    
+    def _registrar_huella(self, reporte: ReporteModelo):
+        """Anota el archivo de origen de un reporte aceptado para detectar subidas repetidas"""
+        if reporte.huella_contenido:
+            self.huellas_locales[reporte.huella_contenido] = reporte.id
+    
+    async def buscar_reporte_por_huella(self, huella: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca el reporte generado a partir de un archivo ya procesado
+        
+        Args:
+            huella: SHA-256 (hex) del contenido del PDF
+            
+        Returns:
+            Reporte en formato del frontend o None si el archivo no se procesó
+        """
+        reporte_id = self.huellas_locales.get(huella)
+        if reporte_id:
+            reporte = await self.obtener_reporte_formateado(reporte_id)
+            if reporte:
+                return reporte
+            # El reporte se eliminó: la huella ya no apunta a nada
+            self.huellas_locales.pop(huella, None)
+        
+        fila = await self._consultar_reporte_por_huella_bd(huella)
+        if not fila:
+            return None
+        reporte = self._formatear_reporte_supabase(fila)
+        self.huellas_locales[huella] = reporte["id"]
+        return reporte
+    
+    def _publicar_reporte_creado(self, reporte: ReporteModelo):
+        """Avisa a los clientes conectados de un reporte nuevo"""
+        bus_eventos.publicar("reporte.creado", {
+            "id": reporte.id,
+            "tipo_estudio": reporte.tipo_estudio,
+            "paciente": reporte.paciente.get("nombre"),
+            "veterinario": reporte.veterinario.get("nombre"),
+            "estado": reporte.estado,
+            "fecha_creacion": reporte.fecha_creacion.isoformat()
+        })
+        self._publicar_delta_estadisticas([(None, reporte.estado)])
+    
+    def _publicar_delta_estadisticas(self, transiciones):
+        """Publica la variación de los contadores del dashboard (si cambió algo)"""
+        delta = delta_estadisticas(transiciones)
+        if delta:
+            bus_eventos.publicar("estadisticas.delta", delta)
+    
     async def guardar_reporte(self, reporte: ReporteModelo) -> Dict[str, Any]:
         """
         Guarda un reporte en la base de datos
@@ -60,75 +616,56 @@ class ReportesServicio:
         try:
             logger.info(f"Guardando reporte: {reporte.id}")
             
-            # Conectar a Supabase real
-            supabase = obtener_conexion_bd()
-            
-            # Preparar datos para Supabase (tabla 'reporte')
-            # El ID será auto-generado por Supabase, no lo incluimos
-            datos_supabase = {
-                "paciente_id": reporte.paciente.get("id", 1),
-                "veterinario_id": reporte.veterinario.get("id", 1),
-                "fecha_estudio": reporte.fecha_creacion.date().isoformat(),
-                "tipo_estudio": reporte.tipo_estudio,
-                "origen_archivo": reporte.archivo_original,
-                "json_resultado": {
-                    "id": reporte.id,  # Guardamos el UUID en el JSON
-                    "paciente": reporte.paciente,
-                    "tutor": reporte.tutor,
-                    "veterinario": reporte.veterinario,
-                    "diagnostico": reporte.diagnostico,
-                    "imagenes": reporte.imagenes,
-                    "contenido_extraido": reporte.contenido_extraido,
-                    "confianza_extraccion": reporte.confianza_extraccion,
-                    "url_google_drive": reporte.url_google_drive,
-                    "id_google_drive": reporte.id_google_drive
-                },
-                "tipo_procesamiento": "ia_analisis",
-                "estado_procesamiento": reporte.estado,
-                "creado_en": reporte.fecha_creacion.isoformat(),
-                "actualizado_en": reporte.fecha_actualizacion.isoformat()
-            }
-            
-            # Insertar en la tabla 'reporte' de Supabase
-            resultado = supabase.table('reporte').insert(datos_supabase).execute()
-            
-            if resultado.data:
-                logger.info(f"Reporte guardado exitosamente en Supabase: {reporte.id}")
-                
-                # También guardar en memoria para compatibilidad
-                datos_reporte = {
-                    "id": reporte.id,
-                    "fecha_creacion": reporte.fecha_creacion.isoformat(),
-                    "fecha_actualizacion": reporte.fecha_actualizacion.isoformat(),
-                    "tipo_estudio": reporte.tipo_estudio,
-                    "paciente": reporte.paciente,
-                    "tutor": reporte.tutor,
-                    "veterinario": reporte.veterinario,
-                    "diagnostico": reporte.diagnostico,
-                    "imagenes": reporte.imagenes,
-                    "archivo_original": reporte.archivo_original,
-                    "contenido_extraido": reporte.contenido_extraido,
-                    "confianza_extraccion": reporte.confianza_extraccion,
-                    "estado": reporte.estado,
-                    "url_google_drive": reporte.url_google_drive,
-                    "id_google_drive": reporte.id_google_drive
-                }
-                self.reportes_memoria.append(datos_reporte)
-                self._guardar_reportes()
-                
+            if self.escritura_diferida:
+                await self.escritura_diferida.encolar(self._registro_para_guardar(reporte))
+                self._registrar_huella(reporte)
+                self._publicar_reporte_creado(reporte)
                 return {
                     "exito": True,
-                    "datos": resultado.data[0],
-                    "mensaje": "Reporte guardado exitosamente en Supabase"
+                    "datos": {"id": reporte.id},
+                    "mensaje": "Reporte encolado para guardado en la base de datos"
                 }
+            
+            # Insertar en la tabla 'reporte'
+            registro = self._registro_para_guardar(reporte)
+            try:
+                filas_insertadas = await self._insertar_reporte_bd(registro["bd"])
+            except Exception as e:
+                filas_insertadas, error_bd = [], str(e)
             else:
-                logger.error(f"Error al guardar reporte en Supabase: {resultado}")
+                error_bd = "La base de datos no devolvió el reporte insertado"
+            
+            if not filas_insertadas:
+                # El reporte no se pierde: queda en disco y se reenvía cuando la base responda
+                await self.bandeja_salida.agregar([registro], error_bd)
+                self._registrar_huella(reporte)
+                self._publicar_reporte_creado(reporte)
                 return {
-                    "exito": False,
-                    "error": "Error de base de datos",
-                    "mensaje": "No se pudo guardar el reporte en Supabase"
+                    "exito": True,
+                    "datos": {"id": reporte.id, "pendiente_sincronizacion": True},
+                    "mensaje": "Base de datos no disponible: el reporte se guardará automáticamente cuando se restablezca"
                 }
             
+            logger.info(f"Reporte guardado exitosamente en la base de datos: {reporte.id}")
+            
+            # También guardar en memoria para compatibilidad
+            self._registrar_en_almacenamiento_local([registro["memoria"]])
+            self._registrar_huella(reporte)
+            self._publicar_reporte_creado(reporte)
+            
+            return {
+                "exito": True,
+                "datos": filas_insertadas[0],
+                "mensaje": "Reporte guardado exitosamente en la base de datos"
+            }
+            
+        except ColaEscrituraLlena as e:
+            logger.error(f"Escritura diferida saturada, no se encoló el reporte {reporte.id}: {str(e)}")
+            return {
+                "exito": False,
+                "error": "Sistema ocupado",
+                "mensaje": f"La base de datos está demorada, intente nuevamente: {str(e)}"
+            }
         except Exception as e:
             logger.error(f"Error al guardar reporte: {str(e)}")
             return {
@@ -137,6 +674,107 @@ class ReportesServicio:
                 "mensaje": f"Ha ocurrido un error inesperado: {str(e)}"
             }
     
+    async def _persistir_registros(
+        self,
+        registros: List[Dict[str, Any]],
+        tamano_bloque: int = TAMANO_BLOQUE_LOTE
+    ) -> List[Optional[str]]:
+        """
+        Guarda registros ({'id', 'bd', 'memoria'}) con inserciones multi-fila por bloques
+        
+        Cada bloque es una sola llamada a la base. Si un bloque falla se
+        reintentan sus registros de a uno para aislar los inválidos, así el
+        resto del bloque igual se guarda. El almacenamiento local y el índice
+        se actualizan una sola vez al final.
+        
+        Returns:
+            Por cada registro, None si se guardó o el mensaje de error
+        """
+        errores: List[Optional[str]] = []
+        registros_guardados: List[Dict[str, Any]] = []
+        
+        for inicio in range(0, len(registros), tamano_bloque):
+            bloque = registros[inicio:inicio + tamano_bloque]
+            try:
+                filas = await self._insertar_reportes_bd([r["bd"] for r in bloque])
+                if len(filas) != len(bloque):
+                    raise RuntimeError(f"se insertaron {len(filas)} de {len(bloque)} reportes")
+                errores_bloque = [None] * len(bloque)
+            except Exception as error_bloque:
+                logger.warning(f"Falló el bloque {inicio}-{inicio + len(bloque) - 1}, reintentando de a uno: {str(error_bloque)}")
+                errores_bloque = []
+                for registro in bloque:
+                    try:
+                        filas = await self._insertar_reportes_bd([registro["bd"]])
+                        errores_bloque.append(None if filas else "No se pudo guardar el reporte")
+                    except Exception as e:
+                        errores_bloque.append(str(e))
+            
+            for registro, error in zip(bloque, errores_bloque):
+                if error is None:
+                    registros_guardados.append(registro["memoria"])
+            errores.extend(errores_bloque)
+        
+        self._registrar_en_almacenamiento_local(registros_guardados)
+        return errores
+    
+    def _registro_para_guardar(self, reporte: ReporteModelo) -> Dict[str, Any]:
+        """Fila de la base y registro local de un reporte, listos para persistir"""
+        return {
+            "id": reporte.id,
+            "bd": self._datos_para_bd(reporte),
+            "memoria": self._datos_para_memoria(reporte)
+        }
+    
+    async def guardar_reportes_lote(
+        self,
+        reportes: List[ReporteModelo],
+        tamano_bloque: int = TAMANO_BLOQUE_LOTE
+    ) -> Dict[str, Any]:
+        """
+        Guarda muchos reportes con inserciones multi-fila por bloques
+        
+        Args:
+            reportes: Reportes a guardar
+            tamano_bloque: Cantidad de reportes por sentencia INSERT
+            
+        Returns:
+            Dict con el estado de cada reporte, en el mismo orden recibido
+        """
+        logger.info(f"Guardando lote de {len(reportes)} reportes (bloques de {tamano_bloque})")
+        
+        errores = await self._persistir_registros(
+            [self._registro_para_guardar(r) for r in reportes],
+            tamano_bloque
+        )
+        resultados = [
+            {"id": reporte.id, "exito": True} if error is None
+            else {"id": reporte.id, "exito": False, "error": error}
+            for reporte, error in zip(reportes, errores)
+        ]
+        
+        guardados = errores.count(None)
+        fallidos = len(reportes) - guardados
+        logger.info(f"Lote guardado: {guardados} reportes guardados, {fallidos} fallidos")
+        
+        if guardados:
+            # Un solo evento por lote: una importación no debe inundar a los clientes
+            bus_eventos.publicar("reportes.importados", {"cantidad": guardados})
+            self._publicar_delta_estadisticas(
+                (None, reporte.estado) for reporte, error in zip(reportes, errores) if error is None
+            )
+        
+        return {
+            "exito": fallidos == 0,
+            "datos": {
+                "total": len(reportes),
+                "guardados": guardados,
+                "fallidos": fallidos,
+                "resultados": resultados
+            },
+            "mensaje": f"Se guardaron {guardados} de {len(reportes)} reportes"
+        }
+    
     async def obtener_reportes(self, filtros: Dict[str, Any], pagina: int = 1, limite: int = 10) -> Dict[str, Any]:
         """
         Obtiene reportes con filtros y paginación
@@ -152,58 +790,20 @@ class ReportesServicio:
         try:
             logger.info(f"Obteniendo reportes con filtros: {filtros}")
             
-            # Intentar conectar a Supabase
+            # Intentar conectar a la base de datos
             try:
-                logger.info("Intentando conectar a Supabase...")
-                supabase = self.obtener_conexion_bd()
-                logger.info("Conexión a Supabase exitosa")
-                
-                # Construir consulta con filtros
-                query = supabase.table('reporte').select('*')
-                
-                # Aplicar filtros
-                if filtros.get('tipo_estudio'):
-                    query = query.eq('tipo_estudio', filtros['tipo_estudio'])
-                if filtros.get('especie'):
-                    # Filtrar por especie en el JSON del paciente
-                    query = query.contains('json_resultado', {'paciente': {'especie': filtros['especie']}})
-                if filtros.get('veterinario'):
-                    query = query.eq('veterinario_id', filtros['veterinario'])
-                
-                # Aplicar paginación
-                offset = (pagina - 1) * limite
-                query = query.range(offset, offset + limite - 1)
-                
-                # Ejecutar consulta
-                resultado = query.execute()
+                filas = await self._consultar_reportes_bd(filtros, pagina, limite)
                 
-                # Convertir datos de Supabase al formato esperado por el frontend
-                reportes_formateados = []
-                for reporte in resultado.data or []:
-                    json_data = reporte.get('json_resultado', {})
-                    reporte_formateado = {
-                        "id": json_data.get('id', str(reporte.get('id'))),  # Usar ID del JSON o del registro
-                        "fecha_creacion": reporte.get('creado_en'),
-                        "fecha_actualizacion": reporte.get('actualizado_en'),
-                        "tipo_estudio": reporte.get('tipo_estudio'),
-                        "paciente": json_data.get('paciente', {}),
-                        "tutor": json_data.get('tutor', {}),
-                        "veterinario": json_data.get('veterinario', {}),
-                        "diagnostico": json_data.get('diagnostico', {}),
-                        "imagenes": json_data.get('imagenes', []),
-                        "archivo_original": reporte.get('origen_archivo'),
-                        "contenido_extraido": json_data.get('contenido_extraido', ''),
-                        "confianza_extraccion": json_data.get('confianza_extraccion', 0),
-                        "estado": reporte.get('estado_procesamiento'),
-                        "url_google_drive": json_data.get('url_google_drive'),
-                        "id_google_drive": json_data.get('id_google_drive')
-                    }
-                    reportes_formateados.append(reporte_formateado)
+                # Convertir datos de la base al formato esperado por el frontend
+                reportes_formateados = [
+                    self._formatear_reporte_supabase(reporte)
+                    for reporte in filas
+                ]
                 
                 return {
                     "exito": True,
                     "datos": reportes_formateados,
-                    "mensaje": f"Reportes obtenidos exitosamente desde Supabase ({len(reportes_formateados)} total)"
+                    "mensaje": f"Reportes obtenidos exitosamente desde la base de datos ({len(reportes_formateados)} total)"
                 }
             except Exception as supabase_error:
                 logger.warning(f"Error al conectar con Supabase: {str(supabase_error)}")
@@ -212,13 +812,25 @@ class ReportesServicio:
                 # Fallback a memoria si Supabase falla
                 reportes_filtrados = self.reportes_memoria.copy()
                 
-                # Aplicar filtros
+                # Aplicar filtros (mismo criterio que las columnas de la base)
+                def normalizado(valor: Any) -> str:
+                    return normalizar_valor_filtro(valor) if valor is not None else ''
+                
                 if filtros.get('tipo_estudio'):
-                    reportes_filtrados = [r for r in reportes_filtrados if r.get('tipo_estudio') == filtros['tipo_estudio']]
+                    valor = normalizar_valor_filtro(filtros['tipo_estudio'])
+                    reportes_filtrados = [r for r in reportes_filtrados if normalizado(r.get('tipo_estudio')) == valor]
                 if filtros.get('especie'):
-                    reportes_filtrados = [r for r in reportes_filtrados if r.get('paciente', {}).get('especie') == filtros['especie']]
+                    valor = normalizar_valor_filtro(filtros['especie'])
+                    reportes_filtrados = [r for r in reportes_filtrados if normalizado(r.get('paciente', {}).get('especie')) == valor]
                 if filtros.get('veterinario'):
-                    reportes_filtrados = [r for r in reportes_filtrados if r.get('veterinario', {}).get('id') == filtros['veterinario']]
+                    valor = str(filtros['veterinario']).strip()
+                    reportes_filtrados = [r for r in reportes_filtrados if str(r.get('veterinario', {}).get('id')) == valor]
+                if filtros.get('paciente'):
+                    valor = normalizar_valor_filtro(filtros['paciente'])
+                    reportes_filtrados = [r for r in reportes_filtrados if normalizado(r.get('paciente', {}).get('nombre')).startswith(valor)]
+                if filtros.get('tutor'):
+                    valor = normalizar_valor_filtro(filtros['tutor'])
+                    reportes_filtrados = [r for r in reportes_filtrados if normalizado((r.get('tutor') or {}).get('nombre')).startswith(valor)]
                 
                 # Aplicar paginación
                 offset = (pagina - 1) * limite
@@ -250,20 +862,16 @@ class ReportesServicio:
         try:
             logger.info(f"Obteniendo reporte: {reporte_id}")
             
-            # Conectar a Supabase real
-            supabase = obtener_conexion_bd()
-            
-            # Consultar reporte por ID
-            resultado = supabase.table('reporte').select('*').eq('id', reporte_id).execute()
+            # Consultar reporte por su UUID público (read-through)
+            datos_reporte = await self.obtener_reporte_formateado(reporte_id)
             
-            if resultado.data and len(resultado.data) > 0:
-                datos_bd = resultado.data[0]
-                reporte = ReporteModelo.crear_desde_bd(datos_bd)
+            if datos_reporte:
+                reporte = ReporteModelo.crear_desde_bd(datos_reporte)
                 
                 return {
                     "exito": True,
                     "datos": reporte,
-                    "mensaje": "Reporte obtenido exitosamente desde Supabase"
+                    "mensaje": "Reporte obtenido exitosamente desde la base de datos"
                 }
             else:
                 return {
@@ -280,13 +888,68 @@ class ReportesServicio:
                 "mensaje": f"Ha ocurrido un error inesperado: {str(e)}"
             }
     
+    async def obtener_reportes_por_ids(self, reporte_ids: List[str]) -> Dict[str, Any]:
+        """
+        Obtiene varios reportes por ID en una sola llamada
+        
+        Args:
+            reporte_ids: IDs de los reportes
+            
+        Returns:
+            Dict con un resultado por ID, en el orden recibido
+        """
+        try:
+            logger.info(f"Obteniendo {len(reporte_ids)} reportes por ID")
+            
+            encontrados = await self.obtener_reportes_formateados(reporte_ids)
+            resultados = []
+            for reporte_id in reporte_ids:
+                datos_reporte = encontrados.get(reporte_id)
+                if datos_reporte:
+                    resultados.append({
+                        "id": reporte_id,
+                        "encontrado": True,
+                        "reporte": ReporteModelo.crear_desde_bd(datos_reporte)
+                    })
+                else:
+                    resultados.append({
+                        "id": reporte_id,
+                        "encontrado": False,
+                        "error": "Reporte no encontrado"
+                    })
+            
+            cantidad_encontrados = sum(1 for resultado in resultados if resultado["encontrado"])
+            return {
+                "exito": True,
+                "datos": {
+                    "total": len(reporte_ids),
+                    "encontrados": cantidad_encontrados,
+                    "no_encontrados": len(reporte_ids) - cantidad_encontrados,
+                    "resultados": resultados
+                },
+                "mensaje": f"Se encontraron {cantidad_encontrados} de {len(reporte_ids)} reportes"
+            }
+            
+        except Exception as e:
+            logger.error(f"Error al obtener reportes por ID: {str(e)}")
+            return {
+                "exito": False,
+                "error": str(e),
+                "mensaje": "Error al obtener reportes"
+            }
+    
     async def actualizar_reporte(
         self, 
         reporte_id: str, 
         datos_actualizacion: Dict[str, Any]
     ) -> Dict[str, Any]:
         """
-        Actualiza un reporte existente
+        Actualiza un reporte existente enviando solo los campos que cambian
+        
+        Los cambios se aplican en la base con jsonb_set (RPC
+        actualizar_reporte_parcial). Si 'datos_actualizacion' trae la
+        'fecha_actualizacion' que vio el cliente y el reporte cambió desde
+        entonces, no se aplica nada y se informa el conflicto.
         
         Args:
             reporte_id: ID del reporte
@@ -298,30 +961,65 @@ class ReportesServicio:
         try:
             logger.info(f"Actualizando reporte: {reporte_id}")
             
-            # En un entorno real, aquí se actualizaría la base de datos
-            # Por ahora simulamos la actualización
-            datos_simulados = {
-                'id': reporte_id,
-                'fecha_creacion': datetime.now().isoformat(),
-                'fecha_actualizacion': datetime.now().isoformat(),
-                'tipo_estudio': 'radiografia',
-                'paciente': {'nombre': 'Paciente actualizado'},
-                'tutor': {'nombre': 'Tutor actualizado'},
-                'veterinario': {'nombre': 'Veterinario actualizado'},
-                'diagnostico': {'principal': 'Diagnóstico actualizado'},
-                'imagenes': [],
-                'archivo_original': 'archivo.pdf',
-                'contenido_extraido': 'Contenido actualizado',
-                'confianza_extraccion': 0.9,
-                'estado': 'completado'
-            }
+            try:
+                cambios, columnas = ReporteModelo.cambios_parciales(datos_actualizacion)
+                version = datos_actualizacion.get('fecha_actualizacion')
+                version = datetime.fromisoformat(version) if version else None
+            except (TypeError, ValueError) as e:
+                return {
+                    "exito": False,
+                    "error": "Datos inválidos",
+                    "mensaje": str(e)
+                }
+            if version is not None and version.tzinfo is None:
+                version = version.replace(tzinfo=timezone.utc)
+            
+            if not _es_uuid(reporte_id):
+                return {
+                    "exito": False,
+                    "error": "Reporte no encontrado",
+                    "mensaje": f"No se encontró el reporte con ID {reporte_id}"
+                }
+            if self._obtener_pendiente(reporte_id):
+                return {
+                    "exito": False,
+                    "error": "Reporte en proceso de guardado",
+                    "mensaje": "El reporte todavía se está guardando, intente nuevamente en unos segundos"
+                }
+            
+            with metricas.medir_latencia("reportes.actualizacion_parcial_ms"):
+                resultado = await self._actualizar_reporte_bd(reporte_id, cambios, columnas, version)
             
-            reporte = ReporteModelo.crear_desde_bd(datos_simulados)
-            reporte.actualizar_datos(datos_actualizacion)
+            if resultado.get('estado') == 'no_encontrado':
+                return {
+                    "exito": False,
+                    "error": "Reporte no encontrado",
+                    "mensaje": f"No se encontró el reporte con ID {reporte_id}"
+                }
+            if resultado.get('estado') == 'conflicto':
+                metricas.incrementar("reportes.conflictos_actualizacion")
+                return {
+                    "exito": False,
+                    "error": "Conflicto de versión",
+                    "mensaje": "El reporte fue modificado por otro usuario; recárguelo y vuelva a aplicar los cambios",
+                    "datos": {"fecha_actualizacion": resultado.get('actualizado_en')}
+                }
+            
+            # Solo se invalida lo derivado de este reporte
+            registro = self._formatear_reporte_supabase(resultado['reporte'])
+            await self._invalidar_cache_reporte(reporte_id)
+            self._actualizar_en_almacenamiento_local(registro)
+            
+            bus_eventos.publicar("reporte.actualizado", {
+                "id": reporte_id,
+                "estado": registro["estado"],
+                "fecha_actualizacion": registro["fecha_actualizacion"]
+            })
+            self._publicar_delta_estadisticas([(resultado.get('estado_anterior'), registro["estado"])])
             
             return {
                 "exito": True,
-                "datos": reporte,
+                "datos": ReporteModelo.crear_desde_bd(registro),
                 "mensaje": "Reporte actualizado exitosamente"
             }
             
@@ -333,6 +1031,125 @@ class ReportesServicio:
                 "mensaje": "Ha ocurrido un error inesperado"
             }
     
+    async def listar_extracciones_desactualizadas(
+        self,
+        version_prompt: str,
+        despues_de: Optional[str] = None,
+        limite: int = 50
+    ) -> List[Dict[str, Any]]:
+        """
+        Lista los reportes estructurados con una versión del prompt distinta a la actual
+        
+        Args:
+            version_prompt: Versión actual del prompt
+            despues_de: UUID del último reporte ya recorrido (None = desde el principio)
+            limite: Cantidad máxima de reportes
+            
+        Returns:
+            Lista de {'reporte_id', 'texto', 'imagenes', 'version_prompt', 'actualizado_en'}
+            en orden de UUID
+        """
+        return await self._consultar_extracciones_desactualizadas_bd(
+            version_prompt, despues_de or str(uuid.UUID(int=0)), limite
+        )
+    
+    async def registrar_version_extraccion(self, reporte_id: str, version_prompt: str, modelo: str):
+        """
+        Marca un reporte como estructurado con una versión del prompt y un modelo
+        
+        Args:
+            reporte_id: UUID del reporte
+            version_prompt: Versión del prompt usada
+            modelo: Modelo de Gemini usado
+        """
+        await self._actualizar_version_extraccion_bd(reporte_id, version_prompt, modelo)
+    
+    async def obtener_cambios(self, desde: Optional[str], limite: int = 500) -> Dict[str, Any]:
+        """
+        Obtiene los reportes creados, actualizados o eliminados desde un token
+        
+        Args:
+            desde: Token devuelto por la consulta anterior (None para obtener el actual)
+            limite: Cantidad máxima de cambios a leer
+            
+        Returns:
+            Dict con el token siguiente y los cambios
+        """
+        try:
+            datos = await self.cambios.obtener_cambios(desde, limite)
+            return {
+                "exito": True,
+                "datos": datos,
+                "mensaje": f"{len(datos['cambios'])} reportes cambiaron"
+            }
+        except Exception as e:
+            logger.error(f"Error al obtener cambios de reportes: {str(e)}")
+            return {
+                "exito": False,
+                "error": str(e),
+                "mensaje": "Error al obtener cambios de reportes"
+            }
+    
+    async def iterar_lotes_exportacion(self, filtros: Dict[str, Any]) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Recorre todos los reportes que cumplen los filtros, de a un lote por vez
+        
+        Pagina por ID (keyset): cada consulta continúa después del último ID
+        del lote anterior, así que solo hay un lote en memoria a la vez.
+        
+        Args:
+            filtros: Filtros del listado (tipo_estudio, especie, veterinario, paciente, tutor)
+            
+        Yields:
+            Lotes de reportes en formato del frontend
+        """
+        ultimo_id = 0
+        while True:
+            filas = await self._consultar_reportes_desde_bd(filtros, ultimo_id, TAMANO_LOTE_EXPORTACION)
+            if not filas:
+                return
+            metricas.incrementar("exportacion.filas", len(filas))
+            yield [self._formatear_reporte_supabase(fila) for fila in filas]
+            if len(filas) < TAMANO_LOTE_EXPORTACION:
+                return
+            ultimo_id = filas[-1]['id']
+    
+    def exportar_reportes(self, formato: str, filtros: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Prepara la exportación completa de reportes en el formato pedido
+        
+        Args:
+            formato: 'ndjson', 'csv' o 'parquet'
+            filtros: Filtros del listado
+            
+        Returns:
+            Dict con el generador del contenido, su tipo y el nombre de archivo
+        """
+        if formato not in FORMATOS_EXPORTACION:
+            return {
+                "exito": False,
+                "error": "Formato inválido",
+                "mensaje": f"Formatos soportados: {', '.join(FORMATOS_EXPORTACION)}"
+            }
+        if formato == 'parquet' and not parquet_disponible():
+            return {
+                "exito": False,
+                "error": "Formato no disponible",
+                "mensaje": "La exportación a Parquet requiere el paquete pyarrow"
+            }
+        
+        tipo_contenido, extension = FORMATOS_EXPORTACION[formato]
+        metricas.incrementar(f"exportacion.{formato}")
+        return {
+            "exito": True,
+            "datos": {
+                "contenido": GENERADORES_EXPORTACION[formato](self.iterar_lotes_exportacion(filtros)),
+                "tipo_contenido": tipo_contenido,
+                "nombre_archivo": f"reportes_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+            },
+            "mensaje": "Exportación iniciada"
+        }
+    
     async def eliminar_reporte(self, reporte_id: str) -> Dict[str, Any]:
         """
         Elimina un reporte
@@ -346,8 +1163,43 @@ class ReportesServicio:
         try:
             logger.info(f"Eliminando reporte: {reporte_id}")
             
-            # En un entorno real, aquí se eliminaría de la base de datos
-            # Por ahora simulamos la eliminación
+            # Un reporte que espera en la escritura diferida o en la bandeja de salida no debe guardarse
+            pendiente = None
+            if self.escritura_diferida:
+                registro = await self.escritura_diferida.quitar(reporte_id)
+                pendiente = registro["memoria"] if registro else None
+            en_bandeja = self.bandeja_salida.obtener_pendiente(reporte_id)
+            if en_bandeja:
+                await self.bandeja_salida.quitar(reporte_id)
+            pendiente = pendiente or en_bandeja
+            try:
+                eliminado = await self._eliminar_reporte_bd(reporte_id)
+            except Exception:
+                if not pendiente:
+                    raise
+                eliminado = None
+            if pendiente and not eliminado:
+                eliminado = {"estado_procesamiento": pendiente.get('estado')}
+            await self._invalidar_cache_reporte(reporte_id)
+            
+            # Mantener consistentes el almacenamiento local y su índice
+            cantidad_previa = len(self.reportes_memoria)
+            self.reportes_memoria = [r for r in self.reportes_memoria if r.get('id') != reporte_id]
+            if len(self.reportes_memoria) != cantidad_previa:
+                self._guardar_reportes()
+                self.indice_local.eliminar(reporte_id)
+                self.indice_local.guardar()
+                self.indice_facetas.eliminar(reporte_id)
+            
+            if not eliminado:
+                return {
+                    "exito": False,
+                    "error": "Reporte no encontrado",
+                    "mensaje": f"No se encontró el reporte con ID: {reporte_id}"
+                }
+            
+            bus_eventos.publicar("reporte.eliminado", {"id": reporte_id})
+            self._publicar_delta_estadisticas([(eliminado.get('estado_procesamiento'), None)])
             
             return {
                 "exito": True,
@@ -362,50 +1214,211 @@ class ReportesServicio:
                 "mensaje": "Ha ocurrido un error inesperado"
             }
     
-    async def buscar_reportes(self, termino: str, limite: int = 10) -> Dict[str, Any]:
+    async def obtener_imagenes_por_reporte(self, reporte_id: str) -> Dict[str, Any]:
         """
-        Busca reportes por término
+        Obtiene las imágenes de un reporte desde imagenes_medicas
         
         Args:
-            termino: Término de búsqueda
-            limite: Cantidad máxima de resultados
+            reporte_id: UUID del reporte
             
         Returns:
-            Dict con los reportes encontrados
+            Dict con la lista de imágenes en su orden original
         """
         try:
-            logger.info(f"Buscando reportes con término: {termino}")
+            imagenes = await self.cache_reportes.obtener_o_cargar(
+                f"imagenes:{reporte_id}",
+                lambda: self._cargar_imagenes(reporte_id)
+            )
+            if imagenes is None:
+                return {
+                    "exito": False,
+                    "error": "Reporte no encontrado",
+                    "mensaje": f"No se encontró el reporte con ID: {reporte_id}"
+                }
+            return {
+                "exito": True,
+                "datos": imagenes,
+                "mensaje": "Imágenes obtenidas exitosamente"
+            }
+        except Exception as e:
+            logger.error(f"Error al obtener imágenes del reporte {reporte_id}: {str(e)}")
+            return {
+                "exito": False,
+                "error": str(e),
+                "mensaje": "Error al obtener imágenes"
+            }
+    
+    async def obtener_diagnostico_por_reporte(self, reporte_id: str) -> Dict[str, Any]:
+        """
+        Obtiene el diagnóstico de un reporte desde diagnosticos y hallazgos_clinicos
+        
+        Args:
+            reporte_id: UUID del reporte
             
-            # En un entorno real, aquí se realizaría la búsqueda en la base de datos
-            # Por ahora simulamos la búsqueda
-            reportes_simulados = []
-            
-            for i in range(min(limite, 3)):  # Simular 3 resultados máximo
-                datos_simulados = {
-                    'id': f'busqueda_{i+1}',
-                    'fecha_creacion': datetime.now().isoformat(),
-                    'fecha_actualizacion': datetime.now().isoformat(),
-                    'tipo_estudio': 'radiografia',
-                    'paciente': {'nombre': f'Paciente encontrado {i+1}'},
-                    'tutor': {'nombre': f'Tutor encontrado {i+1}'},
-                    'veterinario': {'nombre': f'Veterinario encontrado {i+1}'},
-                    'diagnostico': {'principal': f'Diagnóstico encontrado {i+1}'},
-                    'imagenes': [],
-                    'archivo_original': f'archivo_encontrado_{i+1}.pdf',
-                    'contenido_extraido': f'Contenido encontrado {i+1}',
-                    'confianza_extraccion': 0.85,
-                    'estado': 'completado'
+        Returns:
+            Dict con el diagnóstico y sus hallazgos clínicos
+        """
+        try:
+            diagnostico = await self.cache_reportes.obtener_o_cargar(
+                f"diagnostico:{reporte_id}",
+                lambda: self._cargar_diagnostico(reporte_id)
+            )
+            if diagnostico is None:
+                return {
+                    "exito": False,
+                    "error": "Reporte no encontrado",
+                    "mensaje": f"No se encontró el reporte con ID: {reporte_id}"
                 }
-                
-                reporte = ReporteModelo.crear_desde_bd(datos_simulados)
-                reportes_simulados.append(reporte)
+            return {
+                "exito": True,
+                "datos": diagnostico,
+                "mensaje": "Diagnóstico obtenido exitosamente"
+            }
+        except Exception as e:
+            logger.error(f"Error al obtener diagnóstico del reporte {reporte_id}: {str(e)}")
+            return {
+                "exito": False,
+                "error": str(e),
+                "mensaje": "Error al obtener diagnóstico"
+            }
+    
+    async def obtener_estadisticas(self) -> Dict[str, Any]:
+        """
+        Obtiene las estadísticas del sistema desde los contadores precalculados
+        
+        Returns:
+            Dict con los contadores del sistema
+        """
+        try:
+            logger.info("Obteniendo estadísticas del sistema")
+            estadisticas = await self.estadisticas.obtener_estadisticas()
+            
+            return {
+                "exito": True,
+                "datos": estadisticas,
+                "mensaje": "Estadísticas obtenidas exitosamente"
+            }
+            
+        except Exception as e:
+            logger.error(f"Error al obtener estadísticas: {str(e)}")
+            return {
+                "exito": False,
+                "error": str(e),
+                "mensaje": "Error al obtener estadísticas"
+            }
+    
+    async def obtener_serie_estadisticas(
+        self,
+        desde: date,
+        hasta: date,
+        agrupar_por: str = "dia",
+        dimension: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Obtiene la serie temporal de reportes desde los buckets diarios precalculados
+        
+        Args:
+            desde: Primer día (inclusive)
+            hasta: Último día (inclusive)
+            agrupar_por: 'dia', 'semana' o 'mes'
+            dimension: 'tipo_estudio', 'especie', 'veterinario' o None
+            
+        Returns:
+            Dict con los períodos y las series
+        """
+        try:
+            logger.info(f"Obteniendo serie de estadísticas {desde} - {hasta} por {agrupar_por}")
+            serie = await self.estadisticas.obtener_serie(desde, hasta, agrupar_por, dimension)
+            
+            return {
+                "exito": True,
+                "datos": serie,
+                "mensaje": "Serie obtenida exitosamente"
+            }
+            
+        except Exception as e:
+            logger.error(f"Error al obtener serie de estadísticas: {str(e)}")
+            return {
+                "exito": False,
+                "error": str(e),
+                "mensaje": "Error al obtener serie de estadísticas"
+            }
+    
+    async def obtener_facetas(self, filtros: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Cuenta reportes por valor de faceta para la combinación de filtros actual
+        
+        Args:
+            filtros: tipo_estudio, especie, veterinario y estado elegidos
+            
+        Returns:
+            Dict con el total filtrado y los conteos de cada faceta
+        """
+        try:
+            with metricas.medir_latencia("facetas.latencia_ms"):
+                facetas = self.indice_facetas.contar(filtros)
             
             return {
                 "exito": True,
-                "datos": reportes_simulados,
-                "mensaje": f"Se encontraron {len(reportes_simulados)} reportes"
+                "datos": facetas,
+                "mensaje": "Facetas obtenidas exitosamente"
             }
             
+        except Exception as e:
+            logger.error(f"Error al obtener facetas: {str(e)}")
+            return {
+                "exito": False,
+                "error": str(e),
+                "mensaje": "Error al obtener facetas"
+            }
+    
+    async def buscar_reportes(
+        self,
+        termino: str,
+        limite: int = 10,
+        desplazamiento: int = 0
+    ) -> Dict[str, Any]:
+        """
+        Busca reportes por término usando la búsqueda de texto completo de Postgres
+        
+        La función 'buscar_reportes_fts' rankea con ts_rank sobre el vector
+        'busqueda_tsv' (índice GIN) y devuelve fragmentos resaltados, todo en
+        un solo round trip.
+        
+        Args:
+            termino: Término de búsqueda (sintaxis de websearch_to_tsquery)
+            limite: Cantidad máxima de resultados
+            desplazamiento: Cantidad de resultados a saltear
+            
+        Returns:
+            Dict con los reportes encontrados y el total de coincidencias
+        """
+        try:
+            logger.info(f"Buscando reportes con término: {termino}")
+            
+            try:
+                filas = await self._buscar_reportes_bd(termino, limite, desplazamiento)
+                reportes_encontrados = []
+                for fila in filas:
+                    reporte = self._formatear_reporte_supabase(fila)
+                    reporte["relevancia"] = fila.get('relevancia')
+                    reporte["fragmento"] = fila.get('fragmento')
+                    reportes_encontrados.append(reporte)
+                
+                total = filas[0].get('total_coincidencias', len(filas)) if filas else 0
+                
+                return {
+                    "exito": True,
+                    "datos": reportes_encontrados,
+                    "total": total,
+                    "mensaje": f"Se encontraron {total} reportes"
+                }
+            except Exception as bd_error:
+                logger.warning(f"Error al buscar en la base de datos: {str(bd_error)}")
+                logger.info("Usando índice de búsqueda local como fallback")
+                
+                return self._buscar_reportes_local(termino, limite, desplazamiento)
+            
         except Exception as e:
             logger.error(f"Error al buscar reportes: {str(e)}")
             return {
@@ -413,3 +1426,26 @@ class ReportesServicio:
                 "error": "Error interno",
                 "mensaje": "Ha ocurrido un error inesperado"
             }
+    
+    def _buscar_reportes_local(self, termino: str, limite: int, desplazamiento: int) -> Dict[str, Any]:
+        """Busca en el índice invertido local (BM25) sobre los reportes en memoria"""
+        coincidencias, total = self.indice_local.buscar(termino, limite, desplazamiento)
+        reportes_por_id = {r.get('id'): r for r in self.reportes_memoria}
+        terminos = normalizar_texto(termino)
+        
+        reportes_encontrados = []
+        for reporte_id, puntaje in coincidencias:
+            reporte = reportes_por_id.get(reporte_id)
+            if not reporte:
+                continue
+            resultado = {k: v for k, v in reporte.items() if k != 'imagenes'}
+            resultado["relevancia"] = round(puntaje, 4)
+            resultado["fragmento"] = resaltar_fragmento(reporte.get('contenido_extraido', ''), terminos)
+            reportes_encontrados.append(resultado)
+        
+        return {
+            "exito": True,
+            "datos": reportes_encontrados,
+            "total": total,
+            "mensaje": f"Se encontraron {total} reportes en el índice local (fallback)"
+        }
@@ -0,0 +1,191 @@
+"""
+Reprocesamiento de reportes
+Regenera los reportes estructurados con una versión anterior del prompt a partir del texto ya extraído
+"""
+
+from typing import Dict, Any, Optional
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+
+from configuracion.database import circuito_bd
+from servicios.procesador_pdf_servicio import circuito_gemini
+from utilidades.circuitos import ABIERTO
+from utilidades.metricas import metricas
+
+logger = logging.getLogger(__name__)
+
+# Campos del reporte que salen de la estructuración (las imágenes se conservan: su URL no está en la extracción)
+CAMPOS_REESTRUCTURADOS = (
+    'tipo_estudio', 'paciente', 'tutor', 'veterinario', 'diagnostico',
+    'contenido_extraido', 'confianza_extraccion'
+)
+
+
+class ReprocesadorReportes:
+    """
+    Repite la estructuración (prompt CliniDoc + parser de Markdown) de los
+    reportes cuya extracción tiene otra versión del prompt
+
+    Recorre reporte_extraccion en orden de UUID, por lotes, con hasta
+    'concurrencia' llamadas a Gemini a la vez. Tras cada lote guarda un
+    checkpoint con el último UUID recorrido, así una ejecución interrumpida
+    continúa donde quedó y los reportes que fallaron no se reintentan en
+    cada corrida (se reintentan con 'reiniciar'). Si la base o Gemini se
+    caen, se detiene sin avanzar el checkpoint.
+    """
+
+    def __init__(
+        self,
+        servicio_reportes,
+        procesador_pdf,
+        version_prompt: str,
+        modelo: str,
+        concurrencia: int = 4,
+        tamano_lote: int = 50,
+        archivo_checkpoint: str = 'reprocesamiento_checkpoint.json'
+    ):
+        """
+        Args:
+            servicio_reportes: ReportesServicio para leer extracciones y actualizar reportes
+            procesador_pdf: ProcesadorPDFServicio que estructura el texto
+            version_prompt: Versión actual del prompt (la que quedará registrada)
+            modelo: Modelo de Gemini usado
+            concurrencia: Reportes reestructurándose a la vez
+            tamano_lote: Reportes leídos por consulta (y por checkpoint)
+            archivo_checkpoint: Archivo donde se guarda el avance
+        """
+        self.servicio_reportes = servicio_reportes
+        self.procesador_pdf = procesador_pdf
+        self.version_prompt = version_prompt
+        self.modelo = modelo
+        self.concurrencia = max(1, concurrencia)
+        self.tamano_lote = max(1, tamano_lote)
+        self.archivo_checkpoint = archivo_checkpoint
+
+    def _checkpoint_nuevo(self) -> Dict[str, Any]:
+        return {
+            "version_prompt": self.version_prompt,
+            "ultimo_id": None,
+            "procesados": 0,
+            "fallidos": {},
+            "completado": False
+        }
+
+    def cargar_checkpoint(self, reiniciar: bool = False) -> Dict[str, Any]:
+        """
+        Lee el avance guardado (uno de otra versión del prompt no sirve y se descarta)
+
+        Args:
+            reiniciar: Ignorar el avance guardado y empezar desde el principio
+        """
+        if reiniciar or not os.path.exists(self.archivo_checkpoint):
+            return self._checkpoint_nuevo()
+        try:
+            with open(self.archivo_checkpoint, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Checkpoint de reprocesamiento ilegible, se empieza de cero: {str(e)}")
+            return self._checkpoint_nuevo()
+        if checkpoint.get("version_prompt") != self.version_prompt:
+            return self._checkpoint_nuevo()
+        return checkpoint
+
+    def _guardar_checkpoint(self, checkpoint: Dict[str, Any]) -> None:
+        checkpoint["actualizado_en"] = datetime.now().isoformat()
+        archivo_temporal = f"{self.archivo_checkpoint}.tmp"
+        with open(archivo_temporal, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+        os.replace(archivo_temporal, self.archivo_checkpoint)
+
+    async def ejecutar(self, limite: Optional[int] = None, reiniciar: bool = False) -> Dict[str, Any]:
+        """
+        Reprocesa los reportes desactualizados desde el último checkpoint
+
+        Args:
+            limite: Reportes máximos a recorrer en esta ejecución (None = todos)
+            reiniciar: Empezar desde el principio (reintenta los fallidos)
+
+        Returns:
+            Dict con procesados, fallidos, si terminó y, si se detuvo, el motivo
+        """
+        checkpoint = self.cargar_checkpoint(reiniciar)
+        semaforo = asyncio.Semaphore(self.concurrencia)
+        recorridos = 0
+        motivo_detencion = None
+
+        while limite is None or recorridos < limite:
+            cantidad = self.tamano_lote if limite is None else min(self.tamano_lote, limite - recorridos)
+            extracciones = await self.servicio_reportes.listar_extracciones_desactualizadas(
+                self.version_prompt, checkpoint["ultimo_id"], cantidad
+            )
+            if not extracciones:
+                checkpoint["completado"] = True
+                break
+
+            errores = await asyncio.gather(*[
+                self._reprocesar(extraccion, semaforo) for extraccion in extracciones
+            ])
+
+            motivo_detencion = self._dependencia_caida()
+            if motivo_detencion:
+                # Los fallos del lote pueden deberse a la caída: se reintentan en la próxima ejecución
+                logger.error(f"Reprocesamiento detenido: {motivo_detencion}")
+                break
+
+            for extraccion, error in zip(extracciones, errores):
+                if error:
+                    checkpoint["fallidos"][extraccion["reporte_id"]] = error
+                else:
+                    checkpoint["procesados"] += 1
+            checkpoint["ultimo_id"] = extracciones[-1]["reporte_id"]
+            self._guardar_checkpoint(checkpoint)
+            recorridos += len(extracciones)
+            logger.info(
+                f"Reprocesamiento: {checkpoint['procesados']} reportes actualizados, "
+                f"{len(checkpoint['fallidos'])} fallidos"
+            )
+
+        if checkpoint["completado"]:
+            self._guardar_checkpoint(checkpoint)
+        return {
+            "procesados": checkpoint["procesados"],
+            "fallidos": checkpoint["fallidos"],
+            "completado": checkpoint["completado"],
+            "detenido": motivo_detencion
+        }
+
+    def _dependencia_caida(self) -> Optional[str]:
+        for circuito in (circuito_bd, circuito_gemini):
+            if circuito.estado == ABIERTO:
+                return f"el circuito '{circuito.nombre}' está abierto"
+        return None
+
+    async def _reprocesar(self, extraccion: Dict[str, Any], semaforo: asyncio.Semaphore) -> Optional[str]:
+        """Reestructura un reporte y lo actualiza; devuelve None o el mensaje de error"""
+        reporte_id = extraccion["reporte_id"]
+        async with semaforo:
+            try:
+                with metricas.medir_latencia("reprocesamiento.reporte_ms"):
+                    datos = await self.procesador_pdf.reestructurar(
+                        extraccion["texto"], extraccion.get("imagenes") or []
+                    )
+                actualizacion = {campo: datos[campo] for campo in CAMPOS_REESTRUCTURADOS if campo in datos}
+                # Si alguien editó el reporte mientras se reestructuraba, no se pisa su cambio
+                if extraccion.get("actualizado_en"):
+                    actualizacion["fecha_actualizacion"] = extraccion["actualizado_en"]
+
+                resultado = await self.servicio_reportes.actualizar_reporte(reporte_id, actualizacion)
+                if not resultado["exito"]:
+                    raise RuntimeError(resultado.get("mensaje") or resultado.get("error"))
+                await self.servicio_reportes.registrar_version_extraccion(
+                    reporte_id, self.version_prompt, self.modelo
+                )
+            except Exception as e:
+                logger.warning(f"No se pudo reprocesar el reporte {reporte_id}: {str(e)}")
+                metricas.incrementar("reprocesamiento.fallidos")
+                return str(e)
+        metricas.incrementar("reprocesamiento.procesados")
+        return None
@@ -0,0 +1,371 @@
+"""
+Caché de lectura para DiagnoVET
+LRU acotado con TTL en memoria y backend compartido opcional (Redis o compatible)
+"""
+
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+from collections import OrderedDict
+import asyncio
+import copy
+import json
+import logging
+import os
+import time
+
+from utilidades.metricas import metricas
+
+logger = logging.getLogger(__name__)
+
+# Redis es opcional: sin REDIS_URL (o sin el paquete) la caché es solo local al worker
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:
+    redis_asyncio = None
+
+REDIS_URL = os.getenv("REDIS_URL", "")
+CANAL_INVALIDACIONES = "diagnovet:cache:invalidaciones"
+
+
+class BackendCacheRedis:
+    """Backend compartido entre workers sobre Redis (o un servidor compatible)"""
+
+    def __init__(self, url: str, prefijo: str):
+        self.cliente = redis_asyncio.from_url(url, decode_responses=True)
+        self.prefijo = prefijo
+
+    def _clave(self, clave: str) -> str:
+        return f"{self.prefijo}:{clave}"
+
+    async def obtener(self, clave: str) -> Optional[Any]:
+        valor = await self.cliente.get(self._clave(clave))
+        return json.loads(valor) if valor is not None else None
+
+    async def obtener_varios(self, claves: List[str]) -> Dict[str, Any]:
+        """Lee varias claves con un solo MGET; devuelve solo las que existen"""
+        valores = await self.cliente.mget([self._clave(clave) for clave in claves])
+        return {
+            clave: json.loads(valor)
+            for clave, valor in zip(claves, valores)
+            if valor is not None
+        }
+
+    async def guardar(self, clave: str, valor: Any, ttl_segundos: float) -> None:
+        await self.cliente.set(self._clave(clave), json.dumps(valor, default=str), px=int(ttl_segundos * 1000))
+
+    async def guardar_varios(self, valores: Dict[str, Any], ttl_segundos: float) -> None:
+        """Guarda varias claves en un solo viaje (pipeline)"""
+        async with self.cliente.pipeline(transaction=False) as pipeline:
+            for clave, valor in valores.items():
+                pipeline.set(self._clave(clave), json.dumps(valor, default=str), px=int(ttl_segundos * 1000))
+            await pipeline.execute()
+
+    async def eliminar(self, clave: str) -> None:
+        """Elimina la clave y avisa al resto de los workers para que la saquen de su L1"""
+        await self.cliente.delete(self._clave(clave))
+        await self.cliente.publish(CANAL_INVALIDACIONES, self._clave(clave))
+
+    async def escuchar_invalidaciones(self, al_invalidar: Callable[[str], None]) -> None:
+        """Escucha el canal de invalidaciones hasta que la tarea sea cancelada"""
+        suscripcion = self.cliente.pubsub()
+        await suscripcion.subscribe(CANAL_INVALIDACIONES)
+        prefijo = f"{self.prefijo}:"
+        try:
+            async for mensaje in suscripcion.listen():
+                if mensaje.get("type") != "message":
+                    continue
+                clave = mensaje.get("data", "")
+                if clave.startswith(prefijo):
+                    al_invalidar(clave[len(prefijo):])
+        finally:
+            await suscripcion.aclose()
+
+    async def cerrar(self) -> None:
+        await self.cliente.aclose()
+
+
+class CacheLectura:
+    """
+    Caché read-through con LRU acotado, TTL e invalidación explícita
+
+    Las lecturas pasan por la L1 en memoria, después por el backend compartido
+    (si hay) y por último por la función de carga. Las cargas concurrentes de
+    una misma clave se unifican en una sola, y una invalidación que llega
+    mientras una carga está en curso impide que ese valor viejo se guarde.
+    """
+
+    def __init__(
+        self,
+        nombre: str,
+        capacidad: int = 512,
+        ttl_segundos: float = 60.0,
+        url_compartida: str = REDIS_URL
+    ):
+        self.nombre = nombre
+        self.capacidad = capacidad
+        self.ttl_segundos = ttl_segundos
+        self._entradas: "OrderedDict[str, tuple]" = OrderedDict()
+        # Invalidaciones de las claves con una carga en curso (se borran al terminar la carga)
+        self._generaciones: Dict[str, int] = {}
+        self._cargas_en_curso: Dict[str, asyncio.Future] = {}
+        self._tarea_invalidaciones: Optional[asyncio.Task] = None
+
+        self.backend_compartido: Optional[BackendCacheRedis] = None
+        if url_compartida:
+            if redis_asyncio is None:
+                logger.warning("REDIS_URL configurada pero el paquete 'redis' no está instalado; caché solo local")
+            else:
+                self.backend_compartido = BackendCacheRedis(url_compartida, f"diagnovet:{nombre}")
+
+        metricas.registrar_medidor(f"cache.{nombre}.tasa_aciertos", self.tasa_aciertos)
+        metricas.registrar_medidor(f"cache.{nombre}.entradas", lambda: len(self._entradas))
+
+    async def iniciar(self) -> None:
+        """Arranca la escucha de invalidaciones del backend compartido"""
+        if self.backend_compartido and not self._tarea_invalidaciones:
+            self._tarea_invalidaciones = asyncio.create_task(
+                self.backend_compartido.escuchar_invalidaciones(self._descartar_local)
+            )
+            logger.info(f"Caché '{self.nombre}' sincronizada con backend compartido")
+
+    async def detener(self) -> None:
+        """Detiene la escucha de invalidaciones y cierra el backend compartido"""
+        if self._tarea_invalidaciones:
+            self._tarea_invalidaciones.cancel()
+            try:
+                await self._tarea_invalidaciones
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._tarea_invalidaciones = None
+        if self.backend_compartido:
+            await self.backend_compartido.cerrar()
+
+    def tasa_aciertos(self) -> float:
+        """Proporción de lecturas resueltas sin llamar a la función de carga"""
+        aciertos = metricas.obtener_contador(f"cache.{self.nombre}.aciertos")
+        fallos = metricas.obtener_contador(f"cache.{self.nombre}.fallos")
+        total = aciertos + fallos
+        return round(aciertos / total, 4) if total else 0.0
+
+    def _obtener_local(self, clave: str) -> Optional[Any]:
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            return None
+        valor, vence_en = entrada
+        if vence_en <= time.monotonic():
+            del self._entradas[clave]
+            return None
+        self._entradas.move_to_end(clave)
+        return valor
+
+    def _guardar_local(self, clave: str, valor: Any) -> None:
+        self._entradas[clave] = (valor, time.monotonic() + self.ttl_segundos)
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.capacidad:
+            self._entradas.popitem(last=False)
+            metricas.incrementar(f"cache.{self.nombre}.desalojos")
+
+    def _descartar_local(self, clave: str) -> None:
+        self._entradas.pop(clave, None)
+        # Solo hace falta marcar la invalidación si hay una carga que podría guardar el valor viejo
+        if clave in self._cargas_en_curso:
+            self._generaciones[clave] = self._generaciones.get(clave, 0) + 1
+
+    async def obtener_o_cargar(
+        self,
+        clave: str,
+        cargador: Callable[[], Awaitable[Optional[Any]]]
+    ) -> Optional[Any]:
+        """
+        Obtiene un valor de la caché o lo carga si no está
+
+        Args:
+            clave: Clave del valor
+            cargador: Función asíncrona que obtiene el valor de la fuente; si
+                devuelve None no se guarda nada
+
+        Returns:
+            Copia del valor (los llamadores pueden modificarla libremente) o None
+        """
+        with metricas.medir_latencia(f"cache.{self.nombre}.latencia_ms"):
+            valor = self._obtener_local(clave)
+            if valor is not None:
+                metricas.incrementar(f"cache.{self.nombre}.aciertos")
+                return copy.deepcopy(valor)
+
+            carga_en_curso = self._cargas_en_curso.get(clave)
+            if carga_en_curso:
+                metricas.incrementar(f"cache.{self.nombre}.aciertos")
+                metricas.incrementar(f"cache.{self.nombre}.cargas_unificadas")
+                return copy.deepcopy(await asyncio.shield(carga_en_curso))
+
+            futuro = asyncio.get_running_loop().create_future()
+            self._cargas_en_curso[clave] = futuro
+            generacion = self._generaciones.get(clave, 0)
+            try:
+                valor = await self._obtener_compartido(clave)
+                if valor is not None:
+                    metricas.incrementar(f"cache.{self.nombre}.aciertos")
+                    metricas.incrementar(f"cache.{self.nombre}.aciertos_compartidos")
+                else:
+                    metricas.incrementar(f"cache.{self.nombre}.fallos")
+                    with metricas.medir_latencia(f"cache.{self.nombre}.latencia_carga_ms"):
+                        valor = await cargador()
+                    if valor is not None and self._generaciones.get(clave, 0) == generacion:
+                        await self._guardar_compartido(clave, valor)
+
+                if valor is not None and self._generaciones.get(clave, 0) == generacion:
+                    self._guardar_local(clave, valor)
+                futuro.set_result(valor)
+                return copy.deepcopy(valor)
+            except Exception as e:
+                futuro.set_exception(e)
+                # Evitar el aviso de "excepción nunca recuperada" si nadie esperaba
+                futuro.exception()
+                raise
+            finally:
+                self._cargas_en_curso.pop(clave, None)
+                self._generaciones.pop(clave, None)
+                # Carga cancelada: quienes la esperaban no deben quedar colgados
+                if not futuro.done():
+                    futuro.cancel()
+
+    async def obtener_o_cargar_varios(
+        self,
+        claves: List[str],
+        cargador: Callable[[List[str]], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        Obtiene varios valores resolviendo todos los faltantes con una sola carga
+
+        Las claves que ya están en la L1, en el backend compartido (un solo
+        MGET) o siendo cargadas por otra lectura no se piden al cargador.
+
+        Args:
+            claves: Claves a obtener (las repetidas se resuelven una vez)
+            cargador: Función asíncrona que recibe las claves faltantes y
+                devuelve un dict con las que encontró
+
+        Returns:
+            Dict clave -> copia del valor, solo con las claves encontradas
+        """
+        resultados: Dict[str, Any] = {}
+        cargas_ajenas: Dict[str, asyncio.Future] = {}
+        faltantes: List[str] = []
+
+        with metricas.medir_latencia(f"cache.{self.nombre}.latencia_ms"):
+            for clave in dict.fromkeys(claves):
+                valor = self._obtener_local(clave)
+                if valor is not None:
+                    metricas.incrementar(f"cache.{self.nombre}.aciertos")
+                    resultados[clave] = copy.deepcopy(valor)
+                elif clave in self._cargas_en_curso:
+                    metricas.incrementar(f"cache.{self.nombre}.aciertos")
+                    metricas.incrementar(f"cache.{self.nombre}.cargas_unificadas")
+                    cargas_ajenas[clave] = self._cargas_en_curso[clave]
+                else:
+                    faltantes.append(clave)
+
+            if faltantes:
+                # Las cargas quedan registradas para que otras lecturas se unan
+                futuros = {}
+                for clave in faltantes:
+                    futuros[clave] = asyncio.get_running_loop().create_future()
+                    self._cargas_en_curso[clave] = futuros[clave]
+                generaciones = {clave: self._generaciones.get(clave, 0) for clave in faltantes}
+                try:
+                    valores = await self._obtener_compartido_varios(faltantes)
+                    metricas.incrementar(f"cache.{self.nombre}.aciertos", len(valores))
+                    metricas.incrementar(f"cache.{self.nombre}.aciertos_compartidos", len(valores))
+
+                    a_cargar = [clave for clave in faltantes if clave not in valores]
+                    if a_cargar:
+                        metricas.incrementar(f"cache.{self.nombre}.fallos", len(a_cargar))
+                        with metricas.medir_latencia(f"cache.{self.nombre}.latencia_carga_ms"):
+                            cargados = await cargador(a_cargar)
+                        vigentes = {
+                            clave: valor for clave, valor in cargados.items()
+                            if clave in generaciones and valor is not None
+                            and self._generaciones.get(clave, 0) == generaciones[clave]
+                        }
+                        await self._guardar_compartido_varios(vigentes)
+                        valores.update(cargados)
+
+                    for clave in faltantes:
+                        valor = valores.get(clave)
+                        if valor is not None and self._generaciones.get(clave, 0) == generaciones[clave]:
+                            self._guardar_local(clave, valor)
+                        futuros[clave].set_result(valor)
+                        if valor is not None:
+                            resultados[clave] = copy.deepcopy(valor)
+                except Exception as e:
+                    for futuro in futuros.values():
+                        if not futuro.done():
+                            futuro.set_exception(e)
+                            futuro.exception()
+                    raise
+                finally:
+                    for clave in faltantes:
+                        self._cargas_en_curso.pop(clave, None)
+                        self._generaciones.pop(clave, None)
+                        if not futuros[clave].done():
+                            futuros[clave].cancel()
+
+            for clave, futuro in cargas_ajenas.items():
+                valor = await asyncio.shield(futuro)
+                if valor is not None:
+                    resultados[clave] = copy.deepcopy(valor)
+
+        return resultados
+
+    async def invalidar(self, clave: str) -> None:
+        """
+        Invalida una clave en este worker y en el backend compartido
+
+        Args:
+            clave: Clave a invalidar
+        """
+        self._descartar_local(clave)
+        metricas.incrementar(f"cache.{self.nombre}.invalidaciones")
+        if self.backend_compartido:
+            try:
+                await self.backend_compartido.eliminar(clave)
+            except Exception as e:
+                logger.warning(f"No se pudo invalidar '{clave}' en el backend compartido: {str(e)}")
+
+    async def _obtener_compartido(self, clave: str) -> Optional[Any]:
+        if not self.backend_compartido:
+            return None
+        try:
+            return await self.backend_compartido.obtener(clave)
+        except Exception as e:
+            metricas.incrementar(f"cache.{self.nombre}.errores_compartido")
+            logger.warning(f"Backend de caché compartido no disponible: {str(e)}")
+            return None
+
+    async def _obtener_compartido_varios(self, claves: List[str]) -> Dict[str, Any]:
+        if not self.backend_compartido:
+            return {}
+        try:
+            return await self.backend_compartido.obtener_varios(claves)
+        except Exception as e:
+            metricas.incrementar(f"cache.{self.nombre}.errores_compartido")
+            logger.warning(f"Backend de caché compartido no disponible: {str(e)}")
+            return {}
+
+    async def _guardar_compartido_varios(self, valores: Dict[str, Any]) -> None:
+        if not self.backend_compartido or not valores:
+            return
+        try:
+            await self.backend_compartido.guardar_varios(valores, self.ttl_segundos)
+        except Exception as e:
+            metricas.incrementar(f"cache.{self.nombre}.errores_compartido")
+            logger.warning(f"Backend de caché compartido no disponible: {str(e)}")
+
+    async def _guardar_compartido(self, clave: str, valor: Any) -> None:
+        if not self.backend_compartido:
+            return
+        try:
+            await self.backend_compartido.guardar(clave, valor, self.ttl_segundos)
+        except Exception as e:
+            metricas.incrementar(f"cache.{self.nombre}.errores_compartido")
+            logger.warning(f"Backend de caché compartido no disponible: {str(e)}")
@@ -0,0 +1,251 @@
+"""
+Circuit breakers para dependencias externas
+Cortan las llamadas a una dependencia caída para no esperar su timeout en cada request
+"""
+
+from typing import Dict, Any, Callable, Optional
+from contextlib import contextmanager
+import logging
+import os
+import threading
+import time
+
+from utilidades.metricas import metricas
+
+logger = logging.getLogger(__name__)
+
+# Estados del circuito
+CERRADO = "cerrado"
+ABIERTO = "abierto"
+SEMIABIERTO = "semiabierto"
+
+
+class CircuitoAbierto(Exception):
+    """La dependencia está marcada como caída; la llamada no se intentó"""
+
+    def __init__(self, nombre: str, reintento_en_s: float):
+        super().__init__(f"Circuito '{nombre}' abierto (próximo intento en {reintento_en_s:.1f}s)")
+        self.nombre = nombre
+        self.reintento_en_s = reintento_en_s
+
+
+class Circuito:
+    """
+    Circuit breaker de una dependencia externa
+
+    - cerrado: las llamadas pasan; tras 'umbral_fallos' fallos consecutivos
+      se abre.
+    - abierto: las llamadas fallan al instante con CircuitoAbierto, así el
+      llamador usa su fallback sin esperar el timeout de la red.
+    - semiabierto: pasados 'espera_apertura_s' se dejan pasar hasta
+      'maximo_sondeos' llamadas de prueba; un éxito cierra el circuito y un
+      fallo lo vuelve a abrir.
+
+    'es_fallo' decide qué excepciones indican una dependencia caída; las
+    demás (ej: un error de validación) significan que respondió y no
+    cuentan como fallo.
+    """
+
+    def __init__(
+        self,
+        nombre: str,
+        umbral_fallos: int = 5,
+        espera_apertura_s: float = 30.0,
+        maximo_sondeos: int = 1,
+        es_fallo: Optional[Callable[[Exception], bool]] = None
+    ):
+        self.nombre = nombre
+        self.umbral_fallos = max(1, umbral_fallos)
+        self.espera_apertura_s = espera_apertura_s
+        self.maximo_sondeos = max(1, maximo_sondeos)
+        self.es_fallo = es_fallo or (lambda excepcion: True)
+        self._bloqueo = threading.Lock()
+        self._estado = CERRADO
+        self._fallos_consecutivos = 0
+        self._abierto_desde = 0.0
+        self._sondeos_en_curso = 0
+        metricas.registrar_medidor(f"circuitos.{nombre}.estado", lambda: self.estado)
+
+    @property
+    def estado(self) -> str:
+        """Estado actual (un circuito abierto pasa a semiabierto al vencer la espera)"""
+        with self._bloqueo:
+            self._actualizar_estado()
+            return self._estado
+
+    def _actualizar_estado(self) -> None:
+        if self._estado == ABIERTO and time.monotonic() - self._abierto_desde >= self.espera_apertura_s:
+            self._estado = SEMIABIERTO
+            self._sondeos_en_curso = 0
+
+    def _abrir(self) -> None:
+        if self._estado != ABIERTO:
+            logger.warning(f"Circuito '{self.nombre}' abierto tras {self._fallos_consecutivos} fallos")
+            metricas.incrementar(f"circuitos.{self.nombre}.aperturas")
+        self._estado = ABIERTO
+        self._abierto_desde = time.monotonic()
+
+    def permitir(self) -> bool:
+        """
+        Reserva el paso de una llamada
+
+        Returns:
+            True si la llamada es un sondeo del estado semiabierto
+
+        Raises:
+            CircuitoAbierto: Si el circuito no deja pasar la llamada
+        """
+        with self._bloqueo:
+            self._actualizar_estado()
+            if self._estado == CERRADO:
+                return False
+            if self._estado == SEMIABIERTO and self._sondeos_en_curso < self.maximo_sondeos:
+                self._sondeos_en_curso += 1
+                return True
+            reintento = max(0.0, self.espera_apertura_s - (time.monotonic() - self._abierto_desde))
+        metricas.incrementar(f"circuitos.{self.nombre}.rechazos")
+        raise CircuitoAbierto(self.nombre, reintento)
+
+    def registrar_exito(self, sondeo: bool = False) -> None:
+        """Registra una llamada exitosa; un sondeo exitoso cierra el circuito"""
+        with self._bloqueo:
+            if sondeo:
+                self._sondeos_en_curso = max(0, self._sondeos_en_curso - 1)
+            if self._estado == SEMIABIERTO:
+                logger.info(f"Circuito '{self.nombre}' cerrado: la dependencia volvió a responder")
+            if self._estado != ABIERTO:
+                self._estado = CERRADO
+            self._fallos_consecutivos = 0
+
+    def registrar_fallo(self, sondeo: bool = False) -> None:
+        """Registra una llamada fallida; abre el circuito al llegar al umbral"""
+        metricas.incrementar(f"circuitos.{self.nombre}.fallos")
+        with self._bloqueo:
+            if sondeo:
+                self._sondeos_en_curso = max(0, self._sondeos_en_curso - 1)
+            self._fallos_consecutivos += 1
+            if self._estado == SEMIABIERTO or self._fallos_consecutivos >= self.umbral_fallos:
+                self._abrir()
+
+    def _liberar_sondeo(self) -> None:
+        with self._bloqueo:
+            self._sondeos_en_curso = max(0, self._sondeos_en_curso - 1)
+
+    @contextmanager
+    def proteger(self):
+        """
+        Ejecuta el bloque a través del circuito (sirve también con awaits adentro)
+
+        Raises:
+            CircuitoAbierto: Si el circuito está abierto; el bloque no se ejecuta
+        """
+        sondeo = self.permitir()
+        try:
+            yield
+        except Exception as e:
+            if self.es_fallo(e):
+                self.registrar_fallo(sondeo)
+            else:
+                self.registrar_exito(sondeo)
+            raise
+        except BaseException:
+            # Cancelación: no dice nada de la dependencia, solo se libera el sondeo
+            if sondeo:
+                self._liberar_sondeo()
+            raise
+        else:
+            self.registrar_exito(sondeo)
+
+    def resumen(self) -> Dict[str, Any]:
+        """Estado y configuración del circuito"""
+        estado = self.estado
+        return {
+            "estado": estado,
+            "fallos_consecutivos": self._fallos_consecutivos,
+            "umbral_fallos": self.umbral_fallos,
+            "espera_apertura_s": self.espera_apertura_s,
+        }
+
+
+def codigo_estado_http(excepcion: Exception) -> Optional[int]:
+    """
+    Código de estado HTTP de un error de cliente (None si no trae uno)
+
+    Lo reconoce en los errores de requests/httpx (response.status_code),
+    googleapiclient (resp.status) y google-api-core (code).
+    """
+    # Sin 'or': una respuesta de requests con error es falsa en contexto booleano
+    respuesta = getattr(excepcion, 'response', None)
+    if respuesta is None:
+        respuesta = getattr(excepcion, 'resp', None)
+    codigo = getattr(respuesta, 'status_code', None)
+    if codigo is None:
+        codigo = getattr(respuesta, 'status', None)
+    if codigo is None:
+        codigo = getattr(excepcion, 'code', None)
+    if callable(codigo):
+        # grpc expone code() como método
+        return None
+    try:
+        return int(codigo)
+    except (TypeError, ValueError):
+        return None
+
+
+def es_fallo_http(excepcion: Exception) -> bool:
+    """
+    Criterio para APIs HTTP: un 4xx es un error del pedido, no de la dependencia
+
+    Timeouts, errores de conexión, 5xx y 408/429 cuentan como fallo.
+    """
+    codigo = codigo_estado_http(excepcion)
+    if codigo is None:
+        return True
+    return not (400 <= codigo < 500) or codigo in (408, 429)
+
+
+# Un circuito por dependencia, compartido por toda la aplicación
+_circuitos: Dict[str, Circuito] = {}
+_bloqueo_registro = threading.Lock()
+
+
+def _configuracion(nombre: str, clave: str, por_defecto: str) -> str:
+    return os.getenv(f"CIRCUITO_{nombre.upper()}_{clave}", os.getenv(f"CIRCUITO_{clave}", por_defecto))
+
+
+def obtener_circuito(
+    nombre: str,
+    es_fallo: Optional[Callable[[Exception], bool]] = None
+) -> Circuito:
+    """
+    Obtiene (o crea) el circuito de una dependencia
+
+    La configuración se lee de CIRCUITO_<NOMBRE>_UMBRAL_FALLOS,
+    CIRCUITO_<NOMBRE>_ESPERA_S y CIRCUITO_<NOMBRE>_SONDEOS, con
+    CIRCUITO_UMBRAL_FALLOS, CIRCUITO_ESPERA_S y CIRCUITO_SONDEOS como
+    valores por defecto para todas las dependencias.
+
+    Args:
+        nombre: Nombre de la dependencia (ej: 'supabase', 'gemini')
+        es_fallo: Decide si una excepción indica la dependencia caída (por defecto todas)
+
+    Returns:
+        Circuito de la dependencia
+    """
+    with _bloqueo_registro:
+        if nombre not in _circuitos:
+            _circuitos[nombre] = Circuito(
+                nombre,
+                umbral_fallos=int(_configuracion(nombre, "UMBRAL_FALLOS", "5")),
+                espera_apertura_s=float(_configuracion(nombre, "ESPERA_S", "30")),
+                maximo_sondeos=int(_configuracion(nombre, "SONDEOS", "1")),
+                es_fallo=es_fallo
+            )
+        return _circuitos[nombre]
+
+
+def estado_circuitos() -> Dict[str, Dict[str, Any]]:
+    """Resumen de todos los circuitos creados"""
+    with _bloqueo_registro:
+        circuitos = list(_circuitos.values())
+    return {circuito.nombre: circuito.resumen() for circuito in circuitos}
@@ -0,0 +1,196 @@
+"""
+Bus de eventos en proceso
+Publica eventos de la aplicación y los reparte a los clientes conectados por Server-Sent Events
+"""
+
+from typing import Dict, Any, List, Optional, Iterable, AsyncIterator
+from collections import deque
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+
+from utilidades.metricas import metricas
+
+logger = logging.getLogger(__name__)
+
+# Qué hacer cuando el buffer de un cliente está lleno
+POLITICAS_DESCARTE = ("descartar_antiguos", "descartar_nuevos", "desconectar")
+
+# Tipos de evento publicados por la aplicación
+TIPOS_EVENTO = (
+    "reporte.creado",
+    "reporte.actualizado",
+    "reporte.eliminado",
+    "reportes.importados",
+    "procesamiento.etapa",
+    "turno.creado",
+    "estadisticas.delta",
+)
+
+
+class Suscripcion:
+    """
+    Buffer acotado de un cliente
+
+    'publicar' nunca espera: si el buffer está lleno se aplica la política
+    de descarte. Los eventos perdidos se cuentan y se informan al cliente
+    con un evento 'eventos.perdidos' para que recargue lo que necesite.
+    """
+
+    def __init__(self, tipos: Optional[Iterable[str]], capacidad: int, politica: str):
+        self.tipos = set(tipos) if tipos else None
+        self.capacidad = capacidad
+        self.politica = politica
+        self._buffer: deque = deque()
+        self._hay_eventos = asyncio.Event()
+        self.perdidos = 0
+        self.cerrada = False
+
+    def acepta(self, tipo: str) -> bool:
+        return self.tipos is None or tipo in self.tipos
+
+    def entregar(self, evento: Dict[str, Any]) -> None:
+        """Agrega un evento al buffer aplicando la política si está lleno"""
+        if self.cerrada:
+            return
+        if len(self._buffer) >= self.capacidad:
+            metricas.incrementar("eventos.descartados")
+            self.perdidos += 1
+            if self.politica == "descartar_nuevos":
+                return
+            if self.politica == "desconectar":
+                metricas.incrementar("eventos.desconexiones_lentas")
+                self.cerrar()
+                return
+            self._buffer.popleft()
+        self._buffer.append(evento)
+        self._hay_eventos.set()
+
+    def cerrar(self) -> None:
+        self.cerrada = True
+        self._buffer.clear()
+        self._hay_eventos.set()
+
+    async def siguiente(self, espera_maxima_s: float) -> Optional[Dict[str, Any]]:
+        """
+        Espera el próximo evento
+
+        Returns:
+            El evento, o None si pasó 'espera_maxima_s' sin eventos o la
+            suscripción se cerró
+        """
+        if not self._buffer and not self.cerrada:
+            self._hay_eventos.clear()
+            try:
+                await asyncio.wait_for(self._hay_eventos.wait(), timeout=espera_maxima_s)
+            except asyncio.TimeoutError:
+                return None
+        if self.perdidos and not self.cerrada:
+            perdidos, self.perdidos = self.perdidos, 0
+            return {"id": None, "tipo": "eventos.perdidos", "datos": {"cantidad": perdidos}}
+        return self._buffer.popleft() if self._buffer else None
+
+
+class BusEventos:
+    """
+    Pub/sub en memoria del proceso
+
+    Los controladores y servicios publican con 'publicar' (sincrónico y sin
+    esperas); cada cliente SSE tiene su propia Suscripcion con un buffer
+    acotado, así un cliente lento no puede hacer crecer la memoria ni
+    demorar a los demás. Se guardan los últimos eventos para que un cliente
+    que se reconecta con Last-Event-ID reciba lo que se perdió.
+    """
+
+    def __init__(self, capacidad_historial: int = 256):
+        self._secuencia = itertools.count(1)
+        self._suscripciones: List[Suscripcion] = []
+        self._historial: deque = deque(maxlen=capacidad_historial)
+        metricas.registrar_medidor("eventos.suscriptores", lambda: len(self._suscripciones))
+
+    def publicar(self, tipo: str, datos: Dict[str, Any]) -> None:
+        """
+        Publica un evento para todos los suscriptores interesados
+
+        Args:
+            tipo: Tipo de evento (ver TIPOS_EVENTO)
+            datos: Contenido del evento (serializable a JSON)
+        """
+        evento = {"id": next(self._secuencia), "tipo": tipo, "datos": datos, "emitido_en": time.time()}
+        self._historial.append(evento)
+        metricas.incrementar("eventos.publicados")
+        for suscripcion in self._suscripciones:
+            if suscripcion.acepta(tipo):
+                suscripcion.entregar(evento)
+
+    def suscribir(
+        self,
+        tipos: Optional[Iterable[str]] = None,
+        capacidad: int = 100,
+        politica: str = "descartar_antiguos",
+        ultimo_id: Optional[int] = None
+    ) -> Suscripcion:
+        """
+        Crea una suscripción
+
+        Args:
+            tipos: Tipos de evento a recibir (None = todos)
+            capacidad: Eventos que puede acumular el cliente sin leer
+            politica: Qué hacer con el buffer lleno (ver POLITICAS_DESCARTE)
+            ultimo_id: Último evento recibido antes de reconectarse
+
+        Returns:
+            Suscripcion a leer con 'siguiente'
+        """
+        suscripcion = Suscripcion(tipos, capacidad, politica)
+        if ultimo_id is not None:
+            for evento in self._historial:
+                if evento["id"] > ultimo_id and suscripcion.acepta(evento["tipo"]):
+                    suscripcion.entregar(evento)
+        self._suscripciones.append(suscripcion)
+        return suscripcion
+
+    def desuscribir(self, suscripcion: Suscripcion) -> None:
+        """Quita una suscripción y libera su buffer"""
+        suscripcion.cerrar()
+        if suscripcion in self._suscripciones:
+            self._suscripciones.remove(suscripcion)
+
+
+def formatear_sse(evento: Dict[str, Any]) -> str:
+    """Serializa un evento en el formato de Server-Sent Events"""
+    lineas = []
+    if evento.get("id") is not None:
+        lineas.append(f"id: {evento['id']}")
+    lineas.append(f"event: {evento['tipo']}")
+    lineas.append(f"data: {json.dumps(evento['datos'], ensure_ascii=False, default=str)}")
+    return "\n".join(lineas) + "\n\n"
+
+
+async def flujo_sse(suscripcion: Suscripcion, intervalo_latido_s: float = 15) -> AsyncIterator[str]:
+    """
+    Genera el cuerpo de una respuesta SSE para una suscripción
+
+    Envía un comentario de latido cuando no hay eventos para que proxies y
+    balanceadores no corten la conexión. Al terminar (cliente desconectado
+    o suscripción cerrada por lenta) se desuscribe.
+    """
+    try:
+        # Reintento sugerido al navegador si se corta la conexión
+        yield "retry: 3000\n\n"
+        while not suscripcion.cerrada:
+            evento = await suscripcion.siguiente(intervalo_latido_s)
+            if evento is None:
+                if not suscripcion.cerrada:
+                    yield ": latido\n\n"
+                continue
+            yield formatear_sse(evento)
+    finally:
+        bus_eventos.desuscribir(suscripcion)
+
+
+# Bus compartido por toda la aplicación
+bus_eventos = BusEventos(capacidad_historial=int(os.getenv("EVENTOS_HISTORIAL", "256")))
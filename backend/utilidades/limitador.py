@@ -0,0 +1,231 @@
+"""
+Limitador de llamadas a APIs con cuota
+Token bucket de solicitudes y tokens por minuto, concurrencia adaptativa (AIMD) y cola justa por clave
+"""
+
+from typing import Dict, Any, Callable, Optional
+from collections import deque
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import time
+
+from utilidades.circuitos import codigo_estado_http
+from utilidades.metricas import metricas
+
+logger = logging.getLogger(__name__)
+
+
+def es_limite_excedido(excepcion: Exception) -> bool:
+    """Indica si la API rechazó la llamada por cuota (HTTP 429 / RESOURCE_EXHAUSTED)"""
+    return codigo_estado_http(excepcion) == 429 or type(excepcion).__name__ == 'ResourceExhausted'
+
+
+class _Cubeta:
+    """Token bucket que se rellena de forma continua hasta su capacidad"""
+
+    def __init__(self, por_minuto: float):
+        self.capacidad = float(por_minuto)
+        self.por_segundo = por_minuto / 60.0
+        self.disponible = self.capacidad
+        self._actualizado = time.monotonic()
+
+    def rellenar(self) -> None:
+        ahora = time.monotonic()
+        self.disponible = min(self.capacidad, self.disponible + (ahora - self._actualizado) * self.por_segundo)
+        self._actualizado = ahora
+
+    def espera_para(self, cantidad: float) -> float:
+        """Segundos hasta tener 'cantidad' disponible (0 si ya está)"""
+        faltante = min(cantidad, self.capacidad) - self.disponible
+        return max(0.0, faltante / self.por_segundo) if self.por_segundo > 0 else float('inf')
+
+
+class LimitadorAdaptativo:
+    """
+    Limitador compartido para las llamadas a una API con cuota (ej: Gemini)
+
+    - Cuota: dos token buckets, uno de solicitudes por minuto y otro de
+      tokens por minuto. Una llamada sale solo si hay saldo en ambos.
+    - Concurrencia AIMD: el máximo de llamadas en curso sube de a una por
+      ronda mientras la latencia se mantiene bajo 'latencia_objetivo_s', y
+      se reduce a la mitad con un 429 (a 3/4 si la latencia se pasa del
+      objetivo). Las reducciones se espacian para que una ráfaga de 429 de
+      llamadas que ya estaban en curso no lleve el límite al mínimo.
+    - Cola justa: las llamadas esperan en una cola por clave (ej: clínica) y
+      se atienden por turnos, así una clínica que sube cien PDFs no demora
+      a las demás.
+
+    Los límites son por proceso: con varios workers, repartir la cuota.
+    """
+
+    def __init__(
+        self,
+        nombre: str,
+        solicitudes_por_minuto: float,
+        tokens_por_minuto: float,
+        concurrencia_inicial: int = 4,
+        concurrencia_minima: int = 1,
+        concurrencia_maxima: int = 16,
+        latencia_objetivo_s: float = 30.0,
+        es_limite: Optional[Callable[[Exception], bool]] = None
+    ):
+        """
+        Args:
+            nombre: Prefijo de las métricas (ej: 'gemini')
+            solicitudes_por_minuto: Cuota de solicitudes por minuto
+            tokens_por_minuto: Cuota de tokens por minuto
+            concurrencia_inicial: Llamadas en curso permitidas al arrancar
+            concurrencia_minima: Piso del límite de concurrencia
+            concurrencia_maxima: Techo del límite de concurrencia
+            latencia_objetivo_s: Latencia por encima de la cual se deja de crecer y se reduce
+            es_limite: Decide si una excepción es un rechazo por cuota (por defecto 429)
+        """
+        self.nombre = nombre
+        self.solicitudes = _Cubeta(solicitudes_por_minuto)
+        self.tokens = _Cubeta(tokens_por_minuto)
+        self.concurrencia_minima = max(1, concurrencia_minima)
+        self.concurrencia_maxima = max(self.concurrencia_minima, concurrencia_maxima)
+        self.limite = float(min(self.concurrencia_maxima, max(self.concurrencia_minima, concurrencia_inicial)))
+        self.latencia_objetivo_s = latencia_objetivo_s
+        self.es_limite = es_limite or es_limite_excedido
+
+        self.en_curso = 0
+        # Clave -> cola FIFO de esperas; 'turnos' rota entre las claves con esperas
+        self._colas: Dict[str, deque] = {}
+        self._turnos: deque = deque()
+        self._temporizador: Optional[asyncio.TimerHandle] = None
+        self._ultima_reduccion = 0.0
+
+        metricas.registrar_medidor(f"{nombre}.concurrencia_limite", lambda: int(self.limite))
+        metricas.registrar_medidor(f"{nombre}.en_curso", lambda: self.en_curso)
+        metricas.registrar_medidor(f"{nombre}.en_cola", lambda: sum(len(c) for c in self._colas.values()))
+
+    @asynccontextmanager
+    async def adquirir(self, clave: str, tokens: int):
+        """
+        Espera turno y cuota para una llamada y la registra al terminar
+
+        Args:
+            clave: Clave de reparto justo (ej: ID de la clínica)
+            tokens: Tokens estimados de la llamada (prompt + respuesta)
+
+        Raises:
+            La excepción de la llamada; un 429 reduce la concurrencia
+        """
+        encolado_en = time.monotonic()
+        await self._esperar_turno(clave, tokens)
+        metricas.observar(f"{self.nombre}.espera_cola_ms", (time.monotonic() - encolado_en) * 1000)
+
+        inicio = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            if self.es_limite(e):
+                metricas.incrementar(f"{self.nombre}.limite_excedido")
+                self._reducir(0.5, "límite de cuota (429)")
+                # La API dice que se consumió la cuota: se espera al próximo rellenado
+                self.solicitudes.disponible = min(self.solicitudes.disponible, 0.0)
+            raise
+        else:
+            self._ajustar_por_latencia(time.monotonic() - inicio)
+        finally:
+            self.en_curso -= 1
+            self._despachar()
+
+    async def _esperar_turno(self, clave: str, tokens: int) -> None:
+        futuro = asyncio.get_running_loop().create_future()
+        espera = (futuro, tokens)
+        if clave not in self._colas:
+            self._colas[clave] = deque()
+            self._turnos.append(clave)
+        self._colas[clave].append(espera)
+        self._despachar()
+        try:
+            await futuro
+        except asyncio.CancelledError:
+            if futuro.done() and not futuro.cancelled():
+                # Se canceló justo después de obtener el turno: se devuelve el lugar
+                self.en_curso -= 1
+                self._despachar()
+            else:
+                self._quitar_espera(clave, espera)
+            raise
+
+    def _quitar_espera(self, clave: str, espera) -> None:
+        cola = self._colas.get(clave)
+        if cola is None:
+            return
+        try:
+            cola.remove(espera)
+        except ValueError:
+            return
+        if not cola:
+            del self._colas[clave]
+            self._turnos.remove(clave)
+
+    def _despachar(self) -> None:
+        """Da turno a las esperas que entran en la concurrencia y en la cuota, por turnos entre claves"""
+        self.solicitudes.rellenar()
+        self.tokens.rellenar()
+        while self._turnos and self.en_curso < int(self.limite):
+            clave = self._turnos[0]
+            futuro, tokens = self._colas[clave][0]
+            if futuro.done():
+                self._colas[clave].popleft()
+            else:
+                espera_s = max(self.solicitudes.espera_para(1), self.tokens.espera_para(tokens))
+                if espera_s > 0:
+                    self._programar(espera_s)
+                    return
+                self.solicitudes.disponible -= 1
+                self.tokens.disponible -= min(tokens, self.tokens.capacidad)
+                self._colas[clave].popleft()
+                self.en_curso += 1
+                futuro.set_result(None)
+            # La clave pasa al final de la ronda (o sale si no le quedan esperas)
+            self._turnos.popleft()
+            if self._colas[clave]:
+                self._turnos.append(clave)
+            else:
+                del self._colas[clave]
+
+    def _programar(self, espera_s: float) -> None:
+        if self._temporizador is not None and not self._temporizador.cancelled():
+            self._temporizador.cancel()
+        self._temporizador = asyncio.get_running_loop().call_later(espera_s, self._despachar)
+
+    def _ajustar_por_latencia(self, latencia_s: float) -> None:
+        if latencia_s > self.latencia_objetivo_s:
+            self._reducir(0.75, f"latencia de {latencia_s:.1f}s")
+        elif self.limite < self.concurrencia_maxima:
+            # Aumento aditivo: +1 cada 'limite' llamadas exitosas
+            self.limite = min(self.concurrencia_maxima, self.limite + 1 / self.limite)
+
+    def _reducir(self, factor: float, motivo: str) -> None:
+        ahora = time.monotonic()
+        # Una reducción por "ronda": las llamadas que ya estaban en curso no vuelven a reducir
+        if ahora - self._ultima_reduccion < min(self.latencia_objetivo_s, 5.0):
+            return
+        self._ultima_reduccion = ahora
+        anterior = int(self.limite)
+        self.limite = max(self.concurrencia_minima, self.limite * factor)
+        if int(self.limite) != anterior:
+            logger.warning(f"Limitador '{self.nombre}': concurrencia {anterior} -> {int(self.limite)} ({motivo})")
+
+    def tiene_capacidad(self) -> bool:
+        """Indica si una llamada nueva saldría sin esperar (sin cola, bajo el límite y con cuota)"""
+        self.solicitudes.rellenar()
+        return not self._turnos and self.en_curso < int(self.limite) and self.solicitudes.espera_para(1) == 0
+
+    def resumen(self) -> Dict[str, Any]:
+        """Estado actual del limitador"""
+        self.solicitudes.rellenar()
+        self.tokens.rellenar()
+        return {
+            "concurrencia_limite": int(self.limite),
+            "en_curso": self.en_curso,
+            "en_cola": {clave: len(cola) for clave, cola in self._colas.items()},
+            "solicitudes_disponibles": round(self.solicitudes.disponible, 2),
+            "tokens_disponibles": round(self.tokens.disponible),
+        }
@@ -0,0 +1,134 @@
+"""
+Métricas de la aplicación
+Registro en proceso de contadores, medidores y distribuciones de latencia
+"""
+
+from typing import Dict, Any, Callable, List
+from collections import deque
+from contextlib import contextmanager
+import threading
+import time
+
+# Cantidad de observaciones que se conservan por distribución
+VENTANA_OBSERVACIONES = 2048
+
+
+def _percentil(valores: List[float], percentil: float) -> float:
+    """Percentil por rango más cercano sobre una lista ordenada"""
+    if not valores:
+        return 0.0
+    indice = min(len(valores) - 1, max(0, int(round(percentil / 100 * len(valores))) - 1))
+    return valores[indice]
+
+
+class RegistroMetricas:
+    """Registro de métricas en memoria, seguro para hilos"""
+
+    def __init__(self):
+        self._bloqueo = threading.Lock()
+        self._contadores: Dict[str, float] = {}
+        self._distribuciones: Dict[str, deque] = {}
+        self._medidores: Dict[str, Callable[[], Any]] = {}
+
+    def incrementar(self, nombre: str, valor: float = 1) -> None:
+        """
+        Incrementa un contador
+
+        Args:
+            nombre: Nombre de la métrica
+            valor: Cantidad a sumar
+        """
+        with self._bloqueo:
+            self._contadores[nombre] = self._contadores.get(nombre, 0) + valor
+
+    def observar(self, nombre: str, valor: float) -> None:
+        """
+        Registra una observación en una distribución (ej: latencia en ms)
+
+        Args:
+            nombre: Nombre de la métrica
+            valor: Valor observado
+        """
+        with self._bloqueo:
+            if nombre not in self._distribuciones:
+                self._distribuciones[nombre] = deque(maxlen=VENTANA_OBSERVACIONES)
+            self._distribuciones[nombre].append(valor)
+
+    def registrar_medidor(self, nombre: str, funcion: Callable[[], Any]) -> None:
+        """
+        Registra un medidor cuyo valor se calcula al consultar las métricas
+
+        Args:
+            nombre: Nombre de la métrica
+            funcion: Función sin argumentos que devuelve el valor actual
+        """
+        with self._bloqueo:
+            self._medidores[nombre] = funcion
+
+    @contextmanager
+    def medir_latencia(self, nombre: str):
+        """Mide en milisegundos la duración del bloque y la registra en 'nombre'"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(nombre, (time.perf_counter() - inicio) * 1000)
+
+    def obtener_contador(self, nombre: str) -> float:
+        """Devuelve el valor actual de un contador (0 si no existe)"""
+        with self._bloqueo:
+            return self._contadores.get(nombre, 0)
+
+    def resumen_distribucion(self, nombre: str) -> Dict[str, float]:
+        """
+        Resume una distribución
+
+        Args:
+            nombre: Nombre de la métrica
+
+        Returns:
+            Dict con cantidad, promedio y percentiles 50/90/99
+        """
+        with self._bloqueo:
+            valores = sorted(self._distribuciones.get(nombre, ()))
+        if not valores:
+            return {"cantidad": 0, "promedio": 0.0, "p50": 0.0, "p90": 0.0, "p99": 0.0}
+        return {
+            "cantidad": len(valores),
+            "promedio": round(sum(valores) / len(valores), 3),
+            "p50": round(_percentil(valores, 50), 3),
+            "p90": round(_percentil(valores, 90), 3),
+            "p99": round(_percentil(valores, 99), 3),
+        }
+
+    def instantanea(self) -> Dict[str, Any]:
+        """
+        Obtiene el estado actual de todas las métricas
+
+        Returns:
+            Dict con contadores, medidores y resúmenes de distribuciones
+        """
+        with self._bloqueo:
+            contadores = dict(self._contadores)
+            medidores = dict(self._medidores)
+            nombres_distribuciones = list(self._distribuciones)
+
+        valores_medidores = {}
+        for nombre, funcion in medidores.items():
+            try:
+                valores_medidores[nombre] = funcion()
+            except Exception as e:
+                valores_medidores[nombre] = f"error: {str(e)}"
+
+        return {
+            "contadores": contadores,
+            "medidores": valores_medidores,
+            "distribuciones": {
+                nombre: self.resumen_distribucion(nombre)
+                for nombre in nombres_distribuciones
+            }
+        }
+
+
+# Registro principal de la aplicación
+metricas = RegistroMetricas()
@@ -0,0 +1,182 @@
+"""
+Solicitudes de respaldo (hedging)
+Repite una llamada idempotente que tarda más que el percentil observado y se queda con la primera respuesta
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+import asyncio
+import logging
+import time
+
+from utilidades.metricas import metricas
+
+logger = logging.getLogger(__name__)
+
+
+class PoliticaRespaldo:
+    """
+    Política de solicitudes de respaldo para llamadas idempotentes (ej: generate_content)
+
+    Si la llamada no respondió dentro del percentil 'percentil' de las
+    latencias observadas para su tipo, se envía una segunda y gana la primera
+    que responde bien (si una falla, se espera a la otra). La perdedora no se
+    cancela: corre en un hilo que no se puede interrumpir y su latencia sigue
+    alimentando la distribución.
+
+    El presupuesto acota el costo: cada llamada suma 'presupuesto' créditos
+    (hasta 'maximo_creditos') y cada respaldo consume uno, así los respaldos
+    no superan esa fracción de las llamadas aunque la API entera se ponga
+    lenta.
+    """
+
+    def __init__(
+        self,
+        nombre: str,
+        habilitada: bool = True,
+        percentil: str = 'p90',
+        presupuesto: float = 0.1,
+        minimo_muestras: int = 20,
+        maximo_creditos: float = 5.0
+    ):
+        """
+        Args:
+            nombre: Prefijo de las métricas (ej: 'gemini')
+            habilitada: Si es False las llamadas se ejecutan una sola vez
+            percentil: Percentil de la latencia a partir del cual se envía el respaldo ('p50', 'p90' o 'p99')
+            presupuesto: Fracción máxima de llamadas extra (0.1 = hasta un 10%)
+            minimo_muestras: Latencias observadas necesarias antes de enviar respaldos
+            maximo_creditos: Respaldos que se pueden acumular para una ráfaga de llamadas lentas
+        """
+        self.nombre = nombre
+        self.habilitada = habilitada
+        self.percentil = percentil
+        self.presupuesto = presupuesto
+        self.minimo_muestras = minimo_muestras
+        self.maximo_creditos = maximo_creditos
+        self._creditos = 1.0
+        # Perdedoras que siguen corriendo (referencia para que no las recolecte el GC)
+        self._pendientes: Set[asyncio.Task] = set()
+
+        metricas.registrar_medidor(f"{nombre}.respaldo.tasa_ganados", self._tasa_ganados)
+        metricas.registrar_medidor(f"{nombre}.respaldo.costo_extra", self._costo_extra)
+
+    def _tasa_ganados(self) -> float:
+        """Fracción de los respaldos enviados que respondieron antes que la llamada original"""
+        enviados = metricas.obtener_contador(f"{self.nombre}.respaldo.enviados")
+        if not enviados:
+            return 0.0
+        return round(metricas.obtener_contador(f"{self.nombre}.respaldo.ganados") / enviados, 3)
+
+    def _costo_extra(self) -> float:
+        """Llamadas extra por cada llamada original (0.05 = 5% más de solicitudes)"""
+        llamadas = metricas.obtener_contador(f"{self.nombre}.respaldo.llamadas")
+        if not llamadas:
+            return 0.0
+        return round(metricas.obtener_contador(f"{self.nombre}.respaldo.enviados") / llamadas, 3)
+
+    def _umbral_s(self, tipo: str) -> Optional[float]:
+        """Demora tras la cual se envía el respaldo (None si todavía no hay muestras suficientes)"""
+        distribucion = metricas.resumen_distribucion(f"{self.nombre}.latencia_{tipo}_ms")
+        if distribucion["cantidad"] < self.minimo_muestras:
+            return None
+        return distribucion[self.percentil] / 1000
+
+    async def _medir(self, tipo: str, intento: Callable[[], Awaitable[Any]]) -> Any:
+        inicio = time.perf_counter()
+        resultado = await intento()
+        metricas.observar(f"{self.nombre}.latencia_{tipo}_ms", (time.perf_counter() - inicio) * 1000)
+        return resultado
+
+    async def ejecutar(
+        self,
+        tipo: str,
+        intento: Callable[[], Awaitable[Any]],
+        tokens: int = 0,
+        puede_duplicar: Optional[Callable[[], bool]] = None
+    ) -> Any:
+        """
+        Ejecuta la llamada, con un respaldo si tarda más que el percentil observado
+
+        Args:
+            tipo: Tipo de llamada; cada tipo tiene su propia distribución de latencias
+            intento: Función que devuelve un awaitable nuevo con una ejecución de la llamada
+            tokens: Tokens estimados de la llamada (para medir el costo extra de los respaldos)
+            puede_duplicar: Condición adicional para enviar el respaldo (ej: hay capacidad libre)
+
+        Returns:
+            El resultado de la primera ejecución exitosa
+
+        Raises:
+            La excepción de la llamada original si ninguna ejecución tuvo éxito
+        """
+        metricas.incrementar(f"{self.nombre}.respaldo.llamadas")
+        self._creditos = min(self.maximo_creditos, self._creditos + self.presupuesto)
+
+        umbral_s = self._umbral_s(tipo) if self.habilitada else None
+        if umbral_s is None:
+            return await self._medir(tipo, intento)
+
+        original = asyncio.ensure_future(self._medir(tipo, intento))
+        try:
+            hechas, _ = await asyncio.wait({original}, timeout=umbral_s)
+            if hechas:
+                return original.result()
+
+            if self._creditos < 1:
+                metricas.incrementar(f"{self.nombre}.respaldo.sin_presupuesto")
+                return await original
+            if puede_duplicar is not None and not puede_duplicar():
+                metricas.incrementar(f"{self.nombre}.respaldo.sin_capacidad")
+                return await original
+
+            self._creditos -= 1
+            metricas.incrementar(f"{self.nombre}.respaldo.enviados")
+            metricas.incrementar(f"{self.nombre}.respaldo.tokens_extra", tokens)
+            logger.info(f"'{self.nombre}' ({tipo}) lleva más de {umbral_s:.1f}s: se envía una solicitud de respaldo")
+            respaldo = asyncio.ensure_future(self._medir(tipo, intento))
+            return await self._primera_exitosa(original, respaldo)
+        except asyncio.CancelledError:
+            original.cancel()
+            raise
+
+    async def _primera_exitosa(self, original: asyncio.Task, respaldo: asyncio.Task) -> Any:
+        pendientes = {original, respaldo}
+        try:
+            while pendientes:
+                hechas, pendientes = await asyncio.wait(pendientes, return_when=asyncio.FIRST_COMPLETED)
+                # Si terminan juntas, se prefiere la original
+                for tarea in sorted(hechas, key=lambda t: t is respaldo):
+                    if tarea.exception() is None:
+                        metricas.incrementar(
+                            f"{self.nombre}.respaldo.{'ganados' if tarea is respaldo else 'perdidos'}"
+                        )
+                        self._dejar_correr(pendientes)
+                        return tarea.result()
+        except asyncio.CancelledError:
+            for tarea in pendientes:
+                tarea.cancel()
+            raise
+        # Fallaron las dos: se informa el error de la original
+        return original.result()
+
+    def _dejar_correr(self, tareas: Set[asyncio.Task]) -> None:
+        """La perdedora termina en segundo plano; su resultado (o error) se descarta"""
+        for tarea in tareas:
+            self._pendientes.add(tarea)
+            tarea.add_done_callback(self._descartar)
+
+    def _descartar(self, tarea: asyncio.Task) -> None:
+        self._pendientes.discard(tarea)
+        if not tarea.cancelled() and tarea.exception() is not None:
+            logger.debug(f"La solicitud perdedora de '{self.nombre}' falló: {str(tarea.exception())}")
+
+    def resumen(self) -> Dict[str, Any]:
+        """Configuración y resultados de la política"""
+        return {
+            "habilitada": self.habilitada,
+            "percentil": self.percentil,
+            "presupuesto": self.presupuesto,
+            "creditos": round(self._creditos, 2),
+            "tasa_ganados": self._tasa_ganados(),
+            "costo_extra": self._costo_extra(),
+        }
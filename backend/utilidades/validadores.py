@@ -86,8 +86,8 @@ class ValidadorReporte:
         
         # Validar que al menos un campo esté presente
         campos_validos = [
-            'tipoEstudio', 'paciente', 'tutor', 'veterinario', 
-            'diagnostico', 'imagenes', 'estado'
+            'tipoEstudio', 'tipo_estudio', 'paciente', 'tutor', 'veterinario', 
+            'diagnostico', 'imagenes', 'estado', 'contenido_extraido', 'confianza_extraccion'
         ]
         
         return any(campo in datos for campo in campos_validos)
@@ -110,8 +110,8 @@ class ValidadorReporte:
         if len(termino.strip()) < 2:
             return False
         
-        # Validar caracteres permitidos
-        return bool(re.match(r'^[a-zA-Z0-9\s\-_.,áéíóúÁÉÍÓÚñÑ]+$', termino))
+        # Validar caracteres permitidos (las comillas habilitan frases exactas)
+        return bool(re.match(r'^[a-zA-Z0-9\s\-_.,"áéíóúüÁÉÍÓÚÜñÑ]+$', termino))
 
 class ValidadorChatbot:
     """Validador para el chatbot"""
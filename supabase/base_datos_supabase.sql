@@ -462,6 +462,1045 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- =====================================================
+-- TABLA DE REPORTES DEL BACKEND
+-- =====================================================
+
+-- Tabla donde el backend FastAPI guarda cada reporte procesado
+-- (el resultado completo de la IA vive en json_resultado)
+CREATE TABLE IF NOT EXISTS reporte (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    paciente_id BIGINT,
+    veterinario_id BIGINT,
+    fecha_estudio DATE,
+    tipo_estudio VARCHAR(200),
+    origen_archivo VARCHAR(500),
+    json_resultado JSONB NOT NULL DEFAULT '{}',
+    tipo_procesamiento VARCHAR(50),
+    estado_procesamiento VARCHAR(20),
+    creado_en TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    actualizado_en TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE reporte ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow all operations on reporte" ON reporte;
+CREATE POLICY "Allow all operations on reporte" ON reporte FOR ALL USING (true);
+
+CREATE INDEX IF NOT EXISTS idx_reporte_creado_en ON reporte(creado_en);
+
+-- UUID público del reporte (el que ve el frontend), materializado desde el JSON
+ALTER TABLE reporte ADD COLUMN IF NOT EXISTS reporte_uuid UUID
+    GENERATED ALWAYS AS ((json_resultado ->> 'id')::uuid) STORED;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_reporte_uuid ON reporte(reporte_uuid);
+
+-- Huella (SHA-256) del PDF de origen: detecta la subida repetida del mismo archivo.
+-- No es única: con forzar=true se puede reprocesar el mismo archivo a propósito.
+ALTER TABLE reporte ADD COLUMN IF NOT EXISTS huella_contenido TEXT
+    GENERATED ALWAYS AS (json_resultado ->> 'huella_contenido') STORED;
+
+CREATE INDEX IF NOT EXISTS idx_reporte_huella_contenido ON reporte(huella_contenido, id DESC)
+    WHERE huella_contenido IS NOT NULL;
+
+-- =====================================================
+-- BÚSQUEDA DE TEXTO COMPLETO SOBRE reporte
+-- =====================================================
+
+-- Vector de búsqueda ponderado: diagnóstico principal y paciente (A),
+-- resto del diagnóstico y hallazgos de imágenes (B), contenido extraído (C)
+ALTER TABLE reporte ADD COLUMN IF NOT EXISTS busqueda_tsv tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('spanish', COALESCE(json_resultado #>> '{diagnostico,principal}', '')), 'A') ||
+    setweight(to_tsvector('spanish', COALESCE(json_resultado #>> '{paciente,nombre}', '')), 'A') ||
+    setweight(to_tsvector('spanish', CASE WHEN jsonb_typeof(json_resultado -> 'diagnostico') = 'object'
+        THEN (json_resultado -> 'diagnostico') - 'principal' ELSE '{}'::jsonb END), 'B') ||
+    setweight(to_tsvector('spanish', jsonb_path_query_array(json_resultado, '$.imagenes[*].hallazgos')), 'B') ||
+    setweight(to_tsvector('spanish', COALESCE(json_resultado ->> 'contenido_extraido', '')), 'C')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_reporte_busqueda_fts ON reporte USING gin(busqueda_tsv);
+
+-- Búsqueda rankeada con fragmentos resaltados en un solo round trip.
+-- El ranking se calcula sobre todas las coincidencias (vía índice GIN) y
+-- ts_headline solo se aplica a la página pedida, que es la parte costosa.
+CREATE OR REPLACE FUNCTION buscar_reportes_fts(
+    termino_busqueda TEXT,
+    limite_busqueda INTEGER DEFAULT 10,
+    desplazamiento_busqueda INTEGER DEFAULT 0
+)
+RETURNS TABLE(
+    id BIGINT,
+    json_resultado JSONB,
+    tipo_estudio VARCHAR,
+    origen_archivo VARCHAR,
+    estado_procesamiento VARCHAR,
+    creado_en TIMESTAMP WITH TIME ZONE,
+    actualizado_en TIMESTAMP WITH TIME ZONE,
+    relevancia REAL,
+    fragmento TEXT,
+    total_coincidencias BIGINT
+) AS $$
+    WITH consulta AS (
+        SELECT websearch_to_tsquery('spanish', termino_busqueda) AS q
+    ),
+    pagina AS (
+        SELECT
+            r.id,
+            ts_rank(r.busqueda_tsv, c.q, 32) AS relevancia,
+            COUNT(*) OVER () AS total_coincidencias
+        FROM reporte r, consulta c
+        WHERE r.busqueda_tsv @@ c.q
+        ORDER BY relevancia DESC, r.creado_en DESC
+        LIMIT limite_busqueda
+        OFFSET desplazamiento_busqueda
+    )
+    SELECT
+        r.id,
+        r.json_resultado - 'imagenes',
+        r.tipo_estudio,
+        r.origen_archivo,
+        r.estado_procesamiento,
+        r.creado_en,
+        r.actualizado_en,
+        p.relevancia,
+        ts_headline(
+            'spanish',
+            COALESCE(r.json_resultado ->> 'contenido_extraido', ''),
+            c.q,
+            'StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=25, MinWords=8, FragmentDelimiter=" … "'
+        ),
+        p.total_coincidencias
+    FROM pagina p
+    JOIN reporte r ON r.id = p.id
+    CROSS JOIN consulta c
+    ORDER BY p.relevancia DESC, r.creado_en DESC;
+$$ LANGUAGE sql STABLE;
+
+-- =====================================================
+-- NORMALIZACIÓN DE reporte EN TABLAS HIJAS
+-- =====================================================
+
+-- Diagnóstico, imágenes y hallazgos de cada reporte del backend se escriben
+-- también como filas propias, así se consultan por índice sin traer el JSON
+-- completo (las imágenes incluyen data URLs en base64)
+ALTER TABLE diagnosticos ADD COLUMN IF NOT EXISTS reporte_uuid UUID
+    REFERENCES reporte(reporte_uuid) ON DELETE CASCADE;
+ALTER TABLE diagnosticos ADD COLUMN IF NOT EXISTS metadatos JSONB;
+
+ALTER TABLE imagenes_medicas ADD COLUMN IF NOT EXISTS reporte_uuid UUID
+    REFERENCES reporte(reporte_uuid) ON DELETE CASCADE;
+ALTER TABLE imagenes_medicas ADD COLUMN IF NOT EXISTS posicion INTEGER DEFAULT 0;
+-- Las imágenes procesadas se guardan como data URL, que excede VARCHAR(500)
+ALTER TABLE imagenes_medicas ALTER COLUMN url TYPE TEXT;
+
+ALTER TABLE hallazgos_clinicos ADD COLUMN IF NOT EXISTS reporte_uuid UUID
+    REFERENCES reporte(reporte_uuid) ON DELETE CASCADE;
+ALTER TABLE hallazgos_clinicos ADD COLUMN IF NOT EXISTS posicion INTEGER DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_diagnosticos_reporte_uuid ON diagnosticos(reporte_uuid);
+CREATE INDEX IF NOT EXISTS idx_imagenes_reporte_uuid ON imagenes_medicas(reporte_uuid, posicion);
+CREATE INDEX IF NOT EXISTS idx_hallazgos_reporte_uuid ON hallazgos_clinicos(reporte_uuid, posicion);
+
+-- Texto extraído del PDF y análisis de sus imágenes (sin las data URLs), con
+-- la versión del prompt y el modelo que estructuraron el reporte. Permite
+-- regenerar un reporte al cambiar el prompt sin volver a subir el PDF ni
+-- repetir el OCR (backend/reprocesar_reportes.py)
+CREATE TABLE IF NOT EXISTS reporte_extraccion (
+    reporte_uuid UUID PRIMARY KEY REFERENCES reporte(reporte_uuid) ON DELETE CASCADE,
+    texto TEXT NOT NULL,
+    imagenes JSONB NOT NULL DEFAULT '[]',
+    version_prompt VARCHAR(50) NOT NULL,
+    modelo VARCHAR(100) NOT NULL,
+    creado_en TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    actualizado_en TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE reporte_extraccion ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow all operations on reporte_extraccion" ON reporte_extraccion;
+CREATE POLICY "Allow all operations on reporte_extraccion" ON reporte_extraccion FOR ALL USING (true);
+
+-- Búsqueda de los reportes con una versión de prompt anterior, en orden de UUID
+CREATE INDEX IF NOT EXISTS idx_reporte_extraccion_version ON reporte_extraccion(version_prompt, reporte_uuid);
+
+-- Guarda un lote de reportes (array JSON con el mismo formato de la fila de
+-- 'reporte') junto con sus filas hijas. Es una única sentencia: cada tabla
+-- recibe un solo INSERT ... SELECT para todo el lote y todo queda en la misma
+-- transacción.
+CREATE OR REPLACE FUNCTION guardar_reportes_normalizados(reportes JSONB)
+RETURNS TABLE(
+    id BIGINT,
+    paciente_id BIGINT,
+    veterinario_id BIGINT,
+    fecha_estudio DATE,
+    tipo_estudio VARCHAR,
+    origen_archivo VARCHAR,
+    json_resultado JSONB,
+    tipo_procesamiento VARCHAR,
+    estado_procesamiento VARCHAR,
+    creado_en TIMESTAMP WITH TIME ZONE,
+    actualizado_en TIMESTAMP WITH TIME ZONE
+) AS $$
+    -- Reportes del lote que ya estaban guardados (la sentencia ve la tabla previa a los INSERT)
+    WITH existentes AS (
+        SELECT e.*
+        FROM reporte e
+        WHERE e.reporte_uuid IN (
+            SELECT (r -> 'json_resultado' ->> 'id')::uuid FROM jsonb_array_elements(reportes) AS r
+        )
+    ),
+    nuevos AS (
+        INSERT INTO reporte (
+            paciente_id, veterinario_id, fecha_estudio, tipo_estudio, origen_archivo,
+            json_resultado, tipo_procesamiento, estado_procesamiento, creado_en, actualizado_en
+        )
+        SELECT
+            (r ->> 'paciente_id')::bigint,
+            (r ->> 'veterinario_id')::bigint,
+            (r ->> 'fecha_estudio')::date,
+            r ->> 'tipo_estudio',
+            r ->> 'origen_archivo',
+            COALESCE(r -> 'json_resultado', '{}'::jsonb),
+            r ->> 'tipo_procesamiento',
+            r ->> 'estado_procesamiento',
+            COALESCE((r ->> 'creado_en')::timestamptz, NOW()),
+            COALESCE((r ->> 'actualizado_en')::timestamptz, NOW())
+        FROM jsonb_array_elements(reportes) AS r
+        -- Idempotente por UUID: reenviar un reporte ya guardado (ej: la
+        -- bandeja de salida tras un timeout que sí llegó a confirmar) no lo
+        -- duplica ni vuelve a escribir sus filas hijas
+        ON CONFLICT (reporte_uuid) DO NOTHING
+        RETURNING *
+    ),
+    imagenes AS (
+        SELECT n.reporte_uuid, i.imagen, i.posicion
+        FROM nuevos n
+        CROSS JOIN LATERAL jsonb_array_elements(
+            CASE WHEN jsonb_typeof(n.json_resultado -> 'imagenes') = 'array'
+                 THEN n.json_resultado -> 'imagenes' ELSE '[]'::jsonb END
+        ) WITH ORDINALITY AS i(imagen, posicion)
+    ),
+    diagnosticos_insertados AS (
+        INSERT INTO diagnosticos (reporte_uuid, principal, secundarios, recomendaciones, observaciones, metadatos)
+        SELECT
+            n.reporte_uuid,
+            COALESCE(d ->> 'principal', 'No especificado'),
+            ARRAY(SELECT jsonb_array_elements_text(
+                CASE WHEN jsonb_typeof(d -> 'secundarios') = 'array' THEN d -> 'secundarios' ELSE '[]'::jsonb END)),
+            ARRAY(SELECT jsonb_array_elements_text(
+                CASE WHEN jsonb_typeof(d -> 'recomendaciones') = 'array' THEN d -> 'recomendaciones' ELSE '[]'::jsonb END)),
+            d ->> 'observaciones',
+            d - 'principal' - 'secundarios' - 'recomendaciones' - 'observaciones'
+        FROM nuevos n
+        CROSS JOIN LATERAL (
+            SELECT CASE WHEN jsonb_typeof(n.json_resultado -> 'diagnostico') = 'object'
+                        THEN n.json_resultado -> 'diagnostico' END AS d
+        ) AS diag
+        WHERE d IS NOT NULL
+    ),
+    imagenes_insertadas AS (
+        INSERT INTO imagenes_medicas (reporte_uuid, posicion, nombre, url, descripcion, tipo, pagina, ancho, alto, metadatos)
+        SELECT
+            reporte_uuid,
+            posicion,
+            COALESCE(imagen ->> 'nombre', 'Imagen ' || posicion),
+            COALESCE(imagen ->> 'url', ''),
+            imagen ->> 'descripcion',
+            CASE WHEN imagen ->> 'tipo' IN ('radiografia', 'ecografia', 'ecocardiografia', 'analisis')
+                 THEN imagen ->> 'tipo' ELSE 'otro' END,
+            CASE WHEN imagen ->> 'pagina' ~ '^[0-9]+$' THEN (imagen ->> 'pagina')::integer ELSE 1 END,
+            CASE WHEN imagen ->> 'ancho' ~ '^[0-9]+$' THEN (imagen ->> 'ancho')::integer END,
+            CASE WHEN imagen ->> 'alto' ~ '^[0-9]+$' THEN (imagen ->> 'alto')::integer END,
+            -- Documento original sin la URL, para devolver la imagen tal cual se guardó
+            imagen - 'url'
+        FROM imagenes
+    ),
+    hallazgos_insertados AS (
+        INSERT INTO hallazgos_clinicos (reporte_uuid, posicion, organo, descripcion)
+        SELECT
+            reporte_uuid,
+            posicion,
+            NULLIF(imagen ->> 'ubicacion', 'No especificada'),
+            imagen ->> 'hallazgos'
+        FROM imagenes
+        WHERE COALESCE(imagen ->> 'hallazgos', '') <> ''
+    ),
+    extracciones_insertadas AS (
+        INSERT INTO reporte_extraccion (reporte_uuid, texto, imagenes, version_prompt, modelo)
+        SELECT
+            n.reporte_uuid,
+            COALESCE(r -> 'extraccion' ->> 'texto', ''),
+            CASE WHEN jsonb_typeof(r -> 'extraccion' -> 'imagenes') = 'array'
+                 THEN r -> 'extraccion' -> 'imagenes' ELSE '[]'::jsonb END,
+            r -> 'extraccion' ->> 'version_prompt',
+            r -> 'extraccion' ->> 'modelo'
+        FROM nuevos n
+        JOIN jsonb_array_elements(reportes) AS r
+            ON (r -> 'json_resultado' ->> 'id')::uuid = n.reporte_uuid
+        WHERE jsonb_typeof(r -> 'extraccion') = 'object'
+    )
+    -- Los que ya existían también se devuelven: para el llamador quedaron guardados.
+    -- La unión va en una subconsulta: como sentencia final de la función,
+    -- un UNION con los INSERT del WITH falla al capturar las transition tables.
+    SELECT * FROM (
+        SELECT
+            n.id, n.paciente_id, n.veterinario_id, n.fecha_estudio, n.tipo_estudio, n.origen_archivo,
+            n.json_resultado, n.tipo_procesamiento, n.estado_procesamiento, n.creado_en, n.actualizado_en
+        FROM nuevos n
+        UNION ALL
+        SELECT
+            e.id, e.paciente_id, e.veterinario_id, e.fecha_estudio, e.tipo_estudio, e.origen_archivo,
+            e.json_resultado, e.tipo_procesamiento, e.estado_procesamiento, e.creado_en, e.actualizado_en
+        FROM existentes e
+    ) AS guardados
+    ORDER BY guardados.id;
+$$ LANGUAGE sql;
+
+-- =====================================================
+-- ESTADÍSTICAS PRECALCULADAS
+-- =====================================================
+
+-- Contadores del sistema mantenidos por triggers. /api/estadisticas lee esta
+-- tabla (unas pocas filas) en lugar de correr los COUNT(*) de
+-- vista_estadisticas_sistema sobre tablas completas.
+CREATE TABLE IF NOT EXISTS estadisticas_resumen (
+    clave VARCHAR(100) PRIMARY KEY,
+    valor NUMERIC NOT NULL DEFAULT 0,
+    actualizado_en TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE estadisticas_resumen ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow all operations on estadisticas_resumen" ON estadisticas_resumen;
+CREATE POLICY "Allow all operations on estadisticas_resumen" ON estadisticas_resumen FOR ALL USING (true);
+
+-- Suma deltas ({clave: delta}) a los contadores. Las claves se actualizan en
+-- orden fijo para que dos transacciones concurrentes no se bloqueen mutuamente.
+CREATE OR REPLACE FUNCTION sumar_estadisticas(deltas JSONB)
+RETURNS VOID AS $$
+    INSERT INTO estadisticas_resumen (clave, valor, actualizado_en)
+    SELECT d.key, d.value::numeric, NOW()
+    FROM jsonb_each_text(deltas) AS d
+    WHERE d.value::numeric <> 0
+    ORDER BY d.key
+    ON CONFLICT (clave) DO UPDATE
+    SET valor = estadisticas_resumen.valor + EXCLUDED.valor,
+        actualizado_en = NOW();
+$$ LANGUAGE sql;
+
+-- Deltas de un conjunto de filas de 'reporte' (signo 1 al agregar, -1 al quitar)
+CREATE OR REPLACE FUNCTION deltas_estadisticas_reporte(filas JSONB, signo INTEGER)
+RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'total_reportes', signo * COUNT(*),
+        'reportes_completados', signo * COUNT(*) FILTER (WHERE f ->> 'estado' = 'completado'),
+        'reportes_procesando', signo * COUNT(*) FILTER (WHERE f ->> 'estado' = 'procesando'),
+        'reportes_error', signo * COUNT(*) FILTER (WHERE f ->> 'estado' = 'error'),
+        'reportes_con_confianza', signo * COUNT(*) FILTER (WHERE c.confianza > 0),
+        'suma_confianza', signo * COALESCE(SUM(c.confianza) FILTER (WHERE c.confianza > 0), 0)
+    )
+    FROM jsonb_array_elements(COALESCE(filas, '[]'::jsonb)) AS f
+    CROSS JOIN LATERAL (
+        SELECT CASE WHEN jsonb_typeof(f -> 'confianza') = 'number'
+                    THEN (f ->> 'confianza')::numeric END AS confianza
+    ) AS c;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Triggers por sentencia: un INSERT de 500 reportes actualiza los contadores
+-- una sola vez, a partir de las tablas de transición
+CREATE OR REPLACE FUNCTION estadisticas_reporte_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM sumar_estadisticas(deltas_estadisticas_reporte((
+            SELECT jsonb_agg(jsonb_build_object(
+                'estado', estado_procesamiento,
+                'confianza', json_resultado -> 'confianza_extraccion'))
+            FROM filas_nuevas
+        ), 1));
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        PERFORM sumar_estadisticas(deltas_estadisticas_reporte((
+            SELECT jsonb_agg(jsonb_build_object(
+                'estado', estado_procesamiento,
+                'confianza', json_resultado -> 'confianza_extraccion'))
+            FROM filas_viejas
+        ), -1));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Contador genérico: TG_ARGV[0] es la clave y TG_ARGV[1] una condición opcional
+CREATE OR REPLACE FUNCTION estadisticas_contar_trigger()
+RETURNS TRIGGER AS $$
+DECLARE
+    condicion TEXT := COALESCE(TG_ARGV[1], 'true');
+    altas BIGINT := 0;
+    bajas BIGINT := 0;
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        EXECUTE format('SELECT COUNT(*) FROM filas_nuevas WHERE %s', condicion) INTO altas;
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        EXECUTE format('SELECT COUNT(*) FROM filas_viejas WHERE %s', condicion) INTO bajas;
+    END IF;
+    PERFORM sumar_estadisticas(jsonb_build_object(TG_ARGV[0], altas - bajas));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS estadisticas_reporte_insert ON reporte;
+DROP TRIGGER IF EXISTS estadisticas_reporte_update ON reporte;
+DROP TRIGGER IF EXISTS estadisticas_reporte_delete ON reporte;
+CREATE TRIGGER estadisticas_reporte_insert AFTER INSERT ON reporte
+    REFERENCING NEW TABLE AS filas_nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION estadisticas_reporte_trigger();
+CREATE TRIGGER estadisticas_reporte_update AFTER UPDATE ON reporte
+    REFERENCING OLD TABLE AS filas_viejas NEW TABLE AS filas_nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION estadisticas_reporte_trigger();
+CREATE TRIGGER estadisticas_reporte_delete AFTER DELETE ON reporte
+    REFERENCING OLD TABLE AS filas_viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION estadisticas_reporte_trigger();
+
+DROP TRIGGER IF EXISTS estadisticas_imagenes_insert ON imagenes_medicas;
+DROP TRIGGER IF EXISTS estadisticas_imagenes_delete ON imagenes_medicas;
+CREATE TRIGGER estadisticas_imagenes_insert AFTER INSERT ON imagenes_medicas
+    REFERENCING NEW TABLE AS filas_nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION estadisticas_contar_trigger('total_imagenes');
+CREATE TRIGGER estadisticas_imagenes_delete AFTER DELETE ON imagenes_medicas
+    REFERENCING OLD TABLE AS filas_viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION estadisticas_contar_trigger('total_imagenes');
+
+DROP TRIGGER IF EXISTS estadisticas_pacientes_insert ON pacientes;
+DROP TRIGGER IF EXISTS estadisticas_pacientes_delete ON pacientes;
+CREATE TRIGGER estadisticas_pacientes_insert AFTER INSERT ON pacientes
+    REFERENCING NEW TABLE AS filas_nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION estadisticas_contar_trigger('total_pacientes');
+CREATE TRIGGER estadisticas_pacientes_delete AFTER DELETE ON pacientes
+    REFERENCING OLD TABLE AS filas_viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION estadisticas_contar_trigger('total_pacientes');
+
+DROP TRIGGER IF EXISTS estadisticas_veterinarios_insert ON veterinarios;
+DROP TRIGGER IF EXISTS estadisticas_veterinarios_update ON veterinarios;
+DROP TRIGGER IF EXISTS estadisticas_veterinarios_delete ON veterinarios;
+CREATE TRIGGER estadisticas_veterinarios_insert AFTER INSERT ON veterinarios
+    REFERENCING NEW TABLE AS filas_nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION estadisticas_contar_trigger('veterinarios_activos', 'activo');
+CREATE TRIGGER estadisticas_veterinarios_update AFTER UPDATE ON veterinarios
+    REFERENCING OLD TABLE AS filas_viejas NEW TABLE AS filas_nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION estadisticas_contar_trigger('veterinarios_activos', 'activo');
+CREATE TRIGGER estadisticas_veterinarios_delete AFTER DELETE ON veterinarios
+    REFERENCING OLD TABLE AS filas_viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION estadisticas_contar_trigger('veterinarios_activos', 'activo');
+
+DROP TRIGGER IF EXISTS estadisticas_turnos_insert ON turnos;
+DROP TRIGGER IF EXISTS estadisticas_turnos_update ON turnos;
+DROP TRIGGER IF EXISTS estadisticas_turnos_delete ON turnos;
+CREATE TRIGGER estadisticas_turnos_insert AFTER INSERT ON turnos
+    REFERENCING NEW TABLE AS filas_nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION estadisticas_contar_trigger('turnos_pendientes', 'estado = ''programado''');
+CREATE TRIGGER estadisticas_turnos_update AFTER UPDATE ON turnos
+    REFERENCING OLD TABLE AS filas_viejas NEW TABLE AS filas_nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION estadisticas_contar_trigger('turnos_pendientes', 'estado = ''programado''');
+CREATE TRIGGER estadisticas_turnos_delete AFTER DELETE ON turnos
+    REFERENCING OLD TABLE AS filas_viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION estadisticas_contar_trigger('turnos_pendientes', 'estado = ''programado''');
+
+-- Recalcula todos los contadores desde las tablas y corrige el desvío (por
+-- ejemplo tras un TRUNCATE o una carga con los triggers desactivados).
+-- Cuenta con COUNT(*) FILTER / SUM directamente sobre las tablas y, en la
+-- misma sentencia (una sola foto de los datos), lee los contadores; la
+-- corrección se suma como delta, así no pisa los deltas de los triggers que
+-- confirmen mientras tanto y no hace falta bloquear la tabla. Si otra sesión
+-- ya está reconciliando, no hace nada. Devuelve solo las claves que estaban
+-- desviadas.
+CREATE OR REPLACE FUNCTION reconciliar_estadisticas()
+RETURNS TABLE(clave VARCHAR, valor_anterior NUMERIC, valor_real NUMERIC) AS $$
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('reconciliar_estadisticas')) THEN
+        RETURN;
+    END IF;
+
+    RETURN QUERY
+    WITH conteos AS (
+        SELECT
+            COUNT(*) AS total_reportes,
+            COUNT(*) FILTER (WHERE r.estado_procesamiento = 'completado') AS reportes_completados,
+            COUNT(*) FILTER (WHERE r.estado_procesamiento = 'procesando') AS reportes_procesando,
+            COUNT(*) FILTER (WHERE r.estado_procesamiento = 'error') AS reportes_error,
+            COUNT(*) FILTER (WHERE c.confianza > 0) AS reportes_con_confianza,
+            COALESCE(SUM(c.confianza) FILTER (WHERE c.confianza > 0), 0) AS suma_confianza
+        FROM reporte r
+        CROSS JOIN LATERAL (
+            SELECT CASE WHEN jsonb_typeof(r.json_resultado -> 'confianza_extraccion') = 'number'
+                        THEN (r.json_resultado ->> 'confianza_extraccion')::numeric END AS confianza
+        ) AS c
+    ),
+    reales AS (
+        SELECT v.clave::VARCHAR AS clave, v.valor::numeric AS valor
+        FROM conteos t
+        CROSS JOIN LATERAL (VALUES
+            ('total_reportes', t.total_reportes::numeric),
+            ('reportes_completados', t.reportes_completados),
+            ('reportes_procesando', t.reportes_procesando),
+            ('reportes_error', t.reportes_error),
+            ('reportes_con_confianza', t.reportes_con_confianza),
+            ('suma_confianza', t.suma_confianza),
+            ('total_imagenes', (SELECT COUNT(*) FROM imagenes_medicas)),
+            ('total_pacientes', (SELECT COUNT(*) FROM pacientes)),
+            ('veterinarios_activos', (SELECT COUNT(*) FROM veterinarios WHERE activo)),
+            ('turnos_pendientes', (SELECT COUNT(*) FROM turnos WHERE estado = 'programado'))
+        ) AS v(clave, valor)
+    ),
+    desviados AS (
+        SELECT reales.clave, COALESCE(e.valor, 0) AS anterior, reales.valor AS real
+        FROM reales
+        LEFT JOIN estadisticas_resumen e ON e.clave = reales.clave
+        WHERE e.valor IS DISTINCT FROM reales.valor
+    ),
+    corregidos AS (
+        INSERT INTO estadisticas_resumen AS e (clave, valor, actualizado_en)
+        SELECT d.clave, d.real - d.anterior, NOW()
+        FROM desviados d
+        ORDER BY d.clave
+        ON CONFLICT ON CONSTRAINT estadisticas_resumen_pkey DO UPDATE
+        SET valor = e.valor + EXCLUDED.valor, actualizado_en = NOW()
+        RETURNING e.clave
+    )
+    SELECT d.clave, d.anterior, d.real
+    FROM desviados d
+    JOIN corregidos c ON c.clave = d.clave
+    WHERE d.anterior <> d.real;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Los contadores arrancan con los datos que ya existan
+SELECT * FROM reconciliar_estadisticas();
+
+-- =====================================================
+-- SERIES DIARIAS PRECALCULADAS (ROLLUPS)
+-- =====================================================
+
+-- Un bucket por día, tipo de estudio, especie y veterinario. Los triggers de
+-- reporte lo mantienen al día; /api/estadisticas/serie lee solo esta tabla y
+-- re-agrupa por semana o mes en el backend.
+CREATE TABLE IF NOT EXISTS estadisticas_diarias (
+    dia DATE NOT NULL,
+    tipo_estudio VARCHAR(200) NOT NULL,
+    especie VARCHAR(100) NOT NULL,
+    veterinario VARCHAR(200) NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    completados INTEGER NOT NULL DEFAULT 0,
+    errores INTEGER NOT NULL DEFAULT 0,
+    con_confianza INTEGER NOT NULL DEFAULT 0,
+    suma_confianza NUMERIC NOT NULL DEFAULT 0,
+    PRIMARY KEY (dia, tipo_estudio, especie, veterinario)
+);
+
+ALTER TABLE estadisticas_diarias ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow all operations on estadisticas_diarias" ON estadisticas_diarias;
+CREATE POLICY "Allow all operations on estadisticas_diarias" ON estadisticas_diarias FOR ALL USING (true);
+
+-- Dimensiones de una fila de reporte (como JSONB) tal como se agrupan en los buckets
+CREATE OR REPLACE FUNCTION dimensiones_reporte(f JSONB)
+RETURNS TABLE(
+    dia DATE,
+    tipo_estudio VARCHAR,
+    especie VARCHAR,
+    veterinario VARCHAR,
+    completado INTEGER,
+    error INTEGER,
+    confianza NUMERIC
+) AS $$
+    SELECT
+        COALESCE((f ->> 'fecha_estudio')::date, (f ->> 'creado_en')::date, CURRENT_DATE),
+        COALESCE(NULLIF(lower(trim(f ->> 'tipo_estudio')), ''), 'desconocido')::VARCHAR,
+        COALESCE(NULLIF(lower(trim(f -> 'json_resultado' -> 'paciente' ->> 'especie')), ''), 'desconocida')::VARCHAR,
+        COALESCE(NULLIF(trim(f -> 'json_resultado' -> 'veterinario' ->> 'nombre'), ''), 'Sin asignar')::VARCHAR,
+        (f ->> 'estado_procesamiento' = 'completado')::INTEGER,
+        (f ->> 'estado_procesamiento' = 'error')::INTEGER,
+        CASE WHEN jsonb_typeof(f -> 'json_resultado' -> 'confianza_extraccion') = 'number'
+              AND (f -> 'json_resultado' ->> 'confianza_extraccion')::NUMERIC > 0
+             THEN (f -> 'json_resultado' ->> 'confianza_extraccion')::NUMERIC END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Suma (signo = 1) o resta (signo = -1) un conjunto de reportes a sus buckets.
+-- Los buckets se actualizan en orden de clave para no bloquearse con otra
+-- transacción concurrente.
+CREATE OR REPLACE FUNCTION sumar_estadisticas_diarias(filas JSONB, signo INTEGER)
+RETURNS VOID AS $$
+    INSERT INTO estadisticas_diarias AS e
+        (dia, tipo_estudio, especie, veterinario, total, completados, errores, con_confianza, suma_confianza)
+    SELECT
+        d.dia, d.tipo_estudio, d.especie, d.veterinario,
+        signo * COUNT(*),
+        signo * SUM(d.completado),
+        signo * SUM(d.error),
+        signo * COUNT(d.confianza),
+        signo * COALESCE(SUM(d.confianza), 0)
+    FROM jsonb_array_elements(filas) AS f, LATERAL dimensiones_reporte(f) d
+    GROUP BY d.dia, d.tipo_estudio, d.especie, d.veterinario
+    ORDER BY d.dia, d.tipo_estudio, d.especie, d.veterinario
+    ON CONFLICT (dia, tipo_estudio, especie, veterinario) DO UPDATE SET
+        total = e.total + EXCLUDED.total,
+        completados = e.completados + EXCLUDED.completados,
+        errores = e.errores + EXCLUDED.errores,
+        con_confianza = e.con_confianza + EXCLUDED.con_confianza,
+        suma_confianza = e.suma_confianza + EXCLUDED.suma_confianza;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION estadisticas_diarias_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM sumar_estadisticas_diarias((SELECT jsonb_agg(to_jsonb(v)) FROM filas_viejas v), -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM sumar_estadisticas_diarias((SELECT jsonb_agg(to_jsonb(n)) FROM filas_nuevas n), 1);
+    END IF;
+    -- Buckets que quedaron vacíos tras borrar o mover reportes
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM estadisticas_diarias e
+        USING (SELECT DISTINCT d.dia, d.tipo_estudio, d.especie, d.veterinario
+               FROM filas_viejas v, LATERAL dimensiones_reporte(to_jsonb(v)) d) d
+        WHERE e.total = 0
+          AND (e.dia, e.tipo_estudio, e.especie, e.veterinario) = (d.dia, d.tipo_estudio, d.especie, d.veterinario);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_estadisticas_diarias_insert ON reporte;
+CREATE TRIGGER trigger_estadisticas_diarias_insert
+    AFTER INSERT ON reporte
+    REFERENCING NEW TABLE AS filas_nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION estadisticas_diarias_trigger();
+
+DROP TRIGGER IF EXISTS trigger_estadisticas_diarias_update ON reporte;
+CREATE TRIGGER trigger_estadisticas_diarias_update
+    AFTER UPDATE ON reporte
+    REFERENCING OLD TABLE AS filas_viejas NEW TABLE AS filas_nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION estadisticas_diarias_trigger();
+
+DROP TRIGGER IF EXISTS trigger_estadisticas_diarias_delete ON reporte;
+CREATE TRIGGER trigger_estadisticas_diarias_delete
+    AFTER DELETE ON reporte
+    REFERENCING OLD TABLE AS filas_viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION estadisticas_diarias_trigger();
+
+-- Reconstruye los buckets desde reporte (tras un TRUNCATE, una carga con los
+-- triggers desactivados, o para corregir desvíos). Como en
+-- reconciliar_estadisticas, compara buckets reales y guardados en una sola
+-- sentencia y suma la diferencia, sin bloquear la tabla; si otra sesión ya
+-- está reconstruyendo, no hace nada. Devuelve los buckets que tenían otro
+-- valor.
+CREATE OR REPLACE FUNCTION reconstruir_estadisticas_diarias()
+RETURNS INTEGER AS $$
+DECLARE
+    desviados INTEGER;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('reconstruir_estadisticas_diarias')) THEN
+        RETURN 0;
+    END IF;
+
+    WITH reales AS (
+        SELECT
+            d.dia, d.tipo_estudio, d.especie, d.veterinario,
+            COUNT(*)::INTEGER AS total,
+            SUM(d.completado)::INTEGER AS completados,
+            SUM(d.error)::INTEGER AS errores,
+            COUNT(d.confianza)::INTEGER AS con_confianza,
+            COALESCE(SUM(d.confianza), 0) AS suma_confianza
+        FROM reporte r, LATERAL dimensiones_reporte(to_jsonb(r)) d
+        GROUP BY d.dia, d.tipo_estudio, d.especie, d.veterinario
+    ),
+    diferencias AS (
+        SELECT
+            dia, tipo_estudio, especie, veterinario,
+            COALESCE(r.total, 0) - COALESCE(e.total, 0) AS total,
+            COALESCE(r.completados, 0) - COALESCE(e.completados, 0) AS completados,
+            COALESCE(r.errores, 0) - COALESCE(e.errores, 0) AS errores,
+            COALESCE(r.con_confianza, 0) - COALESCE(e.con_confianza, 0) AS con_confianza,
+            COALESCE(r.suma_confianza, 0) - COALESCE(e.suma_confianza, 0) AS suma_confianza
+        FROM estadisticas_diarias e
+        FULL JOIN reales r USING (dia, tipo_estudio, especie, veterinario)
+        WHERE (e.total, e.completados, e.errores, e.con_confianza, e.suma_confianza)
+              IS DISTINCT FROM (r.total, r.completados, r.errores, r.con_confianza, r.suma_confianza)
+    ),
+    corregidos AS (
+        INSERT INTO estadisticas_diarias AS e
+            (dia, tipo_estudio, especie, veterinario, total, completados, errores, con_confianza, suma_confianza)
+        SELECT * FROM diferencias
+        ORDER BY dia, tipo_estudio, especie, veterinario
+        ON CONFLICT (dia, tipo_estudio, especie, veterinario) DO UPDATE SET
+            total = e.total + EXCLUDED.total,
+            completados = e.completados + EXCLUDED.completados,
+            errores = e.errores + EXCLUDED.errores,
+            con_confianza = e.con_confianza + EXCLUDED.con_confianza,
+            suma_confianza = e.suma_confianza + EXCLUDED.suma_confianza
+        RETURNING 1
+    )
+    SELECT COUNT(*) INTO desviados FROM corregidos;
+
+    -- Buckets que quedaron vacíos (había reportes que ya no existen)
+    IF desviados > 0 THEN
+        DELETE FROM estadisticas_diarias WHERE total = 0;
+    END IF;
+    RETURN desviados;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Los buckets arrancan con los reportes que ya existan
+SELECT reconstruir_estadisticas_diarias();
+
+-- =====================================================
+-- COLUMNAS DE FILTRO MATERIALIZADAS EN reporte
+-- =====================================================
+
+-- Campos del JSON por los que filtra /api/reportes, materializados como
+-- columnas generadas (normalizadas a minúsculas y sin espacios en los bordes)
+-- para que los filtros sean igualdades o prefijos sobre índices btree en
+-- lugar de un contains sobre json_resultado.
+ALTER TABLE reporte ADD COLUMN IF NOT EXISTS tipo_estudio_normalizado TEXT
+    GENERATED ALWAYS AS (lower(trim(tipo_estudio))) STORED;
+ALTER TABLE reporte ADD COLUMN IF NOT EXISTS especie TEXT
+    GENERATED ALWAYS AS (lower(trim(json_resultado -> 'paciente' ->> 'especie'))) STORED;
+ALTER TABLE reporte ADD COLUMN IF NOT EXISTS paciente_nombre TEXT
+    GENERATED ALWAYS AS (lower(trim(json_resultado -> 'paciente' ->> 'nombre'))) STORED;
+ALTER TABLE reporte ADD COLUMN IF NOT EXISTS tutor_nombre TEXT
+    GENERATED ALWAYS AS (lower(trim(json_resultado -> 'tutor' ->> 'nombre'))) STORED;
+
+-- Igualdades: el listado ordena por creado_en, así cada filtro sale ya ordenado
+CREATE INDEX IF NOT EXISTS idx_reporte_tipo_estudio_normalizado ON reporte(tipo_estudio_normalizado, creado_en DESC);
+CREATE INDEX IF NOT EXISTS idx_reporte_especie ON reporte(especie, creado_en DESC);
+CREATE INDEX IF NOT EXISTS idx_reporte_veterinario_id ON reporte(veterinario_id, creado_en DESC);
+
+-- Prefijos (LIKE 'valor%'): text_pattern_ops permite usarlos con cualquier collation
+CREATE INDEX IF NOT EXISTS idx_reporte_paciente_nombre ON reporte(paciente_nombre text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_reporte_tutor_nombre ON reporte(tutor_nombre text_pattern_ops);
+
+-- =====================================================
+-- ACTUALIZACIÓN PARCIAL DE reporte
+-- =====================================================
+
+-- Vuelve a generar diagnóstico, imágenes y hallazgos de un reporte desde su
+-- json_resultado. Usa el mismo mapeo que guardar_reportes_normalizados: si
+-- cambia uno, cambiar el otro.
+CREATE OR REPLACE FUNCTION regenerar_filas_hijas_reporte(p_reporte_uuid UUID)
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM diagnosticos WHERE reporte_uuid = p_reporte_uuid;
+    DELETE FROM imagenes_medicas WHERE reporte_uuid = p_reporte_uuid;
+    DELETE FROM hallazgos_clinicos WHERE reporte_uuid = p_reporte_uuid;
+
+    INSERT INTO diagnosticos (reporte_uuid, principal, secundarios, recomendaciones, observaciones, metadatos)
+    SELECT
+        r.reporte_uuid,
+        COALESCE(d ->> 'principal', 'No especificado'),
+        ARRAY(SELECT jsonb_array_elements_text(
+            CASE WHEN jsonb_typeof(d -> 'secundarios') = 'array' THEN d -> 'secundarios' ELSE '[]'::jsonb END)),
+        ARRAY(SELECT jsonb_array_elements_text(
+            CASE WHEN jsonb_typeof(d -> 'recomendaciones') = 'array' THEN d -> 'recomendaciones' ELSE '[]'::jsonb END)),
+        d ->> 'observaciones',
+        d - 'principal' - 'secundarios' - 'recomendaciones' - 'observaciones'
+    FROM reporte r
+    CROSS JOIN LATERAL (
+        SELECT CASE WHEN jsonb_typeof(r.json_resultado -> 'diagnostico') = 'object'
+                    THEN r.json_resultado -> 'diagnostico' END AS d
+    ) AS diag
+    WHERE r.reporte_uuid = p_reporte_uuid AND d IS NOT NULL;
+
+    WITH imagenes AS (
+        SELECT r.reporte_uuid, i.imagen, i.posicion
+        FROM reporte r
+        CROSS JOIN LATERAL jsonb_array_elements(
+            CASE WHEN jsonb_typeof(r.json_resultado -> 'imagenes') = 'array'
+                 THEN r.json_resultado -> 'imagenes' ELSE '[]'::jsonb END
+        ) WITH ORDINALITY AS i(imagen, posicion)
+        WHERE r.reporte_uuid = p_reporte_uuid
+    ),
+    imagenes_insertadas AS (
+        INSERT INTO imagenes_medicas (reporte_uuid, posicion, nombre, url, descripcion, tipo, pagina, ancho, alto, metadatos)
+        SELECT
+            reporte_uuid,
+            posicion,
+            COALESCE(imagen ->> 'nombre', 'Imagen ' || posicion),
+            COALESCE(imagen ->> 'url', ''),
+            imagen ->> 'descripcion',
+            CASE WHEN imagen ->> 'tipo' IN ('radiografia', 'ecografia', 'ecocardiografia', 'analisis')
+                 THEN imagen ->> 'tipo' ELSE 'otro' END,
+            CASE WHEN imagen ->> 'pagina' ~ '^[0-9]+$' THEN (imagen ->> 'pagina')::integer ELSE 1 END,
+            CASE WHEN imagen ->> 'ancho' ~ '^[0-9]+$' THEN (imagen ->> 'ancho')::integer END,
+            CASE WHEN imagen ->> 'alto' ~ '^[0-9]+$' THEN (imagen ->> 'alto')::integer END,
+            imagen - 'url'
+        FROM imagenes
+    )
+    INSERT INTO hallazgos_clinicos (reporte_uuid, posicion, organo, descripcion)
+    SELECT
+        reporte_uuid,
+        posicion,
+        NULLIF(imagen ->> 'ubicacion', 'No especificada'),
+        imagen ->> 'hallazgos'
+    FROM imagenes
+    WHERE COALESCE(imagen ->> 'hallazgos', '') <> '';
+END;
+$$ LANGUAGE plpgsql;
+
+-- Aplica cambios puntuales a un reporte sin reenviar el documento completo.
+--   p_cambios: [{"ruta": ["paciente", "nombre"], "valor": ...}, ...] sobre json_resultado
+--   p_columnas: {"tipo_estudio": ..., "estado_procesamiento": ...} (opcionales)
+--   p_actualizado_en: versión que vio el cliente; si la fila cambió desde
+--     entonces no se aplica nada (concurrencia optimista). NULL no verifica.
+-- Devuelve {"estado": "actualizado", "estado_anterior": ..., "reporte": fila}, {"estado": "conflicto",
+-- "actualizado_en": versión actual} o {"estado": "no_encontrado"}.
+CREATE OR REPLACE FUNCTION actualizar_reporte_parcial(
+    p_reporte_uuid UUID,
+    p_cambios JSONB,
+    p_columnas JSONB DEFAULT '{}'::jsonb,
+    p_actualizado_en TIMESTAMP WITH TIME ZONE DEFAULT NULL
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_id BIGINT;
+    v_json JSONB;
+    v_actualizado_en TIMESTAMP WITH TIME ZONE;
+    v_cambio JSONB;
+    v_ruta TEXT[];
+    v_padre TEXT[];
+    v_regenerar_hijas BOOLEAN := FALSE;
+    v_estado_anterior VARCHAR;
+    v_fila reporte%ROWTYPE;
+BEGIN
+    SELECT r.id, r.json_resultado, r.actualizado_en, r.estado_procesamiento
+    INTO v_id, v_json, v_actualizado_en, v_estado_anterior
+    FROM reporte r
+    WHERE r.reporte_uuid = p_reporte_uuid
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('estado', 'no_encontrado');
+    END IF;
+
+    IF p_actualizado_en IS NOT NULL AND v_actualizado_en <> p_actualizado_en THEN
+        RETURN jsonb_build_object('estado', 'conflicto', 'actualizado_en', v_actualizado_en);
+    END IF;
+
+    FOR v_cambio IN SELECT * FROM jsonb_array_elements(COALESCE(p_cambios, '[]'::jsonb)) LOOP
+        v_ruta := ARRAY(SELECT jsonb_array_elements_text(v_cambio -> 'ruta'));
+        IF COALESCE(array_length(v_ruta, 1), 0) = 0 OR v_ruta[1] = 'id' THEN
+            CONTINUE;
+        END IF;
+        -- jsonb_set solo crea la última clave: los objetos intermedios deben existir
+        FOR nivel IN 1 .. array_length(v_ruta, 1) - 1 LOOP
+            v_padre := v_ruta[1:nivel];
+            IF jsonb_typeof(v_json #> v_padre) IS DISTINCT FROM 'object' THEN
+                v_json := jsonb_set(v_json, v_padre, '{}'::jsonb, true);
+            END IF;
+        END LOOP;
+        v_json := jsonb_set(v_json, v_ruta, COALESCE(v_cambio -> 'valor', 'null'::jsonb), true);
+        v_regenerar_hijas := v_regenerar_hijas OR v_ruta[1] IN ('diagnostico', 'imagenes');
+    END LOOP;
+
+    UPDATE reporte r SET
+        json_resultado = v_json,
+        tipo_estudio = COALESCE(p_columnas ->> 'tipo_estudio', r.tipo_estudio),
+        estado_procesamiento = COALESCE(p_columnas ->> 'estado_procesamiento', r.estado_procesamiento),
+        actualizado_en = GREATEST(NOW(), r.actualizado_en + INTERVAL '1 microsecond')
+    WHERE r.id = v_id
+    RETURNING r.* INTO v_fila;
+
+    IF v_regenerar_hijas THEN
+        PERFORM regenerar_filas_hijas_reporte(p_reporte_uuid);
+    END IF;
+
+    RETURN jsonb_build_object(
+        'estado', 'actualizado',
+        'estado_anterior', v_estado_anterior,
+        'reporte', jsonb_build_object(
+            'id', v_fila.id,
+            'paciente_id', v_fila.paciente_id,
+            'veterinario_id', v_fila.veterinario_id,
+            'fecha_estudio', v_fila.fecha_estudio,
+            'tipo_estudio', v_fila.tipo_estudio,
+            'origen_archivo', v_fila.origen_archivo,
+            'json_resultado', v_fila.json_resultado,
+            'tipo_procesamiento', v_fila.tipo_procesamiento,
+            'estado_procesamiento', v_fila.estado_procesamiento,
+            'creado_en', v_fila.creado_en,
+            'actualizado_en', v_fila.actualizado_en
+        )
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- =====================================================
+-- REGISTRO DE CAMBIOS DE reporte (sincronización incremental)
+-- =====================================================
+
+-- Una fila por reporte creado, actualizado o eliminado, escrita por triggers
+-- en la misma transacción que el cambio. 'transaccion' permite entregar los
+-- cambios en orden de confirmación (ver obtener_cambios_reportes).
+CREATE TABLE IF NOT EXISTS reporte_cambios (
+    id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    transaccion XID8 NOT NULL DEFAULT pg_current_xact_id(),
+    reporte_uuid UUID NOT NULL,
+    operacion VARCHAR(20) NOT NULL CHECK (operacion IN ('creado', 'actualizado', 'eliminado')),
+    registrado_en TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_reporte_cambios_transaccion ON reporte_cambios(transaccion, id);
+CREATE INDEX IF NOT EXISTS idx_reporte_cambios_registrado_en ON reporte_cambios(registrado_en);
+
+ALTER TABLE reporte_cambios ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow all operations on reporte_cambios" ON reporte_cambios;
+CREATE POLICY "Allow all operations on reporte_cambios" ON reporte_cambios FOR ALL USING (true);
+
+-- Transacción más nueva purgada: un token anterior ya no puede completarse
+CREATE TABLE IF NOT EXISTS reporte_cambios_purga (
+    unica BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (unica),
+    horizonte XID8 NOT NULL
+);
+
+ALTER TABLE reporte_cambios_purga ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow all operations on reporte_cambios_purga" ON reporte_cambios_purga;
+CREATE POLICY "Allow all operations on reporte_cambios_purga" ON reporte_cambios_purga FOR ALL USING (true);
+
+CREATE OR REPLACE FUNCTION registrar_cambios_reporte_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO reporte_cambios (reporte_uuid, operacion)
+        SELECT reporte_uuid, 'creado' FROM filas_nuevas WHERE reporte_uuid IS NOT NULL;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO reporte_cambios (reporte_uuid, operacion)
+        SELECT reporte_uuid, 'actualizado' FROM filas_nuevas WHERE reporte_uuid IS NOT NULL;
+    ELSE
+        INSERT INTO reporte_cambios (reporte_uuid, operacion)
+        SELECT reporte_uuid, 'eliminado' FROM filas_viejas WHERE reporte_uuid IS NOT NULL;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS cambios_reporte_insert ON reporte;
+DROP TRIGGER IF EXISTS cambios_reporte_update ON reporte;
+DROP TRIGGER IF EXISTS cambios_reporte_delete ON reporte;
+CREATE TRIGGER cambios_reporte_insert AFTER INSERT ON reporte
+    REFERENCING NEW TABLE AS filas_nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION registrar_cambios_reporte_trigger();
+CREATE TRIGGER cambios_reporte_update AFTER UPDATE ON reporte
+    REFERENCING NEW TABLE AS filas_nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION registrar_cambios_reporte_trigger();
+CREATE TRIGGER cambios_reporte_delete AFTER DELETE ON reporte
+    REFERENCING OLD TABLE AS filas_viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION registrar_cambios_reporte_trigger();
+
+-- Devuelve los reportes que cambiaron desde un token.
+--
+-- El token es '<transacción>.<id>'. Solo se entregan cambios de
+-- transacciones anteriores al xmin del snapshot actual: todas esas ya
+-- terminaron, así que un cambio confirmado tarde nunca queda detrás de un
+-- token ya entregado. Sin p_desde devuelve el token actual (sin cambios)
+-- para que el cliente arranque después de una carga completa.
+--
+-- Cada reporte aparece una vez con su estado actual; 'reiniciar' indica que
+-- el token es anterior a la última purga y hay que recargar todo.
+CREATE OR REPLACE FUNCTION obtener_cambios_reportes(
+    p_desde TEXT DEFAULT NULL,
+    p_limite INTEGER DEFAULT 500
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_xmin XID8 := pg_snapshot_xmin(pg_current_snapshot());
+    v_transaccion XID8;
+    v_id BIGINT;
+    v_ultimo TEXT;
+    v_cantidad INTEGER;
+    v_cambios JSONB;
+BEGIN
+    IF p_desde IS NULL OR p_desde = '' THEN
+        RETURN jsonb_build_object('token', v_xmin || '.0', 'cambios', '[]'::jsonb, 'hay_mas', false, 'reiniciar', false);
+    END IF;
+
+    v_transaccion := split_part(p_desde, '.', 1)::xid8;
+    v_id := split_part(p_desde, '.', 2)::bigint;
+
+    IF v_transaccion <= (SELECT horizonte FROM reporte_cambios_purga) THEN
+        RETURN jsonb_build_object('token', v_xmin || '.0', 'cambios', '[]'::jsonb, 'hay_mas', false, 'reiniciar', true);
+    END IF;
+
+    WITH pagina AS (
+        SELECT c.id, c.transaccion, c.reporte_uuid, c.operacion
+        FROM reporte_cambios c
+        WHERE (c.transaccion, c.id) > (v_transaccion, v_id)
+          AND c.transaccion < v_xmin
+        ORDER BY c.transaccion, c.id
+        LIMIT p_limite
+    ),
+    -- Último cambio de cada reporte, en el orden en que ocurrió
+    ultimos AS (
+        SELECT DISTINCT ON (p.reporte_uuid)
+            p.reporte_uuid, p.operacion,
+            row_number() OVER (ORDER BY p.transaccion, p.id) AS orden
+        FROM pagina p
+        ORDER BY p.reporte_uuid, p.transaccion DESC, p.id DESC
+    )
+    SELECT
+        (SELECT count(*) FROM pagina),
+        (SELECT p.transaccion || '.' || p.id FROM pagina p ORDER BY p.transaccion DESC, p.id DESC LIMIT 1),
+        (
+            SELECT COALESCE(jsonb_agg(jsonb_build_object(
+                'id', u.reporte_uuid,
+                'operacion', CASE WHEN r.id IS NULL THEN 'eliminado' ELSE u.operacion END,
+                'reporte', CASE WHEN r.id IS NULL THEN NULL ELSE jsonb_build_object(
+                    'id', r.id,
+                    'paciente_id', r.paciente_id,
+                    'veterinario_id', r.veterinario_id,
+                    'fecha_estudio', r.fecha_estudio,
+                    'tipo_estudio', r.tipo_estudio,
+                    'origen_archivo', r.origen_archivo,
+                    'json_resultado', r.json_resultado,
+                    'tipo_procesamiento', r.tipo_procesamiento,
+                    'estado_procesamiento', r.estado_procesamiento,
+                    'creado_en', r.creado_en,
+                    'actualizado_en', r.actualizado_en
+                ) END
+            ) ORDER BY u.orden), '[]'::jsonb)
+            FROM ultimos u
+            LEFT JOIN reporte r ON r.reporte_uuid = u.reporte_uuid
+        )
+    INTO v_cantidad, v_ultimo, v_cambios;
+
+    RETURN jsonb_build_object(
+        'token', CASE WHEN v_cantidad = p_limite THEN v_ultimo ELSE v_xmin || '.0' END,
+        'cambios', v_cambios,
+        'hay_mas', v_cantidad = p_limite,
+        'reiniciar', false
+    );
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Borra los cambios de más de p_dias días y anota el horizonte purgado.
+-- Devuelve la cantidad de filas borradas.
+CREATE OR REPLACE FUNCTION purgar_cambios_reportes(p_dias INTEGER DEFAULT 30)
+RETURNS INTEGER AS $$
+DECLARE
+    v_horizonte XID8;
+    v_borrados INTEGER;
+BEGIN
+    WITH borrados AS (
+        DELETE FROM reporte_cambios
+        WHERE registrado_en < NOW() - make_interval(days => p_dias)
+        RETURNING transaccion
+    )
+    SELECT max(transaccion), count(*) INTO v_horizonte, v_borrados FROM borrados;
+
+    IF v_horizonte IS NOT NULL THEN
+        INSERT INTO reporte_cambios_purga (horizonte) VALUES (v_horizonte)
+        ON CONFLICT (unica) DO UPDATE SET horizonte = GREATEST(reporte_cambios_purga.horizonte, EXCLUDED.horizonte);
+    END IF;
+    RETURN v_borrados;
+END;
+$$ LANGUAGE plpgsql;
+
 -- =====================================================
 -- COMENTARIOS FINALES
 -- =====================================================
@@ -480,6 +1519,10 @@ COMMENT ON TABLE integraciones_n8n IS 'Configuración de integraciones con n8n';
 COMMENT ON TABLE eventos_n8n IS 'Eventos procesados por n8n';
 COMMENT ON TABLE notificaciones IS 'Sistema de notificaciones';
 COMMENT ON TABLE configuraciones_sistema IS 'Configuraciones generales del sistema';
+COMMENT ON TABLE reporte IS 'Reportes procesados por el backend con el resultado completo de la IA';
+COMMENT ON TABLE estadisticas_resumen IS 'Contadores del sistema mantenidos por triggers y reconciliados periódicamente';
+COMMENT ON TABLE estadisticas_diarias IS 'Reportes por día, tipo de estudio, especie y veterinario (mantenida por triggers)';
+COMMENT ON TABLE reporte_cambios IS 'Registro de reportes creados, actualizados y eliminados para la sincronización incremental';
 
 -- =====================================================
 -- FIN DEL SCRIPT
@@ -0,0 +1,71 @@
+-- =====================================================
+-- DIAGNOVET - BENCHMARK DE BÚSQUEDA DE TEXTO COMPLETO
+-- Mide buscar_reportes_fts sobre un corpus sintético de 100k reportes
+--
+-- Uso (psql contra una base con el esquema cargado):
+--   psql "$DATABASE_URL" -f supabase/benchmarks/busqueda_fts_100k.sql
+--
+-- Todo corre dentro de una transacción que se revierte al final,
+-- así que no deja datos en la base.
+-- =====================================================
+
+\timing on
+BEGIN;
+
+-- Corpus sintético: combina vocabulario clínico para que los términos
+-- tengan selectividades distintas (frecuentes, medios y raros)
+INSERT INTO reporte (tipo_estudio, origen_archivo, estado_procesamiento, json_resultado, creado_en)
+SELECT
+    (ARRAY['radiografia', 'ecografia', 'ecocardiografia', 'analisis'])[1 + (i % 4)],
+    'sintetico_' || i || '.pdf',
+    'completado',
+    jsonb_build_object(
+        'id', gen_random_uuid(),
+        'paciente', jsonb_build_object(
+            'nombre', (ARRAY['Firulais', 'Michi', 'Luna', 'Toby', 'Lola', 'Rocco', 'Nala', 'Simba'])[1 + (i % 8)] || ' ' || i,
+            'especie', (ARRAY['canino', 'felino', 'equino'])[1 + (i % 3)]
+        ),
+        'diagnostico', jsonb_build_object(
+            'principal', (ARRAY['Cardiomegalia leve', 'Fractura de fémur', 'Catarata intumescente bilateral',
+                                'Hepatomegalia difusa', 'Estudio dentro de parámetros normales',
+                                'Insuficiencia valvular mitral', 'Nefrolitiasis'])[1 + (i % 7)],
+            'secundarios', jsonb_build_array(
+                (ARRAY['Esclerosis nuclear', 'Soplo sistólico', 'Efusión pleural', 'Sin hallazgos'])[1 + (i % 4)]
+            ),
+            'observaciones', 'Observación clínica número ' || i
+        ),
+        'imagenes', jsonb_build_array(
+            jsonb_build_object('hallazgos', (ARRAY['Silueta cardíaca aumentada', 'Trazo de fractura',
+                                                   'Cristalino hiperecoico', 'Parénquima homogéneo'])[1 + (i % 4)])
+        ),
+        'contenido_extraido', repeat(
+            'Se realiza estudio del paciente. ' ||
+            (ARRAY['Presenta silueta cardíaca aumentada compatible con cardiomegalia. ',
+                   'Se observa trazo de fractura completa en diáfisis femoral. ',
+                   'Cristalino con estructura hiperecoica central en reloj de arena. ',
+                   'Hígado de tamaño aumentado con bordes redondeados. ',
+                   'Riñones de forma y tamaño conservados. '])[1 + (i % 5)] ||
+            CASE WHEN i % 997 = 0 THEN 'Hallazgo compatible con neoplasia esplénica. ' ELSE '' END,
+            3 + (i % 5)
+        )
+    ),
+    NOW() - (i || ' minutes')::interval
+FROM generate_series(1, 100000) AS i;
+
+ANALYZE reporte;
+
+-- Término frecuente (~20% del corpus)
+EXPLAIN (ANALYZE, BUFFERS) SELECT * FROM buscar_reportes_fts('cardiomegalia', 10, 0);
+SELECT id, relevancia, total_coincidencias FROM buscar_reportes_fts('cardiomegalia', 10, 0);
+
+-- Término raro (~0.1% del corpus)
+EXPLAIN (ANALYZE, BUFFERS) SELECT * FROM buscar_reportes_fts('neoplasia', 10, 0);
+SELECT id, relevancia, total_coincidencias FROM buscar_reportes_fts('neoplasia', 10, 0);
+
+-- Frase exacta con exclusión (sintaxis websearch)
+EXPLAIN (ANALYZE, BUFFERS) SELECT * FROM buscar_reportes_fts('"silueta cardíaca" -fractura', 10, 0);
+
+-- Página profunda
+EXPLAIN (ANALYZE, BUFFERS) SELECT * FROM buscar_reportes_fts('fractura', 10, 5000);
+
+ROLLBACK;
@@ -0,0 +1,89 @@
+-- =====================================================
+-- TEST: ACTUALIZACIÓN PARCIAL DE REPORTES
+-- =====================================================
+-- Verifica actualizar_reporte_parcial: aplica solo las rutas enviadas,
+-- regenera las filas hijas cuando cambian diagnóstico o imágenes y rechaza
+-- los cambios sobre una versión vieja (concurrencia optimista).
+--
+-- Uso (con el esquema de supabase/base_datos_supabase.sql cargado):
+--     psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f test/test-actualizacion-parcial.sql
+--
+-- Corre dentro de una transacción que se deshace al final: no deja datos.
+
+BEGIN;
+
+SELECT count(*) FROM guardar_reportes_normalizados(jsonb_build_array(jsonb_build_object(
+    'paciente_id', 1,
+    'veterinario_id', 1,
+    'fecha_estudio', CURRENT_DATE,
+    'tipo_estudio', 'Radiografia',
+    'origen_archivo', 'test_parcial.pdf',
+    'json_resultado', jsonb_build_object(
+        'id', '00000000-0000-4000-8000-000000000038',
+        'paciente', jsonb_build_object('nombre', 'Rex', 'especie', 'Canino', 'raza', 'Mestizo'),
+        'diagnostico', jsonb_build_object('principal', 'Sin hallazgos'),
+        'imagenes', '[{"url": "a.png", "hallazgos": "Opacidad"}]'::jsonb
+    ),
+    'tipo_procesamiento', 'ia_analisis',
+    'estado_procesamiento', 'procesando'
+)));
+
+DO $$
+DECLARE
+    v_uuid UUID := '00000000-0000-4000-8000-000000000038';
+    v_version TIMESTAMP WITH TIME ZONE;
+    v_resultado JSONB;
+    v_json JSONB;
+BEGIN
+    SELECT actualizado_en INTO v_version FROM reporte WHERE reporte_uuid = v_uuid;
+
+    v_resultado := actualizar_reporte_parcial(
+        v_uuid,
+        '[{"ruta": ["paciente", "nombre"], "valor": "Max"},
+          {"ruta": ["tutor", "nombre"], "valor": "Ana"},
+          {"ruta": ["diagnostico", "principal"], "valor": "Fractura"},
+          {"ruta": ["imagenes"], "valor": [{"url": "b.png"}, {"url": "c.png", "hallazgos": "Fisura"}]}]',
+        '{"estado_procesamiento": "completado"}',
+        v_version
+    );
+    IF v_resultado ->> 'estado' <> 'actualizado' THEN
+        RAISE EXCEPTION 'Se esperaba actualizado: %', v_resultado;
+    END IF;
+
+    SELECT json_resultado INTO v_json FROM reporte WHERE reporte_uuid = v_uuid;
+    IF v_json -> 'paciente' <> '{"nombre": "Max", "especie": "Canino", "raza": "Mestizo"}'::jsonb THEN
+        RAISE EXCEPTION 'El paciente no conservó las claves no enviadas: %', v_json -> 'paciente';
+    END IF;
+    IF v_json #>> '{tutor,nombre}' <> 'Ana' THEN
+        RAISE EXCEPTION 'No se creó el objeto intermedio tutor: %', v_json;
+    END IF;
+    IF (SELECT principal FROM diagnosticos WHERE reporte_uuid = v_uuid) <> 'Fractura' THEN
+        RAISE EXCEPTION 'No se regeneró el diagnóstico normalizado';
+    END IF;
+    IF (SELECT count(*) FROM imagenes_medicas WHERE reporte_uuid = v_uuid) <> 2
+       OR (SELECT string_agg(descripcion, ',') FROM hallazgos_clinicos WHERE reporte_uuid = v_uuid) <> 'Fisura' THEN
+        RAISE EXCEPTION 'No se regeneraron imágenes y hallazgos';
+    END IF;
+    IF (SELECT estado_procesamiento FROM reporte WHERE reporte_uuid = v_uuid) <> 'completado' THEN
+        RAISE EXCEPTION 'No se actualizó la columna estado_procesamiento';
+    END IF;
+
+    -- La versión vieja ya no es válida: no debe aplicarse nada
+    v_resultado := actualizar_reporte_parcial(
+        v_uuid, '[{"ruta": ["paciente", "nombre"], "valor": "Otro"}]', '{}', v_version
+    );
+    IF v_resultado ->> 'estado' <> 'conflicto'
+       OR (SELECT json_resultado #>> '{paciente,nombre}' FROM reporte WHERE reporte_uuid = v_uuid) <> 'Max' THEN
+        RAISE EXCEPTION 'Se esperaba conflicto sin cambios: %', v_resultado;
+    END IF;
+
+    v_resultado := actualizar_reporte_parcial(gen_random_uuid(), '[]', '{}', NULL);
+    IF v_resultado ->> 'estado' <> 'no_encontrado' THEN
+        RAISE EXCEPTION 'Se esperaba no_encontrado: %', v_resultado;
+    END IF;
+
+    RAISE NOTICE 'actualizar_reporte_parcial: OK';
+END;
+$$;
+
+ROLLBACK;
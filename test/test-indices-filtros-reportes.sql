@@ -0,0 +1,164 @@
+-- =====================================================
+-- TEST: PLANES DE LOS FILTROS DE /api/reportes
+-- =====================================================
+-- Verifica que cada combinación de filtros del listado use los índices de las
+-- columnas materializadas (ninguna hace Seq Scan sobre reporte). Imprime el
+-- EXPLAIN de cada consulta y aborta con error si algún plan no es el esperado.
+--
+-- Uso (con el esquema de supabase/base_datos_supabase.sql cargado):
+--     psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f test/test-indices-filtros-reportes.sql
+--
+-- Corre dentro de una transacción que se deshace al final: no deja datos.
+
+BEGIN;
+
+-- Datos de prueba con la distribución típica: pocas especies y tipos de
+-- estudio, muchos pacientes y tutores distintos, y algunos valores raros
+-- (tomografía, exóticos, el veterinario 99) para los que el índice propio del
+-- filtro es la única opción razonable
+INSERT INTO reporte (
+    paciente_id, veterinario_id, fecha_estudio, tipo_estudio, origen_archivo,
+    json_resultado, tipo_procesamiento, estado_procesamiento, creado_en
+)
+SELECT
+    i,
+    CASE WHEN i % 89 = 0 THEN 99 ELSE 1 + i % 25 END,
+    CURRENT_DATE - (i % 365),
+    CASE WHEN i % 100 = 0 THEN 'Tomografia' ELSE (ARRAY['Radiografia', 'Ecografia', 'Ecocardiografia'])[1 + i % 3] END,
+    'test_filtros_' || i || '.pdf',
+    jsonb_build_object(
+        'id', gen_random_uuid(),
+        'paciente', jsonb_build_object(
+            'nombre', (ARRAY['Firulais', 'Michi', 'Rocco', 'Luna', 'Toby', 'Nala', 'Simba', 'Kira'])[1 + i % 8] || ' ' || i,
+            'especie', CASE WHEN i % 97 = 0 THEN 'Exotico' ELSE (ARRAY['Canino', 'Felino', 'Equino', 'Ave'])[1 + i % 4] END
+        ),
+        'tutor', jsonb_build_object(
+            'nombre', (ARRAY['Garcia', 'Lopez', 'Martinez', 'Fernandez', 'Rodriguez', 'Perez'])[1 + i % 6] || ' ' || (i % 997)
+        ),
+        'diagnostico', jsonb_build_object('principal', 'Sin hallazgos'),
+        'imagenes', '[]'::jsonb
+    ),
+    'ia_analisis',
+    'completado',
+    NOW() - (i || ' minutes')::interval
+FROM generate_series(1, 20000) AS i;
+
+ANALYZE reporte;
+
+-- Imprime el plan de la consulta y falla si recorre reporte completo o si no
+-- usa el índice esperado
+CREATE FUNCTION pg_temp.verificar_plan(descripcion TEXT, consulta TEXT, indice_esperado TEXT)
+RETURNS VOID AS $$
+DECLARE
+    linea TEXT;
+    plan TEXT := '';
+BEGIN
+    FOR linea IN EXECUTE 'EXPLAIN (COSTS OFF) ' || consulta LOOP
+        plan := plan || linea || E'\n';
+    END LOOP;
+    RAISE NOTICE E'\n-- %\n%', descripcion, plan;
+
+    IF plan LIKE '%Seq Scan on reporte%' THEN
+        RAISE EXCEPTION 'El filtro "%" recorre la tabla reporte completa', descripcion;
+    END IF;
+    IF plan NOT LIKE '%' || indice_esperado || '%' THEN
+        RAISE EXCEPTION 'El filtro "%" no usa %', descripcion, indice_esperado;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Mismas consultas que arma _sql_listar en backend/servicios/reportes_repositorio_postgres.py
+SELECT pg_temp.verificar_plan(
+    'sin filtros',
+    $q$SELECT id FROM reporte ORDER BY creado_en DESC LIMIT 10 OFFSET 0$q$,
+    'idx_reporte_creado_en'
+);
+
+-- Valores frecuentes: recorrer creado_en hacia atrás filtrando también es
+-- válido (encuentra 10 filas enseguida); solo se exige que haya un índice
+SELECT pg_temp.verificar_plan(
+    'tipo_estudio (valor frecuente)',
+    $q$SELECT id FROM reporte WHERE tipo_estudio_normalizado = 'ecografia'
+       ORDER BY creado_en DESC LIMIT 10 OFFSET 0$q$,
+    'idx_reporte_'
+);
+
+SELECT pg_temp.verificar_plan(
+    'tipo_estudio',
+    $q$SELECT id FROM reporte WHERE tipo_estudio_normalizado = 'tomografia'
+       ORDER BY creado_en DESC LIMIT 10 OFFSET 0$q$,
+    'idx_reporte_tipo_estudio_normalizado'
+);
+
+SELECT pg_temp.verificar_plan(
+    'especie (valor frecuente)',
+    $q$SELECT id FROM reporte WHERE especie = 'felino'
+       ORDER BY creado_en DESC LIMIT 10 OFFSET 0$q$,
+    'idx_reporte_'
+);
+
+SELECT pg_temp.verificar_plan(
+    'especie',
+    $q$SELECT id FROM reporte WHERE especie = 'exotico'
+       ORDER BY creado_en DESC LIMIT 10 OFFSET 0$q$,
+    'idx_reporte_especie'
+);
+
+SELECT pg_temp.verificar_plan(
+    'veterinario',
+    $q$SELECT id FROM reporte WHERE veterinario_id = '99'::bigint
+       ORDER BY creado_en DESC LIMIT 10 OFFSET 0$q$,
+    'idx_reporte_veterinario_id'
+);
+
+SELECT pg_temp.verificar_plan(
+    'paciente (prefijo)',
+    $q$SELECT id FROM reporte WHERE paciente_nombre LIKE 'firulais 120%'
+       ORDER BY creado_en DESC LIMIT 10 OFFSET 0$q$,
+    'idx_reporte_paciente_nombre'
+);
+
+SELECT pg_temp.verificar_plan(
+    'tutor (prefijo)',
+    $q$SELECT id FROM reporte WHERE tutor_nombre LIKE 'garcia 99%'
+       ORDER BY creado_en DESC LIMIT 10 OFFSET 0$q$,
+    'idx_reporte_tutor_nombre'
+);
+
+SELECT pg_temp.verificar_plan(
+    'tipo_estudio + especie',
+    $q$SELECT id FROM reporte WHERE tipo_estudio_normalizado = 'tomografia' AND especie = 'felino'
+       ORDER BY creado_en DESC LIMIT 10 OFFSET 0$q$,
+    'idx_reporte_'
+);
+
+SELECT pg_temp.verificar_plan(
+    'especie + veterinario',
+    $q$SELECT id FROM reporte WHERE especie = 'exotico' AND veterinario_id = '7'::bigint
+       ORDER BY creado_en DESC LIMIT 10 OFFSET 0$q$,
+    'idx_reporte_'
+);
+
+SELECT pg_temp.verificar_plan(
+    'tipo_estudio + especie + veterinario',
+    $q$SELECT id FROM reporte
+       WHERE tipo_estudio_normalizado = 'ecografia' AND especie = 'exotico' AND veterinario_id = '99'::bigint
+       ORDER BY creado_en DESC LIMIT 10 OFFSET 0$q$,
+    'idx_reporte_'
+);
+
+SELECT pg_temp.verificar_plan(
+    'especie + paciente (prefijo)',
+    $q$SELECT id FROM reporte WHERE especie = 'canino' AND paciente_nombre LIKE 'firulais 1%'
+       ORDER BY creado_en DESC LIMIT 10 OFFSET 0$q$,
+    'idx_reporte_'
+);
+
+SELECT pg_temp.verificar_plan(
+    'especie + tutor (prefijo)',
+    $q$SELECT id FROM reporte WHERE especie = 'canino' AND tutor_nombre LIKE 'lopez 5%'
+       ORDER BY creado_en DESC LIMIT 10 OFFSET 0$q$,
+    'idx_reporte_'
+);
+
+ROLLBACK;